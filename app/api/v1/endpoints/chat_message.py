@@ -34,6 +34,7 @@ async def chat(
     assistant_response = await supervisor.async_start_chat(
         collection=collection,
         thread_id=thread_id,
+        user_id=str(current_user.id),
         user_input=message_in.content
     )
     
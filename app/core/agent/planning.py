@@ -11,7 +11,13 @@ from pydantic import BaseModel
 
 from app.core.agent.base import AgentBase
 from app.core.config import settings
-from app.core.context import AgentContext
+from app.core.context import (
+    AgentContext,
+    TodoItem,
+    evidence_sections,
+    namespaced_agent_id,
+    todo_item_id,
+)
 from app.core.prompt.planning import PLANNING_PROMPT, SOLVE_PROMPT
 from app.core.tools.documentation import DocumentationTool
 from app.core.tools.markdown_saver import MarkdownSaver
@@ -20,7 +26,23 @@ from app.core.tools.summary import SummaryTool
 from app.core.tools.time import TimeTool
 from app.core.tools.topic import TopicGenerator
 from app.core.tools.topic_selection import TopicSelectionTool
-from app.core.tools.writer import ArticleWriterTool, OutlineTool, WriterTool
+from app.core.tools.search.base import SearchItem
+from app.core.tools.writer import (
+    ArticleOutline,
+    ArticleWriterTool,
+    OutlineTool,
+    WriterTool,
+)
+
+# 提示词中任务上下文的 token 预算
+SOLVE_CONTEXT_TOKENS = 6000
+ARTICLE_CONTEXT_TOKENS = 3000
+# 共享产物缓存中搜索结果的有效期（秒），摘要和大纲只取决于输入，不设有效期
+SEARCH_CACHE_MAX_AGE = 24 * 3600
+# 其他任务中至少有这么多条目覆盖查询的大部分词语时，直接使用已有研究结果，不再调用搜索
+PRIOR_RESEARCH_MIN_HITS = 2
+PRIOR_RESEARCH_MIN_COVERAGE = 0.8
+PRIOR_RESEARCH_FILE_TYPES = ("summary", "scratchpad", "resource")
 
 
 class TopicSuggestion(BaseModel):
@@ -59,14 +81,22 @@ class WriterPlanningAgent(AgentBase):
     graph: Optional[Any] = None
     agent_context: Optional[AgentContext] = None
     markdown_saver: Optional[MarkdownSaver] = None  # 显式声明
+    # 按用户/会话隔离上下文工作空间，未提供时使用共享的 default 工作空间
+    user_id: Optional[str] = None
+    thread_id: Optional[str] = None
 
     def __init__(self, agent_context: Optional[AgentContext] = None, **kwargs):
         super().__init__(**kwargs)
-        self.agent_context = agent_context or AgentContext(agent_id="default")
+        self.agent_context = agent_context or AgentContext(
+            agent_id=namespaced_agent_id("default", self.user_id, self.thread_id)
+        )
         # 确保 deepseek_llm 初始化
         if not hasattr(self, "deepseek_llm") or self.deepseek_llm is None:
             os.environ["DEEPSEEK_API_KEY"] = settings.DEEPSEEK_API_KEY
             self.deepseek_llm = ChatDeepSeek(model="deepseek-chat")
+        # 上下文超过阈值时在后台压缩，不占用步骤执行时间
+        if self.agent_context.compaction_worker is None:
+            self.agent_context.enable_compaction(llm=self.deepseek_llm)
         object.__setattr__(
             self, "markdown_saver", MarkdownSaver()
         )  # 兼容 pydantic BaseModel
@@ -141,8 +171,9 @@ class WriterPlanningAgent(AgentBase):
                 continue
             step_name = step.get("step_name", "")
             description = step.get("description", "")
+            # 以步骤名作为待办事项 ID，完成时按 ID 精确标记
             todo_item = f"{step_name} ({tool}): {description}"
-            todo_items.append(todo_item)
+            todo_items.append(TodoItem(todo_item, todo_item_id(step_name) or None))
 
             # 初始化 step 执行信息
             step_execution_info[step_name] = {
@@ -252,37 +283,37 @@ class WriterPlanningAgent(AgentBase):
                 else:
                     search_result = self._execute_search(tool_input)
 
-                # 将搜索结果写入 context 的 resource 文件
-                if self.agent_context is not None and isinstance(search_result, dict):
-                    search_items = search_result.get("search_items", [])
-                    from app.core.tools.search.base import SearchItem
-
-                    for item in search_items:
-                        if isinstance(item, SearchItem):
-                            self.agent_context.add_resource_link(
-                                title=item.title,
-                                url=item.link,
-                                description=item.summary or "",
-                            )
-
-                # 记录搜索操作到 scratchpad
+                # 将搜索结果写入 context 的 resource 文件，并记录搜索操作到 scratchpad
                 if self.agent_context is not None:
-                    result = search_result.get("result", str(search_result))
-                    self.agent_context.add_scratchpad_entry(
-                        f"搜索[{tool_input}]结果: {result}"
-                    )
+                    with self.agent_context.batch():
+                        if isinstance(search_result, dict):
+                            for item in search_result.get("search_items", []):
+                                # 复用的已有研究结果没有链接，只记录在 scratchpad 中
+                                if isinstance(item, SearchItem) and item.link:
+                                    self.agent_context.add_resource_link(
+                                        title=item.title,
+                                        url=item.link,
+                                        description=item.summary or "",
+                                    )
+                        result = search_result.get("result", str(search_result))
+                        self.agent_context.add_scratchpad_entry(
+                            f"搜索[{tool_input}]结果: {result}"
+                        )
 
                 # 返回字符串格式的结果
                 result = search_result.get("result", str(search_result))
             elif tool == "Topic":
                 result = self._execute_topic(tool_input, state.get("task"))
                 if self.agent_context is not None:
-                    self.agent_context.add_summary_entry("选题", str(result))
+                    # 重复执行时替换原条目，而不是追加新的同名条目
+                    self.agent_context.upsert_section("summary", "选题", str(result))
             elif tool == "Summary":
                 result = self._execute_summary(tool_input)
                 # 记录 summary 结果到 summary
                 if self.agent_context is not None:
-                    self.agent_context.add_summary_entry("内容摘要", str(result))
+                    self.agent_context.upsert_section(
+                        "summary", "内容摘要", str(result)
+                    )
             elif tool == "Outline":
                 # 尝试从之前步骤的结果中获取选题信息
                 topic_info = _results.get("selected_topic", "")
@@ -368,40 +399,40 @@ class WriterPlanningAgent(AgentBase):
         # 存储结果
         _results[current_step["step_name"]] = str(result)
 
-        # 记录步骤执行完成后的最终信息
+        # 记录步骤执行完成后的最终信息（todo 进度和完成记录合并为一次写入）
         if self.agent_context is not None:
             step_name = current_step.get("step_name", "")
             step_description = current_step.get("description", "")
 
-            # 更新 todo 进度 - 标记当前步骤为完成
-            if step_description:
-                try:
-                    self.agent_context.update_todo_progress([step_description])
-                    print(f"✓ 更新 todo 进度: {step_description}")
-                except Exception as e:
-                    print(f"Warning: Failed to update todo progress: {e}")
-
-            # 记录步骤执行完成信息（除 ArticleWriter 步骤外）
-            if tool != "ArticleWriter":
-                step_completion_info = {
-                    "step_name": step_name,
-                    "tool": tool,
-                    "description": step_description,
-                    "status": "completed",
-                    "result": str(result)[:500],  # 限制结果长度
-                    "execution_time": round(execution_time, 2),
-                    "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-                }
-                # 以文本和 JSON 两种形式追加到 todo.md
-                todo_append_text = f"\n---\n步骤完成: {step_name} ({tool})\n描述: {step_description}\n状态: completed\n结果: {str(result)[:200]}...\n执行时间: {round(execution_time, 2)}s\n时间: {step_completion_info['timestamp']}\nJSON: {json.dumps(step_completion_info, ensure_ascii=False)}\n"
-                # 追加到 todo.md
-                agent_id = self.agent_context.agent_id
-                task_id = self.agent_context.get_current_task_id()
-                if agent_id and task_id:
-                    self.agent_context.context_manager.append_to_task_file(
-                        agent_id, task_id, "todo", todo_append_text
+            with self.agent_context.batch() as batch:
+                # 更新 todo 进度 - 按步骤名标记当前步骤为完成
+                if step_name or step_description:
+                    self.agent_context.update_todo_progress(
+                        [step_name or step_description]
                     )
 
+                # 记录步骤执行完成信息（除 ArticleWriter 步骤外）
+                if tool != "ArticleWriter":
+                    step_completion_info = {
+                        "step_name": step_name,
+                        "tool": tool,
+                        "description": step_description,
+                        "status": "completed",
+                        "result": str(result)[:500],  # 限制结果长度
+                        "execution_time": round(execution_time, 2),
+                        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                    }
+                    # 以文本和 JSON 两种形式追加到 todo.md
+                    todo_append_text = f"\n---\n步骤完成: {step_name} ({tool})\n描述: {step_description}\n状态: completed\n结果: {str(result)[:200]}...\n执行时间: {round(execution_time, 2)}s\n时间: {step_completion_info['timestamp']}\nJSON: {json.dumps(step_completion_info, ensure_ascii=False)}\n"
+                    # 追加到 todo.md
+                    self.agent_context.append_to_task_file("todo", todo_append_text)
+
+            if batch.committed:
+                if step_description:
+                    print(f"✓ 更新 todo 进度: {step_description}")
+            else:
+                print(f"Warning: Failed to update todo progress: {step_description}")
+
         return {"results": _results}
 
     def _execute_search(self, query: str) -> dict:
@@ -413,13 +444,11 @@ class WriterPlanningAgent(AgentBase):
             else:
                 processed_query = query
 
-            # 执行搜索，获取 SearchItem 列表
-            search_items = TavilySearchEngine.perform_search(processed_query)
+            # 执行搜索，获取 SearchItem 列表（优先复用其他任务的搜索结果）
+            search_items = self._search(processed_query)
 
             # 将 SearchItem 列表转换为字符串格式
             if isinstance(search_items, list):
-                from app.core.tools.search.base import SearchItem
-
                 items_str = ", ".join(
                     [
                         f"SearchItem(title='{item.title}', link='{item.link}', summary='{item.summary}')"
@@ -443,6 +472,76 @@ class WriterPlanningAgent(AgentBase):
                 "result": f"Search error: {str(e)}",
             }
 
+    def _cached_artifact(
+        self, kind: str, request: str, compute, max_age: Optional[float] = None
+    ) -> Optional[str]:
+        """从共享产物缓存读取产物，未命中时调用 compute 生成"""
+        if self.agent_context is None:
+            return compute()
+        return self.agent_context.cached_artifact(kind, request, compute, max_age)
+
+    def _prior_research(self, query: str) -> List[SearchItem]:
+        """从其他任务的总结、笔记和资源中检索足以回答查询的已有研究结果"""
+        if self.agent_context is None:
+            return []
+        hits = [
+            hit
+            for hit in self.agent_context.search_contexts(
+                query, k=5, file_types=PRIOR_RESEARCH_FILE_TYPES
+            )
+            if hit["coverage"] >= PRIOR_RESEARCH_MIN_COVERAGE
+        ]
+        if len(hits) < PRIOR_RESEARCH_MIN_HITS:
+            return []
+        return [
+            SearchItem(
+                title=f"已有研究 {hit['task_id']}/{hit['file_type']}",
+                link="",
+                summary=hit["snippet"],
+            )
+            for hit in hits
+        ]
+
+    def _search(self, query: str) -> Any:
+        """
+        执行搜索，非空的搜索结果写入共享产物缓存
+
+        调用搜索引擎前先检索其他任务中的已有研究结果，足够时直接使用（不写入缓存）
+        """
+        fetched: Dict[str, Any] = {}
+
+        def compute() -> Optional[str]:
+            prior = self._prior_research(query)
+            if prior:
+                print(f"复用其他任务的研究结果: {query}")
+                fetched["items"] = prior
+                return None
+            items = TavilySearchEngine.perform_search(query)
+            fetched["items"] = items
+            if not isinstance(items, list) or not items:
+                return None
+            if not all(isinstance(item, SearchItem) for item in items):
+                return None
+            return json.dumps(
+                [item.model_dump() for item in items], ensure_ascii=False
+            )
+
+        cached = self._cached_artifact(
+            "search", query, compute, max_age=SEARCH_CACHE_MAX_AGE
+        )
+        if cached is None:
+            return fetched.get("items", [])
+        return [SearchItem(**item) for item in json.loads(cached)]
+
+    def _create_outline(self, topic: str) -> ArticleOutline:
+        """生成大纲，相同主题复用共享产物缓存中的大纲"""
+        cached = self._cached_artifact(
+            "outline",
+            topic,
+            lambda: self.outline_tool.create_outline(topic).model_dump_json(),
+        )
+        return ArticleOutline.model_validate_json(cached)
+
     def _execute_topic(self, requirement: str, user_query: Optional[str] = None) -> str:
         if self.topic_generator is not None:
             if isinstance(requirement, dict):
@@ -497,7 +596,11 @@ class WriterPlanningAgent(AgentBase):
                 else:
                     content_str = str(content)
 
-                summary = self.summary_tool.summarize(content_str)
+                summary = self._cached_artifact(
+                    "summary",
+                    content_str,
+                    lambda: str(self.summary_tool.summarize(content_str)),
+                )
                 return f"Summary: {summary}"
             else:
                 return "Summary tool not initialized"
@@ -525,7 +628,7 @@ class WriterPlanningAgent(AgentBase):
 
                 # 生成大纲
                 print(f"_execute_outline Outline 工具输入: {topic_str}")
-                outline = self.outline_tool.create_outline(topic_str)
+                outline = self._create_outline(topic_str)
 
                 # 显示大纲并等待用户确认
                 print("\n=== 生成的文章大纲 ===")
@@ -545,6 +648,9 @@ class WriterPlanningAgent(AgentBase):
                         return f"Confirmed outline for '{topic_str}': {outline.title}"
                     elif user_input in ["n", "no", "否", "不"]:
                         print("✗ 大纲被拒绝，需要重新生成")
+                        # 被拒绝的大纲不再复用
+                        if self.agent_context is not None:
+                            self.agent_context.invalidate_artifact("outline", topic_str)
                         return f"Outline rejected for '{topic_str}'"
                     else:
                         print("请输入 y/yes/是/确认 或 n/no/否/不")
@@ -566,19 +672,17 @@ class WriterPlanningAgent(AgentBase):
                 # 从上下文获取大纲信息
                 outline_info = ""
                 if self.agent_context is not None:
-                    # 尝试从 summary 中获取大纲信息
-                    summary_content = self.agent_context.get_task_file_content(
-                        "summary"
+                    # 按 token 预算从 summary 中选取与主题相关的条目
+                    summary_content = self.agent_context.assemble_context(
+                        ARTICLE_CONTEXT_TOKENS, query=topic_str, sources=("summary",)
                     )
-                    if summary_content and "文章大纲" in summary_content:
+                    if "文章大纲" in summary_content:
                         outline_info = summary_content
 
                 # 如果没有大纲信息，使用默认大纲
                 if not outline_info:
                     outline = (
-                        self.outline_tool.create_outline(topic_str)
-                        if self.outline_tool
-                        else None
+                        self._create_outline(topic_str) if self.outline_tool else None
                     )
                     if outline:
                         outline_info = (
@@ -664,17 +768,23 @@ class WriterPlanningAgent(AgentBase):
             description = step.get("description", "")
             tool = step.get("tool", "")
             tool_input = step.get("tool_input", "")
-
-            _results = state.get("results", {}) or {}
-            for k, v in _results.items():
-                if isinstance(tool_input, str):
-                    tool_input = tool_input.replace(k, str(v))
-                if isinstance(step_name, str):
-                    step_name = step_name.replace(k, str(v))
-
             plan += f"Plan: {description}\n{step_name} = {tool}[{tool_input}]\n"
 
-        solve_prompt = SOLVE_PROMPT.format(plan=plan, task=state["task"])
+        # 步骤结果不再逐字代入计划，与任务上下文一起按 token 预算选取
+        _results = state.get("results", {}) or {}
+        evidence = evidence_sections(_results)
+        if self.agent_context is not None:
+            context = self.agent_context.assemble_context(
+                SOLVE_CONTEXT_TOKENS,
+                query=str(state["task"]),
+                extra_sections=evidence,
+            )
+        else:
+            # 没有任务上下文时只使用步骤结果
+            context = "\n\n".join(section.text for section in evidence)
+        solve_prompt = SOLVE_PROMPT.format(
+            plan=plan, context=context, task=state["task"]
+        )
         result = self.deepseek_llm.invoke(solve_prompt)
 
         # 完成任务记录
@@ -697,7 +807,11 @@ class WriterPlanningAgent(AgentBase):
 
         # 新增：将最终结果写入 context summary
         if self.agent_context is not None:
-            self.agent_context.add_summary_entry("最终结果", str(result.content))
+            self.agent_context.upsert_section(
+                "summary", "最终结果", str(result.content)
+            )
+            # 任务完成，释放对共享产物的引用，允许其被淘汰
+            self.agent_context.release_artifacts()
 
         return {"result": result.content}
 
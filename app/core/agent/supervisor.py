@@ -25,6 +25,9 @@ class AgentState(MessagesState):
     """代理状态类，继承自MessagesState并添加next字段"""
 
     next: str
+    # 当前会话所属的用户和线程，用于隔离上下文工作空间
+    user_id: Optional[str]
+    thread_id: Optional[str]
 
 
 class Router(TypedDict):
@@ -76,6 +79,7 @@ class Supervisor(AgentBase):
         *,
         user_input: str,
         thread_id: str,
+        user_id: Optional[str] = None,
         collection: AsyncIOMotorCollection = Depends(get_message_collection),
     ) -> str:
         """
@@ -84,6 +88,7 @@ class Supervisor(AgentBase):
         Args:
             user_input: 用户输入
             thread_id: 线程ID
+            user_id: 用户ID
             collection: MongoDB集合
 
         Returns:
@@ -102,7 +107,9 @@ class Supervisor(AgentBase):
                 self.graph = self.initialize_agent()
 
             # 流式处理聊天
-            final_response = await self._process_chat_stream(all_messages)
+            final_response = await self._process_chat_stream(
+                all_messages, thread_id=thread_id, user_id=user_id
+            )
 
             # 保存聊天记录
             if final_response and collection is not None:
@@ -146,12 +153,19 @@ class Supervisor(AgentBase):
 
         return all_messages
 
-    async def _process_chat_stream(self, all_messages: List[AnyMessage]) -> str:
+    async def _process_chat_stream(
+        self,
+        all_messages: List[AnyMessage],
+        thread_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+    ) -> str:
         """
         处理聊天流
 
         Args:
             all_messages: 所有消息
+            thread_id: 线程ID
+            user_id: 用户ID
 
         Returns:
             最终回复
@@ -160,7 +174,10 @@ class Supervisor(AgentBase):
 
         # 创建初始状态，包含next字段
         initial_state = AgentState(
-            messages=all_messages, next="supervisor"  # 设置初始next值
+            messages=all_messages,
+            next="supervisor",  # 设置初始next值
+            user_id=user_id,
+            thread_id=thread_id,
         )
 
         if self.graph:
@@ -277,7 +294,9 @@ class Supervisor(AgentBase):
                 }
 
             # 创建创作规划代理并执行任务
-            planning_agent = WriterPlanningAgent()
+            planning_agent = WriterPlanningAgent(
+                user_id=state.get("user_id"), thread_id=state.get("thread_id")
+            )
 
             # 使用创作规划代理的测试方法
             execution_result = planning_agent.test_async_start_chat(str(user_input))
@@ -4,7 +4,55 @@ Agent上下文管理模块
 """
 
 from .agent_context import AgentContext
+from .artifact_cache import ArtifactCache
+from .async_context import AsyncAgentContext, AsyncFileContextManager
+from .cache_watcher import CacheInvalidationWatcher
+from .compaction import (
+    CompactionPolicy,
+    CompactionWorker,
+    get_shared_compaction_worker,
+)
+from .context_assembler import (
+    ContextAssembler,
+    ContextSection,
+    evidence_sections,
+)
+from .context_layout import namespaced_agent_id
+from .context_store import ContextStore
 from .context_tools import ContextTools
 from .file_context_manager import FileContextManager
+from .retention import RetentionEngine, RetentionPolicy
+from .search_index import ContextSearchIndex
+from .sqlite_context_store import SQLiteContextStore
+from .task_cache import TaskContextCache, get_shared_task_cache
+from .task_transfer import ImportedFile, ImportedTask, read_tasks
+from .todo_index import TodoItem, todo_item_id
 
-__all__ = ["FileContextManager", "AgentContext", "ContextTools"]
+__all__ = [
+    "ContextStore",
+    "FileContextManager",
+    "SQLiteContextStore",
+    "AgentContext",
+    "ContextTools",
+    "AsyncFileContextManager",
+    "AsyncAgentContext",
+    "TaskContextCache",
+    "get_shared_task_cache",
+    "namespaced_agent_id",
+    "TodoItem",
+    "todo_item_id",
+    "CompactionPolicy",
+    "CompactionWorker",
+    "get_shared_compaction_worker",
+    "ContextAssembler",
+    "ContextSection",
+    "evidence_sections",
+    "ImportedFile",
+    "ImportedTask",
+    "read_tasks",
+    "ArtifactCache",
+    "CacheInvalidationWatcher",
+    "ContextSearchIndex",
+    "RetentionEngine",
+    "RetentionPolicy",
+]
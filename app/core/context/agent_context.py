@@ -1,28 +1,74 @@
 """
 Agent上下文类
-集成文件系统上下文管理器，提供高级上下文管理功能
+集成上下文存储（默认文件系统，可切换为 SQLite），提供高级上下文管理功能
 """
 
 import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Union
-
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Union,
+)
+
+from .compaction import CompactionWorker, get_shared_compaction_worker
+from .context_assembler import ContextAssembler, ContextSection
+from .context_store import ContextBatch, ContextMutation, ContextStore
 from .file_context_manager import ContextFile, FileContextManager, TaskContext
+from .task_transfer import task_from_dict
+from .todo_index import TodoItem
+
+# 各 AgentContext 正在进行的批量提交（按 id 索引）。保存在 ContextVar 中，
+# 每个线程、每个协程只看到自己开启的批量提交，其他线程或协程的写操作直接写入
+_active_batches: ContextVar[Dict[int, ContextBatch]] = ContextVar(
+    "active_context_batches", default={}
+)
 
 
 class AgentContext:
     """Agent上下文管理类"""
 
-    def __init__(
-        self, agent_id: str, context_manager: Optional[FileContextManager] = None
-    ):
+    def __init__(self, agent_id: str, context_manager: Optional[ContextStore] = None):
         self.agent_id = agent_id
         self.context_manager = context_manager or FileContextManager()
         self.current_task_id: Optional[str] = None
         self.current_task_context: Optional[TaskContext] = None
+        # 后台压缩服务（enable_compaction 启用）
+        self.compaction_worker: Optional[CompactionWorker] = None
+        self.compaction_llm = None
+        # 提示词上下文组装器（首次调用 assemble_context 时创建）
+        self.context_assembler: Optional[ContextAssembler] = None
+
+    def enable_compaction(self, worker: Optional[CompactionWorker] = None, llm=None):
+        """启用后台压缩：写入后检查任务大小，超过阈值时在后台压缩（默认使用共享服务）"""
+        self.compaction_worker = worker or get_shared_compaction_worker()
+        self.compaction_llm = llm
+
+    def _after_write(self, written: bool, task_id: Optional[str] = None) -> bool:
+        """写入成功后通知后台压缩服务"""
+        if written and self.compaction_worker is not None:
+            self.compaction_worker.notify(
+                self.context_manager,
+                self.agent_id,
+                task_id or self.current_task_id,
+                self.compaction_llm,
+            )
+        return written
 
     def create_new_task(
-        self, title: str, description: str, task_id: Optional[str] = None, todo_items: Optional[List[str]] = None
+        self,
+        title: str,
+        description: str,
+        task_id: Optional[str] = None,
+        todo_items: Optional[List[Union[str, TodoItem]]] = None,
     ) -> str:
         """创建新任务"""
         if task_id is None:
@@ -44,6 +90,64 @@ class AgentContext:
             return True
         return False
 
+    @property
+    def _batch(self) -> Optional[ContextBatch]:
+        """当前线程/协程中 batch() 期间缓存的修改"""
+        return _active_batches.get().get(id(self))
+
+    @contextmanager
+    def batch(self) -> Iterator[ContextBatch]:
+        """
+        批量修改当前任务
+
+        代码块内的写操作先缓存在内存中（直接返回 True），退出时一次性提交：
+        每个文件只加载、写入一次，全部成功或全部不生效，结果记录在 batch.committed。
+        代码块抛出异常时丢弃缓存的修改；代码块内的读操作看不到尚未提交的修改。
+        嵌套调用时并入外层批量提交；只缓存当前线程（协程）的写操作
+        """
+        if self._batch is not None:
+            yield self._batch
+            return
+        if not self.current_task_id:
+            # 没有当前任务时写操作本身就会失败，无需缓存
+            yield ContextBatch(task_id="", committed=False)
+            return
+
+        batch = ContextBatch(task_id=self.current_task_id)
+        with self._activate_batch(batch):
+            yield batch
+        # 代码块正常结束才提交
+        self._commit_batch(batch)
+
+    @contextmanager
+    def _activate_batch(self, batch: ContextBatch) -> Iterator[None]:
+        """在当前线程/协程中开始缓存写操作"""
+        token = _active_batches.set({**_active_batches.get(), id(self): batch})
+        try:
+            yield
+        finally:
+            _active_batches.reset(token)
+
+    def _commit_batch(self, batch: ContextBatch) -> bool:
+        """一次性提交缓存的修改，结果记录在 batch.committed"""
+        batch.committed = self._after_write(
+            self.context_manager.apply_mutations(
+                self.agent_id, batch.task_id, batch.mutations
+            ),
+            batch.task_id,
+        )
+        if batch.committed and self.current_task_id == batch.task_id:
+            for mutation in batch.mutations:
+                if mutation.method == "update_task_status":
+                    self.current_task_context.status = mutation.args[0]
+                    self.current_task_context.updated_at = datetime.utcnow()
+        return batch.committed
+
+    def _queue(self, method: str, *args) -> bool:
+        """批量模式下缓存一次修改"""
+        self._batch.mutations.append(ContextMutation(method, args))
+        return True
+
     def get_current_task_id(self) -> Optional[str]:
         """获取当前任务ID"""
         return self.current_task_id
@@ -57,8 +161,13 @@ class AgentContext:
         if not self.current_task_id:
             return False
 
-        return self.context_manager.add_chat_message(
-            self.agent_id, self.current_task_id, role, content
+        if self._batch is not None:
+            return self._queue("add_chat_message", role, content)
+
+        return self._after_write(
+            self.context_manager.add_chat_message(
+                self.agent_id, self.current_task_id, role, content
+            )
         )
 
     def update_todo_progress(self, progress_updates: List[str]) -> bool:
@@ -66,8 +175,13 @@ class AgentContext:
         if not self.current_task_id:
             return False
 
-        return self.context_manager.update_todo_progress(
-            self.agent_id, self.current_task_id, progress_updates
+        if self._batch is not None:
+            return self._queue("update_todo_progress", progress_updates)
+
+        return self._after_write(
+            self.context_manager.update_todo_progress(
+                self.agent_id, self.current_task_id, progress_updates
+            )
         )
 
     def add_resource_link(self, title: str, url: str, description: str = "") -> bool:
@@ -75,8 +189,13 @@ class AgentContext:
         if not self.current_task_id:
             return False
 
-        return self.context_manager.add_resource_link(
-            self.agent_id, self.current_task_id, title, url, description
+        if self._batch is not None:
+            return self._queue("add_resource_link", title, url, description)
+
+        return self._after_write(
+            self.context_manager.add_resource_link(
+                self.agent_id, self.current_task_id, title, url, description
+            )
         )
 
     def add_summary_entry(self, section: str, content: str) -> bool:
@@ -84,8 +203,41 @@ class AgentContext:
         if not self.current_task_id:
             return False
 
-        return self.context_manager.add_summary_entry(
-            self.agent_id, self.current_task_id, section, content
+        if self._batch is not None:
+            return self._queue("add_summary_entry", section, content)
+
+        return self._after_write(
+            self.context_manager.add_summary_entry(
+                self.agent_id, self.current_task_id, section, content
+            )
+        )
+
+    def upsert_section(self, file_type: str, section: str, content: str) -> bool:
+        """写入 summary/todo 中的 "## section" 条目，已存在时原位替换"""
+        if not self.current_task_id:
+            return False
+
+        if self._batch is not None:
+            return self._queue("upsert_section", file_type, section, content)
+
+        return self._after_write(
+            self.context_manager.upsert_section(
+                self.agent_id, self.current_task_id, file_type, section, content
+            )
+        )
+
+    def delete_section(self, file_type: str, section: str) -> bool:
+        """删除 summary/todo 中的 "## section" 条目"""
+        if not self.current_task_id:
+            return False
+
+        if self._batch is not None:
+            return self._queue("delete_section", file_type, section)
+
+        return self._after_write(
+            self.context_manager.delete_section(
+                self.agent_id, self.current_task_id, file_type, section
+            )
         )
 
     def add_scratchpad_entry(self, content: str) -> bool:
@@ -93,8 +245,13 @@ class AgentContext:
         if not self.current_task_id:
             return False
 
-        return self.context_manager.add_scratchpad_entry(
-            self.agent_id, self.current_task_id, content
+        if self._batch is not None:
+            return self._queue("add_scratchpad_entry", content)
+
+        return self._after_write(
+            self.context_manager.add_scratchpad_entry(
+                self.agent_id, self.current_task_id, content
+            )
         )
 
     def get_context_summary(self) -> Dict[str, Any]:
@@ -106,155 +263,166 @@ class AgentContext:
             self.agent_id, self.current_task_id
         )
 
+    def get_context_size(self) -> Dict[str, Any]:
+        """获取当前任务的字节数、字符数和 token 数（只读取元数据）"""
+        if not self.current_task_id:
+            return {}
+
+        return self.context_manager.get_context_size(
+            self.agent_id, self.current_task_id
+        )
+
+    def assemble_context(
+        self,
+        budget: int,
+        query: Optional[str] = None,
+        sources: Optional[Sequence[str]] = None,
+        extra_sections: Optional[List[ContextSection]] = None,
+    ) -> str:
+        """按 token 预算组装当前任务的提示词上下文（没有当前任务时只使用额外条目）"""
+        if self.context_assembler is None:
+            self.context_assembler = ContextAssembler(self.context_manager)
+        return self.context_assembler.assemble(
+            self.agent_id,
+            self.current_task_id,
+            budget,
+            query=query,
+            sources=sources,
+            extra_sections=extra_sections,
+        )
+
+    def _artifact_holder(self) -> Optional[str]:
+        if self.current_task_id is None:
+            return None
+        return f"{self.agent_id}/{self.current_task_id}"
+
+    def cached_artifact(
+        self,
+        kind: str,
+        request: str,
+        compute: Callable[[], Optional[str]],
+        max_age: Optional[float] = None,
+    ) -> Optional[str]:
+        """
+        从共享产物缓存读取产物（如搜索结果、摘要），未命中时调用 compute 生成并发布
+
+        当前任务持有读到的产物，release_artifacts 之前不会被淘汰；
+        存储不支持产物缓存时直接调用 compute
+        """
+        cache = self.context_manager.get_artifact_cache()
+        if cache is None:
+            return compute()
+        return cache.get_or_compute(
+            kind, request, compute, max_age=max_age, holder=self._artifact_holder()
+        )
+
+    def invalidate_artifact(self, kind: str, request: str) -> bool:
+        """从共享产物缓存中删除产物"""
+        cache = self.context_manager.get_artifact_cache()
+        return cache.invalidate(kind, request) if cache is not None else False
+
+    def release_artifacts(self) -> int:
+        """释放当前任务持有的产物引用，返回释放的引用数"""
+        cache = self.context_manager.get_artifact_cache()
+        holder = self._artifact_holder()
+        if cache is None or holder is None:
+            return 0
+        return cache.release(holder)
+
+    def search_contexts(
+        self, query: str, k: int = 10, file_types: Optional[Sequence[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """检索所有 Agent 其他任务中的相关研究结果（排除当前任务）"""
+        exclude_task = None
+        if self.current_task_id is not None:
+            exclude_task = (self.agent_id, self.current_task_id)
+        return self.context_manager.search_contexts(
+            query, k, exclude_task=exclude_task, file_types=file_types
+        )
+
     def list_all_tasks(self) -> List[Dict[str, Any]]:
         """列出所有任务"""
         return self.context_manager.list_agent_tasks(self.agent_id)
 
     def get_task_file_content(self, file_type: str) -> Optional[str]:
-        """获取指定类型文件的内容"""
-        if not self.current_task_context:
+        """获取指定类型文件的内容（从存储读取最新内容）"""
+        if not self.current_task_id:
             return None
 
-        file_obj = self.current_task_context.files.get(file_type)
-        if file_obj:
-            return file_obj.content
-        return None
+        return self.context_manager.get_file_content(
+            self.agent_id, self.current_task_id, file_type
+        )
+
+    def append_to_task_file(self, file_type: str, append_text: str) -> bool:
+        """向当前任务的指定文件追加内容"""
+        if not self.current_task_id:
+            return False
+
+        if self._batch is not None:
+            return self._queue("append_file_content", file_type, append_text)
+
+        return self._after_write(
+            self.context_manager.append_to_task_file(
+                self.agent_id, self.current_task_id, file_type, append_text
+            )
+        )
 
     def update_task_status(self, status: str) -> bool:
         """更新任务状态"""
         if not self.current_task_context or not self.current_task_id:
             return False
 
+        if self._batch is not None:
+            return self._queue("update_task_status", status)
+
+        if not self.context_manager.update_task_status(
+            self.agent_id, self.current_task_id, status
+        ):
+            return False
+
         self.current_task_context.status = status
         self.current_task_context.updated_at = datetime.utcnow()
 
-        # 更新元数据
-        task_path = self.context_manager._get_task_path(
-            self.agent_id, self.current_task_id
-        )
-        self.context_manager._save_task_metadata(self.current_task_context, task_path)
-
         return True
 
-    def get_recent_chat_history(self, limit: int = 10) -> List[Dict[str, str]]:
-        """获取最近的聊天历史"""
-        if not self.current_task_context:
-            return []
-
-        history_file = self.current_task_context.files.get("history")
-        if not history_file:
+    def get_recent_chat_history(
+        self, limit: Optional[int] = 10, since: Optional[datetime] = None
+    ) -> List[Dict[str, str]]:
+        """获取最近的聊天历史（limit 为 None 时返回 since 之后的全部消息）"""
+        if not self.current_task_id:
             return []
 
-        # 简单的历史解析（可以根据需要改进）
-        lines = history_file.content.split("\n")
-        chat_history = []
-        current_role = None
-        current_content = []
-
-        for line in lines:
-            if line.startswith("### ") and ":" in line:
-                # 保存之前的消息
-                if current_role and current_content:
-                    chat_history.append(
-                        {
-                            "role": current_role,
-                            "content": "\n".join(current_content).strip(),
-                        }
-                    )
-
-                # 解析新消息
-                parts = line.split(":", 2)
-                if len(parts) >= 2:
-                    current_role = parts[1].strip()
-                    current_content = []
-            elif line.strip() and current_role:
-                current_content.append(line)
-
-        # 添加最后一条消息
-        if current_role and current_content:
-            chat_history.append(
-                {"role": current_role, "content": "\n".join(current_content).strip()}
-            )
-
-        return chat_history[-limit:]
+        return self.context_manager.get_chat_messages(
+            self.agent_id, self.current_task_id, limit, since
+        )
 
     def get_task_todo_items(self) -> List[str]:
         """获取待办事项列表"""
-        if not self.current_task_context:
-            return []
-
-        todo_file = self.current_task_context.files.get("todo")
-        if not todo_file:
+        if not self.current_task_id:
             return []
 
-        # 简单的待办事项解析
-        lines = todo_file.content.split("\n")
-        todo_items = []
-
-        for line in lines:
-            if line.strip().startswith("- [ ]"):
-                todo_items.append(line.strip()[4:].strip())
-
-        return todo_items
+        return self.context_manager.get_todo_items(self.agent_id, self.current_task_id)
 
     def mark_todo_completed(self, item_text: str) -> bool:
         """标记待办事项为完成"""
-        if not self.current_task_context or not self.current_task_id:
-            return False
-
-        todo_file = self.current_task_context.files.get("todo")
-        if not todo_file:
+        if not self.current_task_id:
             return False
 
-        # 更新待办事项状态
-        lines = todo_file.content.split("\n")
-        updated_lines = []
+        if self._batch is not None:
+            return self._queue("mark_todo_completed", item_text)
 
-        for line in lines:
-            if line.strip().startswith("- [ ]") and item_text in line:
-                # 标记为完成
-                updated_lines.append(line.replace("- [ ]", "- [x]"))
-            else:
-                updated_lines.append(line)
-
-        new_content = "\n".join(updated_lines)
-        return self.context_manager.update_file_content(
-            self.agent_id, self.current_task_id, "todo", new_content
+        return self._after_write(
+            self.context_manager.mark_todo_completed(
+                self.agent_id, self.current_task_id, item_text
+            )
         )
 
-    def get_task_resources(self) -> List[Dict[str, str]]:
+    def get_task_resources(self) -> List[Dict[str, Any]]:
         """获取任务资源列表"""
-        if not self.current_task_context:
-            return []
-
-        resource_file = self.current_task_context.files.get("resource")
-        if not resource_file:
+        if not self.current_task_id:
             return []
 
-        # 简单的资源解析
-        lines = resource_file.content.split("\n")
-        resources = []
-        current_resource = {}
-
-        for line in lines:
-            line = line.strip()
-            if line.startswith("## ") and not line.startswith("## 任务信息"):
-                # 保存之前的资源
-                if current_resource:
-                    resources.append(current_resource)
-
-                # 开始新资源
-                current_resource = {"title": line[3:].strip()}
-            elif line.startswith("- URL:") and current_resource:
-                current_resource["url"] = line[6:].strip()
-            elif line.startswith("- 描述:") and current_resource:
-                current_resource["description"] = line[5:].strip()
-
-        # 添加最后一个资源
-        if current_resource:
-            resources.append(current_resource)
-
-        return resources
+        return self.context_manager.get_resources(self.agent_id, self.current_task_id)
 
     def summarize_current_file_with_llm(
         self, file_type: str, llm, max_length: int = 200
@@ -286,18 +454,50 @@ class AgentContext:
         )
         return True
 
+    def list_file_versions(self, file_type: str) -> List[Dict[str, Any]]:
+        """列出当前任务指定文件的历史版本"""
+        if not self.current_task_id:
+            return []
+
+        return self.context_manager.list_file_versions(
+            self.agent_id, self.current_task_id, file_type
+        )
+
+    def get_file_version(self, file_type: str, version: int) -> Optional[str]:
+        """读取当前任务指定文件的历史版本"""
+        if not self.current_task_id:
+            return None
+
+        return self.context_manager.get_file_version(
+            self.agent_id, self.current_task_id, file_type, version
+        )
+
+    def rollback_file(self, file_type: str, version: int) -> bool:
+        """将当前任务的指定文件回滚到历史版本"""
+        if not self.current_task_id:
+            return False
+
+        return self.context_manager.rollback_file(
+            self.agent_id, self.current_task_id, file_type, version
+        )
+
     def export_task_context(self) -> Dict[str, Any]:
-        """导出任务上下文"""
-        if not self.current_task_context:
+        """导出任务上下文（从存储读取最新内容；大任务或批量导出使用 export_task_stream）"""
+        if not self.current_task_id:
+            return {}
+        task_context = self.context_manager.load_task_context(
+            self.agent_id, self.current_task_id
+        )
+        if not task_context:
             return {}
 
         return {
-            "task_id": self.current_task_context.task_id,
-            "title": self.current_task_context.title,
-            "description": self.current_task_context.description,
-            "status": self.current_task_context.status,
-            "created_at": self.current_task_context.created_at.isoformat(),
-            "updated_at": self.current_task_context.updated_at.isoformat(),
+            "task_id": task_context.task_id,
+            "title": task_context.title,
+            "description": task_context.description,
+            "status": task_context.status,
+            "created_at": task_context.created_at.isoformat(),
+            "updated_at": task_context.updated_at.isoformat(),
             "files": {
                 name: {
                     "name": file.name,
@@ -306,31 +506,39 @@ class AgentContext:
                     "version": file.version,
                     "metadata": file.metadata,
                 }
-                for name, file in self.current_task_context.files.items()
+                for name, file in task_context.files.items()
             },
-            "metadata": self.current_task_context.metadata,
+            "metadata": task_context.metadata,
         }
 
     def import_task_context(self, context_data: Dict[str, Any]) -> bool:
-        """导入任务上下文"""
+        """导入任务上下文（文件和元数据一次写入），导入后切换为当前任务"""
         try:
-            # 创建新任务
-            task_id = context_data.get("task_id", str(uuid.uuid4()))
-            title = context_data.get("title", "Imported Task")
-            description = context_data.get("description", "")
-
-            self.create_new_task(title, description, task_id)
-
-            # 导入文件内容
-            files_data = context_data.get("files", {})
-            for file_type, file_data in files_data.items():
-                content = file_data.get("content", "")
-                if content:
-                    self.context_manager.update_file_content(
-                        self.agent_id, task_id, file_type, content
-                    )
-
-            return True
+            task = task_from_dict(
+                {
+                    **context_data,
+                    "task_id": context_data.get("task_id") or str(uuid.uuid4()),
+                }
+            )
+            if not self.context_manager.import_task_batch(self.agent_id, [task]):
+                return False
+            return self.load_task(task.task_id)
         except Exception as e:
             print(f"导入任务上下文失败: {e}")
             return False
+
+    def export_task_stream(
+        self, task_ids: Optional[List[str]] = None
+    ) -> Iterator[bytes]:
+        """以 NDJSON 流导出任务（默认当前任务），格式见 task_transfer"""
+        if task_ids is None:
+            task_ids = [self.current_task_id] if self.current_task_id else []
+        return self.context_manager.export_tasks(self.agent_id, task_ids)
+
+    def import_task_stream(
+        self, source: Iterable[Union[bytes, str]], batch_size: int = 500
+    ) -> Dict[str, Any]:
+        """将 NDJSON 流中的任务导入到当前 Agent"""
+        return self.context_manager.import_tasks(
+            source, agent_id=self.agent_id, batch_size=batch_size
+        )
@@ -0,0 +1,393 @@
+"""
+跨任务共享的产物缓存
+搜索结果、摘要和大纲等产物按内容寻址存放在 shared/ 工作空间，同一请求的产物被后续任务
+（包括其他 Agent 的任务）直接复用，无需再次调用搜索接口或 LLM：
+
+    objects/<ab>/<sha256>   产物内容，先写临时文件再重命名发布，读取时按摘要校验
+    artifacts.sqlite        请求键 -> 内容摘要、创建和访问时间，内容的引用计数，
+                            以及任务对产物的引用
+
+总大小超过上限时按最近访问时间淘汰没有被任务引用的产物
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from .atomic_io import atomic_write_bytes
+from .resource_registry import normalize_url
+
+# 默认缓存上限
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# 任务引用的有效期（秒），进程异常退出未释放的引用过期后不再阻止淘汰
+DEFAULT_REF_TTL = 24 * 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_entries_access ON entries (last_access);
+CREATE TABLE IF NOT EXISTS objects (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    refcount INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS refs (
+    key TEXT NOT NULL,
+    holder TEXT NOT NULL,
+    acquired_at REAL NOT NULL,
+    PRIMARY KEY (key, holder)
+);
+CREATE INDEX IF NOT EXISTS idx_refs_holder ON refs (holder);
+"""
+
+
+def normalize_request(request: str) -> str:
+    """规范化请求：URL 按 normalize_url 规范化，其他文本合并连续空白"""
+    request = " ".join(str(request).split())
+    if "://" in request and " " not in request:
+        try:
+            return normalize_url(request)
+        except ValueError:
+            pass
+    return request
+
+
+def artifact_key(kind: str, request: str) -> str:
+    """产物的请求键（产物类型 + 规范化请求的 sha256）"""
+    data = f"{kind}\0{normalize_request(request)}".encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+class ArtifactCache:
+    """内容寻址的产物缓存（线程安全，多个进程可共用同一目录）"""
+
+    def __init__(
+        self,
+        root: Path,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ref_ttl: float = DEFAULT_REF_TTL,
+    ):
+        self.root = Path(root)
+        self.objects_path = self.root / "objects"
+        self.objects_path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ref_ttl = ref_ttl
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(
+            str(self.root / "artifacts.sqlite"),
+            timeout=30,
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        # 正在计算的请求键 -> [锁, 等待数]，同一进程内相同请求只计算一次
+        self._inflight: Dict[str, List[Any]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.puts = 0
+        self.evictions = 0
+
+    def close(self):
+        """关闭索引库连接"""
+        with self._lock:
+            self._conn.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """写事务（BEGIN IMMEDIATE，跨进程串行化读改写）"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _object_path(self, digest: str) -> Path:
+        return self.objects_path / digest[:2] / digest
+
+    def _unlink_objects(self, digests: List[str]):
+        """删除引用计数归零的内容文件（在索引事务提交之后调用）"""
+        for digest in digests:
+            try:
+                self._object_path(digest).unlink()
+            except FileNotFoundError:
+                pass
+
+    def _drop_entries(self, conn: sqlite3.Connection, keys: List[str]) -> List[str]:
+        """删除请求键并减少内容的引用计数，返回引用计数归零的内容摘要"""
+        orphaned = []
+        for key in keys:
+            row = conn.execute(
+                "SELECT digest FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                continue
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            conn.execute("DELETE FROM refs WHERE key = ?", (key,))
+            orphaned += self._release_object(conn, row["digest"])
+        return orphaned
+
+    @staticmethod
+    def _release_object(conn: sqlite3.Connection, digest: str) -> List[str]:
+        conn.execute(
+            "UPDATE objects SET refcount = refcount - 1 WHERE digest = ?", (digest,)
+        )
+        deleted = conn.execute(
+            "DELETE FROM objects WHERE digest = ? AND refcount <= 0", (digest,)
+        ).rowcount
+        return [digest] if deleted else []
+
+    def get(
+        self,
+        kind: str,
+        request: str,
+        max_age: Optional[float] = None,
+        holder: Optional[str] = None,
+    ) -> Optional[str]:
+        """
+        读取产物
+
+        Args:
+            max_age: 产物的最长有效期（秒），超过时视为未命中
+            holder: 引用产物的任务（如 "agent_id/task_id"），释放前产物不会被淘汰
+
+        Returns:
+            产物内容，未命中时返回 None
+        """
+        return self._get(artifact_key(kind, request), max_age, holder)
+
+    def _get(
+        self, key: str, max_age: Optional[float], holder: Optional[str]
+    ) -> Optional[str]:
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT digest, created_at FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+            if row is None or (
+                max_age is not None and time.time() - row["created_at"] > max_age
+            ):
+                self.misses += 1
+                return None
+
+            digest = row["digest"]
+            try:
+                data = self._object_path(digest).read_bytes()
+            except FileNotFoundError:
+                data = None
+            if data is None or hashlib.sha256(data).hexdigest() != digest:
+                # 内容文件丢失或损坏（如被并发淘汰），删除索引项后按未命中处理
+                with self._transaction() as conn:
+                    orphaned = self._drop_entries(conn, [key])
+                self._unlink_objects(orphaned)
+                self.misses += 1
+                return None
+
+            now = time.time()
+            with self._transaction() as conn:
+                conn.execute(
+                    "UPDATE entries SET last_access = ?, hits = hits + 1 "
+                    "WHERE key = ?",
+                    (now, key),
+                )
+                if holder:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO refs (key, holder, acquired_at) "
+                        "VALUES (?, ?, ?)",
+                        (key, holder, now),
+                    )
+            self.hits += 1
+            return data.decode("utf-8")
+        except Exception as e:
+            print(f"读取产物缓存失败: {e}")
+            return None
+
+    def put(
+        self, kind: str, request: str, content: str, holder: Optional[str] = None
+    ) -> bool:
+        """发布产物（同一请求的旧产物被替换），超过容量上限时淘汰最久未访问的产物"""
+        return self._put(artifact_key(kind, request), kind, content, holder)
+
+    def _put(
+        self, key: str, kind: str, content: str, holder: Optional[str]
+    ) -> bool:
+        data = content.encode("utf-8")
+        if len(data) > self.max_bytes:
+            return False
+        digest = hashlib.sha256(data).hexdigest()
+        try:
+            # 先发布内容文件，再提交索引项：读者看到索引项时内容一定完整
+            object_path = self._object_path(digest)
+            object_path.parent.mkdir(exist_ok=True)
+            atomic_write_bytes(object_path, data, fsync=False)
+
+            now = time.time()
+            orphaned: List[str] = []
+            with self._transaction() as conn:
+                previous = conn.execute(
+                    "SELECT digest FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+                if previous is not None and previous["digest"] == digest:
+                    conn.execute(
+                        "UPDATE entries SET created_at = ?, last_access = ? "
+                        "WHERE key = ?",
+                        (now, now, key),
+                    )
+                else:
+                    conn.execute(
+                        "INSERT INTO objects (digest, size, refcount) VALUES (?, ?, 1) "
+                        "ON CONFLICT(digest) DO UPDATE SET refcount = refcount + 1",
+                        (digest, len(data)),
+                    )
+                    if previous is not None:
+                        orphaned += self._release_object(conn, previous["digest"])
+                    conn.execute(
+                        "INSERT OR REPLACE INTO entries "
+                        "(key, kind, digest, created_at, last_access, hits) "
+                        "VALUES (?, ?, ?, ?, ?, 0)",
+                        (key, kind, digest, now, now),
+                    )
+                if holder:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO refs (key, holder, acquired_at) "
+                        "VALUES (?, ?, ?)",
+                        (key, holder, now),
+                    )
+                orphaned += self._evict(conn, self.max_bytes, now)
+            self._unlink_objects(orphaned)
+            self.puts += 1
+            return True
+        except Exception as e:
+            print(f"写入产物缓存失败: {e}")
+            return False
+
+    def get_or_compute(
+        self,
+        kind: str,
+        request: str,
+        compute: Callable[[], Optional[str]],
+        max_age: Optional[float] = None,
+        holder: Optional[str] = None,
+    ) -> Optional[str]:
+        """
+        读取产物，未命中时调用 compute 生成并发布
+
+        同一进程内并发的相同请求只调用一次 compute；compute 返回 None 或空字符串
+        （如搜索失败）时不写入缓存，异常原样抛出
+        """
+        key = artifact_key(kind, request)
+        with self._lock:
+            inflight = self._inflight.setdefault(key, [threading.Lock(), 0])
+            inflight[1] += 1
+        try:
+            with inflight[0]:
+                content = self._get(key, max_age, holder)
+                if content is None:
+                    content = compute()
+                    if content:
+                        self._put(key, kind, content, holder)
+                return content
+        finally:
+            with self._lock:
+                inflight[1] -= 1
+                if not inflight[1]:
+                    del self._inflight[key]
+
+    def invalidate(self, kind: str, request: str) -> bool:
+        """删除产物（如用户拒绝了缓存的大纲）"""
+        try:
+            with self._transaction() as conn:
+                orphaned = self._drop_entries(conn, [artifact_key(kind, request)])
+            self._unlink_objects(orphaned)
+            return True
+        except Exception as e:
+            print(f"删除产物缓存失败: {e}")
+            return False
+
+    def release(self, holder: str) -> int:
+        """释放任务持有的全部引用，返回释放的引用数"""
+        try:
+            with self._transaction() as conn:
+                released = conn.execute(
+                    "DELETE FROM refs WHERE holder = ?", (holder,)
+                ).rowcount
+                orphaned = self._evict(conn, self.max_bytes, time.time())
+            self._unlink_objects(orphaned)
+            return released
+        except Exception as e:
+            print(f"释放产物引用失败: {e}")
+            return 0
+
+    def evict(self, max_bytes: Optional[int] = None) -> int:
+        """按最近访问时间淘汰未被引用的产物，直到总大小不超过 max_bytes，返回淘汰数"""
+        evictions = self.evictions
+        with self._transaction() as conn:
+            orphaned = self._evict(
+                conn, self.max_bytes if max_bytes is None else max_bytes, time.time()
+            )
+        self._unlink_objects(orphaned)
+        return self.evictions - evictions
+
+    def _evict(
+        self, conn: sqlite3.Connection, max_bytes: int, now: float
+    ) -> List[str]:
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+        if total <= max_bytes:
+            return []
+        candidates = conn.execute(
+            "SELECT e.key, o.size, o.refcount FROM entries e "
+            "JOIN objects o ON o.digest = e.digest "
+            "WHERE NOT EXISTS (SELECT 1 FROM refs r "
+            "WHERE r.key = e.key AND r.acquired_at > ?) "
+            "ORDER BY e.last_access",
+            (now - self.ref_ttl,),
+        )
+        keys = []
+        for row in candidates:
+            if total <= max_bytes:
+                break
+            keys.append(row["key"])
+            # 内容被多个请求共用时，淘汰其中一个请求不会释放空间
+            if row["refcount"] == 1:
+                total -= row["size"]
+        self.evictions += len(keys)
+        return self._drop_entries(conn, keys)
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存的汇总指标"""
+        with self._lock:
+            entries, referenced = self._conn.execute(
+                "SELECT COUNT(DISTINCT e.key), COUNT(DISTINCT r.key) FROM entries e "
+                "LEFT JOIN refs r ON r.key = e.key"
+            ).fetchone()
+            objects, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM objects"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "referenced": referenced,
+            "objects": objects,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "puts": self.puts,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,729 @@
+"""
+异步上下文管理
+为 asyncio 代码提供 ContextStore（FileContextManager 等）/ AgentContext 的异步版本，
+文件 I/O 在有界线程池中执行，同一任务的写操作按顺序串行，避免阻塞事件循环
+"""
+
+import asyncio
+import functools
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from .agent_context import AgentContext
+from .context_assembler import ContextSection
+from .context_store import ContextBatch, ContextMutation, ContextStore
+from .file_context_manager import FileContextManager, TaskContext
+from .todo_index import TodoItem
+
+
+class AsyncFileContextManager:
+    """ContextStore 的异步封装（默认使用 FileContextManager）"""
+
+    def __init__(
+        self,
+        context_manager: Optional[ContextStore] = None,
+        max_workers: int = 4,
+    ):
+        self.context_manager = context_manager or FileContextManager()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="context-io"
+        )
+        # 每个任务一把 asyncio 锁；无协程引用时自动回收
+        self._write_locks: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """在 I/O 线程池中执行同步函数"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+    def task_write_lock(self, agent_id: str, task_id: str) -> asyncio.Lock:
+        """获取任务级写锁，保证同一任务的写操作按提交顺序执行"""
+        key = (agent_id, task_id)
+        lock = self._write_locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._write_locks[key] = lock
+        return lock
+
+    async def _write(
+        self, agent_id: str, task_id: str, func: Callable, *args, **kwargs
+    ) -> Any:
+        """串行执行同一任务的写操作"""
+        async with self.task_write_lock(agent_id, task_id):
+            return await self.run(func, agent_id, task_id, *args, **kwargs)
+
+    async def close(self):
+        """落盘待提交内容并关闭线程池"""
+        await self.run(self.context_manager.flush)
+        self._executor.shutdown(wait=True)
+
+    async def create_task_context(
+        self,
+        agent_id: str,
+        task_id: str,
+        title: str,
+        description: str,
+        todo_items: Optional[List[Union[str, TodoItem]]] = None,
+    ) -> TaskContext:
+        """创建新的任务上下文"""
+        return await self._write(
+            agent_id,
+            task_id,
+            self.context_manager.create_task_context,
+            title,
+            description,
+            todo_items=todo_items,
+        )
+
+    async def load_task_context(
+        self, agent_id: str, task_id: str
+    ) -> Optional[TaskContext]:
+        """加载任务上下文"""
+        return await self.run(
+            self.context_manager.load_task_context, agent_id, task_id
+        )
+
+    async def update_file_content(
+        self,
+        agent_id: str,
+        task_id: str,
+        file_type: str,
+        content: str,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> bool:
+        """更新文件内容"""
+        return await self._write(
+            agent_id,
+            task_id,
+            self.context_manager.update_file_content,
+            file_type,
+            content,
+            metadata,
+        )
+
+    async def append_file_content(
+        self, agent_id: str, task_id: str, file_type: str, append_text: str
+    ) -> bool:
+        """追加文件内容"""
+        return await self._write(
+            agent_id,
+            task_id,
+            self.context_manager.append_file_content,
+            file_type,
+            append_text,
+        )
+
+    async def append_to_task_file(
+        self, agent_id: str, task_id: str, file_type: str, append_text: str
+    ) -> bool:
+        """向指定类型的任务文件追加内容"""
+        return await self._write(
+            agent_id,
+            task_id,
+            self.context_manager.append_to_task_file,
+            file_type,
+            append_text,
+        )
+
+    async def update_task_status(
+        self, agent_id: str, task_id: str, status: str
+    ) -> bool:
+        """更新任务状态"""
+        return await self._write(
+            agent_id, task_id, self.context_manager.update_task_status, status
+        )
+
+    async def add_chat_message(
+        self, agent_id: str, task_id: str, role: str, content: str
+    ) -> bool:
+        """添加聊天消息到历史记录"""
+        return await self._write(
+            agent_id, task_id, self.context_manager.add_chat_message, role, content
+        )
+
+    async def update_todo_progress(
+        self, agent_id: str, task_id: str, progress_updates: List[str]
+    ) -> bool:
+        """更新待办事项进度"""
+        return await self._write(
+            agent_id,
+            task_id,
+            self.context_manager.update_todo_progress,
+            progress_updates,
+        )
+
+    async def add_resource_link(
+        self, agent_id: str, task_id: str, title: str, url: str, description: str = ""
+    ) -> bool:
+        """添加资源链接"""
+        return await self._write(
+            agent_id,
+            task_id,
+            self.context_manager.add_resource_link,
+            title,
+            url,
+            description,
+        )
+
+    async def add_summary_entry(
+        self, agent_id: str, task_id: str, section: str, content: str
+    ) -> bool:
+        """添加总结条目"""
+        return await self._write(
+            agent_id, task_id, self.context_manager.add_summary_entry, section, content
+        )
+
+    async def upsert_section(
+        self, agent_id: str, task_id: str, file_type: str, section: str, content: str
+    ) -> bool:
+        """写入或替换 summary/todo 中的条目"""
+        return await self._write(
+            agent_id,
+            task_id,
+            self.context_manager.upsert_section,
+            file_type,
+            section,
+            content,
+        )
+
+    async def delete_section(
+        self, agent_id: str, task_id: str, file_type: str, section: str
+    ) -> bool:
+        """删除 summary/todo 中的条目"""
+        return await self._write(
+            agent_id, task_id, self.context_manager.delete_section, file_type, section
+        )
+
+    async def add_scratchpad_entry(
+        self, agent_id: str, task_id: str, content: str
+    ) -> bool:
+        """添加临时笔记"""
+        return await self._write(
+            agent_id, task_id, self.context_manager.add_scratchpad_entry, content
+        )
+
+    async def apply_mutations(
+        self, agent_id: str, task_id: str, mutations: Sequence[ContextMutation]
+    ) -> bool:
+        """批量提交修改（一次加载，每个文件最多写入一次）"""
+        return await self._write(
+            agent_id, task_id, self.context_manager.apply_mutations, mutations
+        )
+
+    async def get_file_content(
+        self, agent_id: str, task_id: str, file_type: str
+    ) -> Optional[str]:
+        """获取指定类型文件的完整内容"""
+        return await self.run(
+            self.context_manager.get_file_content, agent_id, task_id, file_type
+        )
+
+    async def get_chat_messages(
+        self,
+        agent_id: str,
+        task_id: str,
+        limit: Optional[int] = None,
+        since: Optional[datetime] = None,
+    ) -> List[Dict[str, str]]:
+        """获取聊天消息"""
+        return await self.run(
+            self.context_manager.get_chat_messages, agent_id, task_id, limit, since
+        )
+
+    async def get_todo_items(
+        self, agent_id: str, task_id: str, include_completed: bool = False
+    ) -> List[str]:
+        """获取待办事项文本"""
+        return await self.run(
+            self.context_manager.get_todo_items, agent_id, task_id, include_completed
+        )
+
+    async def mark_todo_completed(
+        self, agent_id: str, task_id: str, item_text: str
+    ) -> bool:
+        """标记待办事项为完成"""
+        return await self._write(
+            agent_id, task_id, self.context_manager.mark_todo_completed, item_text
+        )
+
+    async def get_resources(
+        self, agent_id: str, task_id: str
+    ) -> List[Dict[str, Any]]:
+        """获取资源链接列表"""
+        return await self.run(self.context_manager.get_resources, agent_id, task_id)
+
+    async def get_context_summary(self, agent_id: str, task_id: str) -> Dict[str, Any]:
+        """获取上下文摘要"""
+        return await self.run(
+            self.context_manager.get_context_summary, agent_id, task_id
+        )
+
+    async def get_context_size(self, agent_id: str, task_id: str) -> Dict[str, Any]:
+        """获取任务的字节数、字符数和 token 数"""
+        return await self.run(self.context_manager.get_context_size, agent_id, task_id)
+
+    async def list_agent_tasks(
+        self,
+        agent_id: str,
+        status: Union[str, Sequence[str], None] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """列出Agent的任务"""
+        return await self.run(
+            self.context_manager.list_agent_tasks, agent_id, status, limit, cursor
+        )
+
+    async def search_contexts(
+        self,
+        query: str,
+        k: int = 10,
+        agent_id: Optional[str] = None,
+        exclude_task: Optional[Tuple[str, str]] = None,
+        file_types: Optional[Sequence[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """全文检索所有任务的上下文"""
+        return await self.run(
+            self.context_manager.search_contexts,
+            query,
+            k,
+            agent_id,
+            exclude_task,
+            file_types,
+        )
+
+    async def list_agent_tasks_page(
+        self,
+        agent_id: str,
+        status: Union[str, Sequence[str], None] = None,
+        page_size: Optional[int] = 50,
+        cursor: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """分页列出Agent的任务"""
+        return await self.run(
+            self.context_manager.list_agent_tasks_page,
+            agent_id,
+            status,
+            page_size,
+            cursor,
+        )
+
+    async def cleanup_old_versions(
+        self, agent_id: str, task_id: str, keep_versions: int = 5
+    ):
+        """清理旧版本文件"""
+        return await self._write(
+            agent_id, task_id, self.context_manager.cleanup_old_versions, keep_versions
+        )
+
+    async def list_file_versions(
+        self, agent_id: str, task_id: str, file_type: str
+    ) -> List[Dict[str, Any]]:
+        """列出文件的历史版本"""
+        return await self.run(
+            self.context_manager.list_file_versions, agent_id, task_id, file_type
+        )
+
+    async def get_file_version(
+        self, agent_id: str, task_id: str, file_type: str, version: int
+    ) -> Optional[str]:
+        """读取文件的指定历史版本"""
+        return await self.run(
+            self.context_manager.get_file_version, agent_id, task_id, file_type, version
+        )
+
+    async def rollback_file(
+        self, agent_id: str, task_id: str, file_type: str, version: int
+    ) -> bool:
+        """将文件回滚到指定历史版本"""
+        return await self._write(
+            agent_id, task_id, self.context_manager.rollback_file, file_type, version
+        )
+
+    async def summarize_file_with_llm(
+        self, agent_id: str, task_id: str, file_type: str, llm, max_length: int = 200
+    ) -> bool:
+        """对指定文件用LLM生成摘要"""
+        return await self._write(
+            agent_id,
+            task_id,
+            self.context_manager.summarize_file_with_llm,
+            file_type,
+            llm,
+            max_length=max_length,
+        )
+
+    async def summarize_task_context_with_llm(
+        self, agent_id: str, task_id: str, llm, max_size: int = 10000
+    ) -> bool:
+        """对整个任务上下文用LLM摘要压缩"""
+        return await self._write(
+            agent_id,
+            task_id,
+            self.context_manager.summarize_task_context_with_llm,
+            llm,
+            max_size=max_size,
+        )
+
+    async def archive_idle_tasks(
+        self,
+        idle_days: float = 30,
+        agent_id: Optional[str] = None,
+        status: Union[str, Sequence[str], None] = None,
+        limit: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """归档长期未更新的任务"""
+        return await self.run(
+            self.context_manager.archive_idle_tasks, idle_days, agent_id, status, limit
+        )
+
+    async def delete_task(
+        self,
+        agent_id: str,
+        task_id: str,
+        idle_before: Optional[datetime] = None,
+        statuses: Optional[Sequence[str]] = None,
+    ) -> Optional[int]:
+        """永久删除任务，返回释放的字节数（条件在加锁后重新检查）"""
+        return await self._write(
+            agent_id,
+            task_id,
+            self.context_manager.delete_task,
+            idle_before=idle_before,
+            statuses=statuses,
+        )
+
+    async def migrate_layout(
+        self, agent_id: Optional[str] = None, limit: Optional[int] = None
+    ) -> Dict[str, int]:
+        """将旧版平铺布局在线迁移到分桶布局"""
+        return await self.run(self.context_manager.migrate_layout, agent_id, limit)
+
+    async def export_tasks(
+        self, agent_id: str, task_ids: Optional[Iterable[str]] = None
+    ) -> AsyncIterator[bytes]:
+        """以 NDJSON 流导出任务，每行在线程池中生成，可直接作为 HTTP 流式响应体"""
+        async for line in self.iterate(
+            self.context_manager.export_tasks(agent_id, task_ids)
+        ):
+            yield line
+
+    async def iterate(self, iterator: Iterator[Any]) -> AsyncIterator[Any]:
+        """在线程池中逐项推进同步迭代器"""
+        done = object()
+        while True:
+            item = await self.run(next, iterator, done)
+            if item is done:
+                return
+            yield item
+
+    async def import_tasks(
+        self,
+        source: Iterable[Union[bytes, str]],
+        agent_id: Optional[str] = None,
+        batch_size: int = 500,
+    ) -> Dict[str, Any]:
+        """导入 NDJSON 流中的任务（source 为同步可迭代对象，如文件对象）"""
+        return await self.run(
+            self.context_manager.import_tasks, source, agent_id, batch_size
+        )
+
+    def get_archive_stats(self) -> Dict[str, Any]:
+        """获取归档节省的字节数和还原延迟"""
+        return self.context_manager.get_archive_stats()
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """获取任务上下文缓存的命中统计"""
+        return self.context_manager.get_cache_stats()
+
+    def get_lock_stats(self) -> Dict[str, Any]:
+        """获取任务锁等待的汇总指标"""
+        return self.context_manager.get_lock_stats()
+
+
+class AsyncAgentContext:
+    """AgentContext 的异步封装，方法与 AgentContext 一一对应"""
+
+    def __init__(
+        self,
+        agent_id: str,
+        context_manager: Optional[AsyncFileContextManager] = None,
+    ):
+        self.context_manager = context_manager or AsyncFileContextManager()
+        self.sync_context = AgentContext(agent_id, self.context_manager.context_manager)
+
+    @property
+    def agent_id(self) -> str:
+        return self.sync_context.agent_id
+
+    @property
+    def current_task_id(self) -> Optional[str]:
+        return self.sync_context.current_task_id
+
+    @property
+    def current_task_context(self) -> Optional[TaskContext]:
+        return self.sync_context.current_task_context
+
+    async def _read(self, func: Callable, *args, **kwargs) -> Any:
+        """在线程池中执行只读操作"""
+        return await self.context_manager.run(func, *args, **kwargs)
+
+    async def _write(self, func: Callable, *args, **kwargs) -> Any:
+        """串行执行当前任务的写操作（本协程的批量提交期间只缓存修改）"""
+        if self.sync_context._batch is not None:
+            return func(*args, **kwargs)
+        task_id = self.sync_context.current_task_id
+        if task_id is None:
+            return await self._read(func, *args, **kwargs)
+        async with self.context_manager.task_write_lock(self.agent_id, task_id):
+            return await self._read(func, *args, **kwargs)
+
+    @asynccontextmanager
+    async def batch(self) -> AsyncIterator[ContextBatch]:
+        """
+        批量修改当前任务（AgentContext.batch 的异步版本）
+
+        代码块内本协程的写操作只缓存修改，退出时在线程池中一次性提交，
+        全部成功或全部不生效，结果记录在 batch.committed。
+        批量提交状态按协程隔离：其他协程同时进行的写操作照常直接写入
+        """
+        sync_context = self.sync_context
+        if sync_context._batch is not None:
+            yield sync_context._batch
+            return
+        if not sync_context.current_task_id:
+            yield ContextBatch(task_id="", committed=False)
+            return
+
+        batch = ContextBatch(task_id=sync_context.current_task_id)
+        # 代码块抛出异常时丢弃缓存的修改
+        with sync_context._activate_batch(batch):
+            yield batch
+        await self._write(sync_context._commit_batch, batch)
+
+    async def create_new_task(
+        self,
+        title: str,
+        description: str,
+        task_id: Optional[str] = None,
+        todo_items: Optional[List[Union[str, TodoItem]]] = None,
+    ) -> str:
+        """创建新任务"""
+        return await self._read(
+            self.sync_context.create_new_task,
+            title,
+            description,
+            task_id,
+            todo_items=todo_items,
+        )
+
+    async def load_task(self, task_id: str) -> bool:
+        """加载指定任务"""
+        return await self._read(self.sync_context.load_task, task_id)
+
+    def get_current_task_id(self) -> Optional[str]:
+        """获取当前任务ID"""
+        return self.sync_context.get_current_task_id()
+
+    def get_current_task_context(self) -> Optional[TaskContext]:
+        """获取当前任务上下文"""
+        return self.sync_context.get_current_task_context()
+
+    async def add_chat_message(self, role: str, content: str) -> bool:
+        """添加聊天消息"""
+        return await self._write(self.sync_context.add_chat_message, role, content)
+
+    async def update_todo_progress(self, progress_updates: List[str]) -> bool:
+        """更新待办事项进度"""
+        return await self._write(
+            self.sync_context.update_todo_progress, progress_updates
+        )
+
+    async def add_resource_link(
+        self, title: str, url: str, description: str = ""
+    ) -> bool:
+        """添加资源链接"""
+        return await self._write(
+            self.sync_context.add_resource_link, title, url, description
+        )
+
+    async def add_summary_entry(self, section: str, content: str) -> bool:
+        """添加总结条目"""
+        return await self._write(self.sync_context.add_summary_entry, section, content)
+
+    async def upsert_section(self, file_type: str, section: str, content: str) -> bool:
+        """写入或替换 summary/todo 中的条目"""
+        return await self._write(
+            self.sync_context.upsert_section, file_type, section, content
+        )
+
+    async def delete_section(self, file_type: str, section: str) -> bool:
+        """删除 summary/todo 中的条目"""
+        return await self._write(self.sync_context.delete_section, file_type, section)
+
+    async def add_scratchpad_entry(self, content: str) -> bool:
+        """添加临时笔记"""
+        return await self._write(self.sync_context.add_scratchpad_entry, content)
+
+    async def get_context_summary(self) -> Dict[str, Any]:
+        """获取当前任务上下文摘要"""
+        return await self._read(self.sync_context.get_context_summary)
+
+    async def get_context_size(self) -> Dict[str, Any]:
+        """获取当前任务的字节数、字符数和 token 数"""
+        return await self._read(self.sync_context.get_context_size)
+
+    async def assemble_context(
+        self,
+        budget: int,
+        query: Optional[str] = None,
+        sources: Optional[Sequence[str]] = None,
+        extra_sections: Optional[List[ContextSection]] = None,
+    ) -> str:
+        """按 token 预算组装当前任务的提示词上下文"""
+        return await self._read(
+            self.sync_context.assemble_context,
+            budget,
+            query=query,
+            sources=sources,
+            extra_sections=extra_sections,
+        )
+
+    async def cached_artifact(
+        self,
+        kind: str,
+        request: str,
+        compute: Callable[[], Optional[str]],
+        max_age: Optional[float] = None,
+    ) -> Optional[str]:
+        """从共享产物缓存读取产物，未命中时在线程池中调用 compute 生成并发布"""
+        return await self._read(
+            self.sync_context.cached_artifact, kind, request, compute, max_age
+        )
+
+    async def release_artifacts(self) -> int:
+        """释放当前任务持有的产物引用"""
+        return await self._read(self.sync_context.release_artifacts)
+
+    async def search_contexts(
+        self, query: str, k: int = 10, file_types: Optional[Sequence[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """检索其他任务中的相关研究结果"""
+        return await self._read(
+            self.sync_context.search_contexts, query, k, file_types
+        )
+
+    async def list_all_tasks(self) -> List[Dict[str, Any]]:
+        """列出所有任务"""
+        return await self._read(self.sync_context.list_all_tasks)
+
+    async def get_task_file_content(self, file_type: str) -> Optional[str]:
+        """获取指定类型文件的内容"""
+        return await self._read(self.sync_context.get_task_file_content, file_type)
+
+    async def append_to_task_file(self, file_type: str, append_text: str) -> bool:
+        """向当前任务的指定文件追加内容"""
+        return await self._write(
+            self.sync_context.append_to_task_file, file_type, append_text
+        )
+
+    async def update_task_status(self, status: str) -> bool:
+        """更新任务状态"""
+        return await self._write(self.sync_context.update_task_status, status)
+
+    async def get_recent_chat_history(
+        self, limit: Optional[int] = 10, since: Optional[datetime] = None
+    ) -> List[Dict[str, str]]:
+        """获取最近的聊天历史"""
+        return await self._read(self.sync_context.get_recent_chat_history, limit, since)
+
+    async def get_task_todo_items(self) -> List[str]:
+        """获取待办事项列表"""
+        return await self._read(self.sync_context.get_task_todo_items)
+
+    async def mark_todo_completed(self, item_text: str) -> bool:
+        """标记待办事项为完成"""
+        return await self._write(self.sync_context.mark_todo_completed, item_text)
+
+    async def get_task_resources(self) -> List[Dict[str, Any]]:
+        """获取任务资源列表"""
+        return await self._read(self.sync_context.get_task_resources)
+
+    async def summarize_current_file_with_llm(
+        self, file_type: str, llm, max_length: int = 200
+    ) -> bool:
+        """对当前任务的指定文件用LLM生成摘要"""
+        return await self._write(
+            self.sync_context.summarize_current_file_with_llm,
+            file_type,
+            llm,
+            max_length=max_length,
+        )
+
+    async def summarize_current_task_context_with_llm(
+        self, llm, max_size: int = 10000
+    ) -> bool:
+        """对当前任务的所有文件用LLM自动压缩摘要"""
+        return await self._write(
+            self.sync_context.summarize_current_task_context_with_llm,
+            llm,
+            max_size=max_size,
+        )
+
+    async def cleanup_old_versions(self, keep_versions: int = 5) -> bool:
+        """清理旧版本文件"""
+        return await self._write(self.sync_context.cleanup_old_versions, keep_versions)
+
+    async def list_file_versions(self, file_type: str) -> List[Dict[str, Any]]:
+        """列出当前任务指定文件的历史版本"""
+        return await self._read(self.sync_context.list_file_versions, file_type)
+
+    async def get_file_version(self, file_type: str, version: int) -> Optional[str]:
+        """读取当前任务指定文件的历史版本"""
+        return await self._read(self.sync_context.get_file_version, file_type, version)
+
+    async def rollback_file(self, file_type: str, version: int) -> bool:
+        """将当前任务的指定文件回滚到历史版本"""
+        return await self._write(self.sync_context.rollback_file, file_type, version)
+
+    async def export_task_context(self) -> Dict[str, Any]:
+        """导出任务上下文"""
+        return await self._read(self.sync_context.export_task_context)
+
+    async def import_task_context(self, context_data: Dict[str, Any]) -> bool:
+        """导入任务上下文"""
+        return await self._read(self.sync_context.import_task_context, context_data)
+
+    async def export_task_stream(
+        self, task_ids: Optional[List[str]] = None
+    ) -> AsyncIterator[bytes]:
+        """以 NDJSON 流导出任务（默认当前任务）"""
+        async for line in self.context_manager.iterate(
+            self.sync_context.export_task_stream(task_ids)
+        ):
+            yield line
+
+    async def import_task_stream(
+        self, source: Iterable[Union[bytes, str]], batch_size: int = 500
+    ) -> Dict[str, Any]:
+        """将 NDJSON 流中的任务导入到当前 Agent"""
+        return await self._read(
+            self.sync_context.import_task_stream, source, batch_size=batch_size
+        )
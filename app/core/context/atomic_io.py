@@ -0,0 +1,171 @@
+"""
+原子写入工具
+提供临时文件 + fsync + rename 的原子写入，以及把短时间窗口内多次写入的 fsync 合并执行的组提交
+"""
+
+import atexit
+import os
+import threading
+import time
+import weakref
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+# 持久化模式
+DURABILITY_UNSAFE = "unsafe"  # 直接覆盖写，不保证原子性
+DURABILITY_ATOMIC = "atomic"  # 临时文件 + rename，进程崩溃安全
+DURABILITY_FSYNC = "fsync"  # 每次写入都 fsync，掉电安全
+DURABILITY_GROUP = "group"  # 组提交（延迟 fsync）：写入立即生效，窗口内的 fsync 合并执行
+DURABILITY_MODES = (
+    DURABILITY_UNSAFE,
+    DURABILITY_ATOMIC,
+    DURABILITY_FSYNC,
+    DURABILITY_GROUP,
+)
+
+
+def fsync_dir(dir_path: Path):
+    """fsync 目录，确保 rename 结果落盘"""
+    try:
+        fd = os.open(str(dir_path), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def fsync_file(file_path: Path):
+    """fsync 已存在的文件"""
+    try:
+        fd = os.open(str(file_path), os.O_RDONLY)
+    except FileNotFoundError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write_bytes(file_path: Path, data: bytes, fsync: bool = True):
+    """原子写入：先写同目录临时文件，再 rename 覆盖目标文件"""
+    tmp_path = file_path.with_name(
+        f".{file_path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    )
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            tmp_path.unlink()
+        except FileNotFoundError:
+            pass
+        raise
+    if fsync:
+        fsync_dir(file_path.parent)
+
+
+class DeferredFsyncWriter:
+    """
+    延迟 fsync：写入由调用方在锁内直接完成，这里只登记需要 fsync 的文件，
+    窗口期结束后由后台线程一次性同步（组提交模式的“提交”即这一次合并的 fsync）
+    """
+
+    def __init__(self, window: float = 0.05):
+        self.window = window
+        self._sync_paths: Set[Path] = set()
+        self._lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.submitted = 0
+        self.commits = 0
+        self.files_synced = 0
+        _live_writers.add(self)
+
+    def sync_later(self, file_path: Path):
+        """登记需要在下次提交时 fsync 的文件"""
+        with self._lock:
+            self._sync_paths.add(file_path)
+            self.submitted += 1
+        self._schedule()
+
+    def flush(self):
+        """立即 fsync 所有已登记的文件"""
+        with self._commit_lock:
+            with self._lock:
+                sync_paths, self._sync_paths = self._sync_paths, set()
+            if not sync_paths:
+                return
+
+            dirs = set()
+            for file_path in sync_paths:
+                fsync_file(file_path)
+                # 原子替换产生的新目录项同样需要落盘
+                dirs.add(file_path.parent)
+            for dir_path in dirs:
+                fsync_dir(dir_path)
+
+            self.commits += 1
+            self.files_synced += len(sync_paths)
+
+    def close(self):
+        """同步剩余文件并停止后台线程"""
+        self._closed = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        """获取组提交统计信息（登记次数、合并后的提交次数和同步的文件数）"""
+        return {
+            "submitted": self.submitted,
+            "commits": self.commits,
+            "files_synced": self.files_synced,
+        }
+
+    def _schedule(self):
+        """唤醒（必要时启动）后台提交线程"""
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(
+                        target=self._run, name="context-group-commit", daemon=True
+                    )
+                    self._thread.start()
+        self._wakeup.set()
+
+    def _run(self):
+        """后台线程：收到登记后等待一个窗口期，再一次性 fsync"""
+        while not self._closed:
+            self._wakeup.wait()
+            if self._closed:
+                break
+            time.sleep(self.window)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"组提交 fsync 失败: {e}")
+
+
+# 进程退出前 fsync 所有已登记的文件
+_live_writers: "weakref.WeakSet[DeferredFsyncWriter]" = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_live_writers():
+    for writer in list(_live_writers):
+        try:
+            writer.flush()
+        except Exception as e:
+            print(f"组提交 fsync 失败: {e}")
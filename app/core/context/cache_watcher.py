@@ -0,0 +1,269 @@
+"""
+跨进程缓存失效
+其他 worker 进程和离线脚本会直接修改 agent_contexts 目录，进程内的 TaskContext 缓存
+无法感知这些写入。CacheInvalidationWatcher 监听已缓存任务的目录（有 watchfiles 时使用
+inotify 等系统通知，否则由后台线程定期轮询文件签名），目录发生变化时重新校验对应的
+缓存项，签名不一致则丢弃。监听生效期间，只读加载可以跳过逐文件的 stat 校验，
+缓存过期的窗口即失效延迟，可通过 stats() 中的延迟指标观察
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from .task_cache import FileSignature, TaskContextCache
+
+try:
+    import watchfiles
+except ImportError:  # pragma: no cover - 可选依赖
+    watchfiles = None
+
+BACKEND_WATCHFILES = "watchfiles"
+BACKEND_POLL = "poll"
+
+# watchfiles 合并短时间内多个变化的窗口（毫秒）
+DEBOUNCE_MS = 20
+# watchfiles 后端检查订阅变化的间隔（秒）
+CHECK_INTERVAL = 0.2
+# 轮询后端校验签名的间隔（秒）
+POLL_INTERVAL = 0.2
+
+SignatureFn = Callable[[Any], FileSignature]
+
+
+def _watch_filter(change: Any, path: str) -> bool:
+    """忽略原子写入产生的临时文件"""
+    return not path.endswith(".tmp")
+
+
+class CacheInvalidationWatcher:
+    """监听已缓存任务的目录，其他进程修改任务后使对应的缓存项失效"""
+
+    def __init__(
+        self,
+        cache: TaskContextCache,
+        backend: Optional[str] = None,
+        poll_interval: float = POLL_INTERVAL,
+        max_lag_samples: int = 1000,
+    ):
+        if backend is None:
+            backend = BACKEND_WATCHFILES if watchfiles is not None else BACKEND_POLL
+        if backend not in (BACKEND_WATCHFILES, BACKEND_POLL):
+            raise ValueError(f"不支持的监听方式: {backend}")
+        if backend == BACKEND_WATCHFILES and watchfiles is None:
+            raise ValueError("未安装 watchfiles，无法使用系统文件通知")
+        self.cache = cache
+        self.backend = backend
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        # 任务目录 -> {缓存键: 签名函数}
+        self._subscriptions: Dict[Path, Dict[Hashable, SignatureFn]] = {}
+        self._paths: Dict[Hashable, Path] = {}
+        # watchfiles 后端：当前监听的目录，以及监听建立并重新校验后可信任的缓存键
+        self._watched: Set[Path] = set()
+        self._active: Set[Hashable] = set()
+        self._resubscribe = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # 失效延迟（秒）：文件修改时间到缓存项被丢弃的时间
+        self._lags: Deque[float] = deque(maxlen=max_lag_samples)
+        self.events = 0
+        self.invalidations = 0
+        self.restarts = 0
+        self.errors = 0
+
+    def _start_locked(self):
+        if self._thread is not None or self._stop.is_set():
+            return
+        target = (
+            self._run_watchfiles
+            if self.backend == BACKEND_WATCHFILES
+            else self._run_poll
+        )
+        self._thread = threading.Thread(
+            target=target, name="context-cache-watcher", daemon=True
+        )
+        self._thread.start()
+
+    def subscribe(self, key: Hashable, task_path: Path, signature_fn: SignatureFn):
+        """订阅任务目录的变化（缓存项写入后调用），首次订阅时启动监听线程"""
+        task_path = Path(os.path.abspath(task_path))
+        with self._lock:
+            previous = self._paths.get(key)
+            if previous is not None and previous != task_path:
+                self._remove_locked(key)
+            self._subscriptions.setdefault(task_path, {})[key] = signature_fn
+            self._paths[key] = task_path
+            if task_path in self._watched:
+                # 目录一直在监听中，缓存项写入之后的变化都会收到通知
+                self._active.add(key)
+            elif self.backend == BACKEND_WATCHFILES:
+                self._resubscribe.set()
+            self._start_locked()
+
+    def unsubscribe(self, key: Hashable):
+        """取消订阅（目录在下次重建监听时移除）"""
+        with self._lock:
+            self._remove_locked(key)
+
+    def _remove_locked(self, key: Hashable):
+        task_path = self._paths.pop(key, None)
+        self._active.discard(key)
+        keys = self._subscriptions.get(task_path)
+        if keys is not None:
+            keys.pop(key, None)
+            if not keys:
+                del self._subscriptions[task_path]
+
+    def _prune_locked(self):
+        """移除已不在缓存中的订阅（LRU 淘汰、失效或被其他实例替换）"""
+        for key in [key for key in self._paths if not self.cache.contains(key)]:
+            self._remove_locked(key)
+
+    def is_trusted(self, key: Hashable) -> bool:
+        """缓存项是否处于监听之下，命中时可以跳过签名校验"""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return False
+        with self._lock:
+            if self.backend == BACKEND_POLL:
+                return key in self._paths
+            return key in self._active
+
+    def _items(self, paths: Iterable[Path]) -> List[Tuple[Hashable, SignatureFn]]:
+        with self._lock:
+            return [
+                item
+                for path in paths
+                for item in self._subscriptions.get(path, {}).items()
+            ]
+
+    def _revalidate(self, items: List[Tuple[Hashable, SignatureFn]]):
+        """重新校验缓存项，丢弃过期的项并记录失效延迟"""
+        for key, signature_fn in items:
+            try:
+                result = self.cache.revalidate(key, signature_fn)
+            except Exception as e:
+                self.errors += 1
+                print(f"校验缓存失败: {e}")
+                continue
+            if result is None:
+                continue
+            cached_signature, current_signature = result
+            self.invalidations += 1
+            changed = set(current_signature) - set(cached_signature)
+            mtimes = [mtime_ns for _, _, mtime_ns, _ in changed if mtime_ns > 0]
+            if mtimes:
+                self._lags.append(max(time.time() - max(mtimes) / 1e9, 0.0))
+
+    def _run_poll(self):
+        while not self._stop.wait(self.poll_interval):
+            with self._lock:
+                self._prune_locked()
+                paths = list(self._subscriptions)
+            self._revalidate(self._items(paths))
+
+    def _run_watchfiles(self):
+        while not self._stop.is_set():
+            with self._lock:
+                self._prune_locked()
+                paths = [path for path in self._subscriptions if path.is_dir()]
+                self._watched = set()
+                self._active.clear()
+                self._resubscribe.clear()
+            if not paths:
+                self._resubscribe.wait(CHECK_INTERVAL)
+                continue
+
+            self.restarts += 1
+            changes_iter = watchfiles.watch(
+                *paths,
+                watch_filter=_watch_filter,
+                debounce=DEBOUNCE_MS,
+                step=5,
+                stop_event=self._stop,
+                rust_timeout=int(CHECK_INTERVAL * 1000),
+                yield_on_timeout=True,
+                recursive=False,
+                raise_interrupt=False,
+            )
+            try:
+                resynced = False
+                for changes in changes_iter:
+                    if not resynced:
+                        # 监听已建立：重新校验全部订阅，覆盖重建监听期间发生的变化
+                        self._revalidate(self._items(paths))
+                        with self._lock:
+                            self._watched = set(paths)
+                            self._active = {
+                                key
+                                for path in paths
+                                for key in self._subscriptions.get(path, {})
+                            }
+                        resynced = True
+                    if changes:
+                        self.events += len(changes)
+                        dirs = set()
+                        for _, changed_path in changes:
+                            changed_path = Path(changed_path)
+                            dirs.update((changed_path, changed_path.parent))
+                        self._revalidate(self._items(dirs))
+                    if self._resubscribe.is_set():
+                        break
+            except Exception as e:
+                # 目录被删除或移动（如归档）时重建监听
+                self.errors += 1
+                print(f"监听任务目录失败: {e}")
+                self._stop.wait(CHECK_INTERVAL)
+            finally:
+                changes_iter.close()
+        with self._lock:
+            self._watched = set()
+            self._active.clear()
+
+    def stop(self):
+        """停止监听线程，之后的缓存查找恢复签名校验"""
+        self._stop.set()
+        self._resubscribe.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """监听和失效延迟的汇总指标"""
+        with self._lock:
+            lags = sorted(self._lags)
+            subscriptions = len(self._paths)
+            watched_dirs = len(self._subscriptions)
+
+        def percentile(ratio: float) -> float:
+            if not lags:
+                return 0.0
+            return round(lags[min(int(len(lags) * ratio), len(lags) - 1)] * 1000, 1)
+
+        return {
+            "backend": self.backend,
+            "subscriptions": subscriptions,
+            "watched_dirs": watched_dirs,
+            "events": self.events,
+            "invalidations": self.invalidations,
+            "restarts": self.restarts,
+            "errors": self.errors,
+            "lag_p50_ms": percentile(0.5),
+            "lag_p95_ms": percentile(0.95),
+            "lag_max_ms": round(lags[-1] * 1000, 1) if lags else 0.0,
+        }
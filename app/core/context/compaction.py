@@ -0,0 +1,350 @@
+"""
+后台上下文压缩
+写入后按元数据中的 token 数检查任务大小，超过阈值时在后台线程池中压缩较大的文件：
+保留文件头部和最近的条目，较早的条目替换为一条摘要（有 LLM 时由 LLM 生成，否则抽取式），
+调用方的写入路径只多一次元数据读取
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from . import context_format
+from .context_store import ContextStore
+from .context_tools import ContextTools
+from .token_count import count_tokens
+
+# 条目起始位置：历史消息和临时笔记以带时间的 ### 标题开始，其他文件以 ## 标题开始
+_TIMED_SECTION = re.compile(r"\n+(?=### \d{4}-\d\d-\d\d )")
+_SECTION_STARTS = {"history": _TIMED_SECTION, "scratchpad": _TIMED_SECTION}
+_DEFAULT_SECTION = re.compile(r"\n+(?=## )")
+
+# 压缩摘要条目开头的标记
+_MARKER = re.compile(r"^\[已压缩 \d+ 条较早的记录\]\n?")
+# 摘要中的标题标记（避免摘要被解析为新的条目）
+_HEADING = re.compile(r"(?m)^#+[ \t]*")
+
+# 压缩后的摘要条目
+_SUMMARY_ENTRIES: Dict[str, Callable[[str], str]] = {
+    "history": lambda text: context_format.chat_entry("system", text),
+    "scratchpad": context_format.scratchpad_entry,
+    "summary": lambda text: context_format.summary_entry("较早内容摘要", text),
+}
+
+
+@dataclass
+class CompactionPolicy:
+    """压缩阈值"""
+
+    task_tokens: int = 32000  # 任务总 token 数超过该值时检查各文件
+    file_tokens: int = 8000  # 单个文件超过该值时压缩
+    target_ratio: float = 0.5  # 压缩后的目标大小（相对 file_tokens）
+    recent_ratio: float = 0.6  # 目标大小中留给最近条目的比例，其余留给摘要
+    file_types: Tuple[str, ...] = ("history", "scratchpad", "summary")
+    check_interval: float = 5.0  # 同一任务两次检查的最小间隔（秒）
+
+
+@dataclass
+class CompactionRecord:
+    """一次文件压缩的结果"""
+
+    agent_id: str
+    task_id: str
+    file_type: str
+    method: str  # llm, extractive
+    before_size: int
+    after_size: int
+    before_tokens: int
+    after_tokens: int
+    compacted_sections: int
+    elapsed: float
+    finished_at: str = field(default_factory=lambda: datetime.utcnow().isoformat())
+
+
+def split_sections(content: str, file_type: str) -> List[str]:
+    """按条目标题切分文件，第一段为文件头部；各段拼接后与原内容一致"""
+    pattern = _SECTION_STARTS.get(file_type, _DEFAULT_SECTION)
+    bounds = [0] + [match.start() for match in pattern.finditer(content)]
+    bounds = sorted(set(bounds)) + [len(content)]
+    return [content[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+def _section_text(section: str) -> str:
+    """条目转换为 "标签: 内容" 形式的纯文本（去掉标题中的时间和此前的压缩标记）"""
+    section = section.strip()
+    if not section.startswith("#"):
+        return section
+    heading, _, body = section.partition("\n")
+    label = heading.lstrip("#").strip()
+    if _TIMED_SECTION.match("\n" + heading):
+        label = label.split(": ", 1)[-1]
+    body = _MARKER.sub("", body).strip()
+    return f"{label}: {body}"
+
+
+def extractive_summary(sections: List[str], max_length: int) -> str:
+    """抽取式摘要：从较新的条目开始，每个条目取开头的句子，总长度不超过 max_length"""
+    per_section = max(max_length // max(len(sections), 1), 60)
+    lines, used = [], 0
+    for section in reversed(sections):
+        text = ContextTools.generate_summary(_section_text(section), per_section)
+        if used + len(text) > max_length:
+            break
+        lines.append(text)
+        used += len(text) + 1
+    lines.reverse()
+    return "\n".join(lines)
+
+
+def compact_content(
+    content: str,
+    file_type: str,
+    target_tokens: int,
+    recent_ratio: float = 0.6,
+    llm=None,
+) -> Optional[Tuple[str, str, int]]:
+    """
+    压缩文件内容：保留头部和 recent_ratio * target_tokens 以内的最近条目，
+    较早的条目合并为一条摘要
+
+    Returns:
+        (新内容, 压缩方式, 被压缩的条目数)，条目太少无法压缩时返回 None
+    """
+    sections = split_sections(content, file_type)
+    if len(sections) < 3:
+        return None
+    header, entries = sections[0], sections[1:]
+
+    recent_budget = int(target_tokens * recent_ratio)
+    kept, kept_tokens = [], 0
+    for entry in reversed(entries):
+        tokens = count_tokens(entry)
+        if kept and kept_tokens + tokens > recent_budget:
+            break
+        kept.append(entry)
+        kept_tokens += tokens
+    kept.reverse()
+    older = entries[: len(entries) - len(kept)]
+    if not older:
+        return None
+
+    # 摘要长度按字符数给出，中文约 1 token/字，取 token 预算作为字符上限
+    summary_budget = max(target_tokens - kept_tokens - count_tokens(header), 200)
+    method = "extractive"
+    summary = None
+    if llm is not None:
+        try:
+            summary = ContextTools.generate_llm_summary(
+                "\n".join(_section_text(section) for section in older),
+                llm,
+                max_length=summary_budget,
+            )
+            method = "llm"
+        except Exception as e:
+            print(f"LLM压缩失败，改用抽取式摘要: {e}")
+    if not summary:
+        summary = extractive_summary(older, summary_budget)
+    summary = f"[已压缩 {len(older)} 条较早的记录]\n{_HEADING.sub('', summary.strip())}"
+
+    make_entry = _SUMMARY_ENTRIES.get(file_type, _SUMMARY_ENTRIES["summary"])
+    return header + make_entry(summary) + "".join(kept), method, len(older)
+
+
+class CompactionWorker:
+    """
+    后台压缩服务
+
+    notify() 在写入后调用：按元数据判断是否超过阈值，超过时把任务提交到有界线程池，
+    同一任务同时最多一个压缩作业；压缩通过 ContextStore.replace_file_prefix 写回，
+    压缩期间追加的内容会保留
+    """
+
+    def __init__(
+        self,
+        policy: Optional[CompactionPolicy] = None,
+        max_concurrency: int = 2,
+        max_records: int = 1000,
+    ):
+        self.policy = policy or CompactionPolicy()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="context-compaction"
+        )
+        self._lock = threading.Lock()
+        self._running: Dict[Tuple[int, str, str], Future] = {}
+        # 按最近检查时间排序，检查间隔已过的任务从头部移除
+        self._last_checked: Dict[Tuple[int, str, str], float] = OrderedDict()
+        self._records: Deque[CompactionRecord] = deque(maxlen=max_records)
+
+    def files_to_compact(
+        self, store: ContextStore, agent_id: str, task_id: str
+    ) -> List[str]:
+        """按元数据中的 token 数找出需要压缩的文件（不读取文件内容）"""
+        stats = store.get_context_size(agent_id, task_id)
+        if not stats or stats["tokens"] <= self.policy.task_tokens:
+            return []
+        return [
+            file_type
+            for file_type in self.policy.file_types
+            if stats["files"].get(file_type, {}).get("tokens", 0)
+            > self.policy.file_tokens
+        ]
+
+    def notify(
+        self, store: ContextStore, agent_id: str, task_id: str, llm=None
+    ) -> bool:
+        """
+        任务写入后调用，超过阈值时提交后台压缩
+
+        Returns:
+            是否提交了新的压缩作业
+        """
+        key = (id(store), agent_id, task_id)
+        now = time.monotonic()
+        with self._lock:
+            if key in self._running:
+                return False
+            while self._last_checked:
+                oldest_key, oldest = next(iter(self._last_checked.items()))
+                if now - oldest < self.policy.check_interval:
+                    break
+                del self._last_checked[oldest_key]
+            if key in self._last_checked:
+                return False
+            self._last_checked[key] = now
+
+        try:
+            file_types = self.files_to_compact(store, agent_id, task_id)
+        except Exception as e:
+            print(f"检查上下文大小失败: {e}")
+            return False
+        if not file_types:
+            return False
+
+        with self._lock:
+            if key in self._running:
+                return False
+            future = self._executor.submit(
+                self.compact_task, store, agent_id, task_id, llm, file_types
+            )
+            self._running[key] = future
+        future.add_done_callback(lambda _: self._finish(key))
+        return True
+
+    def _finish(self, key: Tuple[int, str, str]):
+        with self._lock:
+            self._running.pop(key, None)
+
+    def compact_task(
+        self,
+        store: ContextStore,
+        agent_id: str,
+        task_id: str,
+        llm=None,
+        file_types: Optional[List[str]] = None,
+    ) -> List[CompactionRecord]:
+        """同步压缩任务中超过阈值的文件（file_types 为 None 时按阈值检查）"""
+        if file_types is None:
+            file_types = self.files_to_compact(store, agent_id, task_id)
+        records = []
+        for file_type in file_types:
+            record = self.compact_file(store, agent_id, task_id, file_type, llm)
+            if record is not None:
+                records.append(record)
+        return records
+
+    def compact_file(
+        self, store: ContextStore, agent_id: str, task_id: str, file_type: str, llm=None
+    ) -> Optional[CompactionRecord]:
+        """压缩单个文件，文件无法压缩或写回失败时返回 None"""
+        started = time.perf_counter()
+        try:
+            content = store.get_file_content(agent_id, task_id, file_type)
+            if not content:
+                return None
+            result = compact_content(
+                content,
+                file_type,
+                int(self.policy.file_tokens * self.policy.target_ratio),
+                self.policy.recent_ratio,
+                llm,
+            )
+            if result is None:
+                return None
+            compacted, method, sections = result
+
+            record = CompactionRecord(
+                agent_id=agent_id,
+                task_id=task_id,
+                file_type=file_type,
+                method=method,
+                before_size=len(content.encode("utf-8")),
+                after_size=len(compacted.encode("utf-8")),
+                before_tokens=count_tokens(content),
+                after_tokens=count_tokens(compacted),
+                compacted_sections=sections,
+                elapsed=round(time.perf_counter() - started, 3),
+            )
+            if not store.replace_file_prefix(
+                agent_id,
+                task_id,
+                file_type,
+                content,
+                compacted,
+                metadata={"compaction": asdict(record)},
+            ):
+                return None
+        except Exception as e:
+            print(f"压缩上下文失败: {e}")
+            return None
+
+        with self._lock:
+            self._records.append(record)
+        return record
+
+    def records(self) -> List[CompactionRecord]:
+        """最近的压缩记录"""
+        with self._lock:
+            return list(self._records)
+
+    def stats(self) -> Dict[str, Any]:
+        """压缩的汇总指标"""
+        with self._lock:
+            records = list(self._records)
+            running = len(self._running)
+        return {
+            "running": running,
+            "compactions": len(records),
+            "bytes_saved": sum(r.before_size - r.after_size for r in records),
+            "tokens_saved": sum(r.before_tokens - r.after_tokens for r in records),
+            "total_elapsed": round(sum(r.elapsed for r in records), 3),
+        }
+
+    def wait(self, timeout: Optional[float] = None):
+        """等待当前所有压缩作业完成"""
+        with self._lock:
+            futures: Set[Future] = set(self._running.values())
+        wait_futures(futures, timeout=timeout)
+
+    def shutdown(self, wait: bool = True):
+        """关闭线程池"""
+        self._executor.shutdown(wait=wait)
+
+
+# 进程级共享的压缩服务，所有任务共用同一个有界线程池
+_shared_worker: Optional[CompactionWorker] = None
+_shared_worker_lock = threading.Lock()
+
+
+def get_shared_compaction_worker() -> CompactionWorker:
+    """获取进程级共享的压缩服务"""
+    global _shared_worker
+    with _shared_worker_lock:
+        if _shared_worker is None:
+            _shared_worker = CompactionWorker()
+        return _shared_worker
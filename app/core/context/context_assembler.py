@@ -0,0 +1,315 @@
+"""
+按 token 预算组装提示词上下文
+从待办事项、总结、资源、临时笔记和对话历史中切分出条目，按来源权重、新近程度和
+与查询的相关性打分，在预算内贪心选取，再按来源和时间顺序渲染为提示词文本。
+条目的 token 数和分词结果按内容哈希缓存，重复组装时只计算新增或修改的条目
+"""
+
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+from .compaction import split_sections
+from .context_store import ContextStore
+from .todo_index import tokenize
+from .token_count import count_tokens
+
+# 渲染顺序和各来源的标题（evidence 为调用方传入的步骤结果等额外条目）
+SOURCE_ORDER = ("todo", "evidence", "summary", "resource", "scratchpad", "history")
+SOURCE_TITLES = {
+    "todo": "待办事项",
+    "evidence": "步骤结果",
+    "summary": "任务总结",
+    "resource": "参考资料",
+    "scratchpad": "临时笔记",
+    "history": "对话历史",
+}
+# 逐行列出的来源，条目之间不空行
+_LINE_SOURCES = {"todo", "resource"}
+
+DEFAULT_SOURCE_WEIGHTS = {
+    "todo": 1.0,
+    "evidence": 1.2,
+    "summary": 0.8,
+    "resource": 0.5,
+    "scratchpad": 0.4,
+    "history": 0.6,
+}
+
+# 新近程度每隔该数量的条目减半
+RECENCY_HALF_LIFE = 8.0
+
+# 剩余预算不少于该值时，放不下的条目截断后放入
+MIN_TRUNCATED_TOKENS = 64
+
+_COMMENT = re.compile(r"<!--.*?-->", re.S)
+_SUMMARY_FOOTER = re.compile(r"\n+---\n更新时间: [^\n]*\s*$")
+_TIMED_HEADING = re.compile(r"^### \d{4}-\d\d-\d\d [^\n]*: [^\n]*\n?")
+
+
+@dataclass
+class ContextSection:
+    """可放入提示词的一个条目"""
+
+    source: str
+    text: str
+    order: int = 0  # 来源内的时间顺序
+    recency: float = 1.0  # 新近程度，最新的条目为 1
+    tokens: int = 0
+    score: float = 0.0
+
+
+def _digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def _recency(index: int, count: int, half_life: float) -> float:
+    """第 index 个条目（共 count 个，按时间顺序）的新近程度，每隔 half_life 个条目减半"""
+    return 0.5 ** ((count - 1 - index) / half_life)
+
+
+def _file_entries(content: str, file_type: str) -> List[str]:
+    """总结和临时笔记文件中的条目正文（去掉模板占位、时间标题和更新时间）"""
+    entries = []
+    for section in split_sections(content, file_type)[1:]:
+        section = _COMMENT.sub("", section).strip()
+        if file_type == "summary":
+            if section.startswith("## 任务信息"):
+                continue
+            section = _SUMMARY_FOOTER.sub("", section)
+            heading, _, body = section.partition("\n")
+            if body.strip():
+                entries.append(f"#{heading}\n{body.strip()}")
+        else:
+            body = _TIMED_HEADING.sub("", section).strip()
+            if body:
+                entries.append(body)
+    return entries
+
+
+class ContextAssembler:
+    """提示词上下文组装器（线程安全，可在多个任务间共用）"""
+
+    def __init__(
+        self,
+        store: ContextStore,
+        source_weights: Optional[Dict[str, float]] = None,
+        recency_weight: float = 1.0,
+        relevance_weight: float = 2.0,
+        recency_half_life: float = RECENCY_HALF_LIFE,
+        max_history_messages: int = 50,
+        cache_size: int = 4096,
+    ):
+        self.store = store
+        self.source_weights = {**DEFAULT_SOURCE_WEIGHTS, **(source_weights or {})}
+        self.recency_weight = recency_weight
+        self.relevance_weight = relevance_weight
+        self.recency_half_life = recency_half_life
+        self.max_history_messages = max_history_messages
+        self.cache_size = cache_size
+        # 内容哈希 -> (token 数, 分词结果)
+        self._cache: "OrderedDict[bytes, Tuple[int, FrozenSet[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def measure(self, text: str) -> Tuple[int, FrozenSet[str]]:
+        """条目的 token 数和分词结果（按内容哈希缓存）"""
+        key = _digest(text)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return cached
+        measured = (count_tokens(text), frozenset(tokenize(text)))
+        with self._lock:
+            self.cache_misses += 1
+            self._cache[key] = measured
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return measured
+
+    def collect_sections(
+        self, agent_id: str, task_id: str, sources: Optional[Iterable[str]] = None
+    ) -> List[ContextSection]:
+        """从任务上下文中收集条目"""
+        sources = set(sources or SOURCE_ORDER)
+        texts: Dict[str, List[str]] = {}
+        if "todo" in sources:
+            texts["todo"] = [
+                f"- {item}" for item in self.store.get_todo_items(agent_id, task_id)
+            ]
+        for file_type in ("summary", "scratchpad"):
+            if file_type in sources:
+                content = self.store.get_file_content(agent_id, task_id, file_type)
+                texts[file_type] = _file_entries(content or "", file_type)
+        if "resource" in sources:
+            texts["resource"] = [
+                f"- [{resource['title']}]({resource['url']})"
+                + (f": {resource['description']}" if resource["description"] else "")
+                for resource in self.store.get_resources(agent_id, task_id)
+            ]
+        if "history" in sources:
+            texts["history"] = [
+                f"{message['role']}: {message['content']}"
+                for message in self.store.get_chat_messages(
+                    agent_id, task_id, limit=self.max_history_messages
+                )
+            ]
+
+        sections = []
+        for source, entries in texts.items():
+            count = len(entries)
+            for index, text in enumerate(entries):
+                # 待办事项越靠前越紧迫，其他来源越靠后越新
+                position = count - 1 - index if source == "todo" else index
+                sections.append(
+                    ContextSection(
+                        source=source,
+                        text=text,
+                        order=index,
+                        recency=_recency(position, count, self.recency_half_life),
+                    )
+                )
+        return sections
+
+    def score(self, sections: List[ContextSection], query: Optional[str] = None):
+        """计算各条目的 token 数和得分"""
+        query_terms = tokenize(query) if query else set()
+        for section in sections:
+            section.tokens, terms = self.measure(section.text)
+            relevance = (
+                len(query_terms & terms) / len(query_terms) if query_terms else 0.0
+            )
+            section.score = (
+                self.source_weights.get(section.source, 0.5)
+                + self.recency_weight * section.recency
+                + self.relevance_weight * relevance
+            )
+
+    def select(
+        self, sections: List[ContextSection], budget: int
+    ) -> List[ContextSection]:
+        """按得分贪心选取条目（计入来源标题和分隔符的开销），总 token 数不超过预算"""
+        selected, used = [], 0
+        started = set()
+        for section in sorted(sections, key=lambda s: (-s.score, s.source, s.order)):
+            overhead = 1
+            if section.source not in started:
+                overhead += count_tokens(self._heading(section.source)) + 1
+            remaining = budget - used - overhead
+            if section.tokens <= remaining:
+                selected.append(section)
+            elif remaining >= MIN_TRUNCATED_TOKENS:
+                text = _truncate_to_tokens(section.text, remaining)
+                if not text:
+                    continue
+                section = ContextSection(
+                    section.source,
+                    text,
+                    section.order,
+                    section.recency,
+                    count_tokens(text),
+                    section.score,
+                )
+                selected.append(section)
+            else:
+                continue
+            started.add(section.source)
+            used += section.tokens + overhead
+        return selected
+
+    @staticmethod
+    def _heading(source: str) -> str:
+        return f"## {SOURCE_TITLES.get(source, source)}"
+
+    def render(self, sections: List[ContextSection]) -> str:
+        """按来源分组、组内按时间顺序渲染条目"""
+        groups: Dict[str, List[ContextSection]] = {}
+        for section in sections:
+            groups.setdefault(section.source, []).append(section)
+        sources = [s for s in SOURCE_ORDER if s in groups]
+        sources += sorted(s for s in groups if s not in SOURCE_ORDER)
+
+        blocks = []
+        for source in sources:
+            separator = "\n" if source in _LINE_SOURCES else "\n\n"
+            entries = sorted(groups[source], key=lambda s: s.order)
+            blocks.append(
+                f"{self._heading(source)}\n"
+                + separator.join(entry.text for entry in entries)
+            )
+        return "\n\n".join(blocks)
+
+    def assemble(
+        self,
+        agent_id: str,
+        task_id: str,
+        budget: int,
+        query: Optional[str] = None,
+        sources: Optional[Sequence[str]] = None,
+        extra_sections: Optional[List[ContextSection]] = None,
+    ) -> str:
+        """
+        组装任务上下文
+
+        Args:
+            budget: token 预算，返回文本的 token 数不超过该值
+            query: 用于计算相关性的查询（如当前任务或主题）
+            sources: 只使用这些来源（默认全部）
+            extra_sections: 额外的条目（如步骤结果），与任务上下文一起参与选取
+
+        Returns:
+            可直接放入提示词的文本，没有可用条目或预算不足时返回空字符串
+        """
+        if budget <= 0:
+            return ""
+        try:
+            sections = []
+            if task_id:
+                sections = self.collect_sections(agent_id, task_id, sources)
+            sections += extra_sections or []
+            self.score(sections, query)
+            selected = self.select(sections, budget)
+            text = self.render(selected)
+            # 分段计数之和与整体计数可能略有差异，超出时去掉得分最低的条目
+            while selected and count_tokens(text) > budget:
+                selected.remove(min(selected, key=lambda s: s.score))
+                text = self.render(selected)
+            return text
+        except Exception as e:
+            print(f"组装上下文失败: {e}")
+            return ""
+
+
+def evidence_sections(results: Dict[str, str]) -> List[ContextSection]:
+    """将步骤结果（步骤名 -> 结果）转换为条目，越靠后的步骤越新"""
+    items = [(name, str(result)) for name, result in results.items() if result]
+    return [
+        ContextSection(
+            source="evidence",
+            text=f"### {name}\n{result}",
+            order=index,
+            recency=_recency(index, len(items), RECENCY_HALF_LIFE),
+        )
+        for index, (name, result) in enumerate(items)
+    ]
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """截断文本使其 token 数（含省略标记）不超过 max_tokens"""
+    suffix = "..."
+    if count_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle] + suffix) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low] + suffix if low else ""
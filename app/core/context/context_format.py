@@ -0,0 +1,336 @@
+"""
+上下文文件格式
+各类上下文文件的模板与条目格式，文件系统存储和 SQLite 存储共用，保证渲染结果一致
+"""
+
+import re
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .todo_index import TodoIndex
+
+# 预览长度（字符数），与 get_context_summary 的 content_preview 保持一致
+PREVIEW_LENGTH = 200
+
+DEFAULT_TODO_ITEMS = [
+    "分析任务需求",
+    "制定执行计划",
+    "收集必要信息",
+    "执行任务",
+    "总结结果",
+]
+
+# 文件类型 -> 文件名
+FILE_NAMES = {
+    "todo": "todo.md",
+    "history": "history.md",
+    "resource": "resource_links.txt",
+    "summary": "summary.md",
+    "scratchpad": "scratchpad.md",
+}
+
+# 待办事项行末尾的 ID 标记
+_TODO_ID = re.compile(r"\s*<!-- id: ([^>]*?) -->\s*$")
+
+
+def todo_header(
+    task_id: str, title: str, description: str, status: str, created_at: datetime
+) -> str:
+    """待办事项文件头部（到“## 待办事项”为止）"""
+    return f"""# 任务待办事项
+
+## 任务信息
+- 任务ID: {task_id}
+- 标题: {title}
+- 描述: {description}
+- 状态: {status}
+- 创建时间: {created_at}
+
+## 目标
+{description}
+
+## 待办事项
+"""
+
+
+def todo_item(
+    text: str, completed: bool = False, item_id: Optional[str] = None
+) -> str:
+    """待办事项行（item_id 以 HTML 注释的形式附在行末）"""
+    checkbox = "- [x]" if completed else "- [ ]"
+    marker = f" <!-- id: {item_id} -->" if item_id else ""
+    return f"{checkbox} {text}{marker}\n"
+
+
+def todo_footer(created_at: datetime) -> str:
+    """待办事项列表之后的进度记录起始部分"""
+    return f"""
+
+## 进度记录
+- {created_at}: 任务创建
+"""
+
+
+def todo_progress_block(
+    updates: Iterable[str], timestamp: Optional[datetime] = None
+) -> str:
+    """进度记录块"""
+    block = """
+
+## 进度记录
+"""
+    for update in updates:
+        block += f"- {timestamp or datetime.utcnow()}: {update}\n"
+    return block
+
+
+def history_header(task_id: str, title: str, created_at: datetime) -> str:
+    """历史记录文件头部"""
+    return f"""# 任务历史记录
+
+## 任务信息
+- 任务ID: {task_id}
+- 标题: {title}
+
+## 对话历史
+### {created_at}: 任务创建
+任务已创建，开始执行。
+
+## 决策记录
+### {created_at}: 初始化
+- 创建任务上下文
+- 初始化基础文件结构
+"""
+
+
+def resource_header(task_id: str, title: str) -> str:
+    """资源链接文件头部"""
+    return f"""# 外部资源链接
+
+## 任务信息
+- 任务ID: {task_id}
+- 标题: {title}
+
+## 资源链接
+<!-- 在此添加相关的外部资源链接 -->
+
+## 文档引用
+<!-- 在此添加文档引用和摘要 -->
+
+## 工具配置
+<!-- 在此添加使用的工具配置信息 -->
+"""
+
+
+def summary_header(task_id: str, title: str, description: str) -> str:
+    """总结文件头部"""
+    return f"""# 任务总结
+
+## 任务信息
+- 任务ID: {task_id}
+- 标题: {title}
+- 描述: {description}
+
+## 执行摘要
+<!-- 在此记录任务执行的关键信息和结果 -->
+
+## 关键要点
+<!-- 在此记录重要的发现和结论 -->
+
+## 后续行动
+<!-- 在此记录需要后续处理的事项 -->
+"""
+
+
+def scratchpad_header(task_id: str, title: str) -> str:
+    """临时笔记文件头部"""
+    return f"""# 临时笔记
+
+## 任务信息
+- 任务ID: {task_id}
+- 标题: {title}
+
+## 推理过程
+<!-- 在此记录推理过程和临时想法 -->
+
+## 临时计算
+<!-- 在此记录临时计算和实验 -->
+
+## 待验证想法
+<!-- 在此记录需要验证的想法和假设 -->
+"""
+
+
+def chat_entry(role: str, content: str, timestamp: Optional[datetime] = None) -> str:
+    """历史记录中的一条消息"""
+    return f"""
+
+### {timestamp or datetime.utcnow()}: {role}
+{content}
+"""
+
+
+def resource_entry(
+    title: str, url: str, description: str = "", timestamp: Optional[datetime] = None
+) -> str:
+    """资源链接条目"""
+    return f"""
+
+## {title}
+- URL: {url}
+- 描述: {description}
+- 添加时间: {timestamp or datetime.utcnow()}
+"""
+
+
+def summary_entry(
+    section: str, content: str, timestamp: Optional[datetime] = None
+) -> str:
+    """总结条目"""
+    return f"""
+
+## {section}
+{content}
+
+---
+更新时间: {timestamp or datetime.utcnow()}
+"""
+
+
+def scratchpad_entry(content: str, timestamp: Optional[datetime] = None) -> str:
+    """临时笔记条目"""
+    return f"""
+
+### {timestamp or datetime.utcnow()}: 临时笔记
+{content}
+"""
+
+
+def parse_chat_messages(content: str) -> List[Dict[str, str]]:
+    """从历史记录 Markdown 中解析聊天消息"""
+    lines = content.split("\n")
+    chat_history = []
+    current_role = None
+    current_content = []
+
+    for line in lines:
+        if line.startswith("### ") and ":" in line:
+            # 保存之前的消息
+            if current_role and current_content:
+                chat_history.append(
+                    {
+                        "role": current_role,
+                        "content": "\n".join(current_content).strip(),
+                    }
+                )
+
+            # 解析新消息：时间戳本身包含冒号，按第一个 ": " 分隔时间和角色
+            parts = line[4:].split(": ", 1)
+            if len(parts) == 2:
+                current_role = parts[1].strip()
+                current_content = []
+        elif line.strip() and current_role:
+            current_content.append(line)
+
+    # 添加最后一条消息
+    if current_role and current_content:
+        chat_history.append(
+            {"role": current_role, "content": "\n".join(current_content).strip()}
+        )
+
+    return chat_history
+
+
+def parse_todo_line(line: str) -> Optional[Tuple[bool, str, Optional[str]]]:
+    """解析待办事项行，返回 (是否完成, 文本, ID)，不是待办事项行时返回 None"""
+    stripped = line.strip()
+    if not stripped.startswith(("- [ ]", "- [x]")):
+        return None
+    text = stripped[5:].strip()
+    match = _TODO_ID.search(text)
+    item_id = None
+    if match:
+        item_id = match.group(1).strip() or None
+        text = text[: match.start()]
+    return stripped.startswith("- [x]"), text, item_id
+
+
+def parse_todo_items(content: str, include_completed: bool = False) -> List[str]:
+    """从待办事项 Markdown 中解析待办事项文本"""
+    todo_items = []
+    for line in content.split("\n"):
+        parsed = parse_todo_line(line)
+        if parsed and (include_completed or not parsed[0]):
+            todo_items.append(parsed[1])
+    return todo_items
+
+
+def apply_todo_progress(content: str, progress_updates: List[str]) -> str:
+    """
+    将进度更新对应的未完成待办事项标记为完成，并在末尾追加进度记录
+
+    匹配规则见 todo_index.resolve_updates（与偏移索引、SQLite 存储一致）
+    """
+    lines = content.split("\n")
+    index = TodoIndex()
+    for number, line in enumerate(lines):
+        parsed = parse_todo_line(line)
+        if parsed and not parsed[0]:
+            index.add(number, parsed[1], parsed[2])
+    for number in index.resolve_all(progress_updates):
+        lines[number] = lines[number].replace("- [ ]", "- [x]", 1)
+    return "\n".join(lines) + todo_progress_block(progress_updates)
+
+
+def mark_todo_line(content: str, item_text: str) -> str:
+    """将文本包含 item_text 的未完成待办事项行标记为完成"""
+    updated_lines = []
+    for line in content.split("\n"):
+        parsed = parse_todo_line(line)
+        if parsed and not parsed[0] and item_text in parsed[1]:
+            updated_lines.append(line.replace("- [ ]", "- [x]", 1))
+        else:
+            updated_lines.append(line)
+    return "\n".join(updated_lines)
+
+
+def parse_resources(content: str) -> List[Dict[str, str]]:
+    """从资源链接文件中解析资源列表（描述可以跨多行，直到 "- 添加时间:" 为止）"""
+    resources = []
+    current_resource = {}
+    # 正在收集的多行描述
+    description_lines = None
+
+    def finish_description():
+        if description_lines is not None:
+            current_resource["description"] = "\n".join(description_lines).strip()
+
+    for raw_line in content.split("\n"):
+        line = raw_line.strip()
+        if line.startswith("## ") and not line.startswith("## 任务信息"):
+            # 保存之前的资源
+            finish_description()
+            description_lines = None
+            if current_resource:
+                resources.append(current_resource)
+
+            # 开始新资源
+            current_resource = {"title": line[3:].strip()}
+        elif line.startswith("- URL:") and current_resource:
+            finish_description()
+            description_lines = None
+            current_resource["url"] = line[6:].strip()
+        elif line.startswith("- 描述:") and current_resource:
+            description_lines = [line[5:].strip()]
+        elif line.startswith("- 添加时间:") and current_resource:
+            finish_description()
+            description_lines = None
+        elif description_lines is not None:
+            description_lines.append(raw_line.rstrip())
+
+    # 添加最后一个资源
+    finish_description()
+    if current_resource:
+        resources.append(current_resource)
+
+    return resources
@@ -0,0 +1,107 @@
+"""
+上下文目录布局
+按哈希前缀分桶的目录结构，避免单个目录下堆积大量 Agent 或任务：
+
+    agents/<ab>/agent_<agent_id>/tasks/<cd>/<ef>/task_<task_id>
+
+其中 ab 为 agent_id 的哈希前缀，cd/ef 为 task_id 哈希的前两级，
+百万级任务时每个目录下也只有少量条目。旧版平铺布局为 agent_<agent_id>/task_<task_id>
+"""
+
+import hashlib
+import re
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+AGENTS_DIR = "agents"
+TASKS_DIR = "tasks"
+
+_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def shard_key(key: str) -> str:
+    """计算分桶用的哈希值"""
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def _safe_component(value: str) -> str:
+    """将任意字符串转换为可用作目录名的片段，替换过字符时追加哈希避免冲突"""
+    safe = _UNSAFE_CHARS.sub("_", value)
+    if safe != value:
+        safe = f"{safe}-{shard_key(value)[:8]}"
+    return safe
+
+
+def namespaced_agent_id(
+    agent_id: str, user_id: Optional[str] = None, thread_id: Optional[str] = None
+) -> str:
+    """
+    生成按用户/会话隔离的 Agent ID
+
+    Args:
+        agent_id: 基础 Agent ID，例如 "default"
+        user_id: 用户ID
+        thread_id: 会话（线程）ID
+
+    Returns:
+        形如 "default--u-<user_id>--t-<thread_id>" 的 Agent ID，
+        未提供 user_id 和 thread_id 时原样返回 agent_id
+    """
+    parts = [agent_id]
+    if user_id:
+        parts.append(f"u-{_safe_component(str(user_id))}")
+    if thread_id:
+        parts.append(f"t-{_safe_component(str(thread_id))}")
+    return "--".join(parts)
+
+
+def agent_path(base_path: Path, agent_id: str) -> Path:
+    """分桶布局下的 Agent 目录"""
+    return base_path / AGENTS_DIR / shard_key(agent_id)[:2] / f"agent_{agent_id}"
+
+
+def task_path(agent_dir: Path, task_id: str) -> Path:
+    """分桶布局下的任务目录"""
+    digest = shard_key(task_id)
+    return agent_dir / TASKS_DIR / digest[:2] / digest[2:4] / f"task_{task_id}"
+
+
+def legacy_agent_path(base_path: Path, agent_id: str) -> Path:
+    """旧版平铺布局下的 Agent 目录"""
+    return base_path / f"agent_{agent_id}"
+
+
+def iter_task_dirs(agent_dir: Path) -> Iterator[Tuple[str, Path]]:
+    """遍历分桶布局下 Agent 的所有任务目录，返回 (task_id, 目录)"""
+    tasks_root = agent_dir / TASKS_DIR
+    if not tasks_root.exists():
+        return
+    for task_dir in tasks_root.glob("*/*/task_*"):
+        if task_dir.is_dir():
+            yield task_dir.name[5:], task_dir
+
+
+def iter_legacy_task_dirs(legacy_dir: Path) -> Iterator[Tuple[str, Path]]:
+    """遍历旧版平铺布局下 Agent 的所有任务目录"""
+    if not legacy_dir.exists():
+        return
+    for task_dir in legacy_dir.iterdir():
+        if task_dir.is_dir() and task_dir.name.startswith("task_"):
+            yield task_dir.name[5:], task_dir
+
+
+def iter_agent_ids(base_path: Path) -> Iterator[str]:
+    """遍历所有 Agent ID（分桶布局和旧版布局，去重）"""
+    seen = set()
+    agents_root = base_path / AGENTS_DIR
+    if agents_root.exists():
+        for agent_dir in agents_root.glob("*/agent_*"):
+            agent_id = agent_dir.name[6:]
+            if agent_dir.is_dir() and agent_id not in seen:
+                seen.add(agent_id)
+                yield agent_id
+    for agent_dir in base_path.glob("agent_*"):
+        agent_id = agent_dir.name[6:]
+        if agent_dir.is_dir() and agent_id not in seen:
+            seen.add(agent_id)
+            yield agent_id
@@ -0,0 +1,506 @@
+"""
+上下文存储接口
+FileContextManager（Markdown 文件）和 SQLiteContextStore（SQLite 行存储）的公共抽象，
+AgentContext 只依赖该接口，可以在两种后端之间切换
+"""
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from .context_format import PREVIEW_LENGTH
+from .section_index import is_section_name, replace_section, section_entry
+from .task_transfer import (
+    CHUNK_CHARS,
+    ImportedTask,
+    batched,
+    export_ndjson,
+    read_tasks,
+)
+from .todo_index import TodoItem
+
+if TYPE_CHECKING:
+    from .artifact_cache import ArtifactCache
+    from .file_context_manager import TaskContext
+
+
+@dataclass
+class ContextMutation:
+    """批量提交中的一次修改：存储的写方法名及其参数（不含 agent_id、task_id）"""
+
+    method: str
+    args: Tuple[Any, ...] = ()
+
+
+@dataclass
+class ContextBatch:
+    """AgentContext.batch() 缓存的修改，退出后 committed 表示是否提交成功"""
+
+    task_id: str
+    mutations: List[ContextMutation] = field(default_factory=list)
+    committed: Optional[bool] = None
+
+
+# 可以放入批量提交的写方法
+BATCH_METHODS = (
+    "add_chat_message",
+    "add_resource_link",
+    "add_summary_entry",
+    "add_scratchpad_entry",
+    "append_file_content",
+    "update_todo_progress",
+    "mark_todo_completed",
+    "update_file_content",
+    "update_task_status",
+    "upsert_section",
+    "delete_section",
+)
+
+
+class ContextStore(ABC):
+    """上下文存储后端"""
+
+    @abstractmethod
+    def create_task_context(
+        self,
+        agent_id: str,
+        task_id: str,
+        title: str,
+        description: str,
+        todo_items: Optional[List[Union[str, TodoItem]]] = None,
+    ) -> "TaskContext":
+        """创建新的任务上下文"""
+
+    @abstractmethod
+    def load_task_context(
+        self, agent_id: str, task_id: str
+    ) -> Optional["TaskContext"]:
+        """加载任务上下文，文件内容在首次访问时读取"""
+
+    @abstractmethod
+    def update_file_content(
+        self,
+        agent_id: str,
+        task_id: str,
+        file_type: str,
+        content: str,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> bool:
+        """整体替换文件内容"""
+
+    @abstractmethod
+    def update_task_status(self, agent_id: str, task_id: str, status: str) -> bool:
+        """更新任务状态"""
+
+    @abstractmethod
+    def append_file_content(
+        self, agent_id: str, task_id: str, file_type: str, append_text: str
+    ) -> bool:
+        """向文件末尾追加文本"""
+
+    @abstractmethod
+    def add_chat_message(
+        self, agent_id: str, task_id: str, role: str, content: str
+    ) -> bool:
+        """添加聊天消息到历史记录"""
+
+    @abstractmethod
+    def update_todo_progress(
+        self, agent_id: str, task_id: str, progress_updates: List[str]
+    ) -> bool:
+        """更新待办事项进度"""
+
+    @abstractmethod
+    def add_resource_link(
+        self, agent_id: str, task_id: str, title: str, url: str, description: str = ""
+    ) -> bool:
+        """添加资源链接"""
+
+    @abstractmethod
+    def add_summary_entry(
+        self, agent_id: str, task_id: str, section: str, content: str
+    ) -> bool:
+        """添加总结条目"""
+
+    @abstractmethod
+    def add_scratchpad_entry(self, agent_id: str, task_id: str, content: str) -> bool:
+        """添加临时笔记"""
+
+    @abstractmethod
+    def get_chat_messages(
+        self,
+        agent_id: str,
+        task_id: str,
+        limit: Optional[int] = None,
+        since: Optional[datetime] = None,
+    ) -> List[Dict[str, str]]:
+        """获取聊天消息（按时间顺序，limit 表示只取最近的若干条，since 表示起始时间）"""
+
+    @abstractmethod
+    def get_todo_items(
+        self, agent_id: str, task_id: str, include_completed: bool = False
+    ) -> List[str]:
+        """获取待办事项文本（默认只返回未完成项）"""
+
+    @abstractmethod
+    def mark_todo_completed(self, agent_id: str, task_id: str, item_text: str) -> bool:
+        """将包含 item_text 的未完成待办事项标记为完成"""
+
+    @abstractmethod
+    def get_resources(self, agent_id: str, task_id: str) -> List[Dict[str, Any]]:
+        """获取资源链接列表（按 URL 去重，每项包含 title/url/description/hits）"""
+
+    @abstractmethod
+    def list_agent_tasks_page(
+        self,
+        agent_id: str,
+        status: Union[str, Sequence[str], None] = None,
+        page_size: Optional[int] = 50,
+        cursor: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """分页列出Agent的任务，返回 {"tasks": [...], "next_cursor": ...}"""
+
+    def append_to_task_file(
+        self, agent_id: str, task_id: str, file_type: str, append_text: str
+    ) -> bool:
+        """向指定类型的任务文件追加内容（如 todo.md）"""
+        return self.append_file_content(agent_id, task_id, file_type, append_text)
+
+    def get_file_content(
+        self, agent_id: str, task_id: str, file_type: str
+    ) -> Optional[str]:
+        """获取指定类型文件的完整内容"""
+        task_context = self.load_task_context(agent_id, task_id)
+        if not task_context:
+            return None
+        file_obj = task_context.files.get(file_type)
+        return file_obj.content if file_obj else None
+
+    def list_agent_tasks(
+        self,
+        agent_id: str,
+        status: Union[str, Sequence[str], None] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """列出Agent的任务（按 updated_at 倒序，支持状态过滤和游标分页）"""
+        return self.list_agent_tasks_page(agent_id, status, limit, cursor)["tasks"]
+
+    def get_context_summary(self, agent_id: str, task_id: str) -> Dict[str, Any]:
+        """获取上下文摘要"""
+        task_context = self.load_task_context(agent_id, task_id)
+        if not task_context:
+            return {}
+
+        summary = {
+            "task_id": task_context.task_id,
+            "title": task_context.title,
+            "status": task_context.status,
+            "created_at": task_context.created_at.isoformat(),
+            "updated_at": task_context.updated_at.isoformat(),
+            "files": {},
+        }
+
+        for name, file in task_context.files.items():
+            # 只返回文件的基本信息和内容摘要
+            summary["files"][name] = {
+                "name": file.name,
+                "file_type": file.file_type,
+                "content_length": file.get_length(),
+                "content_size": file.size,
+                "content_tokens": file.get_tokens(),
+                "content_preview": (
+                    file.get_preview() + "..."
+                    if file.get_length() > PREVIEW_LENGTH
+                    else file.get_preview()
+                ),
+                "updated_at": file.updated_at.isoformat(),
+                "version": file.version,
+            }
+        summary["stats"] = {
+            key: value
+            for key, value in task_context.get_stats().items()
+            if key != "files"
+        }
+
+        return summary
+
+    def get_context_size(self, agent_id: str, task_id: str) -> Dict[str, Any]:
+        """
+        获取任务的字节数、字符数和 token 数（各文件随写入增量维护，只读取元数据）
+
+        Returns:
+            {"size", "length", "tokens", "files": {文件类型: {"size", "length", "tokens"}}}，
+            任务不存在时返回空字典
+        """
+        task_context = self.load_task_context(agent_id, task_id)
+        if not task_context:
+            return {}
+        return task_context.get_stats()
+
+    def list_file_versions(
+        self, agent_id: str, task_id: str, file_type: str
+    ) -> List[Dict[str, Any]]:
+        """列出文件的历史版本（默认不保留历史版本）"""
+        return []
+
+    def get_file_version(
+        self, agent_id: str, task_id: str, file_type: str, version: int
+    ) -> Optional[str]:
+        """读取文件的指定历史版本"""
+        return None
+
+    def rollback_file(
+        self, agent_id: str, task_id: str, file_type: str, version: int
+    ) -> bool:
+        """将文件回滚到指定历史版本"""
+        return False
+
+    def cleanup_old_versions(self, agent_id: str, task_id: str, keep_versions: int = 5):
+        """清理旧版本（默认不保存历史版本，无需清理）"""
+
+    def summarize_file_with_llm(
+        self, agent_id: str, task_id: str, file_type: str, llm, max_length: int = 200
+    ) -> bool:
+        """对指定文件用LLM生成摘要并覆盖内容（或生成新版本）"""
+        task_context = self.load_task_context(agent_id, task_id)
+        if not task_context or file_type not in task_context.files:
+            return False
+        file_obj = task_context.files[file_type]
+        summary = None
+        try:
+            from app.core.context.context_tools import ContextTools
+
+            summary = ContextTools.generate_llm_summary(
+                file_obj.content, llm, max_length=max_length
+            )
+        except Exception as e:
+            print(f"LLM摘要失败: {e}")
+            return False
+        if summary:
+            return self.update_file_content(agent_id, task_id, file_type, summary)
+        return False
+
+    def summarize_task_context_with_llm(
+        self, agent_id: str, task_id: str, llm, max_size: int = 10000
+    ) -> bool:
+        """
+        对整个任务上下文所有文件用LLM摘要，自动压缩
+
+        是否超限以及哪些文件需要压缩都按元数据中的字符数判断，只读取需要压缩的文件内容
+        """
+        from app.core.context.context_tools import ContextTools
+
+        context_data = self.get_context_summary(agent_id, task_id)
+        if ContextTools.calculate_context_size(context_data) <= max_size:
+            return True
+        file_budget = max_size // max(1, len(context_data["files"]))
+        for file_type, file_data in context_data["files"].items():
+            if file_data["content_length"] > file_budget:
+                file_data["content"] = self.get_file_content(
+                    agent_id, task_id, file_type
+                )
+        compressed = ContextTools.compress_context_with_llm(
+            context_data, llm, max_size=max_size
+        )
+        # 更新所有被压缩的文件内容
+        files = compressed.get("files", {})
+        for file_type, file_data in files.items():
+            if file_data.get("compressed"):
+                self.update_file_content(
+                    agent_id, task_id, file_type, file_data["content"]
+                )
+        return True
+
+    def replace_file_prefix(
+        self,
+        agent_id: str,
+        task_id: str,
+        file_type: str,
+        old_prefix: str,
+        new_prefix: str,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> bool:
+        """
+        将文件开头的 old_prefix 替换为 new_prefix，保留其后追加的内容
+
+        用于耗时的后台改写（如压缩）：文件在读取后只被追加时写回成功，
+        被其他操作改写时放弃并返回 False。后端应在任务锁或事务中执行
+        """
+        content = self.get_file_content(agent_id, task_id, file_type)
+        if content is None or not content.startswith(old_prefix):
+            return False
+        return self.update_file_content(
+            agent_id,
+            task_id,
+            file_type,
+            new_prefix + content[len(old_prefix) :],
+            metadata=metadata,
+        )
+
+    def upsert_section(
+        self, agent_id: str, task_id: str, file_type: str, section: str, content: str
+    ) -> bool:
+        """
+        写入 summary.md 或 todo.md 中的 "## section" 条目：已存在时替换，否则追加到末尾
+
+        同名条目只保留最后一个的位置；内容中的一、二级标题降为三级。
+        默认读取完整内容后整体改写，后端应在任务锁或事务中执行
+        """
+        section = section.strip()
+        if not is_section_name(file_type, section):
+            print(f"写入条目失败: 不支持的文件 {file_type} 或条目 {section!r}")
+            return False
+        entry = section_entry(file_type, section, content)
+        current = self.get_file_content(agent_id, task_id, file_type)
+        if current is None:
+            return self.append_file_content(agent_id, task_id, file_type, entry)
+        new_content, _ = replace_section(current, section, entry)
+        return self.update_file_content(agent_id, task_id, file_type, new_content)
+
+    def delete_section(
+        self, agent_id: str, task_id: str, file_type: str, section: str
+    ) -> bool:
+        """删除 summary.md 或 todo.md 中的 "## section" 条目，条目不存在时返回 False"""
+        section = section.strip()
+        if not is_section_name(file_type, section):
+            return False
+        current = self.get_file_content(agent_id, task_id, file_type)
+        if current is None:
+            return False
+        new_content, found = replace_section(current, section, None)
+        if not found:
+            return False
+        return self.update_file_content(agent_id, task_id, file_type, new_content)
+
+    def iter_file_chunks(
+        self,
+        agent_id: str,
+        task_id: str,
+        file_type: str,
+        chunk_chars: int = CHUNK_CHARS,
+    ) -> Iterator[str]:
+        """分块读取文件内容（默认读取完整内容后切分，后端可覆盖为流式读取）"""
+        content = self.get_file_content(agent_id, task_id, file_type) or ""
+        for start in range(0, len(content), chunk_chars):
+            yield content[start : start + chunk_chars]
+
+    def export_tasks(
+        self, agent_id: str, task_ids: Optional[Iterable[str]] = None
+    ) -> Iterator[bytes]:
+        """
+        以 NDJSON 流导出任务（task_ids 为 None 时导出 Agent 的全部任务）
+
+        逐行生成，文件内容分块读取，可直接作为 HTTP 流式响应体，格式见 task_transfer
+        """
+        return export_ndjson(self, agent_id, task_ids)
+
+    def import_tasks(
+        self,
+        source: Iterable[Union[bytes, str]],
+        agent_id: Optional[str] = None,
+        batch_size: int = 500,
+    ) -> Dict[str, Any]:
+        """
+        导入 NDJSON 流中的任务（同 ID 的任务被覆盖），按 batch_size 分批写入
+
+        Args:
+            source: 按行或任意切分的输入（文件对象、HTTP 请求体等）
+            agent_id: 导入到的 Agent，为 None 时使用记录中的 Agent
+
+        Returns:
+            {"imported": 导入的任务数, "failed": 失败的任务数, "errors": [...]}
+        """
+        errors: List[str] = []
+        imported = failed = 0
+        for batch in batched(read_tasks(source, errors), batch_size):
+            by_agent: Dict[str, List[ImportedTask]] = {}
+            for task in batch:
+                target = agent_id or task.agent_id
+                if not target:
+                    errors.append(f"任务 {task.task_id} 缺少 Agent ID")
+                    failed += 1
+                    continue
+                by_agent.setdefault(target, []).append(task)
+            for target, tasks in by_agent.items():
+                count = self.import_task_batch(target, tasks)
+                imported += count
+                failed += len(tasks) - count
+        return {"imported": imported, "failed": failed, "errors": errors}
+
+    def import_task_batch(self, agent_id: str, tasks: List[ImportedTask]) -> int:
+        """
+        导入一批任务，返回成功导入的任务数
+
+        默认逐个创建任务再写入各文件；后端应覆盖为每个文件和元数据只写入一次
+        """
+        imported = 0
+        for task in tasks:
+            try:
+                self.create_task_context(
+                    agent_id, task.task_id, task.title, task.description
+                )
+                for file_type, imported_file in task.files.items():
+                    if not self.update_file_content(
+                        agent_id,
+                        task.task_id,
+                        file_type,
+                        imported_file.content,
+                        metadata=imported_file.metadata,
+                    ):
+                        raise ValueError(f"写入 {file_type} 失败")
+                self.update_task_status(agent_id, task.task_id, task.status)
+                imported += 1
+            except Exception as e:
+                print(f"导入任务 {task.task_id} 失败: {e}")
+        return imported
+
+    def apply_mutations(
+        self, agent_id: str, task_id: str, mutations: Sequence[ContextMutation]
+    ) -> bool:
+        """
+        批量提交修改（默认逐条执行，遇到失败即停止，不保证原子性）
+
+        后端应覆盖该方法：一次加载，每个文件最多写入一次，全部成功或全部不生效
+        """
+        for mutation in mutations:
+            if mutation.method not in BATCH_METHODS:
+                print(f"批量写入失败: 不支持的操作 {mutation.method}")
+                return False
+            method = getattr(self, mutation.method)
+            if not method(agent_id, task_id, *mutation.args):
+                return False
+        return True
+
+    def get_artifact_cache(self) -> Optional["ArtifactCache"]:
+        """跨任务共享的产物缓存，后端不支持时返回 None"""
+        return None
+
+    def search_contexts(
+        self,
+        query: str,
+        k: int = 10,
+        agent_id: Optional[str] = None,
+        exclude_task: Optional[Tuple[str, str]] = None,
+        file_types: Optional[Sequence[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """全文检索所有任务的上下文，后端不支持时返回空列表"""
+        return []
+
+    def flush(self):
+        """立即落盘待提交的写入"""
+
+    def close(self):
+        """释放存储占用的资源"""
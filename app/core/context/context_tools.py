@@ -9,6 +9,15 @@ from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
+from .token_count import count_tokens
+
+# 计量单位 -> get_context_summary 中各文件预先统计的字段
+SIZE_UNIT_KEYS = {
+    "chars": "content_length",
+    "bytes": "content_size",
+    "tokens": "content_tokens",
+}
+
 
 class ContextTools:
     """上下文管理工具类"""
@@ -246,29 +255,53 @@ class ContextTools:
         return f"\n### {timestamp}: 临时笔记\n{content}\n"
 
     @staticmethod
-    def calculate_context_size(context_data: Dict[str, Any]) -> int:
-        """计算上下文大小（字符数）"""
+    def measure_text(text: str, unit: str = "chars") -> int:
+        """按字符数、字节数或 token 数计量文本"""
+        if unit == "chars":
+            return len(text)
+        if unit == "bytes":
+            return len(text.encode("utf-8"))
+        if unit == "tokens":
+            return count_tokens(text)
+        raise ValueError(f"不支持的计量单位: {unit}")
+
+    @staticmethod
+    def measure_file(file_data: Dict[str, Any], unit: str = "chars") -> int:
+        """计量单个文件：有 content 时按内容计算，否则使用预先统计的字段"""
+        if "content" in file_data:
+            return ContextTools.measure_text(file_data["content"], unit)
+        return file_data.get(SIZE_UNIT_KEYS[unit], 0)
+
+    @staticmethod
+    def calculate_context_size(
+        context_data: Dict[str, Any], unit: str = "chars"
+    ) -> int:
+        """
+        计算上下文大小（unit: chars/bytes/tokens）
+
+        get_context_summary 的结果不含文件内容，直接使用其中随写入维护的统计字段
+        """
         total_size = 0
 
         # 计算基本信息的长度
         for key in ["task_id", "title", "description", "status"]:
             if key in context_data:
-                total_size += len(str(context_data[key]))
+                total_size += ContextTools.measure_text(str(context_data[key]), unit)
 
         # 计算文件内容的长度
         files = context_data.get("files", {})
         for file_type, file_data in files.items():
-            if isinstance(file_data, dict) and "content" in file_data:
-                total_size += len(file_data["content"])
+            if isinstance(file_data, dict):
+                total_size += ContextTools.measure_file(file_data, unit)
 
         return total_size
 
     @staticmethod
     def compress_context(
-        context_data: Dict[str, Any], max_size: int = 10000
+        context_data: Dict[str, Any], max_size: int = 10000, unit: str = "chars"
     ) -> Dict[str, Any]:
-        """压缩上下文数据"""
-        current_size = ContextTools.calculate_context_size(context_data)
+        """压缩上下文数据（只压缩带有 content 的文件）"""
+        current_size = ContextTools.calculate_context_size(context_data, unit)
 
         if current_size <= max_size:
             return context_data
@@ -280,7 +313,7 @@ class ContextTools:
         for file_type, file_data in files.items():
             if isinstance(file_data, dict) and "content" in file_data:
                 content = file_data["content"]
-                if len(content) > max_size // len(files):
+                if ContextTools.measure_file(file_data, unit) > max_size // len(files):
                     # 生成摘要
                     file_data["content"] = ContextTools.generate_summary(
                         content, max_size // len(files)
@@ -308,10 +341,10 @@ class ContextTools:
 
     @staticmethod
     def compress_context_with_llm(
-        context_data: Dict[str, Any], llm, max_size: int = 10000
+        context_data: Dict[str, Any], llm, max_size: int = 10000, unit: str = "chars"
     ) -> Dict[str, Any]:
-        """使用大模型对上下文进行压缩（摘要）"""
-        current_size = ContextTools.calculate_context_size(context_data)
+        """使用大模型对上下文进行压缩（摘要，只压缩带有 content 的文件）"""
+        current_size = ContextTools.calculate_context_size(context_data, unit)
         if current_size <= max_size:
             return context_data
         compressed = context_data.copy()
@@ -319,7 +352,8 @@ class ContextTools:
         for file_type, file_data in files.items():
             if isinstance(file_data, dict) and "content" in file_data:
                 content = file_data["content"]
-                if len(content) > max_size // max(1, len(files)):
+                file_size = ContextTools.measure_file(file_data, unit)
+                if file_size > max_size // max(1, len(files)):
                     # 用LLM生成摘要
                     summary = ContextTools.generate_llm_summary(
                         content, llm, max_length=max_size // max(1, len(files))
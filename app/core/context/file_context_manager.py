@@ -3,32 +3,194 @@
 实现基于文件系统的Agent上下文管理
 """
 
-import hashlib
-import json
+import codecs
+import itertools
+import mmap
 import os
 import shutil
+import threading
+import time
 import uuid
-from dataclasses import asdict, dataclass, field
-from datetime import datetime
+from contextlib import ExitStack, contextmanager
+from dataclasses import asdict, dataclass, field, replace
+from datetime import datetime, timedelta
+from functools import partial
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Union
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from . import context_format, context_layout
+from .artifact_cache import DEFAULT_MAX_BYTES, ArtifactCache
+from .atomic_io import (
+    DURABILITY_ATOMIC,
+    DURABILITY_FSYNC,
+    DURABILITY_GROUP,
+    DURABILITY_MODES,
+    DURABILITY_UNSAFE,
+    DeferredFsyncWriter,
+    atomic_write_bytes,
+)
+from .cache_watcher import CacheInvalidationWatcher
+from .context_format import PREVIEW_LENGTH
+from .context_store import ContextMutation, ContextStore
+from .history_index import HistoryIndex
+from .metadata_codec import decode_metadata, get_codec
+from .resource_registry import ResourceRegistry
+from .search_index import ContextSearchIndex
+from .section_index import (
+    SECTION_FILE_TYPES,
+    TOMBSTONE_GC_BYTES,
+    SectionIndex,
+    heading_name,
+    is_section_name,
+    replace_section,
+    section_entry,
+    strip_tombstone_chunks,
+    strip_tombstones,
+    write_tombstone,
+)
+from .task_archive import (
+    BUNDLE_SUFFIXES,
+    bundle_suffix,
+    disk_usage,
+    pack_task,
+    read_bundle_metadata,
+    unpack_task,
+)
+from .task_cache import FileSignature, TaskContextCache, get_shared_task_cache
+from .task_index import TaskIndex
+from .task_lock import TaskLockManager
+from .task_transfer import CHUNK_CHARS, ImportedTask
+from .todo_index import TodoItem
+from .todo_offset_index import TodoOffsetIndex, scan_open_items
+from .token_count import count_tokens
+from .version_store import VersionStore
+
+# 首次写入时才创建的上下文文件
+LAZY_FILE_TYPES = ("history", "summary", "scratchpad")
 
 
 @dataclass
 class ContextFile:
-    """上下文文件结构"""
+    """上下文文件结构（content 为 None 时在首次访问时通过 loader 或 path 加载）"""
 
     name: str
-    content: str
+    content: Optional[str] = field(repr=False)
     file_type: str  # todo, history, resource, summary, scratchpad
     created_at: datetime
     updated_at: datetime
     version: int = 1
     metadata: Dict[str, Any] = field(default_factory=dict)
+    size: int = 0  # 文件字节数，随写入增量维护
+    length: Optional[int] = None  # 文件字符数，随写入增量维护
+    tokens: Optional[int] = None  # 文件 token 数（估算），随写入增量维护
+    preview: Optional[str] = None  # 文件开头 PREVIEW_LENGTH 个字符
+    path: Optional[Path] = field(default=None, repr=False, compare=False)
+    loader: Optional[Callable[[], str]] = field(
+        default=None, repr=False, compare=False
+    )
 
     def __post_init__(self):
         pass
 
+    @property
+    def is_loaded(self) -> bool:
+        """内容是否已加载到内存"""
+        return self._content is not None
+
+    def get_length(self) -> int:
+        """文件字符数，优先使用元数据；缺失时计算一次并记录"""
+        if self.length is None:
+            self.length = len(self.content)
+        return self.length
+
+    def get_tokens(self) -> int:
+        """文件 token 数，优先使用元数据；缺失时计算一次并记录"""
+        if self.tokens is None:
+            self.tokens = count_tokens(self.content)
+        return self.tokens
+
+    def get_preview(self) -> str:
+        """文件开头的预览文本，优先使用元数据，无需读取内容"""
+        if self.preview is not None:
+            return self.preview
+        return self.content[:PREVIEW_LENGTH]
+
+    @contextmanager
+    def open_view(self) -> Iterator[Union[mmap.mmap, bytes]]:
+        """以只读 mmap 方式打开文件，用于在大文件中查找/切片而不加载全文"""
+        if self.path is None or self.size == 0:
+            yield (self._content or "").encode("utf-8")
+            return
+        with open(self.path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                yield view
+
+    def _load_content(self) -> str:
+        """
+        读取文件内容（非文件存储后端通过 loader 按需渲染）
+
+        summary/todo 中按条目删除留下的删除标记不属于内容，读取时去掉
+        """
+        if self.loader is not None:
+            return self.loader()
+        if self.path is None:
+            return ""
+        try:
+            content = self.path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return ""
+        if self.file_type in SECTION_FILE_TYPES:
+            content = strip_tombstones(content)
+        return content
+
+
+def _get_content(self: ContextFile) -> str:
+    if self._content is None:
+        self._content = self._load_content()
+    return self._content
+
+
+def _set_content(self: ContextFile, value: Optional[str]):
+    self._content = value
+
+
+# dataclass 生成的 __init__ 通过该属性赋值，实现 content 的懒加载
+ContextFile.content = property(_get_content, _set_content)
+
+
+def _todo_mark_changes(
+    offsets: List[int], append_text: str
+) -> Tuple[List[str], List[str]]:
+    """原地标记待办事项并追加文本时写入和被覆盖的文本片段"""
+    return [append_text] + ["- [x]"] * len(offsets), ["- [ ]"] * len(offsets)
+
+
+def _read_text_chunks(f: BinaryIO, remaining: int, chunk_chars: int) -> Iterator[str]:
+    """从已打开的文件中按块读取 remaining 个字节并解码"""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    while remaining > 0:
+        data = f.read(min(chunk_chars, remaining))
+        if not data:
+            break
+        remaining -= len(data)
+        text = decoder.decode(data)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
 
 @dataclass
 class TaskContext:
@@ -46,229 +208,691 @@ class TaskContext:
     def __post_init__(self):
         pass
 
+    def get_stats(self) -> Dict[str, Any]:
+        """任务及各文件的字节数、字符数和 token 数（取自元数据，无需读取文件内容）"""
+        files = {
+            name: {
+                "size": file.size,
+                "length": file.get_length(),
+                "tokens": file.get_tokens(),
+            }
+            for name, file in self.files.items()
+        }
+        stats = {
+            key: sum(file_stats[key] for file_stats in files.values())
+            for key in ("size", "length", "tokens")
+        }
+        stats["files"] = files
+        return stats
 
-class FileContextManager:
+
+class FileContextManager(ContextStore):
     """文件系统上下文管理器"""
 
-    def __init__(self, base_path: str = "./agent_contexts"):
+    def __init__(
+        self,
+        base_path: str = "./agent_contexts",
+        cache: Optional[TaskContextCache] = None,
+        cache_size: Optional[int] = None,
+        durability: str = DURABILITY_ATOMIC,
+        group_commit_window: float = 0.05,
+        lock_timeout: Optional[float] = None,
+        version_history: bool = True,
+        version_budget_bytes: Optional[int] = 64 * 1024 * 1024,
+        artifact_cache_bytes: int = DEFAULT_MAX_BYTES,
+        watch_changes: bool = False,
+        metadata_codec: Optional[str] = None,
+        search_index: bool = True,
+    ):
         self.base_path = Path(base_path)
         self.base_path.mkdir(exist_ok=True)
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"不支持的持久化模式: {durability}")
+        self.durability = durability
+        # 元数据编码（默认 orjson 紧凑 JSON，可选 msgpack），读取时兼容所有格式
+        self._metadata_codec = get_codec(metadata_codec)
+        # 组提交模式下，写入（包括元数据）仍在任务锁内立即完成，只把 fsync
+        # 推迟到后台线程按窗口合并执行；若内容留在进程内等待写入，
+        # 释放锁后其他进程会读到旧的元数据并覆盖更新
+        self._group_writer = (
+            DeferredFsyncWriter(group_commit_window)
+            if durability == DURABILITY_GROUP
+            else None
+        )
+        # 默认使用进程级共享缓存；cache_size=0 可关闭缓存
+        if cache is None:
+            cache = (
+                TaskContextCache(cache_size)
+                if cache_size is not None
+                else get_shared_task_cache()
+            )
+        self._cache = cache
+        self._cache_namespace = str(self.base_path.resolve())
+        # 监听已缓存任务的目录：其他进程修改任务时及时丢弃缓存项，只读加载命中缓存时
+        # 无需逐文件校验签名（watchfiles 未安装时退化为后台轮询）
+        self._watcher = CacheInvalidationWatcher(cache) if watch_changes else None
+        # 任务级跨进程读写锁，锁文件集中放在 .locks 目录下
+        self._locks = TaskLockManager(self.base_path / ".locks", timeout=lock_timeout)
+        # 每个 Agent 的任务索引（SQLite），按需打开
+        self._task_indexes: Dict[str, TaskIndex] = {}
+        self._task_indexes_lock = threading.Lock()
+        # 每个任务的历史版本存放在 .versions 目录，超出预算时淘汰最旧的版本
+        self.version_history = version_history
+        self.version_budget_bytes = version_budget_bytes
+        # 归档与还原的累计指标
+        self._archive_stats: Dict[str, float] = {
+            "archived_tasks": 0,
+            "original_bytes": 0,
+            "archived_bytes": 0,
+            "rehydrations": 0,
+            "rehydration_total": 0.0,
+            "rehydration_max": 0.0,
+        }
+        self._archive_stats_lock = threading.Lock()
+        # shared/ 目录下跨 Agent 共享的产物缓存，按需打开
+        self.artifact_cache_bytes = artifact_cache_bytes
+        self._artifact_cache: Optional[ArtifactCache] = None
+        self._artifact_cache_lock = threading.Lock()
+        # .search 目录下所有 Agent 任务的全文索引，写入文件时增量更新，按需打开
+        self.search_index = search_index
+        self._search_index: Optional[ContextSearchIndex] = None
+        self._search_index_lock = threading.Lock()
+        # 存在旧版平铺布局的 Agent 目录时，查找任务需要兼容旧路径（migrate_layout 后关闭）
+        self._legacy_layout = any(
+            path.is_dir() for path in self.base_path.glob("agent_*")
+        )
 
     def _get_agent_path(self, agent_id: str) -> Path:
-        """获取Agent工作空间路径"""
-        agent_path = self.base_path / f"agent_{agent_id}"
-        agent_path.mkdir(exist_ok=True)
+        """获取Agent工作空间路径（按 Agent ID 哈希分桶）"""
+        agent_path = context_layout.agent_path(self.base_path, agent_id)
+        agent_path.mkdir(parents=True, exist_ok=True)
         return agent_path
 
+    def _task_dir(self, agent_id: str, task_id: str) -> Path:
+        """
+        计算任务目录（不创建）
+
+        尚未迁移的旧版平铺目录 agent_<id>/task_<id> 中有任务时继续使用旧目录，
+        否则使用分桶目录
+        """
+        if self._legacy_layout:
+            legacy_path = (
+                context_layout.legacy_agent_path(self.base_path, agent_id)
+                / f"task_{task_id}"
+            )
+            if self._has_metadata(legacy_path):
+                return legacy_path
+        return context_layout.task_path(
+            context_layout.agent_path(self.base_path, agent_id), task_id
+        )
+
     def _get_task_path(self, agent_id: str, task_id: str) -> Path:
         """获取任务路径"""
-        task_path = self._get_agent_path(agent_id) / f"task_{task_id}"
-        task_path.mkdir(exist_ok=True)
+        task_path = self._task_dir(agent_id, task_id)
+        task_path.mkdir(parents=True, exist_ok=True)
         return task_path
 
+    def _get_metadata_path(self, task_path: Path) -> Path:
+        """获取任务元数据文件路径"""
+        return task_path / "metadata.json"
+
+    def _get_archive_root(self, agent_id: str) -> Path:
+        """获取Agent的归档目录（与工作空间一样按 Agent ID 哈希分桶）"""
+        bucket = context_layout.shard_key(agent_id)[:2]
+        return self.base_path / ".archive" / bucket / f"agent_{agent_id}"
+
+    def _get_archive_path(
+        self,
+        agent_id: str,
+        task_id: str,
+        suffix: Optional[str] = None,
+        archive_root: Optional[Path] = None,
+    ) -> Path:
+        """获取任务归档包路径（按任务ID哈希分桶，避免单个目录下文件过多）"""
+        bucket = context_layout.shard_key(task_id)[:2]
+        return (
+            (archive_root or self._get_archive_root(agent_id))
+            / bucket
+            / f"task_{task_id}{suffix or bundle_suffix()}"
+        )
+
+    def _find_archive(self, agent_id: str, task_id: str) -> Optional[Path]:
+        """查找任务的归档包（兼容旧版未分桶的归档目录），未归档时返回 None"""
+        archive_roots = [
+            self._get_archive_root(agent_id),
+            self.base_path / ".archive" / f"agent_{agent_id}",
+        ]
+        for archive_root in archive_roots:
+            for suffix in BUNDLE_SUFFIXES:
+                bundle_path = self._get_archive_path(
+                    agent_id, task_id, suffix, archive_root
+                )
+                if bundle_path.exists():
+                    return bundle_path
+        return None
+
+    def _has_metadata(self, task_path: Path) -> bool:
+        """任务目录中是否存在元数据"""
+        return self._get_metadata_path(task_path).exists()
+
+    def _get_version_store(self, task_path: Path) -> Optional[VersionStore]:
+        """获取任务的版本存储，未启用版本历史时返回 None"""
+        if not self.version_history:
+            return None
+        return VersionStore(
+            task_path / ".versions", fsync=self.durability == DURABILITY_FSYNC
+        )
+
+    def _get_history_index(self, task_path: Path) -> HistoryIndex:
+        """获取 history.md 的消息偏移索引"""
+        return HistoryIndex(
+            task_path / ".history.idx",
+            task_path / context_format.FILE_NAMES["history"],
+            fsync=self.durability == DURABILITY_FSYNC,
+        )
+
+    def _get_resource_registry(self, task_path: Path) -> ResourceRegistry:
+        """获取任务的资源登记表"""
+        return ResourceRegistry(
+            task_path / ".resources.sqlite",
+            task_path / context_format.FILE_NAMES["resource"],
+            fsync=self.durability == DURABILITY_FSYNC,
+        )
+
+    def _get_todo_offset_index(self, task_path: Path) -> TodoOffsetIndex:
+        """获取 todo.md 中未完成待办事项的偏移索引"""
+        return TodoOffsetIndex(
+            task_path / ".todo.items.sqlite",
+            task_path / context_format.FILE_NAMES["todo"],
+            fsync=self.durability == DURABILITY_FSYNC,
+        )
+
+    def _get_section_index(self, task_path: Path, file_type: str) -> SectionIndex:
+        """获取 summary.md / todo.md 的条目偏移索引"""
+        return SectionIndex(
+            task_path / f".{file_type}.sections.json",
+            task_path / context_format.FILE_NAMES[file_type],
+            fsync=self.durability == DURABILITY_FSYNC,
+        )
+
+    def _task_lock(self, agent_id: str, task_id: str, exclusive: bool = True):
+        """获取任务级读写锁（跨进程，同一线程内可重入）"""
+        return self._locks.acquire(f"{agent_id}/{task_id}", exclusive=exclusive)
+
+    def get_lock_stats(self) -> Dict[str, Any]:
+        """获取任务锁等待的汇总指标"""
+        return self._locks.stats()
+
+    def lock_contention_report(self, top: int = 10) -> List[Dict[str, Any]]:
+        """获取锁竞争最激烈的任务列表"""
+        return self._locks.contention_report(top)
+
+    def _cache_key(self, agent_id: str, task_id: str) -> Tuple[str, str, str]:
+        """缓存键，包含 base_path 以区分不同的上下文根目录"""
+        return (self._cache_namespace, agent_id, task_id)
+
+    def _file_signature(
+        self, task_path: Path, task_context: TaskContext
+    ) -> FileSignature:
+        """根据元数据和各上下文文件的 inode/mtime/size 计算签名"""
+        names = ["metadata.json"] + sorted(
+            file.name for file in task_context.files.values()
+        )
+        signature = []
+        for name in names:
+            try:
+                stat = (task_path / name).stat()
+                signature.append(
+                    (name, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+                )
+            except FileNotFoundError:
+                signature.append((name, -1, -1, -1))
+        return tuple(signature)
+
+    def _clone_task_context(self, task_context: TaskContext) -> TaskContext:
+        """复制任务上下文，避免调用方修改缓存中的对象"""
+        return replace(
+            task_context,
+            files={
+                # 显式传入 _content，避免 replace 触发懒加载
+                name: replace(
+                    file, content=file._content, metadata=dict(file.metadata)
+                )
+                for name, file in task_context.files.items()
+            },
+            metadata=dict(task_context.metadata),
+        )
+
+    def _remember_task_context(
+        self, agent_id: str, task_id: str, task_context: TaskContext, task_path: Path
+    ):
+        """写回缓存：保存后的任务上下文直接放入缓存，下次加载无需读盘"""
+        key = self._cache_key(agent_id, task_id)
+        signature = self._file_signature(task_path, task_context)
+        self._cache.put(key, signature, self._clone_task_context(task_context))
+        if self._watcher is not None:
+            self._watcher.subscribe(
+                key, task_path, lambda value: self._file_signature(task_path, value)
+            )
+
+    def _commit_task_metadata(
+        self, agent_id: str, task_id: str, task_context: TaskContext, task_path: Path
+    ):
+        """保存任务元数据，并同步更新任务索引和缓存"""
+        self._save_task_metadata(task_context, task_path)
+        self._get_task_index(agent_id).upsert(
+            task_id,
+            task_context.title,
+            task_context.status,
+            task_context.created_at.isoformat(),
+            task_context.updated_at.isoformat(),
+        )
+        self._remember_task_context(agent_id, task_id, task_context, task_path)
+
+    def invalidate_task_cache(self, agent_id: str, task_id: str):
+        """使指定任务的缓存失效"""
+        self._cache.invalidate(self._cache_key(agent_id, task_id))
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """获取任务上下文缓存的命中统计"""
+        return self._cache.stats()
+
+    def get_invalidation_stats(self) -> Dict[str, Any]:
+        """获取跨进程缓存失效的指标（事件数、失效数和失效延迟），未启用监听时为空"""
+        return self._watcher.stats() if self._watcher is not None else {}
+
+    def _cache_needs_verify(self, agent_id: str, task_id: str, key: Tuple) -> bool:
+        """
+        缓存命中时是否需要校验文件签名：未启用监听、监听尚未覆盖该任务，
+        或当前线程持有写锁（读改写必须基于磁盘上的最新内容）
+        """
+        return (
+            self._watcher is None
+            or not self._watcher.is_trusted(key)
+            or self._locks.holds_exclusive(f"{agent_id}/{task_id}")
+        )
+
+    def _get_index_path(self, agent_id: str) -> Path:
+        """获取任务索引路径（按 Agent ID 哈希分桶），旧版未分桶的索引文件会被移入"""
+        index_root = self.base_path / ".index"
+        bucket = context_layout.shard_key(agent_id)[:2]
+        index_path = index_root / bucket / f"agent_{agent_id}.sqlite"
+        legacy_path = index_root / f"agent_{agent_id}.sqlite"
+        if legacy_path.exists() and not index_path.exists():
+            index_path.parent.mkdir(parents=True, exist_ok=True)
+            for suffix in ("-wal", "-shm"):
+                sidecar = legacy_path.with_name(legacy_path.name + suffix)
+                if sidecar.exists():
+                    os.rename(sidecar, index_path.with_name(index_path.name + suffix))
+            os.rename(legacy_path, index_path)
+        return index_path
+
+    def _get_task_index(self, agent_id: str) -> TaskIndex:
+        """获取 Agent 的任务索引，首次使用时扫描已有任务目录完成构建"""
+        index = self._task_indexes.get(agent_id)
+        if index is not None:
+            return index
+        with self._task_indexes_lock:
+            index = self._task_indexes.get(agent_id)
+            if index is None:
+                index_path = self._get_index_path(agent_id)
+                index = TaskIndex(index_path)
+                if not index.is_built():
+                    self._build_task_index(agent_id, index)
+                self._task_indexes[agent_id] = index
+        return index
+
+    def _build_task_index(self, agent_id: str, index: TaskIndex):
+        """扫描任务目录构建索引（仅在索引不存在时执行一次）"""
+        rows = {False: [], True: []}
+        for task in self._scan_agent_tasks(agent_id):
+            rows[task["archived"]].append(
+                (
+                    task["task_id"],
+                    task["title"],
+                    task["status"],
+                    task["created_at"],
+                    task["updated_at"],
+                )
+            )
+        index.upsert_many(rows[False])
+        index.upsert_many(rows[True], archived=True)
+        index.mark_built()
+
+    def rebuild_task_index(self, agent_id: str):
+        """重新扫描任务目录，修复任务索引"""
+        self._build_task_index(agent_id, self._get_task_index(agent_id))
+
     def _get_shared_path(self) -> Path:
         """获取共享文件夹路径"""
         shared_path = self.base_path / "shared"
         shared_path.mkdir(exist_ok=True)
         return shared_path
 
+    def get_artifact_cache(self) -> ArtifactCache:
+        """获取 shared/ 目录下跨 Agent 共享的产物缓存"""
+        with self._artifact_cache_lock:
+            if self._artifact_cache is None:
+                self._artifact_cache = ArtifactCache(
+                    self._get_shared_path(), max_bytes=self.artifact_cache_bytes
+                )
+            return self._artifact_cache
+
+    def _get_search_index(self) -> Optional[ContextSearchIndex]:
+        """获取全文索引（未启用时返回 None）"""
+        if not self.search_index:
+            return None
+        with self._search_index_lock:
+            if self._search_index is None:
+                self._search_index = ContextSearchIndex(
+                    self.base_path / ".search" / "contexts.sqlite"
+                )
+            return self._search_index
+
+    def _index_write(
+        self, agent_id: str, task_id: str, file_type: str, text: str, replace: bool
+    ):
+        """文件写入后更新全文索引（replace 为整体改写，否则 text 为追加的内容）"""
+        index = self._get_search_index()
+        if index is None:
+            return
+        try:
+            if replace:
+                index.replace_file(agent_id, task_id, file_type, text)
+            else:
+                index.add_text(agent_id, task_id, file_type, text)
+        except Exception as e:
+            print(f"更新全文索引失败: {e}")
+
+    def _index_patch(
+        self,
+        agent_id: str,
+        task_id: str,
+        file_type: str,
+        removed: List[str],
+        added: Optional[str],
+    ):
+        """条目被替换或删除后更新全文索引：删除旧条目的索引，为新条目建立索引"""
+        index = self._get_search_index()
+        if index is None:
+            return
+        try:
+            for text in removed:
+                index.remove_text(agent_id, task_id, file_type, text)
+            if added is not None:
+                index.add_text(agent_id, task_id, file_type, added)
+        except Exception as e:
+            print(f"更新全文索引失败: {e}")
+
+    def _build_search_index(self, index: ContextSearchIndex):
+        """扫描所有 Agent 的任务目录构建全文索引（已归档的任务不参与构建）"""
+        for agent_id in context_layout.iter_agent_ids(self.base_path):
+            task_dirs = context_layout.iter_task_dirs(
+                context_layout.agent_path(self.base_path, agent_id)
+            )
+            for task_id, task_dir in task_dirs:
+                files = {}
+                for file_type in index.file_types:
+                    name = context_format.FILE_NAMES[file_type]
+                    try:
+                        files[file_type] = (task_dir / name).read_text(
+                            encoding="utf-8", errors="replace"
+                        )
+                    except FileNotFoundError:
+                        continue
+                    if file_type in SECTION_FILE_TYPES:
+                        files[file_type] = strip_tombstones(files[file_type])
+                try:
+                    index.replace_task(agent_id, task_id, files)
+                except Exception as e:
+                    print(f"索引任务 {task_id} 失败: {e}")
+        index.optimize()
+        index.mark_built()
+
+    def _index_delete_task(self, agent_id: str, task_id: str):
+        """任务被重新创建时删除其全文索引条目"""
+        index = self._get_search_index()
+        if index is None:
+            return
+        try:
+            index.delete_task(agent_id, task_id)
+        except Exception as e:
+            print(f"更新全文索引失败: {e}")
+
+    def rebuild_search_index(self):
+        """重新扫描所有任务目录，修复全文索引"""
+        index = self._get_search_index()
+        if index is not None:
+            self._build_search_index(index)
+
+    def search_contexts(
+        self,
+        query: str,
+        k: int = 10,
+        agent_id: Optional[str] = None,
+        exclude_task: Optional[Tuple[str, str]] = None,
+        file_types: Optional[Sequence[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        按 BM25 检索所有 Agent 任务的总结、笔记、资源和对话历史
+
+        首次检索时扫描已有任务目录完成构建，之后由各次写入增量更新
+
+        Args:
+            query: 查询文本（中文按相邻两字匹配）
+            k: 返回的结果数
+            agent_id: 只检索该 Agent 的任务
+            exclude_task: 排除的任务 (agent_id, task_id)
+            file_types: 只检索这些文件类型
+
+        Returns:
+            按相关性排列的条目摘录，见 ContextSearchIndex.search
+        """
+        index = self._get_search_index()
+        if index is None:
+            return []
+        try:
+            if not index.is_built():
+                with self._search_index_lock:
+                    if not index.is_built():
+                        self._build_search_index(index)
+            return index.search(query, k, agent_id, exclude_task, file_types)
+        except Exception as e:
+            print(f"检索任务上下文失败: {e}")
+            return []
+
     def create_task_context(
         self,
         agent_id: str,
         task_id: str,
         title: str,
         description: str,
-        todo_items: Optional[List[str]] = None,
+        todo_items: Optional[List[Union[str, TodoItem]]] = None,
     ) -> TaskContext:
         """创建新的任务上下文（只创建 todo.md 和 resource_links.txt）"""
-        task_path = self._get_task_path(agent_id, task_id)
+        with self._task_lock(agent_id, task_id):
+            task_path = self._get_task_path(agent_id, task_id)
 
-        # 创建任务上下文
-        task_context = TaskContext(
-            task_id=task_id,
-            title=title,
-            description=description,
-            status="pending",
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow(),
-        )
-
-        # 只初始化 todo 文件和 resource_links.txt
-        self._create_todo_file(task_context, task_path, todo_items=todo_items)
-        self._create_resource_file(task_context, task_path)
+            # 创建任务上下文
+            task_context = TaskContext(
+                task_id=task_id,
+                title=title,
+                description=description,
+                status="pending",
+                created_at=datetime.utcnow(),
+                updated_at=datetime.utcnow(),
+            )
 
-        # 保存任务元数据
-        self._save_task_metadata(task_context, task_path)
+            # 重新创建任务时丢弃原有的归档包和版本历史
+            stale_bundle = self._find_archive(agent_id, task_id)
+            if stale_bundle is not None:
+                stale_bundle.unlink()
+            versions = self._get_version_store(task_path)
+            if versions is not None:
+                versions.reset()
+            self._get_history_index(task_path).reset()
+            for file_type in SECTION_FILE_TYPES:
+                self._get_section_index(task_path, file_type).reset()
+            self._get_todo_offset_index(task_path).reset()
+            self._index_delete_task(agent_id, task_id)
+
+            # 只初始化 todo 文件和 resource_links.txt
+            self._create_todo_file(task_context, task_path, todo_items=todo_items)
+            self._create_resource_file(task_context, task_path)
+
+            # 保存任务元数据
+            self._commit_task_metadata(agent_id, task_id, task_context, task_path)
 
-        return task_context
+            return task_context
 
     def _create_todo_file(
         self,
         task_context: TaskContext,
         task_path: Path,
-        todo_items: Optional[List[str]] = None,
+        todo_items: Optional[List[Union[str, TodoItem]]] = None,
     ):
         """创建待办事项文件"""
-        todo_content = f"""# 任务待办事项
-
-## 任务信息
-- 任务ID: {task_context.task_id}
-- 标题: {task_context.title}
-- 描述: {task_context.description}
-- 状态: {task_context.status}
-- 创建时间: {task_context.created_at}
-
-## 目标
-{task_context.description}
-
-## 待办事项
-"""
+        todo_content = context_format.todo_header(
+            task_context.task_id,
+            task_context.title,
+            task_context.description,
+            task_context.status,
+            task_context.created_at,
+        )
         if todo_items and isinstance(todo_items, list) and len(todo_items) > 0:
-            for item in todo_items:
-                todo_content += f"- [ ] {item}\n"
+            items = todo_items
         else:
-            todo_content += "- [ ] 分析任务需求\n- [ ] 制定执行计划\n- [ ] 收集必要信息\n- [ ] 执行任务\n- [ ] 总结结果\n"
-        todo_content += f"""
-
-## 进度记录
-- {task_context.created_at}: 任务创建
-"""
-
-        todo_file = ContextFile(
-            name="todo.md",
-            content=todo_content,
-            file_type="todo",
-            created_at=task_context.created_at,
-            updated_at=task_context.updated_at,
-        )
+            items = context_format.DEFAULT_TODO_ITEMS
+        for item in map(TodoItem.of, items):
+            todo_content += context_format.todo_item(item.text, item_id=item.item_id)
+        todo_content += context_format.todo_footer(task_context.created_at)
 
-        task_context.files["todo"] = todo_file
-        self._save_file(todo_file, task_path / "todo.md")
+        self._create_file(task_context, task_path, "todo", todo_content)
 
     def _create_history_file(self, task_context: TaskContext, task_path: Path):
         """创建历史记录文件"""
-        history_content = f"""# 任务历史记录
-
-## 任务信息
-- 任务ID: {task_context.task_id}
-- 标题: {task_context.title}
-
-## 对话历史
-### {task_context.created_at}: 任务创建
-任务已创建，开始执行。
-
-## 决策记录
-### {task_context.created_at}: 初始化
-- 创建任务上下文
-- 初始化基础文件结构
-"""
-
-        history_file = ContextFile(
-            name="history.md",
-            content=history_content,
-            file_type="history",
-            created_at=task_context.created_at,
-            updated_at=task_context.updated_at,
+        history_content = context_format.history_header(
+            task_context.task_id, task_context.title, task_context.created_at
         )
-
-        task_context.files["history"] = history_file
-        self._save_file(history_file, task_path / "history.md")
+        self._create_file(task_context, task_path, "history", history_content)
 
     def _create_resource_file(self, task_context: TaskContext, task_path: Path):
         """创建资源链接文件"""
-        resource_content = f"""# 外部资源链接
-
-## 任务信息
-- 任务ID: {task_context.task_id}
-- 标题: {task_context.title}
-
-## 资源链接
-<!-- 在此添加相关的外部资源链接 -->
-
-## 文档引用
-<!-- 在此添加文档引用和摘要 -->
-
-## 工具配置
-<!-- 在此添加使用的工具配置信息 -->
-"""
-
-        resource_file = ContextFile(
-            name="resource_links.txt",
-            content=resource_content,
-            file_type="resource",
-            created_at=task_context.created_at,
-            updated_at=task_context.updated_at,
+        resource_content = context_format.resource_header(
+            task_context.task_id, task_context.title
         )
-
-        task_context.files["resource"] = resource_file
-        self._save_file(resource_file, task_path / "resource_links.txt")
+        self._create_file(task_context, task_path, "resource", resource_content)
 
     def _create_summary_file(self, task_context: TaskContext, task_path: Path):
         """创建总结文件"""
-        summary_content = f"""# 任务总结
-
-## 任务信息
-- 任务ID: {task_context.task_id}
-- 标题: {task_context.title}
-- 描述: {task_context.description}
-
-## 执行摘要
-<!-- 在此记录任务执行的关键信息和结果 -->
-
-## 关键要点
-<!-- 在此记录重要的发现和结论 -->
-
-## 后续行动
-<!-- 在此记录需要后续处理的事项 -->
-"""
-
-        summary_file = ContextFile(
-            name="summary.md",
-            content=summary_content,
-            file_type="summary",
-            created_at=task_context.created_at,
-            updated_at=task_context.updated_at,
+        summary_content = context_format.summary_header(
+            task_context.task_id, task_context.title, task_context.description
         )
-
-        task_context.files["summary"] = summary_file
-        self._save_file(summary_file, task_path / "summary.md")
+        self._create_file(task_context, task_path, "summary", summary_content)
 
     def _create_scratchpad_file(self, task_context: TaskContext, task_path: Path):
         """创建临时笔记文件"""
-        scratchpad_content = f"""# 临时笔记
-
-## 任务信息
-- 任务ID: {task_context.task_id}
-- 标题: {task_context.title}
-
-## 推理过程
-<!-- 在此记录推理过程和临时想法 -->
-
-## 临时计算
-<!-- 在此记录临时计算和实验 -->
-
-## 待验证想法
-<!-- 在此记录需要验证的想法和假设 -->
-"""
+        scratchpad_content = context_format.scratchpad_header(
+            task_context.task_id, task_context.title
+        )
+        self._create_file(task_context, task_path, "scratchpad", scratchpad_content)
 
-        scratchpad_file = ContextFile(
-            name="scratchpad.md",
-            content=scratchpad_content,
-            file_type="scratchpad",
+    def _create_file(
+        self, task_context: TaskContext, task_path: Path, file_type: str, content: str
+    ):
+        """创建上下文文件并写入磁盘"""
+        name = context_format.FILE_NAMES[file_type]
+        context_file = ContextFile(
+            name=name,
+            content=content,
+            file_type=file_type,
             created_at=task_context.created_at,
             updated_at=task_context.updated_at,
         )
 
-        task_context.files["scratchpad"] = scratchpad_file
-        self._save_file(scratchpad_file, task_path / "scratchpad.md")
+        task_context.files[file_type] = context_file
+        versions = self._get_version_store(task_path)
+        if versions is not None:
+            versions.start_generation(file_type, task_path / name)
+        self._save_file(context_file, task_path / name)
+        if versions is not None:
+            versions.record(file_type, context_file.version, context_file.size)
+
+    def _write_bytes(self, file_path: Path, data: bytes):
+        """按持久化模式写入整个文件"""
+        if self.durability == DURABILITY_UNSAFE:
+            file_path.write_bytes(data)
+        elif self._group_writer is not None:
+            atomic_write_bytes(file_path, data, fsync=False)
+            self._group_writer.sync_later(file_path)
+        else:
+            atomic_write_bytes(
+                file_path, data, fsync=self.durability == DURABILITY_FSYNC
+            )
+
+    def flush(self):
+        """立即 fsync 组提交中尚未同步的文件"""
+        if self._group_writer is not None:
+            self._group_writer.flush()
 
-    def _save_file(self, context_file: ContextFile, file_path: Path):
-        """保存文件到磁盘"""
-        file_path.write_text(context_file.content, encoding="utf-8")
+    def _save_file(
+        self, context_file: ContextFile, file_path: Path, atomic: bool = True
+    ):
+        """保存文件到磁盘（atomic=False 且不要求 fsync 时直接写入，不经过临时文件）"""
+        content = context_file.content
+        data = content.encode("utf-8")
+        if atomic or self.durability not in (DURABILITY_ATOMIC, DURABILITY_UNSAFE):
+            self._write_bytes(file_path, data)
+        else:
+            file_path.write_bytes(data)
+        context_file.size = len(data)
+        context_file.length = len(content)
+        context_file.tokens = count_tokens(content)
+        context_file.preview = content[:PREVIEW_LENGTH]
+        context_file.path = file_path
+
+    def _append_file(self, context_file: ContextFile, file_path: Path, text: str):
+        """以追加模式写入文件，只写入新增内容"""
+        data = text.encode("utf-8")
+        with open(file_path, "ab") as f:
+            f.write(data)
+            if self.durability == DURABILITY_FSYNC:
+                f.flush()
+                os.fsync(f.fileno())
+        if self._group_writer is not None:
+            self._group_writer.sync_later(file_path)
+        context_file.size += len(data)
+        if context_file.length is not None:
+            context_file.length += len(text)
+        if context_file.tokens is not None:
+            context_file.tokens += count_tokens(text)
+        if context_file.preview is not None:
+            if len(context_file.preview) < PREVIEW_LENGTH:
+                context_file.preview = (context_file.preview + text)[:PREVIEW_LENGTH]
+        # 已加载的内容同步追加，未加载的内容下次访问时从磁盘读取
+        if context_file.is_loaded:
+            context_file.content += text
+
+    def _create_missing_file(
+        self, task_context: TaskContext, task_path: Path, file_type: str
+    ) -> Optional[ContextFile]:
+        """按需创建尚不存在的上下文文件（history、summary、scratchpad）"""
+        creators = {
+            "history": self._create_history_file,
+            "summary": self._create_summary_file,
+            "scratchpad": self._create_scratchpad_file,
+        }
+        creator = creators.get(file_type)
+        if creator is None:
+            return None
+        creator(task_context, task_path)
+        return task_context.files[file_type]
 
     def _save_task_metadata(self, task_context: TaskContext, task_path: Path):
         """保存任务元数据"""
-        metadata_path = task_path / "metadata.json"
+        metadata_path = self._get_metadata_path(task_path)
+        # 先统计：旧版元数据缺少的字符数和 token 数在此补齐并一并保存
+        stats = task_context.get_stats()
         metadata = {
             "task_id": task_context.task_id,
             "title": task_context.title,
@@ -283,60 +907,87 @@ class FileContextManager:
                     "created_at": file.created_at.isoformat(),
                     "updated_at": file.updated_at.isoformat(),
                     "version": file.version,
+                    "size": file.size,
+                    "length": file.length,
+                    "tokens": file.tokens,
+                    "preview": file.preview,
                     "metadata": file.metadata,
                 }
                 for name, file in task_context.files.items()
             },
+            "stats": {key: value for key, value in stats.items() if key != "files"},
             "metadata": task_context.metadata,
         }
 
-        metadata_path.write_text(
-            json.dumps(metadata, ensure_ascii=False, indent=2), encoding="utf-8"
-        )
+        self._write_bytes(metadata_path, self._metadata_codec.encode(metadata))
 
     def load_task_context(self, agent_id: str, task_id: str) -> Optional[TaskContext]:
-        """加载任务上下文"""
-        task_path = self._get_task_path(agent_id, task_id)
-        metadata_path = task_path / "metadata.json"
-
-        if not metadata_path.exists():
-            return None
-
-        try:
-            metadata = json.loads(metadata_path.read_text(encoding="utf-8"))
-
-            # 重建任务上下文
-            task_context = TaskContext(
-                task_id=metadata["task_id"],
-                title=metadata["title"],
-                description=metadata["description"],
-                status=metadata["status"],
-                created_at=datetime.fromisoformat(metadata["created_at"]),
-                updated_at=datetime.fromisoformat(metadata["updated_at"]),
-                metadata=metadata.get("metadata", {}),
+        """加载任务上下文（优先从缓存读取，缓存按文件 mtime/size 校验）"""
+        # 已归档的任务先解压还原（需要写锁，必须在获取读锁之前完成）
+        self._rehydrate_if_archived(agent_id, task_id)
+        with self._task_lock(agent_id, task_id, exclusive=False):
+            task_path = self._get_task_path(agent_id, task_id)
+            key = self._cache_key(agent_id, task_id)
+            cached = self._cache.lookup(
+                key,
+                lambda value: self._file_signature(task_path, value),
+                verify=self._cache_needs_verify(agent_id, task_id, key),
             )
+            if cached is not None:
+                return self._clone_task_context(cached)
+
+            metadata_path = self._get_metadata_path(task_path)
+            if not metadata_path.exists():
+                return None
+
+            try:
+                metadata = decode_metadata(metadata_path.read_bytes())
+
+                # 重建任务上下文
+                task_context = TaskContext(
+                    task_id=metadata["task_id"],
+                    title=metadata["title"],
+                    description=metadata["description"],
+                    status=metadata["status"],
+                    created_at=datetime.fromisoformat(metadata["created_at"]),
+                    updated_at=datetime.fromisoformat(metadata["updated_at"]),
+                    metadata=metadata.get("metadata", {}),
+                )
 
-            # 加载文件
-            for name, file_info in metadata["files"].items():
-                file_path = task_path / file_info["name"]
-                if file_path.exists():
-                    content = file_path.read_text(encoding="utf-8")
-                    context_file = ContextFile(
-                        name=file_info["name"],
-                        content=content,
-                        file_type=file_info["file_type"],
-                        created_at=datetime.fromisoformat(file_info["created_at"]),
-                        updated_at=datetime.fromisoformat(file_info["updated_at"]),
-                        version=file_info["version"],
-                        metadata=file_info.get("metadata", {}),
-                    )
-                    task_context.files[name] = context_file
+                # 只加载文件元数据，内容在首次访问时读取
+                for name, file_info in metadata["files"].items():
+                    file_path = task_path / file_info["name"]
+                    if file_path.exists():
+                        context_file = ContextFile(
+                            name=file_info["name"],
+                            content=None,
+                            file_type=file_info["file_type"],
+                            created_at=datetime.fromisoformat(
+                                file_info["created_at"]
+                            ),
+                            updated_at=datetime.fromisoformat(
+                                file_info["updated_at"]
+                            ),
+                            version=file_info["version"],
+                            metadata=file_info.get("metadata", {}),
+                            size=(
+                                file_info["size"]
+                                if "size" in file_info
+                                else file_path.stat().st_size
+                            ),
+                            length=file_info.get("length"),
+                            tokens=file_info.get("tokens"),
+                            preview=file_info.get("preview"),
+                            path=file_path,
+                        )
+                        task_context.files[name] = context_file
 
-            return task_context
+                self._remember_task_context(agent_id, task_id, task_context, task_path)
+                return task_context
 
-        except Exception as e:
-            print(f"加载任务上下文失败: {e}")
-            return None
+            except Exception as e:
+                print(f"加载任务上下文失败: {e}")
+                return None
 
     def update_file_content(
         self,
@@ -346,324 +997,1323 @@ class FileContextManager:
         content: str,
         metadata: Optional[Dict[str, Any]] = None,
     ):
-        """更新文件内容，只保留最新版本，不保存历史版本"""
-        if metadata is None:
-            metadata = {}
-        task_context = self.load_task_context(agent_id, task_id)
-        if not task_context:
-            return False
+        """整体替换文件内容，旧内容封存到版本存储（启用版本历史时）"""
+        with self._task_lock(agent_id, task_id):
+            if metadata is None:
+                metadata = {}
+            task_context = self.load_task_context(agent_id, task_id)
+            if not task_context:
+                return False
+
+            task_path = self._get_task_path(agent_id, task_id)
+            old_file = task_context.files.get(file_type)
+            if old_file is None:
+                # history/summary/scratchpad 在首次写入时创建
+                old_file = self._create_missing_file(
+                    task_context, task_path, file_type
+                )
+                if old_file is None:
+                    return False
+
+            # 新版本替换内存中的文件对象，版本号递增
+            new_file = ContextFile(
+                name=old_file.name,
+                content=content,
+                file_type=old_file.file_type,
+                created_at=old_file.created_at,
+                updated_at=datetime.utcnow(),
+                version=old_file.version + 1,
+                metadata=metadata if metadata is not None else old_file.metadata or {},
+            )
 
-        if file_type not in task_context.files:
-            return False
+            task_context.files[file_type] = new_file
+            task_context.updated_at = datetime.utcnow()
+
+            # 旧内容封存到版本存储后再覆盖
+            versions = self._get_version_store(task_path)
+            if versions is not None:
+                versions.start_generation(file_type, task_path / old_file.name)
+
+            # 保存文件
+            self._save_file(new_file, task_path / new_file.name)
+            if file_type == "history":
+                self._get_history_index(task_path).reset()
+            elif file_type == "resource":
+                self._get_resource_registry(task_path).reset()
+            elif file_type in SECTION_FILE_TYPES:
+                self._get_section_index(task_path, file_type).reset()
+            if file_type == "todo":
+                self._get_todo_offset_index(task_path).reset()
+            self._commit_task_metadata(agent_id, task_id, task_context, task_path)
+            if versions is not None:
+                versions.record(file_type, new_file.version, new_file.size)
+                versions.enforce_budget(self.version_budget_bytes)
+            self._index_write(agent_id, task_id, file_type, content, replace=True)
+
+            return True
+
+    def replace_file_prefix(
+        self,
+        agent_id: str,
+        task_id: str,
+        file_type: str,
+        old_prefix: str,
+        new_prefix: str,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> bool:
+        """在任务锁内比较并替换文件开头的内容，保留其后追加的内容"""
+        with self._task_lock(agent_id, task_id):
+            return super().replace_file_prefix(
+                agent_id, task_id, file_type, old_prefix, new_prefix, metadata
+            )
 
-        # 只更新当前版本，不保存旧版本
-        old_file = task_context.files[file_type]
-        new_file = ContextFile(
-            name=old_file.name,
-            content=content,
-            file_type=old_file.file_type,
-            created_at=old_file.created_at,
-            updated_at=datetime.utcnow(),
-            version=old_file.version + 1,
-            metadata=metadata if metadata is not None else old_file.metadata or {},
-        )
+    def upsert_section(
+        self, agent_id: str, task_id: str, file_type: str, section: str, content: str
+    ) -> bool:
+        """
+        写入 summary.md 或 todo.md 中的 "## section" 条目：已存在时替换，否则追加到末尾
+
+        通过条目偏移索引只写入受影响的字节：位于文件末尾或长度不变的条目原地改写，
+        否则原条目覆盖为删除标记、新条目追加到末尾
+        """
+        section = section.strip()
+        if not is_section_name(file_type, section):
+            print(f"写入条目失败: 不支持的文件 {file_type} 或条目 {section!r}")
+            return False
+        entry = section_entry(file_type, section, content)
+        return self._patch_section(agent_id, task_id, file_type, section, entry)
 
-        # 只保存当前版本
-        task_context.files[file_type] = new_file
-        task_context.updated_at = datetime.utcnow()
+    def delete_section(
+        self, agent_id: str, task_id: str, file_type: str, section: str
+    ) -> bool:
+        """删除 summary.md 或 todo.md 中的 "## section" 条目，条目不存在时返回 False"""
+        section = section.strip()
+        if not is_section_name(file_type, section):
+            return False
+        return self._patch_section(agent_id, task_id, file_type, section, None)
+
+    def _find_sections(
+        self, index: SectionIndex, file_path: Path, section: str
+    ) -> Tuple[Dict[str, Any], List[Tuple[int, int, bytes]]]:
+        """
+        通过偏移索引查找同名条目，并校验各条目起始处的标题（不一致时重建一次索引）
+
+        Returns:
+            (索引状态, 同名条目的 (在条目列表中的位置, 起始偏移, 原内容) 列表)
+        """
+        for _ in range(2):
+            state = index.refresh()
+            if state is None:
+                raise FileNotFoundError(file_path)
+            entries = state["entries"]
+            positions = [i for i, item in enumerate(entries) if item[0] == section]
+            matches = []
+            with open(file_path, "rb") as f:
+                for i in positions:
+                    start = entries[i][1]
+                    end = entries[i + 1][1] if i + 1 < len(entries) else state["size"]
+                    f.seek(start)
+                    data = f.read(end - start)
+                    if heading_name(data.decode("utf-8", errors="replace")) != section:
+                        break
+                    matches.append((i, start, data))
+                else:
+                    return state, matches
+            index.rebuild()
+        raise ValueError(f"条目索引与文件 {file_path.name} 不一致")
 
-        # 保存文件
-        task_path = self._get_task_path(agent_id, task_id)
-        self._save_file(new_file, task_path / new_file.name)
-        self._save_task_metadata(task_context, task_path)
+    def _patch_section(
+        self,
+        agent_id: str,
+        task_id: str,
+        file_type: str,
+        section: str,
+        entry: Optional[str],
+    ) -> bool:
+        """替换（entry 不为 None）或删除同名条目，只写入受影响的字节范围"""
+        with self._task_lock(agent_id, task_id):
+            task_context = self.load_task_context(agent_id, task_id)
+            if not task_context:
+                return False
+            task_path = self._get_task_path(agent_id, task_id)
+            file_obj = task_context.files.get(file_type)
+            if file_obj is None:
+                if entry is None:
+                    return False
+                # summary 在首次写入时创建
+                return self.append_file_content(agent_id, task_id, file_type, entry)
+
+            file_path = task_path / file_obj.name
+            index = self._get_section_index(task_path, file_type)
+            try:
+                state, matches = self._find_sections(index, file_path, section)
+            except Exception as e:
+                print(f"写入条目失败: {e}")
+                return False
+            if not matches:
+                if entry is None:
+                    return False
+                return self.append_file_content(agent_id, task_id, file_type, entry)
+
+            # 旧内容封存到版本存储后再修改
+            versions = self._get_version_store(task_path)
+            if versions is not None:
+                versions.start_generation(file_type, file_path)
+
+            entries, size = state["entries"], state["size"]
+            new_data = entry.encode("utf-8") if entry is not None else b""
+            removed = [data.decode("utf-8", errors="replace") for _, _, data in matches]
+            added = [entry] if entry is not None else []
+            # 条目列表中的位置 -> (起始偏移, 字节数)
+            tombstoned = {i: (start, len(data)) for i, start, data in matches[:-1]}
+            last, last_start, last_data = matches[-1]
+            truncate_at = None
+            append_at = None
+            if last_start + len(last_data) == size:
+                # 位于文件末尾：直接改写并截断
+                truncate_at = last_start + len(new_data)
+            elif len(new_data) != len(last_data):
+                # 长度变化：原条目覆盖为删除标记，新条目追加到末尾
+                tombstoned[last] = (last_start, len(last_data))
+                if entry is not None:
+                    append_at = size
+
+            with open(file_path, "r+b") as f:
+                for start, length in tombstoned.values():
+                    marker = write_tombstone(f, start, length)
+                    # 读取时去掉的删除标记不计入字符数和 token 数
+                    added.append(strip_tombstones(marker.decode("ascii")))
+                if last not in tombstoned:
+                    f.seek(last_start)
+                    f.write(new_data)
+                    if truncate_at is not None:
+                        f.truncate(truncate_at)
+                if append_at is not None:
+                    f.seek(append_at)
+                    f.write(new_data)
+                    # 与扫描结果一致：条目从标题前的连续换行开始
+                    f.seek(max(append_at - 64, 0))
+                    before = f.read(append_at - f.tell())
+                    append_at -= len(before) - len(before.rstrip(b"\n"))
+                if self.durability == DURABILITY_FSYNC:
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            # 增量更新条目索引
+            for i in tombstoned:
+                entries[i][0] = None
+            if truncate_at is not None:
+                del entries[last:]
+                if entry is not None:
+                    entries.append([section, last_start])
+            elif append_at is not None:
+                while entries and entries[-1][1] >= append_at:
+                    entries.pop()
+                entries.append([section, append_at])
+            garbage = state["garbage"] + sum(
+                length for _, length in tombstoned.values()
+            )
+            state = index.save(entries, garbage)
+
+            if file_type == "todo":
+                self._get_todo_offset_index(task_path).reset()
+            self._commit_in_place_write(
+                agent_id,
+                task_id,
+                task_context,
+                file_obj,
+                state["size"],
+                added,
+                removed,
+                versions,
+                sealed=True,
+            )
+            self._index_patch(agent_id, task_id, file_type, removed, entry)
 
-        return True
+            # 删除标记过多时整体重写文件
+            if garbage > max(TOMBSTONE_GC_BYTES, state["size"] // 2):
+                self.update_file_content(
+                    agent_id,
+                    task_id,
+                    file_type,
+                    strip_tombstones(file_path.read_text(encoding="utf-8")),
+                    metadata=file_obj.metadata,
+                )
+            return True
 
-    def append_to_task_file(
-        self, agent_id: str, task_id: str, file_type: str, append_text: str
+    def _apply_in_place_write(
+        self,
+        file_obj: ContextFile,
+        file_path: Path,
+        size: int,
+        added: List[str],
+        removed: List[str],
     ):
-        """向指定类型的任务文件追加内容（如 todo.md）"""
-        task_context = self.load_task_context(agent_id, task_id)
-        if not task_context:
-            return False
-        if file_type not in task_context.files:
-            return False
-        file_obj = task_context.files[file_type]
-        file_obj.content += append_text
-        file_obj.updated_at = datetime.utcnow()
-        # 保存文件
-        task_path = self._get_task_path(agent_id, task_id)
-        self._save_file(file_obj, task_path / file_obj.name)
-        self._save_task_metadata(task_context, task_path)
-        return True
+        """
+        文件被原地改写部分字节后更新内存中的文件信息：大小、字符数和 token 数按改动
+        增量更新，预览从文件开头重新读取，内容下次访问时从磁盘加载
+        """
+        if self._group_writer is not None:
+            self._group_writer.sync_later(file_path)
+        file_obj.size = size
+        if file_obj.length is not None:
+            file_obj.length += sum(map(len, added)) - sum(map(len, removed))
+        if file_obj.tokens is not None:
+            delta = sum(map(count_tokens, added)) - sum(map(count_tokens, removed))
+            file_obj.tokens = max(file_obj.tokens + delta, 0)
+        with open(file_path, "rb") as f:
+            head = f.read(PREVIEW_LENGTH * 4)
+        preview = head.decode("utf-8", errors="ignore")
+        if file_obj.file_type in SECTION_FILE_TYPES:
+            preview = strip_tombstones(preview)
+        file_obj.preview = preview[:PREVIEW_LENGTH]
+        file_obj.path = file_path
+        file_obj.content = None
+
+    def _commit_in_place_write(
+        self,
+        agent_id: str,
+        task_id: str,
+        task_context: TaskContext,
+        file_obj: ContextFile,
+        size: int,
+        added: List[str],
+        removed: List[str],
+        versions: Optional[VersionStore],
+        sealed: bool,
+    ):
+        """
+        文件被原地改写部分字节后提交元数据（见 _apply_in_place_write）
 
-    def add_chat_message(self, agent_id: str, task_id: str, role: str, content: str):
-        """添加聊天消息到历史记录"""
+        Args:
+            added/removed: 写入和被覆盖的文本片段
+            sealed: 写入前是否封存了版本存储的当前代（原地改写需要封存，纯追加不需要）
+        """
+        task_path = self._get_task_path(agent_id, task_id)
+        self._apply_in_place_write(
+            file_obj, task_path / file_obj.name, size, added, removed
+        )
+        file_obj.updated_at = datetime.utcnow()
+        file_obj.version += 1
+        task_context.updated_at = file_obj.updated_at
+        self._commit_task_metadata(agent_id, task_id, task_context, task_path)
+        if versions is not None:
+            versions.record(file_obj.file_type, file_obj.version, file_obj.size)
+            if sealed:
+                versions.enforce_budget(self.version_budget_bytes)
+
+    def iter_file_chunks(
+        self,
+        agent_id: str,
+        task_id: str,
+        file_type: str,
+        chunk_chars: int = CHUNK_CHARS,
+    ) -> Iterator[str]:
+        """
+        从磁盘分块读取文件，不把整个文件读入内存
+
+        只在打开文件时持有读锁，之后读取打开时的文件和长度：
+        其后追加的内容不会读到，整体替换（原子重命名）也不影响正在读取的内容
+        """
         task_context = self.load_task_context(agent_id, task_id)
-        if not task_context:
-            return False
+        if task_context is None or file_type not in task_context.files:
+            return
+        name = task_context.files[file_type].name
+        with self._task_lock(agent_id, task_id, exclusive=False):
+            try:
+                f = open(self._task_dir(agent_id, task_id) / name, "rb")
+            except FileNotFoundError:
+                return
+            remaining = os.fstat(f.fileno()).st_size
+        with f:
+            chunks = _read_text_chunks(f, remaining, chunk_chars)
+            if file_type in SECTION_FILE_TYPES:
+                chunks = strip_tombstone_chunks(chunks)
+            yield from chunks
+
+    def import_task_batch(self, agent_id: str, tasks: List[ImportedTask]) -> int:
+        """批量导入任务：每个文件和元数据只写入一次，任务索引按批更新"""
+        rows = []
+        for task in tasks:
+            try:
+                self._import_task(agent_id, task)
+            except Exception as e:
+                print(f"导入任务 {task.task_id} 失败: {e}")
+                continue
+            rows.append(
+                (
+                    task.task_id,
+                    task.title,
+                    task.status,
+                    task.created_at.isoformat(),
+                    task.updated_at.isoformat(),
+                )
+            )
+        self._get_task_index(agent_id).upsert_many(rows)
+        return len(rows)
+
+    def _import_task(self, agent_id: str, task: ImportedTask):
+        """
+        在任务锁内写入导入的文件和元数据，覆盖同 ID 的任务
+
+        新建的任务目录中，元数据最后写入、作为提交点，其他文件直接写入而不经过临时文件
+        """
+        with self._task_lock(agent_id, task.task_id):
+            task_path = self._task_dir(agent_id, task.task_id)
+            fresh = not task_path.exists()
+            task_path.mkdir(parents=True, exist_ok=True)
+            stale_bundle = self._find_archive(agent_id, task.task_id)
+            if stale_bundle is not None:
+                stale_bundle.unlink()
+            if not fresh:
+                versions = self._get_version_store(task_path)
+                if versions is not None:
+                    versions.reset()
+                self._get_history_index(task_path).reset()
+                self._get_resource_registry(task_path).reset()
+                for file_type in SECTION_FILE_TYPES:
+                    self._get_section_index(task_path, file_type).reset()
+                self._get_todo_offset_index(task_path).reset()
 
-        history_file = task_context.files.get("history")
-        if not history_file:
-            return False
+            task_context = TaskContext(
+                task_id=task.task_id,
+                title=task.title,
+                description=task.description,
+                status=task.status,
+                created_at=task.created_at,
+                updated_at=task.updated_at,
+                metadata=task.metadata,
+            )
+            for file_type, name in context_format.FILE_NAMES.items():
+                imported_file = task.files.get(file_type)
+                if imported_file is None:
+                    if not fresh:
+                        (task_path / name).unlink(missing_ok=True)
+                    continue
+                context_file = ContextFile(
+                    name=name,
+                    content=imported_file.content,
+                    file_type=file_type,
+                    created_at=imported_file.created_at or task.created_at,
+                    updated_at=imported_file.updated_at or task.updated_at,
+                    version=imported_file.version,
+                    metadata=imported_file.metadata,
+                )
+                self._save_file(context_file, task_path / name, atomic=not fresh)
+                task_context.files[file_type] = context_file
+            self._save_task_metadata(task_context, task_path)
+            self.invalidate_task_cache(agent_id, task.task_id)
+            index = self._get_search_index()
+            if index is not None:
+                try:
+                    index.replace_task(
+                        agent_id,
+                        task.task_id,
+                        {
+                            file_type: context_file.content
+                            for file_type, context_file in task_context.files.items()
+                        },
+                    )
+                except Exception as e:
+                    print(f"更新全文索引失败: {e}")
 
-        # 添加新消息到历史记录
-        new_content = (
-            history_file.content
-            + f"""
+    def update_task_status(self, agent_id: str, task_id: str, status: str) -> bool:
+        """更新任务状态（加锁后基于磁盘最新元数据修改，避免覆盖其他进程的更新）"""
+        with self._task_lock(agent_id, task_id):
+            task_context = self.load_task_context(agent_id, task_id)
+            if not task_context:
+                return False
 
-### {datetime.utcnow()}: {role}
-{content}
-"""
-        )
+            task_context.status = status
+            task_context.updated_at = datetime.utcnow()
+
+            task_path = self._get_task_path(agent_id, task_id)
+            self._commit_task_metadata(agent_id, task_id, task_context, task_path)
+            return True
+
+    def append_file_content(
+        self, agent_id: str, task_id: str, file_type: str, append_text: str
+    ) -> bool:
+        """以追加模式写入文件，写入量与文件大小无关，元数据增量更新"""
+        with self._task_lock(agent_id, task_id):
+            task_context = self.load_task_context(agent_id, task_id)
+            if not task_context:
+                return False
+
+            task_path = self._get_task_path(agent_id, task_id)
+            file_obj = task_context.files.get(file_type)
+            if file_obj is None:
+                # history/summary/scratchpad 在首次写入时创建
+                file_obj = self._create_missing_file(task_context, task_path, file_type)
+                if file_obj is None:
+                    return False
+
+            # 只写入新增内容
+            self._append_file(file_obj, task_path / file_obj.name, append_text)
+            file_obj.updated_at = datetime.utcnow()
+            file_obj.version += 1
+            task_context.updated_at = file_obj.updated_at
+
+            # 元数据只记录版本、更新时间和大小的变化
+            self._commit_task_metadata(agent_id, task_id, task_context, task_path)
+
+            # 追加产生的版本是当前文件的前缀，只需记录长度
+            versions = self._get_version_store(task_path)
+            if versions is not None:
+                versions.record(file_type, file_obj.version, file_obj.size)
+            if file_type == "history":
+                # 只扫描新追加的字节，记录消息偏移
+                self._get_history_index(task_path).refresh()
+            self._index_write(agent_id, task_id, file_type, append_text, replace=False)
+            return True
 
-        return self.update_file_content(agent_id, task_id, "history", new_content)
+    def add_chat_message(self, agent_id: str, task_id: str, role: str, content: str):
+        """添加聊天消息到历史记录"""
+        entry = context_format.chat_entry(role, content)
+        return self.append_file_content(agent_id, task_id, "history", entry)
 
     def update_todo_progress(
         self, agent_id: str, task_id: str, progress_updates: List[str]
     ):
-        """更新待办事项进度"""
-        task_context = self.load_task_context(agent_id, task_id)
-        if not task_context:
-            return False
-
-        todo_file = task_context.files.get("todo")
-        if not todo_file:
-            return False
-
-        # 读取当前 todo 内容
-        lines = todo_file.content.split("\n")
-        new_lines = []
-
-        # 处理每一行
-        for line in lines:
-            # 检查是否是待办事项行
-            if line.strip().startswith("- [ ]"):
-                # 检查是否匹配任何进度更新
-                item_text = line.strip()[4:].strip()  # 移除 "- [ ] "
-                should_mark_complete = False
-
-                for update in progress_updates:
-                    # 简单的匹配逻辑：如果更新文本包含在待办事项中，或者待办事项包含在更新中
-                    if (
-                        update.lower() in item_text.lower()
-                        or item_text.lower() in update.lower()
-                        or any(
-                            word in item_text.lower()
-                            for word in update.lower().split()
-                            if len(word) > 3
-                        )
-                    ):
-                        should_mark_complete = True
-                        break
-
-                if should_mark_complete:
-                    # 标记为完成
-                    new_lines.append(line.replace("- [ ]", "- [x]"))
-                else:
-                    new_lines.append(line)
-            else:
-                new_lines.append(line)
-
-        # 添加进度记录
-        new_content = "\n".join(new_lines)
-        new_content += f"""
-
-## 进度记录
-"""
-        for update in progress_updates:
-            new_content += f"- {datetime.utcnow()}: {update}\n"
+        """
+        更新待办事项进度：通过偏移索引匹配未完成事项，原地改写复选框后追加进度记录，
+        不读取也不重写整个 todo.md
+        """
+        block = context_format.todo_progress_block(progress_updates)
+        return self._mark_todo_items(
+            agent_id,
+            task_id,
+            lambda index: index.match(progress_updates),
+            block,
+        )
 
-        return self.update_file_content(agent_id, task_id, "todo", new_content)
+    def _mark_todo_items(
+        self,
+        agent_id: str,
+        task_id: str,
+        match: Callable[[TodoOffsetIndex], Tuple[Tuple[int, int, int], List[int]]],
+        append_text: str = "",
+    ) -> bool:
+        """将 match 选出的未完成事项原地标记为完成，并追加 append_text"""
+        with self._task_lock(agent_id, task_id):
+            task_context = self.load_task_context(agent_id, task_id)
+            if not task_context:
+                return False
+
+            todo_file = task_context.files.get("todo")
+            if not todo_file:
+                return False
+
+            task_path = self._get_task_path(agent_id, task_id)
+            index = self._get_todo_offset_index(task_path)
+            try:
+                state, offsets = match(index)
+            except Exception as e:
+                print(f"更新待办事项失败: {e}")
+                return False
+            if not offsets and not append_text:
+                return True
+
+            # 原地改写前封存版本存储的当前代，纯追加只需记录长度
+            versions = self._get_version_store(task_path)
+            if versions is not None and offsets:
+                versions.start_generation("todo", task_path / todo_file.name)
+            size = index.mark(state, offsets, append_text.encode("utf-8"))
+            self._commit_in_place_write(
+                agent_id,
+                task_id,
+                task_context,
+                todo_file,
+                size,
+                *_todo_mark_changes(offsets, append_text),
+                versions,
+                sealed=bool(offsets),
+            )
+            return True
 
     def add_resource_link(
         self, agent_id: str, task_id: str, title: str, url: str, description: str = ""
     ):
-        """添加资源链接"""
-        task_context = self.load_task_context(agent_id, task_id)
-        if not task_context:
-            return False
-
-        resource_file = task_context.files.get("resource")
-        if not resource_file:
-            return False
-
-        # 添加新资源链接
-        new_content = (
-            resource_file.content
-            + f"""
-
-## {title}
-- URL: {url}
-- 描述: {description}
-- 添加时间: {datetime.utcnow()}
-"""
-        )
-
-        return self.update_file_content(agent_id, task_id, "resource", new_content)
+        """添加资源链接，已登记的 URL 只累计命中次数并合并描述，不重复写入文件"""
+        with self._task_lock(agent_id, task_id):
+            if not self.load_task_context(agent_id, task_id):
+                return False
+            task_path = self._get_task_path(agent_id, task_id)
+            with self._get_resource_registry(task_path) as registry:
+                try:
+                    is_new = registry.register(title, url, description)
+                except ValueError as e:
+                    print(f"添加资源链接失败: {e}")
+                    return False
+                if is_new:
+                    entry = context_format.resource_entry(title, url, description)
+                    if not self.append_file_content(
+                        agent_id, task_id, "resource", entry
+                    ):
+                        return False
+                registry.save()
+            return True
 
     def add_summary_entry(
         self, agent_id: str, task_id: str, section: str, content: str
     ):
         """添加总结条目"""
-        task_context = self.load_task_context(agent_id, task_id)
-        if not task_context:
-            return False
-
-        summary_file = task_context.files.get("summary")
-        if not summary_file:
-            return False
-
-        # 添加总结条目
-        new_content = (
-            summary_file.content
-            + f"""
-
-## {section}
-{content}
-
----
-更新时间: {datetime.utcnow()}
-"""
-        )
-
-        return self.update_file_content(agent_id, task_id, "summary", new_content)
+        entry = context_format.summary_entry(section, content)
+        return self.append_file_content(agent_id, task_id, "summary", entry)
 
     def add_scratchpad_entry(self, agent_id: str, task_id: str, content: str):
         """添加临时笔记"""
-        task_context = self.load_task_context(agent_id, task_id)
-        if not task_context:
-            return False
-
-        scratchpad_file = task_context.files.get("scratchpad")
-        if not scratchpad_file:
-            return False
-
-        # 添加临时笔记
-        new_content = (
-            scratchpad_file.content
-            + f"""
+        entry = context_format.scratchpad_entry(content)
+        return self.append_file_content(agent_id, task_id, "scratchpad", entry)
+
+    def _plan_mutation(
+        self, mutation: ContextMutation
+    ) -> Tuple[str, Optional[str], Any]:
+        """
+        将一次修改转换为文件级操作
+
+        Returns:
+            ("append", 文件类型, 追加文本)、("rewrite", 文件类型, 由当前内容计算新内容的函数)、
+            ("mark", "todo", (选出事项的函数, 追加文本, 整体重写时使用的函数))、
+            ("resource", "resource", 资源链接参数) 或 ("status", None, 新状态)
+        """
+        method, args = mutation.method, mutation.args
+        if method == "add_chat_message":
+            return "append", "history", context_format.chat_entry(*args)
+        if method == "add_resource_link":
+            return "resource", "resource", args
+        if method == "add_summary_entry":
+            return "append", "summary", context_format.summary_entry(*args)
+        if method == "add_scratchpad_entry":
+            return "append", "scratchpad", context_format.scratchpad_entry(*args)
+        if method == "append_file_content":
+            return "append", args[0], args[1]
+        if method == "update_todo_progress":
+            updates = args[0]
+            return "mark", "todo", (
+                lambda index, exclude: index.match(updates, exclude),
+                context_format.todo_progress_block(updates),
+                partial(context_format.apply_todo_progress, progress_updates=updates),
+            )
+        if method == "mark_todo_completed":
+            item_text = args[0]
+            return "mark", "todo", (
+                lambda index, exclude: index.match_containing(item_text, exclude),
+                "",
+                partial(context_format.mark_todo_line, item_text=item_text),
+            )
+        if method == "update_file_content":
+            return "rewrite", args[0], lambda _: args[1]
+        if method in ("upsert_section", "delete_section"):
+            file_type, section = args[0], args[1].strip()
+            if not is_section_name(file_type, section):
+                raise ValueError(f"不支持的条目 {file_type}/{section!r}")
+            entry = (
+                section_entry(file_type, section, args[2])
+                if method == "upsert_section"
+                else None
+            )
+            return "rewrite", file_type, lambda current: replace_section(
+                current, section, entry
+            )[0]
+        if method == "update_task_status":
+            return "status", None, args[0]
+        raise ValueError(f"不支持的操作 {method}")
+
+    def apply_mutations(
+        self, agent_id: str, task_id: str, mutations: Sequence[ContextMutation]
+    ) -> bool:
+        """
+        批量提交修改：一次加载，每个文件最多写入一次，元数据只提交一次
+
+        先在内存中计算所有文件的新内容，任一修改无法应用时不写入任何内容；
+        写入中途失败时恢复已写入的文件（元数据最后提交，失败时保持不变）。
+        待办事项的进度更新通过偏移索引原地标记，进度记录作为追加写入
+        """
+        if not mutations:
+            return True
+        with self._task_lock(agent_id, task_id), ExitStack() as stack:
+            task_context = self.load_task_context(agent_id, task_id)
+            if not task_context:
+                return False
+            task_path = self._get_task_path(agent_id, task_id)
+
+            # 第一阶段：每个文件合并为一次追加、一次原地标记（todo）或一次整体重写
+            pending: Dict[str, List[Any]] = {}
+            status = None
+            registry = None
+            todo_index = self._get_todo_offset_index(task_path)
+            for mutation in mutations:
+                try:
+                    op, file_type, value = self._plan_mutation(mutation)
+                except Exception as e:
+                    print(f"批量写入失败: {e}")
+                    return False
+                if op == "status":
+                    status = value
+                    continue
+                if op == "resource":
+                    # 只有新 URL 需要写入文件，重复链接只更新登记表
+                    try:
+                        if registry is None:
+                            registry = stack.enter_context(
+                                self._get_resource_registry(task_path)
+                            )
+                        if not registry.register(*value):
+                            continue
+                    except ValueError as e:
+                        print(f"批量写入失败: {e}")
+                        return False
+                    op, value = "append", context_format.resource_entry(*value)
+                file_obj = task_context.files.get(file_type)
+                if file_obj is None and file_type not in LAZY_FILE_TYPES:
+                    print(f"批量写入失败: 文件 {file_type} 不存在")
+                    return False
+                entry = pending.get(file_type)
+                if op == "mark":
+                    select, append_text, rewrite = value
+                    if entry is None or (
+                        entry[0] == "mark" and not scan_open_items(entry[1][1].encode())
+                    ):
+                        # 在磁盘上的文件中选出事项（排除本批已选中的）
+                        marked = entry[1][0] if entry is not None else []
+                        try:
+                            state, offsets = select(todo_index, marked)
+                        except Exception as e:
+                            print(f"批量写入失败: {e}")
+                            return False
+                        if entry is None:
+                            pending[file_type] = ["mark", [offsets, append_text, state]]
+                        else:
+                            entry[1][0] += offsets
+                            entry[1][1] += append_text
+                        continue
+                    # 待追加的内容中可能有要标记的事项：在内存中的完整内容上匹配
+                    op, value = "rewrite", rewrite
+                if op == "append":
+                    if entry is None:
+                        pending[file_type] = ["append", value]
+                    elif entry[0] == "mark":
+                        entry[1][1] += value
+                    else:
+                        entry[1] += value
+                    continue
+                if entry is not None and entry[0] == "rewrite":
+                    current = entry[1]
+                elif entry is not None and entry[0] == "mark":
+                    # 本批尚未写入的原地标记和追加应用后的内容
+                    offsets, append_text, state = entry[1]
+                    marked = todo_index.read_marked(state, offsets)
+                    current = strip_tombstones(marked.decode("utf-8")) + append_text
+                else:
+                    current = file_obj.content if file_obj is not None else ""
+                    if entry is not None:
+                        current += entry[1]
+                pending[file_type] = ["rewrite", value(current)]
+
+            # 第二阶段：写入文件，记录撤销操作
+            now = datetime.utcnow()
+            undo: List[Callable[[], Any]] = []
+            recorded: List[Tuple[str, int, int]] = []
+            versions = self._get_version_store(task_path)
+            try:
+                for file_type, (op, value) in pending.items():
+                    file_obj = task_context.files.get(file_type)
+                    if file_obj is None:
+                        file_obj = self._create_missing_file(
+                            task_context, task_path, file_type
+                        )
+                        undo.append(partial(os.unlink, task_path / file_obj.name))
+                    file_path = task_path / file_obj.name
+
+                    if op == "append":
+                        undo.append(partial(os.truncate, file_path, file_obj.size))
+                        self._append_file(file_obj, file_path, value)
+                        file_obj.updated_at = now
+                        file_obj.version += 1
+                    elif op == "mark":
+                        offsets, append_text, state = value
+                        if not offsets and not append_text:
+                            continue
+                        # 原地改写前封存版本存储的当前代
+                        if versions is not None and offsets:
+                            versions.start_generation(file_type, file_path)
+                        undo.append(
+                            partial(todo_index.undo_mark, offsets, file_obj.size)
+                        )
+                        size = todo_index.mark(
+                            state, offsets, append_text.encode("utf-8")
+                        )
+                        self._apply_in_place_write(
+                            file_obj,
+                            file_path,
+                            size,
+                            *_todo_mark_changes(offsets, append_text),
+                        )
+                        file_obj.updated_at = now
+                        file_obj.version += 1
+                    else:
+                        old_data = file_path.read_bytes()
+                        undo.append(partial(self._write_bytes, file_path, old_data))
+                        file_obj = ContextFile(
+                            name=file_obj.name,
+                            content=value,
+                            file_type=file_obj.file_type,
+                            created_at=file_obj.created_at,
+                            updated_at=now,
+                            version=file_obj.version + 1,
+                        )
+                        if versions is not None:
+                            versions.start_generation(file_type, file_path)
+                        self._save_file(file_obj, file_path)
+                        task_context.files[file_type] = file_obj
+                    recorded.append((file_type, file_obj.version, file_obj.size))
+
+                if status is not None:
+                    task_context.status = status
+                task_context.updated_at = now
+                self._commit_task_metadata(agent_id, task_id, task_context, task_path)
+            except Exception as e:
+                for action in reversed(undo):
+                    try:
+                        action()
+                    except Exception:
+                        pass
+                self.invalidate_task_cache(agent_id, task_id)
+                print(f"批量写入失败: {e}")
+                return False
+
+            if versions is not None:
+                for file_type, version, size in recorded:
+                    versions.record(file_type, version, size)
+                if any(
+                    op == "rewrite" or (op == "mark" and value[0])
+                    for op, value in pending.values()
+                ):
+                    versions.enforce_budget(self.version_budget_bytes)
+            if "history" in pending:
+                history_index = self._get_history_index(task_path)
+                if pending["history"][0] == "rewrite":
+                    history_index.reset()
+                else:
+                    history_index.refresh()
+            if pending.get("resource", [None])[0] == "rewrite":
+                self._get_resource_registry(task_path).reset()
+            elif registry is not None:
+                registry.save()
+            for file_type in SECTION_FILE_TYPES:
+                if pending.get(file_type, [None])[0] == "rewrite":
+                    self._get_section_index(task_path, file_type).reset()
+            if pending.get("todo", [None])[0] == "rewrite":
+                self._get_todo_offset_index(task_path).reset()
+            for file_type, (op, value) in pending.items():
+                if op == "mark":
+                    op, value = "append", value[1]
+                self._index_write(
+                    agent_id, task_id, file_type, value, replace=op == "rewrite"
+                )
+            return True
 
-### {datetime.utcnow()}: 临时笔记
-{content}
-"""
+    def get_chat_messages(
+        self,
+        agent_id: str,
+        task_id: str,
+        limit: Optional[int] = None,
+        since: Optional[datetime] = None,
+    ) -> List[Dict[str, str]]:
+        """通过偏移索引读取聊天消息，只读取 history.md 中需要的字节"""
+        self._rehydrate_if_archived(agent_id, task_id)
+        with self._task_lock(agent_id, task_id, exclusive=False):
+            task_path = self._get_task_path(agent_id, task_id)
+            return self._get_history_index(task_path).read(limit, since)
+
+    def get_todo_items(
+        self, agent_id: str, task_id: str, include_completed: bool = False
+    ) -> List[str]:
+        """从 todo.md 解析待办事项"""
+        content = self.get_file_content(agent_id, task_id, "todo")
+        if not content:
+            return []
+        return context_format.parse_todo_items(content, include_completed)
+
+    def mark_todo_completed(self, agent_id: str, task_id: str, item_text: str) -> bool:
+        """标记文本包含 item_text 的未完成待办事项为完成（通过偏移索引原地改写）"""
+        return self._mark_todo_items(
+            agent_id, task_id, lambda index: index.match_containing(item_text)
         )
 
-        return self.update_file_content(agent_id, task_id, "scratchpad", new_content)
-
-    def get_context_summary(self, agent_id: str, task_id: str) -> Dict[str, Any]:
-        """获取上下文摘要"""
-        task_context = self.load_task_context(agent_id, task_id)
-        if not task_context:
-            return {}
-
-        summary = {
-            "task_id": task_context.task_id,
-            "title": task_context.title,
-            "status": task_context.status,
-            "created_at": task_context.created_at.isoformat(),
-            "updated_at": task_context.updated_at.isoformat(),
-            "files": {},
-        }
-
-        for name, file in task_context.files.items():
-            # 只返回文件的基本信息和内容摘要
-            summary["files"][name] = {
-                "name": file.name,
-                "file_type": file.file_type,
-                "content_length": len(file.content),
-                "content_preview": (
-                    file.content[:200] + "..."
-                    if len(file.content) > 200
-                    else file.content
+    def get_resources(self, agent_id: str, task_id: str) -> List[Dict[str, Any]]:
+        """从资源登记表读取资源列表（按 URL 去重，附带命中次数）"""
+        self._rehydrate_if_archived(agent_id, task_id)
+        with self._task_lock(agent_id, task_id, exclusive=False):
+            task_path = self._task_dir(agent_id, task_id)
+            if not self._has_metadata(task_path):
+                return []
+            with self._get_resource_registry(task_path) as registry:
+                # 登记表落后于 resource_links.txt 时保存补登记的结果
+                registry.save()
+                return registry.list_resources()
+
+    def _scan_agent_tasks(self, agent_id: str) -> Iterator[Dict[str, Any]]:
+        """逐个读取任务目录和归档包的元数据（用于构建索引）"""
+        live_task_ids = set()
+        task_dirs = context_layout.iter_task_dirs(
+            context_layout.agent_path(self.base_path, agent_id)
+        )
+        if self._legacy_layout:
+            task_dirs = itertools.chain(
+                context_layout.iter_legacy_task_dirs(
+                    context_layout.legacy_agent_path(self.base_path, agent_id)
                 ),
-                "updated_at": file.updated_at.isoformat(),
-                "version": file.version,
-            }
-
-        return summary
-
-    def list_agent_tasks(self, agent_id: str) -> List[Dict[str, Any]]:
-        """列出Agent的所有任务"""
-        agent_path = self._get_agent_path(agent_id)
-        tasks = []
+                task_dirs,
+            )
 
-        for task_dir in agent_path.iterdir():
-            if task_dir.is_dir() and task_dir.name.startswith("task_"):
-                task_id = task_dir.name[5:]  # 移除 "task_" 前缀
-                metadata_path = task_dir / "metadata.json"
+        for task_id, task_dir in task_dirs:
+            if task_id in live_task_ids:
+                continue
+            metadata_path = self._get_metadata_path(task_dir)
 
-                if metadata_path.exists():
-                    try:
-                        metadata = json.loads(metadata_path.read_text(encoding="utf-8"))
-                        tasks.append(
-                            {
-                                "task_id": task_id,
-                                "title": metadata["title"],
-                                "status": metadata["status"],
-                                "created_at": metadata["created_at"],
-                                "updated_at": metadata["updated_at"],
-                            }
-                        )
-                    except Exception as e:
-                        print(f"读取任务元数据失败 {task_id}: {e}")
+            if metadata_path.exists():
+                try:
+                    metadata = decode_metadata(metadata_path.read_bytes())
+                    live_task_ids.add(task_id)
+                    yield {
+                        "task_id": task_id,
+                        "title": metadata["title"],
+                        "status": metadata["status"],
+                        "created_at": metadata["created_at"],
+                        "updated_at": metadata["updated_at"],
+                        "archived": False,
+                    }
+                except Exception as e:
+                    print(f"读取任务元数据失败 {task_id}: {e}")
+
+        # 已归档的任务只读取归档包中的 metadata.json
+        bundle_paths = itertools.chain(
+            self._get_archive_root(agent_id).glob("*/task_*"),
+            (self.base_path / ".archive" / f"agent_{agent_id}").glob("*/task_*"),
+        )
+        for bundle_path in bundle_paths:
+            suffix = next(
+                (s for s in BUNDLE_SUFFIXES if bundle_path.name.endswith(s)), None
+            )
+            if suffix is None:
+                continue
+            task_id = bundle_path.name[5 : -len(suffix)]
+            if task_id in live_task_ids:
+                continue
+            try:
+                metadata = decode_metadata(read_bundle_metadata(bundle_path))
+                yield {
+                    "task_id": task_id,
+                    "title": metadata["title"],
+                    "status": metadata["status"],
+                    "created_at": metadata["created_at"],
+                    "updated_at": metadata["updated_at"],
+                    "archived": True,
+                }
+            except Exception as e:
+                print(f"读取归档任务元数据失败 {task_id}: {e}")
 
-        return sorted(tasks, key=lambda x: x["updated_at"], reverse=True)
+    def list_agent_tasks_page(
+        self,
+        agent_id: str,
+        status: Union[str, Sequence[str], None] = None,
+        page_size: Optional[int] = 50,
+        cursor: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        分页列出Agent的任务
+
+        Args:
+            agent_id: Agent ID
+            status: 状态过滤，可以是单个状态或状态列表
+            page_size: 每页数量，None 表示不分页
+            cursor: 上一页返回的 next_cursor
+
+        Returns:
+            {"tasks": [...], "next_cursor": 下一页游标或 None}
+        """
+        after = None
+        if cursor:
+            updated_at, _, task_id = cursor.partition("|")
+            after = (updated_at, task_id)
+
+        rows = self._get_task_index(agent_id).query(
+            status=status, limit=page_size, after=after
+        )
+        next_cursor = None
+        if page_size is not None and len(rows) == page_size:
+            last = rows[-1]
+            next_cursor = f"{last['updated_at']}|{last['task_id']}"
+
+        return {"tasks": rows, "next_cursor": next_cursor}
+
+    def archive_task(
+        self, agent_id: str, task_id: str, idle_before: Optional[datetime] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        将任务目录打包为单个压缩包并删除原目录
+
+        Args:
+            agent_id: Agent ID
+            task_id: 任务ID
+            idle_before: 只有 updated_at 早于该时间时才归档（加锁后重新检查）
+
+        Returns:
+            归档结果（文件数、原占用字节数、压缩包字节数），未归档时返回 None
+        """
+        with self._task_lock(agent_id, task_id):
+            task_path = self._task_dir(agent_id, task_id)
+            metadata_path = self._get_metadata_path(task_path)
+            if not metadata_path.exists():
+                return None
+            if idle_before is not None:
+                updated_at = datetime.fromisoformat(
+                    decode_metadata(metadata_path.read_bytes())["updated_at"]
+                )
+                if updated_at >= idle_before:
+                    return None
+
+            # 组提交中尚未 fsync 的文件先落盘，再打包并删除原目录
+            self.flush()
+            bundle_path = self._get_archive_path(agent_id, task_id)
+            result = pack_task(task_path, bundle_path)
+            self._get_task_index(agent_id).set_archived(task_id, True)
+
+            # 先原子重命名再删除，避免删除中途失败留下不完整的任务目录
+            tombstone = task_path.with_name(f".{task_path.name}.archived")
+            shutil.rmtree(tombstone, ignore_errors=True)
+            os.rename(task_path, tombstone)
+            shutil.rmtree(tombstone, ignore_errors=True)
+            self.invalidate_task_cache(agent_id, task_id)
+
+        with self._archive_stats_lock:
+            self._archive_stats["archived_tasks"] += 1
+            self._archive_stats["original_bytes"] += result["original_bytes"]
+            self._archive_stats["archived_bytes"] += result["archived_bytes"]
+        result["task_id"] = task_id
+        return result
+
+    def delete_task(
+        self,
+        agent_id: str,
+        task_id: str,
+        idle_before: Optional[datetime] = None,
+        statuses: Optional[Sequence[str]] = None,
+    ) -> Optional[int]:
+        """
+        永久删除任务目录、归档包、任务索引项和全文索引条目
+
+        Args:
+            agent_id: Agent ID
+            task_id: 任务ID
+            idle_before: 只有 updated_at 早于该时间时才删除（加锁后重新检查）
+            statuses: 只删除处于这些状态的任务（加锁后重新检查）
+
+        Returns:
+            释放的磁盘字节数，任务不存在或不满足条件时返回 None
+        """
+        with self._task_lock(agent_id, task_id):
+            task_path = self._task_dir(agent_id, task_id)
+            bundle_path = self._find_archive(agent_id, task_id)
+            metadata_path = self._get_metadata_path(task_path)
+            if metadata_path.exists():
+                metadata_bytes = metadata_path.read_bytes()
+            elif bundle_path is not None:
+                metadata_bytes = read_bundle_metadata(bundle_path)
+            else:
+                metadata_bytes = None
+            if metadata_bytes is None:
+                return None
+            metadata = decode_metadata(metadata_bytes)
+            if statuses is not None and metadata["status"] not in statuses:
+                return None
+            if idle_before is not None:
+                updated_at = datetime.fromisoformat(metadata["updated_at"])
+                if updated_at >= idle_before:
+                    return None
+
+            reclaimed = disk_usage(task_path)
+            if task_path.exists():
+                tombstone = task_path.with_name(f".{task_path.name}.deleted")
+                shutil.rmtree(tombstone, ignore_errors=True)
+                os.rename(task_path, tombstone)
+                shutil.rmtree(tombstone, ignore_errors=True)
+            if bundle_path is not None:
+                reclaimed += disk_usage(bundle_path)
+                bundle_path.unlink(missing_ok=True)
+            self._get_task_index(agent_id).remove(task_id)
+            self._index_delete_task(agent_id, task_id)
+            self.invalidate_task_cache(agent_id, task_id)
+        self.get_artifact_cache().release(f"{agent_id}/{task_id}")
+        return reclaimed
+
+    def get_task_disk_usage(self, agent_id: str, task_id: str) -> int:
+        """任务目录（包括版本历史）和归档包占用的磁盘字节数，不会还原已归档的任务"""
+        usage = disk_usage(self._task_dir(agent_id, task_id))
+        bundle_path = self._find_archive(agent_id, task_id)
+        if bundle_path is not None:
+            usage += disk_usage(bundle_path)
+        return usage
+
+    def list_tasks_by_id(
+        self, agent_id: str, after: Optional[str] = None, limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """按任务 ID 顺序分页列出任务索引项（包括已归档的任务），用于增量遍历"""
+        return self._get_task_index(agent_id).query_by_id(after, limit)
+
+    def _rehydrate_if_archived(self, agent_id: str, task_id: str) -> bool:
+        """任务目录不存在但有归档包时解压还原"""
+        task_path = self._task_dir(agent_id, task_id)
+        if self._has_metadata(task_path):
+            return False
+        if self._find_archive(agent_id, task_id) is None:
+            return False
+        return self.rehydrate_task(agent_id, task_id)
+
+    def rehydrate_task(self, agent_id: str, task_id: str) -> bool:
+        """将已归档的任务解压还原为任务目录"""
+        with self._task_lock(agent_id, task_id):
+            task_path = self._task_dir(agent_id, task_id)
+            if self._has_metadata(task_path):
+                # 其他进程已经完成还原
+                return True
+            bundle_path = self._find_archive(agent_id, task_id)
+            if bundle_path is None:
+                return False
+
+            start = time.perf_counter()
+            try:
+                unpack_task(bundle_path, task_path)
+            except Exception as e:
+                print(f"还原归档任务失败 {task_id}: {e}")
+                return False
+            bundle_path.unlink()
+            self._get_task_index(agent_id).set_archived(task_id, False)
+            elapsed = time.perf_counter() - start
+
+        with self._archive_stats_lock:
+            self._archive_stats["rehydrations"] += 1
+            self._archive_stats["rehydration_total"] += elapsed
+            self._archive_stats["rehydration_max"] = max(
+                self._archive_stats["rehydration_max"], elapsed
+            )
+        return True
 
-    def cleanup_old_versions(self, agent_id: str, task_id: str, keep_versions: int = 5):
-        """清理旧版本文件"""
-        task_path = self._get_task_path(agent_id, task_id)
+    def archive_idle_tasks(
+        self,
+        idle_days: float = 30,
+        agent_id: Optional[str] = None,
+        status: Union[str, Sequence[str], None] = None,
+        limit: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        归档超过 idle_days 天未更新的任务
+
+        Args:
+            idle_days: 空闲天数
+            agent_id: 只处理指定 Agent，None 表示所有 Agent
+            status: 状态过滤，例如只归档 completed 的任务
+            limit: 每个 Agent 最多归档的任务数
+
+        Returns:
+            本次归档的任务数、文件数、原占用字节数、压缩包字节数和节省的字节数
+        """
+        cutoff = datetime.utcnow() - timedelta(days=idle_days)
+        if agent_id is not None:
+            agent_ids = [agent_id]
+        else:
+            agent_ids = list(context_layout.iter_agent_ids(self.base_path))
 
-        for file_path in task_path.iterdir():
-            if file_path.name.endswith(".md") and "_v" in file_path.name:
-                # 解析版本号
+        report = {"archived": 0, "files": 0, "original_bytes": 0, "archived_bytes": 0}
+        for current_agent_id in agent_ids:
+            idle_tasks = self._get_task_index(current_agent_id).query_idle(
+                cutoff.isoformat(), status=status, limit=limit
+            )
+            for task in idle_tasks:
                 try:
-                    base_name, version_part = file_path.name.rsplit("_v", 1)
-                    version_num = int(version_part.replace(".md", ""))
-
-                    # 保留最新的几个版本
-                    if version_num > keep_versions:
-                        file_path.unlink()
-                except (ValueError, IndexError):
+                    result = self.archive_task(
+                        current_agent_id, task["task_id"], idle_before=cutoff
+                    )
+                except Exception as e:
+                    print(f"归档任务失败 {task['task_id']}: {e}")
+                    continue
+                if result is None:
                     continue
+                report["archived"] += 1
+                report["files"] += result["files"]
+                report["original_bytes"] += result["original_bytes"]
+                report["archived_bytes"] += result["archived_bytes"]
+
+        report["bytes_saved"] = report["original_bytes"] - report["archived_bytes"]
+        return report
+
+    def get_archive_stats(self) -> Dict[str, Any]:
+        """获取归档节省的字节数和还原延迟"""
+        with self._archive_stats_lock:
+            stats = dict(self._archive_stats)
+        rehydrations = stats.pop("rehydrations")
+        total = stats.pop("rehydration_total")
+        longest = stats.pop("rehydration_max")
+        return {
+            **stats,
+            "bytes_saved": stats["original_bytes"] - stats["archived_bytes"],
+            "rehydrations": rehydrations,
+            "rehydration_avg_ms": total / rehydrations * 1000 if rehydrations else 0.0,
+            "rehydration_max_ms": longest * 1000,
+        }
 
-    def summarize_file_with_llm(
-        self, agent_id: str, task_id: str, file_type: str, llm, max_length: int = 200
-    ) -> bool:
-        """对指定文件用LLM生成摘要并覆盖内容（或生成新版本）"""
-        task_context = self.load_task_context(agent_id, task_id)
-        if not task_context or file_type not in task_context.files:
-            return False
-        file_obj = task_context.files[file_type]
-        summary = None
-        try:
-            from app.core.context.context_tools import ContextTools
+    def migrate_layout(
+        self, agent_id: Optional[str] = None, limit: Optional[int] = None
+    ) -> Dict[str, int]:
+        """
+        将旧版平铺布局（agent_<id>/task_<id>）在线迁移到分桶布局
 
-            summary = ContextTools.generate_llm_summary(
-                file_obj.content, llm, max_length=max_length
-            )
-        except Exception as e:
-            print(f"LLM摘要失败: {e}")
-            return False
-        if summary:
-            return self.update_file_content(agent_id, task_id, file_type, summary)
-        return False
+        每个任务在自身写锁内整体重命名，迁移期间其他任务照常读写；
+        可以重复执行，中途中断后再次执行会从剩余的任务继续
 
-    def summarize_task_context_with_llm(
-        self, agent_id: str, task_id: str, llm, max_size: int = 10000
-    ) -> bool:
-        """对整个任务上下文所有文件用LLM摘要，自动压缩"""
-        from app.core.context.context_tools import ContextTools
+        Args:
+            agent_id: 只迁移指定 Agent，None 表示所有 Agent
+            limit: 本次最多迁移的任务数
 
-        context_data = self.get_context_summary(agent_id, task_id)
-        compressed = ContextTools.compress_context_with_llm(
-            context_data, llm, max_size=max_size
-        )
-        # 更新所有被压缩的文件内容
-        files = compressed.get("files", {})
-        for file_type, file_data in files.items():
-            if file_data.get("compressed"):
-                self.update_file_content(
-                    agent_id, task_id, file_type, file_data["content"]
+        Returns:
+            迁移的任务数、归档包数、冲突数和已迁移完成的 Agent 数
+        """
+        if agent_id is not None:
+            agent_ids = [agent_id]
+        else:
+            agent_ids = [
+                path.name[6:]
+                for path in self.base_path.glob("agent_*")
+                if path.is_dir()
+            ]
+
+        report = {"migrated": 0, "bundles": 0, "conflicts": 0, "agents": 0}
+        for current_agent_id in agent_ids:
+            legacy_dir = context_layout.legacy_agent_path(
+                self.base_path, current_agent_id
+            )
+            agent_path = context_layout.agent_path(self.base_path, current_agent_id)
+            for task_id, legacy_path in list(
+                context_layout.iter_legacy_task_dirs(legacy_dir)
+            ):
+                if limit is not None and report["migrated"] >= limit:
+                    break
+                with self._task_lock(current_agent_id, task_id):
+                    # 组提交中待 fsync 的文件按旧路径登记，重命名前先落盘
+                    self.flush()
+                    target_path = context_layout.task_path(agent_path, task_id)
+                    try:
+                        target_path.parent.mkdir(parents=True, exist_ok=True)
+                        if target_path.exists():
+                            # 只允许覆盖 _get_task_path 提前创建的空目录
+                            target_path.rmdir()
+                        os.rename(legacy_path, target_path)
+                    except OSError as e:
+                        print(f"迁移任务失败 {task_id}: {e}")
+                        report["conflicts"] += 1
+                        continue
+                    self.invalidate_task_cache(current_agent_id, task_id)
+                report["migrated"] += 1
+
+            legacy_archive = self.base_path / ".archive" / f"agent_{current_agent_id}"
+            for bundle_path in list(legacy_archive.glob("*/task_*")):
+                target_path = (
+                    self._get_archive_root(current_agent_id)
+                    / bundle_path.parent.name
+                    / bundle_path.name
                 )
-        return True
+                if target_path.exists():
+                    report["conflicts"] += 1
+                    continue
+                target_path.parent.mkdir(parents=True, exist_ok=True)
+                os.rename(bundle_path, target_path)
+                report["bundles"] += 1
+
+            # 清理迁移后留下的空目录
+            for empty_dir in [
+                *legacy_archive.glob("*"),
+                legacy_archive,
+                *legacy_dir.glob(".task_*"),
+                legacy_dir,
+            ]:
+                try:
+                    empty_dir.rmdir()
+                except OSError:
+                    pass
+            if not legacy_dir.exists():
+                report["agents"] += 1
+
+        self._legacy_layout = any(
+            path.is_dir() for path in self.base_path.glob("agent_*")
+        )
+        return report
+
+    def close(self):
+        """落盘待提交内容，停止目录监听，关闭任务索引、全文索引和产物缓存"""
+        self.flush()
+        if self._watcher is not None:
+            self._watcher.stop()
+        with self._task_indexes_lock:
+            for index in self._task_indexes.values():
+                index.close()
+            self._task_indexes.clear()
+        with self._artifact_cache_lock:
+            if self._artifact_cache is not None:
+                self._artifact_cache.close()
+                self._artifact_cache = None
+        with self._search_index_lock:
+            if self._search_index is not None:
+                self._search_index.close()
+                self._search_index = None
+
+    def list_file_versions(
+        self, agent_id: str, task_id: str, file_type: str
+    ) -> List[Dict[str, Any]]:
+        """列出文件仍保留的历史版本"""
+        self._rehydrate_if_archived(agent_id, task_id)
+        with self._task_lock(agent_id, task_id, exclusive=False):
+            versions = self._get_version_store(self._get_task_path(agent_id, task_id))
+            if versions is None:
+                return []
+            return versions.list_versions(file_type)
+
+    def get_file_version(
+        self, agent_id: str, task_id: str, file_type: str, version: int
+    ) -> Optional[str]:
+        """读取文件的指定历史版本，版本不存在或已被淘汰时返回 None"""
+        self._rehydrate_if_archived(agent_id, task_id)
+        with self._task_lock(agent_id, task_id, exclusive=False):
+            task_path = self._get_task_path(agent_id, task_id)
+            versions = self._get_version_store(task_path)
+            name = context_format.FILE_NAMES.get(file_type)
+            if versions is None or name is None:
+                return None
+            data = versions.get_version(file_type, version, task_path / name)
+            return data.decode("utf-8") if data is not None else None
+
+    def rollback_file(
+        self, agent_id: str, task_id: str, file_type: str, version: int
+    ) -> bool:
+        """将文件回滚到指定历史版本（回滚本身作为一个新版本写入）"""
+        with self._task_lock(agent_id, task_id):
+            content = self.get_file_version(agent_id, task_id, file_type, version)
+            if content is None:
+                return False
+            return self.update_file_content(agent_id, task_id, file_type, content)
+
+    def get_version_stats(self, agent_id: str, task_id: str) -> Dict[str, Any]:
+        """获取任务版本存储的占用字节数和去重前的逻辑字节数"""
+        self._rehydrate_if_archived(agent_id, task_id)
+        with self._task_lock(agent_id, task_id, exclusive=False):
+            versions = self._get_version_store(self._get_task_path(agent_id, task_id))
+            return versions.stats() if versions is not None else {}
+
+    def cleanup_old_versions(self, agent_id: str, task_id: str, keep_versions: int = 5):
+        """每个文件只保留最近的 keep_versions 个历史版本，并回收不再引用的数据块"""
+        self._rehydrate_if_archived(agent_id, task_id)
+        with self._task_lock(agent_id, task_id):
+            versions = self._get_version_store(self._get_task_path(agent_id, task_id))
+            if versions is not None:
+                versions.prune(keep_versions)
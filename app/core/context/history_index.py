@@ -0,0 +1,198 @@
+"""
+历史记录偏移索引
+history.md 的旁路索引 .history.idx，记录每条聊天消息在文件中的起始偏移和时间戳，
+读取最近 N 条或某个时间之后的消息时直接定位到对应字节，耗时与历史长度无关
+
+文件结构：头部 (已索引的字节数, history.md 的 inode, 记录数)，
+其后为定长记录 (消息起始偏移, 时间戳)，第 i 条记录位于 头部长度 + i * 记录长度
+"""
+
+import os
+import re
+import struct
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .atomic_io import atomic_write_bytes
+
+_HEADER = struct.Struct("<QQQ")
+_RECORD = struct.Struct("<Qd")
+
+# context_format.chat_entry 生成的消息头："\n\n### <时间>: <角色>\n"
+_ENTRY_HEADER = re.compile(
+    rb"\n\n### (\d{4}-\d\d-\d\d \d\d:\d\d:\d\d(?:\.\d+)?): ([^\n]*)\n"
+)
+
+
+def _parse_timestamp(raw: bytes) -> float:
+    try:
+        return datetime.fromisoformat(raw.decode("ascii")).timestamp()
+    except ValueError:
+        return 0.0
+
+
+def scan_entries(data: bytes, base_offset: int = 0) -> List[Tuple[int, float]]:
+    """扫描数据中的消息头，返回 (起始偏移, 时间戳) 列表"""
+    return [
+        (base_offset + match.start(), _parse_timestamp(match.group(1)))
+        for match in _ENTRY_HEADER.finditer(data)
+    ]
+
+
+def parse_entry(data: bytes) -> Optional[Dict[str, str]]:
+    """解析一条消息的字节内容"""
+    match = _ENTRY_HEADER.match(data)
+    if match is None:
+        return None
+    return {
+        "role": match.group(2).decode("utf-8").strip(),
+        "content": data[match.end() :].decode("utf-8").strip(),
+    }
+
+
+def split_entries(data: bytes) -> List[Tuple[str, str, str]]:
+    """拆分出全部消息，返回 (时间, 角色, 内容) 列表"""
+    matches = list(_ENTRY_HEADER.finditer(data))
+    ends = [match.start() for match in matches[1:]] + [len(data)]
+    return [
+        (
+            match.group(1).decode("ascii"),
+            match.group(2).decode("utf-8").strip(),
+            data[match.end() : end].decode("utf-8").strip(),
+        )
+        for match, end in zip(matches, ends)
+    ]
+
+
+class HistoryIndex:
+    """单个任务的 history.md 偏移索引（调用方需持有任务锁）"""
+
+    def __init__(self, index_path: Path, history_path: Path, fsync: bool = False):
+        self.index_path = Path(index_path)
+        self.history_path = Path(history_path)
+        self.fsync = fsync
+
+    def reset(self):
+        """删除索引（history.md 被整体重写时调用，下次读取时重建）"""
+        self.index_path.unlink(missing_ok=True)
+
+    def _read_header(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            with open(self.index_path, "rb") as f:
+                data = f.read(_HEADER.size)
+        except FileNotFoundError:
+            return None
+        if len(data) < _HEADER.size:
+            return None
+        return _HEADER.unpack(data)
+
+    def _rebuild(self, inode: int) -> Tuple[int, int, int]:
+        """扫描整个 history.md 重建索引（索引缺失或文件被重写时执行一次）"""
+        data = self.history_path.read_bytes()
+        records = scan_entries(data)
+        header = (len(data), inode, len(records))
+        atomic_write_bytes(
+            self.index_path,
+            _HEADER.pack(*header)
+            + b"".join(_RECORD.pack(offset, ts) for offset, ts in records),
+            fsync=self.fsync,
+        )
+        return header
+
+    def refresh(self) -> Optional[Tuple[int, int, int]]:
+        """
+        使索引与 history.md 保持一致
+
+        正常追加后只扫描新增的尾部字节；history.md 被替换（inode 变化）或变短时整体重建
+
+        Returns:
+            (已索引的字节数, inode, 记录数)，history.md 不存在时返回 None
+        """
+        try:
+            stat = os.stat(self.history_path)
+        except FileNotFoundError:
+            self.reset()
+            return None
+
+        header = self._read_header()
+        if header is None or header[1] != stat.st_ino or header[0] > stat.st_size:
+            return self._rebuild(stat.st_ino)
+        indexed, inode, count = header
+        if indexed == stat.st_size:
+            return header
+
+        with open(self.history_path, "rb") as f:
+            f.seek(indexed)
+            tail = f.read(stat.st_size - indexed)
+        records = scan_entries(tail, indexed)
+        header = (indexed + len(tail), inode, count + len(records))
+
+        # 先写记录再写头部：中途失败时头部仍指向旧的记录数，下次从旧位置重新扫描
+        fd = os.open(str(self.index_path), os.O_RDWR)
+        try:
+            if records:
+                os.pwrite(
+                    fd,
+                    b"".join(_RECORD.pack(offset, ts) for offset, ts in records),
+                    _HEADER.size + count * _RECORD.size,
+                )
+            os.pwrite(fd, _HEADER.pack(*header), 0)
+            if self.fsync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+        return header
+
+    def _bisect(self, f, count: int, timestamp: float) -> int:
+        """二分查找第一条时间戳不早于 timestamp 的记录"""
+        low, high = 0, count
+        while low < high:
+            mid = (low + high) // 2
+            f.seek(_HEADER.size + mid * _RECORD.size)
+            _, ts = _RECORD.unpack(f.read(_RECORD.size))
+            if ts < timestamp:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def read(
+        self, limit: Optional[int] = None, since: Optional[datetime] = None
+    ) -> List[Dict[str, str]]:
+        """
+        读取聊天消息（按时间顺序）
+
+        Args:
+            limit: 只返回最近的若干条
+            since: 只返回该时间及之后的消息
+        """
+        header = self.refresh()
+        if header is None:
+            return []
+        indexed, _, count = header
+
+        with open(self.index_path, "rb") as f:
+            start = 0
+            if since is not None:
+                start = self._bisect(f, count, since.timestamp())
+            if limit:
+                start = max(start, count - limit)
+            if start >= count:
+                return []
+            f.seek(_HEADER.size + start * _RECORD.size)
+            raw = f.read((count - start) * _RECORD.size)
+        offsets = [offset for offset, _ in _RECORD.iter_unpack(raw)]
+
+        with open(self.history_path, "rb") as f:
+            f.seek(offsets[0])
+            data = f.read(indexed - offsets[0])
+        base = offsets[0]
+        bounds = [offset - base for offset in offsets] + [len(data)]
+
+        messages = []
+        for begin, end in zip(bounds, bounds[1:]):
+            message = parse_entry(data[begin:end])
+            if message is not None:
+                messages.append(message)
+        return messages
@@ -0,0 +1,112 @@
+"""
+任务元数据编解码
+每次修改任务都会重写 metadata.json，每次加载都会重新解析。编码器可替换：
+
+- json: 标准库，带缩进，便于人工查看（旧版本的格式）
+- orjson: 紧凑 JSON，旧版本代码仍可读取（默认，未安装 orjson 时退回 json）
+- msgpack: ormsgpack 二进制格式，编解码最快、体积最小
+
+文件名保持 metadata.json，归档包、缓存签名和目录扫描都按同一路径查找；
+读取时按内容开头识别格式，旧版 JSON 和各编码器写入的文件可以混用
+"""
+
+import json
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 可选依赖
+    orjson = None
+
+try:
+    import ormsgpack
+except ImportError:  # pragma: no cover - 可选依赖
+    ormsgpack = None
+
+CODEC_JSON = "json"
+CODEC_ORJSON = "orjson"
+CODEC_MSGPACK = "msgpack"
+
+
+@dataclass(frozen=True)
+class MetadataCodec:
+    """元数据编码器"""
+
+    name: str
+    encode: Callable[[Dict[str, Any]], bytes]
+    decode: Callable[[bytes], Dict[str, Any]]
+    # 根据内容开头判断是否为该编码器写入的格式（JSON 格式作为兜底，无需判断）
+    detect: Optional[Callable[[bytes], bool]] = None
+
+
+def _encode_json(metadata: Dict[str, Any]) -> bytes:
+    return json.dumps(metadata, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def _decode_json(data: bytes) -> Dict[str, Any]:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _encode_orjson(metadata: Dict[str, Any]) -> bytes:
+    try:
+        return orjson.dumps(metadata)
+    except TypeError:
+        # 非字符串键、超出 64 位的整数等 orjson 不支持的值
+        return json.dumps(metadata, ensure_ascii=False).encode("utf-8")
+
+
+def _encode_msgpack(metadata: Dict[str, Any]) -> bytes:
+    try:
+        return ormsgpack.packb(metadata)
+    except TypeError:
+        # 不支持的值写为 JSON，读取时按内容识别
+        return json.dumps(metadata, ensure_ascii=False).encode("utf-8")
+
+
+def _is_msgpack_map(data: bytes) -> bool:
+    """MessagePack map 以 0x80-0x8f（fixmap）、0xde 或 0xdf 开头，JSON 不会如此"""
+    return bool(data) and (0x80 <= data[0] <= 0x8F or data[0] in (0xDE, 0xDF))
+
+
+_codecs: Dict[str, MetadataCodec] = {
+    CODEC_JSON: MetadataCodec(CODEC_JSON, _encode_json, _decode_json),
+}
+if orjson is not None:
+    _codecs[CODEC_ORJSON] = MetadataCodec(CODEC_ORJSON, _encode_orjson, _decode_json)
+if ormsgpack is not None:
+    _codecs[CODEC_MSGPACK] = MetadataCodec(
+        CODEC_MSGPACK, _encode_msgpack, ormsgpack.unpackb, _is_msgpack_map
+    )
+
+
+def register_codec(codec: MetadataCodec):
+    """注册自定义编码器（需要提供 detect，以便读取时识别格式）"""
+    if codec.detect is None and codec.name != CODEC_JSON:
+        raise ValueError(f"编码器 {codec.name} 缺少格式识别函数")
+    _codecs[codec.name] = codec
+
+
+def available_codecs() -> List[str]:
+    """当前环境可用的编码器"""
+    return list(_codecs)
+
+
+def get_codec(name: Optional[str] = None) -> MetadataCodec:
+    """获取编码器，name 为 None 时优先使用 orjson"""
+    if name is None:
+        name = CODEC_ORJSON if CODEC_ORJSON in _codecs else CODEC_JSON
+    codec = _codecs.get(name)
+    if codec is None:
+        raise ValueError(f"不可用的元数据编码: {name}（可用: {available_codecs()}）")
+    return codec
+
+
+def decode_metadata(data: bytes) -> Dict[str, Any]:
+    """解析任何编码器（包括旧版 JSON）写入的元数据"""
+    for codec in _codecs.values():
+        if codec.detect is not None and codec.detect(data):
+            return codec.decode(data)
+    return _decode_json(data)
@@ -0,0 +1,272 @@
+"""
+资源链接登记表
+按规范化 URL 的哈希登记任务的资源链接：重复的链接只累计命中次数、合并描述，
+resource_links.txt 中每个 URL 只写入一次，读取资源列表时也无需解析 Markdown
+
+登记表保存在任务目录的 .resources.sqlite 中，每个资源一行，登记一次只更新对应的行；
+同时记录已登记的 resource_links.txt 的字节数和 inode，文件被直接追加时只解析
+新增的尾部，被替换时整体重建
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from . import context_format
+
+# 合并后的描述超过该长度（字符数）时不再追加新的描述
+MAX_DESCRIPTION_LENGTH = 2000
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+# 不影响页面内容的跟踪参数
+_TRACKING_PARAMS = {"fbclid", "gclid", "spm", "yclid"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS resources (
+    seq INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    url TEXT NOT NULL,
+    description TEXT NOT NULL,
+    hits INTEGER NOT NULL,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS source_state (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    size INTEGER NOT NULL,
+    inode INTEGER NOT NULL
+);
+"""
+
+
+def _is_tracking_param(name: str) -> bool:
+    name = name.lower()
+    return name.startswith("utm_") or name in _TRACKING_PARAMS
+
+
+def normalize_url(url: str) -> str:
+    """
+    规范化 URL：协议和主机名小写，http 与 https 视为相同，去掉默认端口、片段、
+    路径末尾的 / 和跟踪参数，查询参数排序
+
+    Raises:
+        ValueError: URL 为空或无法解析（缺少协议或主机）
+    """
+    url = (url or "").strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError as e:
+        raise ValueError(f"无效的 URL {url!r}: {e}") from None
+    if not parts.scheme or not parts.hostname:
+        raise ValueError(f"无效的 URL {url!r}")
+
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if port and _DEFAULT_PORTS.get(scheme) != port:
+        host = f"{host}:{port}"
+    if scheme in _DEFAULT_PORTS:
+        scheme = "https"
+    path = parts.path.rstrip("/") or "/"
+    query = urlencode(
+        sorted(
+            (name, value)
+            for name, value in parse_qsl(parts.query, keep_blank_values=True)
+            if not _is_tracking_param(name)
+        )
+    )
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def resource_key(url: str) -> str:
+    """资源的登记键：规范化 URL 的哈希"""
+    return hashlib.sha1(normalize_url(url).encode("utf-8")).hexdigest()[:16]
+
+
+def merge_description(existing: str, new: str) -> str:
+    """合并描述：新描述已包含在原描述中时保持不变，包含原描述时替换"""
+    new = (new or "").strip()
+    if not new or new in existing:
+        return existing
+    if not existing or existing in new:
+        return new
+    if len(existing) + len(new) > MAX_DESCRIPTION_LENGTH:
+        return existing
+    return f"{existing}\n{new}"
+
+
+class ResourceRegistry:
+    """
+    单个任务的资源登记表（调用方需持有任务锁）
+
+    作为上下文管理器使用：进入时开启写事务并补登记 resource_links.txt 中新增的资源，
+    save() 提交本次登记，未保存的登记在退出时回滚
+    """
+
+    def __init__(self, registry_path: Path, source_path: Path, fsync: bool = False):
+        self.registry_path = Path(registry_path)
+        self.source_path = Path(source_path)
+        self.fsync = fsync
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def reset(self):
+        """删除登记表（resource_links.txt 被整体重写时调用，下次使用时重建）"""
+        self.registry_path.unlink(missing_ok=True)
+        self.registry_path.with_suffix(".json").unlink(missing_ok=True)
+
+    def __enter__(self) -> "ResourceRegistry":
+        # isolation_level=None：由 BEGIN IMMEDIATE / save() 显式控制事务边界
+        conn = sqlite3.connect(
+            str(self.registry_path), timeout=30, isolation_level=None
+        )
+        try:
+            conn.execute(f"PRAGMA synchronous={'FULL' if self.fsync else 'OFF'}")
+            conn.executescript(_SCHEMA)
+            conn.execute("BEGIN IMMEDIATE")
+            self._conn = conn
+            self._catch_up()
+        except BaseException:
+            self._conn = None
+            conn.close()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        conn, self._conn = self._conn, None
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        finally:
+            conn.close()
+
+    def _source_state(self) -> Tuple[int, int]:
+        try:
+            stat = os.stat(self.source_path)
+        except FileNotFoundError:
+            return 0, 0
+        return stat.st_size, stat.st_ino
+
+    def _import_legacy(self) -> Optional[Tuple[int, int]]:
+        """导入旧版本的 .resources.json 登记表，返回其记录的 (字节数, inode)"""
+        # 旧文件保留到 reset() 时删除：导入后 source_state 已存在，不会再次导入
+        legacy_path = self.registry_path.with_suffix(".json")
+        try:
+            data = json.loads(legacy_path.read_bytes())
+            resources = data["resources"]
+            size, inode = data["source"]
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            return None
+        self._conn.executemany(
+            """
+            INSERT OR IGNORE INTO resources (
+                key, title, url, description, hits, first_seen, last_seen
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (
+                    key,
+                    resource["title"],
+                    resource["url"],
+                    resource["description"],
+                    resource["hits"],
+                    resource["first_seen"],
+                    resource["last_seen"],
+                )
+                for key, resource in resources.items()
+            ],
+        )
+        return size, inode
+
+    def _catch_up(self):
+        """登记 resource_links.txt 中尚未登记的资源"""
+        row = self._conn.execute(
+            "SELECT size, inode FROM source_state WHERE id = 0"
+        ).fetchone()
+        if row is None:
+            row = self._import_legacy()
+        size, inode = row or (0, 0)
+
+        stat_size, stat_inode = self._source_state()
+        if not stat_inode:
+            return
+        if inode != stat_inode or size > stat_size:
+            # 文件被替换或变短：从头重新登记
+            self._conn.execute("DELETE FROM resources")
+            size = 0
+        if size < stat_size:
+            with open(self.source_path, "rb") as f:
+                f.seek(size)
+                tail = f.read(stat_size - size)
+            for resource in context_format.parse_resources(
+                tail.decode("utf-8", errors="replace")
+            ):
+                try:
+                    self.register(
+                        resource["title"],
+                        resource.get("url", ""),
+                        resource.get("description"),
+                    )
+                except ValueError:
+                    # 文件头部的分节标题和无效链接不登记
+                    continue
+        self._save_source_state()
+
+    def _save_source_state(self):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO source_state (id, size, inode) VALUES (0, ?, ?)",
+            self._source_state(),
+        )
+
+    def register(self, title: str, url: str, description: Optional[str] = "") -> bool:
+        """
+        登记一次资源链接
+
+        Returns:
+            True 表示新资源（需要写入 resource_links.txt），False 表示重复链接
+
+        Raises:
+            ValueError: URL 为空或无法解析
+        """
+        key = resource_key(url)
+        now = datetime.utcnow().isoformat()
+        row = self._conn.execute(
+            "SELECT description FROM resources WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self._conn.execute(
+                """
+                INSERT INTO resources (
+                    key, title, url, description, hits, first_seen, last_seen
+                ) VALUES (?, ?, ?, ?, 1, ?, ?)
+                """,
+                (key, title, url, (description or "").strip(), now, now),
+            )
+            return True
+        self._conn.execute(
+            """
+            UPDATE resources SET hits = hits + 1, last_seen = ?, description = ?
+            WHERE key = ?
+            """,
+            (now, merge_description(row[0], description), key),
+        )
+        return False
+
+    def save(self):
+        """提交本次登记，记录当前 resource_links.txt 的大小和 inode"""
+        self._save_source_state()
+        self._conn.commit()
+
+    def list_resources(self) -> List[Dict[str, Any]]:
+        """按首次登记的顺序列出资源"""
+        return [
+            {"title": title, "url": url, "description": description, "hits": hits}
+            for title, url, description, hits in self._conn.execute(
+                "SELECT title, url, description, hits FROM resources ORDER BY seq"
+            )
+        ]
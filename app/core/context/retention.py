@@ -0,0 +1,472 @@
+"""
+上下文保留策略与磁盘配额
+RetentionEngine 在后台按批增量巡检任务：每一步只处理一个 Agent 的一页任务（按任务 ID 游标
+推进，游标和各任务的占用记录在 .retention/ledger.sqlite 中，进程重启后继续），不会一次性
+遍历整个目录树。巡检到的任务按以下顺序处理：
+
+1. 状态超过保留期（如 completed 90 天）的任务永久删除
+2. 已结束且空闲超过 archive_idle_days 的任务打包归档
+3. 空闲任务的版本历史只保留最近 keep_versions 个版本
+
+每一步之后按账本中记录的占用检查每个 Agent 和全局的配额，超出时按最近更新时间从旧到新
+删除已结束的任务（LRU）。output/、reports/ 等输出目录按文件修改时间清理。
+所有回收操作及释放的字节数记录在账本中，可通过 stats() 和 reclaimed() 查看
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from . import context_layout
+
+if TYPE_CHECKING:
+    from .file_context_manager import FileContextManager
+
+# 回收操作
+ACTION_EXPIRED = "expired"  # 超过状态保留期，删除
+ACTION_ARCHIVED = "archived"  # 空闲任务归档
+ACTION_VERSIONS = "versions"  # 清理旧版本
+ACTION_AGENT_QUOTA = "agent_quota"  # 超出 Agent 配额，删除
+ACTION_GLOBAL_QUOTA = "global_quota"  # 超出全局配额，删除
+ACTION_OUTPUT = "output"  # 输出目录中过期的文件
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    agent_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    cycle INTEGER NOT NULL,
+    PRIMARY KEY (agent_id, task_id)
+);
+CREATE INDEX IF NOT EXISTS idx_usage_lru ON usage (status, updated_at);
+CREATE TABLE IF NOT EXISTS pending_agents (
+    agent_id TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS reclaimed (
+    id INTEGER PRIMARY KEY,
+    at TEXT NOT NULL,
+    action TEXT NOT NULL,
+    agent_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    bytes INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+@dataclass
+class RetentionPolicy:
+    """保留策略与配额"""
+
+    # 各状态的保留天数，超过后删除；未列出的状态（如进行中的任务）不会因过期被删除
+    status_ttl_days: Dict[str, float] = field(
+        default_factory=lambda: {"completed": 90.0, "failed": 30.0}
+    )
+    # 已结束的状态：可以归档，超出配额时可以被淘汰
+    finished_statuses: Tuple[str, ...] = ("completed", "failed")
+    archive_idle_days: Optional[float] = 30.0  # None 表示不归档
+    keep_versions: Optional[int] = 5  # 空闲任务保留的版本数，None 表示不清理
+    version_idle_days: float = 1.0  # 超过该天数未更新的任务才清理版本
+    agent_quota_bytes: Optional[int] = None  # 每个 Agent 的配额
+    global_quota_bytes: Optional[int] = None  # 所有 Agent 的总配额
+    min_idle_hours: float = 1.0  # 配额淘汰不会删除最近更新过的任务
+    # 输出目录 -> 文件保留天数（按修改时间）
+    output_dirs: Dict[str, float] = field(default_factory=dict)
+    batch_size: int = 50  # 每一步处理的任务数（输出目录为文件数）
+
+
+class RetentionEngine:
+    """保留策略执行器：step() 执行一步增量巡检，start() 在后台线程中定期执行"""
+
+    def __init__(
+        self,
+        store: "FileContextManager",
+        policy: Optional[RetentionPolicy] = None,
+        ledger_path: Optional[Path] = None,
+    ):
+        self.store = store
+        self.policy = policy or RetentionPolicy()
+        self.ledger_path = Path(
+            ledger_path or store.base_path / ".retention" / "ledger.sqlite"
+        )
+        self.ledger_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(
+            str(self.ledger_path),
+            timeout=30,
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- 账本 ----
+
+    def _get_state(self, key: str, default: str = "") -> str:
+        row = self._conn.execute(
+            "SELECT value FROM state WHERE key = ?", (key,)
+        ).fetchone()
+        return row["value"] if row else default
+
+    def _set_state(self, key: str, value: Any):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)",
+            (key, str(value)),
+        )
+
+    def _record(self, action: str, agent_id: str, task_id: str, reclaimed: int):
+        self._conn.execute(
+            "INSERT INTO reclaimed (at, action, agent_id, task_id, bytes) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (datetime.utcnow().isoformat(), action, agent_id, task_id, reclaimed),
+        )
+
+    def _forget(self, agent_id: str, task_id: str):
+        self._conn.execute(
+            "DELETE FROM usage WHERE agent_id = ? AND task_id = ?",
+            (agent_id, task_id),
+        )
+
+    # ---- 巡检 ----
+
+    def _next_agent(self, cycle: int) -> Tuple[Optional[str], int]:
+        """当前正在巡检的 Agent；一轮结束时清除未再出现的任务记录并开始新一轮"""
+        row = self._conn.execute(
+            "SELECT agent_id FROM pending_agents ORDER BY agent_id LIMIT 1"
+        ).fetchone()
+        if row is not None:
+            return row["agent_id"], cycle
+        if cycle > 0:
+            # 上一轮已遍历全部任务，未被访问到的记录对应已被删除的任务
+            self._conn.execute("DELETE FROM usage WHERE cycle < ?", (cycle,))
+        cycle += 1
+        self._set_state("cycle", cycle)
+        # 新一轮只列出 Agent 目录，各 Agent 的任务在之后的步骤中分页读取
+        agent_ids = context_layout.iter_agent_ids(self.store.base_path)
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO pending_agents (agent_id) VALUES (?)",
+            ((agent_id,) for agent_id in agent_ids),
+        )
+        row = self._conn.execute(
+            "SELECT agent_id FROM pending_agents ORDER BY agent_id LIMIT 1"
+        ).fetchone()
+        return (row["agent_id"] if row else None), cycle
+
+    def _sweep_task(
+        self, agent_id: str, task: Dict[str, Any], now: datetime, cycle: int
+    ):
+        """按保留期、归档和版本清理的顺序处理单个任务，并记录其占用"""
+        policy = self.policy
+        task_id = task["task_id"]
+        status = task["status"]
+        updated_at = datetime.fromisoformat(task["updated_at"])
+
+        ttl_days = policy.status_ttl_days.get(status)
+        if ttl_days is not None and updated_at < now - timedelta(days=ttl_days):
+            reclaimed = self.store.delete_task(
+                agent_id,
+                task_id,
+                idle_before=now - timedelta(days=ttl_days),
+                statuses=[status],
+            )
+            if reclaimed is not None:
+                self._record(ACTION_EXPIRED, agent_id, task_id, reclaimed)
+                self._forget(agent_id, task_id)
+                return
+
+        if not task["archived"]:
+            archive_cutoff = None
+            if policy.archive_idle_days is not None:
+                archive_cutoff = now - timedelta(days=policy.archive_idle_days)
+            version_cutoff = now - timedelta(days=policy.version_idle_days)
+            if (
+                archive_cutoff is not None
+                and status in policy.finished_statuses
+                and updated_at < archive_cutoff
+            ):
+                result = self.store.archive_task(
+                    agent_id, task_id, idle_before=archive_cutoff
+                )
+                if result is not None:
+                    self._record(
+                        ACTION_ARCHIVED,
+                        agent_id,
+                        task_id,
+                        result["original_bytes"] - result["archived_bytes"],
+                    )
+            elif policy.keep_versions is not None and updated_at < version_cutoff:
+                before = self.store.get_task_disk_usage(agent_id, task_id)
+                self.store.cleanup_old_versions(
+                    agent_id, task_id, policy.keep_versions
+                )
+                reclaimed = before - self.store.get_task_disk_usage(agent_id, task_id)
+                if reclaimed > 0:
+                    self._record(ACTION_VERSIONS, agent_id, task_id, reclaimed)
+
+        self._conn.execute(
+            "INSERT OR REPLACE INTO usage "
+            "(agent_id, task_id, status, updated_at, bytes, cycle) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                agent_id,
+                task_id,
+                status,
+                task["updated_at"],
+                self.store.get_task_disk_usage(agent_id, task_id),
+                cycle,
+            ),
+        )
+
+    def _sweep_tasks(self, now: datetime) -> int:
+        """巡检当前 Agent 的下一页任务，返回处理的任务数"""
+        cycle = int(self._get_state("cycle", "0"))
+        agent_id, cycle = self._next_agent(cycle)
+        if agent_id is None:
+            return 0
+        cursor_key = f"cursor:{agent_id}"
+        after = self._get_state(cursor_key) or None
+        tasks = self.store.list_tasks_by_id(
+            agent_id, after=after, limit=self.policy.batch_size
+        )
+        for task in tasks:
+            try:
+                self._sweep_task(agent_id, task, now, cycle)
+            except Exception as e:
+                print(f"执行保留策略失败 {agent_id}/{task['task_id']}: {e}")
+        if len(tasks) < self.policy.batch_size:
+            # 该 Agent 已遍历完毕
+            self._conn.execute(
+                "DELETE FROM pending_agents WHERE agent_id = ?", (agent_id,)
+            )
+            self._conn.execute("DELETE FROM state WHERE key = ?", (cursor_key,))
+        else:
+            self._set_state(cursor_key, tasks[-1]["task_id"])
+        return len(tasks)
+
+    def _evict(
+        self, action: str, excess: int, agent_id: Optional[str], now: datetime
+    ) -> int:
+        """按最近更新时间从旧到新删除已结束的任务，直到释放 excess 字节"""
+        idle_before = now - timedelta(hours=self.policy.min_idle_hours)
+        statuses = list(self.policy.finished_statuses)
+        sql = (
+            "SELECT agent_id, task_id FROM usage "
+            f"WHERE status IN ({', '.join('?' * len(statuses))}) AND updated_at < ?"
+        )
+        params: List[Any] = [*statuses, idle_before.isoformat()]
+        if agent_id is not None:
+            sql += " AND agent_id = ?"
+            params.append(agent_id)
+        sql += " ORDER BY updated_at ASC"
+        candidates = self._conn.execute(sql, params).fetchall()
+
+        freed = 0
+        for row in candidates:
+            if freed >= excess:
+                break
+            try:
+                reclaimed = self.store.delete_task(
+                    row["agent_id"],
+                    row["task_id"],
+                    idle_before=idle_before,
+                    statuses=statuses,
+                )
+            except Exception as e:
+                print(f"淘汰任务失败 {row['agent_id']}/{row['task_id']}: {e}")
+                continue
+            if reclaimed is None:
+                continue
+            self._record(action, row["agent_id"], row["task_id"], reclaimed)
+            self._forget(row["agent_id"], row["task_id"])
+            freed += reclaimed
+        return freed
+
+    def _enforce_quotas(self, now: datetime):
+        """按账本中的占用检查 Agent 配额和全局配额"""
+        policy = self.policy
+        if policy.agent_quota_bytes is not None:
+            over = self._conn.execute(
+                "SELECT agent_id, SUM(bytes) AS total FROM usage "
+                "GROUP BY agent_id HAVING total > ?",
+                (policy.agent_quota_bytes,),
+            ).fetchall()
+            for row in over:
+                self._evict(
+                    ACTION_AGENT_QUOTA,
+                    row["total"] - policy.agent_quota_bytes,
+                    row["agent_id"],
+                    now,
+                )
+        if policy.global_quota_bytes is not None:
+            total = self._conn.execute(
+                "SELECT COALESCE(SUM(bytes), 0) FROM usage"
+            ).fetchone()[0]
+            if total > policy.global_quota_bytes:
+                self._evict(
+                    ACTION_GLOBAL_QUOTA, total - policy.global_quota_bytes, None, now
+                )
+
+    def _sweep_outputs(self, now: float) -> int:
+        """清理输出目录中下一批过期的文件，返回检查的文件数"""
+        checked = 0
+        for directory, ttl_days in self.policy.output_dirs.items():
+            root = Path(directory)
+            if not root.is_dir():
+                continue
+            cursor_key = f"output:{root.resolve()}"
+            after = self._get_state(cursor_key)
+            names = sorted(name for name in os.listdir(root) if name > after)
+            batch = names[: self.policy.batch_size]
+            for name in batch:
+                path = root / name
+                try:
+                    stat = path.stat()
+                    if not path.is_file() or stat.st_mtime >= now - ttl_days * 86400:
+                        continue
+                    path.unlink()
+                except FileNotFoundError:
+                    continue
+                except OSError as e:
+                    print(f"清理输出文件失败 {path}: {e}")
+                    continue
+                self._record(ACTION_OUTPUT, "", str(path), stat.st_size)
+            checked += len(batch)
+            # 到达目录末尾时从头开始
+            self._set_state(
+                cursor_key, batch[-1] if len(batch) == self.policy.batch_size else ""
+            )
+        return checked
+
+    def step(self) -> Dict[str, int]:
+        """
+        执行一步巡检：一页任务、配额检查和一批输出文件
+
+        Returns:
+            本步处理的任务数、检查的输出文件数和释放的字节数
+        """
+        now = datetime.utcnow()
+        with self._lock:
+            last_id = self._conn.execute(
+                "SELECT COALESCE(MAX(id), 0) FROM reclaimed"
+            ).fetchone()[0]
+            tasks = self._sweep_tasks(now)
+            self._enforce_quotas(now)
+            outputs = self._sweep_outputs(time.time())
+            reclaimed = self._conn.execute(
+                "SELECT COALESCE(SUM(bytes), 0) FROM reclaimed WHERE id > ?",
+                (last_id,),
+            ).fetchone()[0]
+        return {"tasks": tasks, "outputs": outputs, "reclaimed_bytes": reclaimed}
+
+    def run_cycle(self, max_steps: Optional[int] = None) -> Dict[str, int]:
+        """连续执行巡检直到完成一整轮（所有 Agent 的任务都被访问一次）"""
+        report = {"steps": 0, "tasks": 0, "outputs": 0, "reclaimed_bytes": 0}
+        while max_steps is None or report["steps"] < max_steps:
+            result = self.step()
+            report["steps"] += 1
+            for key, value in result.items():
+                report[key] += value
+            with self._lock:
+                pending = self._conn.execute(
+                    "SELECT COUNT(*) FROM pending_agents"
+                ).fetchone()[0]
+            if not pending:
+                break
+        return report
+
+    def start(self, interval: float = 30.0):
+        """启动后台巡检线程，每 interval 秒执行一步"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run,
+                args=(interval,),
+                name="context-retention",
+                daemon=True,
+            )
+            self._thread.start()
+
+    def _run(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.step()
+            except Exception as e:
+                print(f"执行保留策略失败: {e}")
+
+    def stop(self):
+        """停止后台巡检线程"""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+            self._thread = None
+
+    def close(self):
+        """停止巡检并关闭账本"""
+        self.stop()
+        with self._lock:
+            self._conn.close()
+
+    # ---- 指标 ----
+
+    def reclaimed(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """最近的回收记录（最新的在前）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT at, action, agent_id, task_id, bytes FROM reclaimed "
+                "ORDER BY id DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def usage(self, top: int = 10) -> List[Dict[str, Any]]:
+        """账本中占用最多的 Agent"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT agent_id, COUNT(*) AS tasks, SUM(bytes) AS bytes FROM usage "
+                "GROUP BY agent_id ORDER BY bytes DESC LIMIT ?",
+                (top,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        """巡检进度、账本中的总占用和按操作汇总的回收量"""
+        with self._lock:
+            tasks, tracked = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM usage"
+            ).fetchone()
+            pending = self._conn.execute(
+                "SELECT COUNT(*) FROM pending_agents"
+            ).fetchone()[0]
+            by_action = {
+                row["action"]: {"count": row["count"], "bytes": row["bytes"]}
+                for row in self._conn.execute(
+                    "SELECT action, COUNT(*) AS count, SUM(bytes) AS bytes "
+                    "FROM reclaimed GROUP BY action"
+                )
+            }
+            cycle = int(self._get_state("cycle", "0"))
+        return {
+            "cycle": cycle,
+            "pending_agents": pending,
+            "tracked_tasks": tasks,
+            "tracked_bytes": tracked,
+            "reclaimed_bytes": sum(item["bytes"] for item in by_action.values()),
+            "reclaimed": by_action,
+        }
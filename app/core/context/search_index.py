@@ -0,0 +1,352 @@
+"""
+任务上下文全文索引
+把各 Agent 任务的总结、临时笔记、资源链接和对话历史按条目切分后建立 BM25 倒排索引，
+新任务可以先检索已有任务的研究结果，再决定是否重新搜索。
+
+索引存放在 SQLite FTS5 表中：写入时只为新增或改写的条目更新索引，FTS5 把倒排表按段
+存储，新写入产生小段，段数达到 automerge 阈值时自动合并（optimize 可合并为一段）。
+中日韩文本由 analyze 切分为相邻两字，英文和数字按词，写入 FTS5 前以空格连接
+"""
+
+import re
+import sqlite3
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .compaction import split_sections
+
+# 参与索引的文件类型
+SEARCHABLE_FILE_TYPES = ("summary", "scratchpad", "resource", "history")
+# 单个索引条目的最大字符数，更长的条目切分为多个
+MAX_CHUNK_CHARS = 1500
+# 摘录的字符数
+SNIPPET_CHARS = 160
+# 同一层级的段数达到该值时自动合并
+AUTOMERGE_SEGMENTS = 8
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    agent_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    file_type TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_file ON chunks (agent_id, task_id, file_type);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+    terms, tokenize = 'unicode61 remove_diacritics 0'
+);
+CREATE TABLE IF NOT EXISTS index_state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# 英文和数字按词，中日韩（汉字、假名、谚文）按连续片段
+_WORD = re.compile(
+    r"[a-z0-9]+|[぀-ヿ㐀-䶿一-鿿가-힯]+"
+)
+_COMMENT = re.compile(r"<!--.*?-->", re.S)
+# 模板中每个文件开头的任务信息块
+_TASK_INFO = re.compile(r"^## 任务信息\n(?:- .*\n?)*", re.M)
+
+
+def analyze(text: str) -> List[str]:
+    """
+    分词（保留重复，用于计算词频）：全角字符归一化并转为小写，
+    英文和数字按词（忽略单个字符），中日韩片段切分为相邻两字，单字片段保留单字
+    """
+    terms = []
+    for word in _WORD.findall(unicodedata.normalize("NFKC", text).lower()):
+        if word[0] >= "぀":
+            if len(word) == 1:
+                terms.append(word)
+            else:
+                terms.extend(word[i : i + 2] for i in range(len(word) - 1))
+        elif len(word) > 1:
+            terms.append(word)
+    return terms
+
+
+def chunk_text(content: str, file_type: str) -> List[str]:
+    """按条目切分文件内容，去掉模板注释、任务信息块和只有标题的空条目"""
+    chunks = []
+    for section in split_sections(content, file_type):
+        section = _TASK_INFO.sub("", _COMMENT.sub("", section)).strip()
+        lines = section.split("\n")
+        if all(line.startswith("#") or not line.strip() for line in lines):
+            continue
+        for start in range(0, len(section), MAX_CHUNK_CHARS):
+            chunks.append(section[start : start + MAX_CHUNK_CHARS])
+    return chunks
+
+
+def make_snippet(text: str, terms: Sequence[str], length: int = SNIPPET_CHARS) -> str:
+    """截取查询词出现最密集的一段文本"""
+    lowered = unicodedata.normalize("NFKC", text).lower()
+    if len(lowered) != len(text):
+        # 归一化改变了长度时无法按位置对应，直接在原文中查找
+        lowered = text.lower()
+    positions = sorted(
+        match.start()
+        for term in set(terms)
+        for match in re.finditer(re.escape(term), lowered)
+    )
+    if len(text) <= length:
+        return text.strip()
+    start = 0
+    if positions:
+        best = 0
+        right = 0
+        for left, position in enumerate(positions):
+            while right < len(positions) and positions[right] < position + length:
+                right += 1
+            if right - left > best:
+                best, start = right - left, position
+        start = max(min(start - length // 4, len(text) - length), 0)
+    snippet = text[start : start + length].strip()
+    prefix = "..." if start > 0 else ""
+    suffix = "..." if start + length < len(text) else ""
+    return f"{prefix}{snippet}{suffix}"
+
+
+class ContextSearchIndex:
+    """任务上下文的 BM25 全文索引（线程安全，多个进程可共用同一索引库）"""
+
+    def __init__(
+        self, db_path: Path, file_types: Sequence[str] = SEARCHABLE_FILE_TYPES
+    ):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.file_types = tuple(file_types)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(
+            str(self.db_path),
+            timeout=30,
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.execute(
+            "INSERT INTO chunks_fts (chunks_fts, rank) VALUES ('automerge', ?)",
+            (AUTOMERGE_SEGMENTS,),
+        )
+
+    def close(self):
+        """关闭索引库连接"""
+        with self._lock:
+            self._conn.close()
+
+    def is_built(self) -> bool:
+        """是否已完成初始构建（索引已有任务）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM index_state WHERE key = 'built'"
+            ).fetchone()
+        return row is not None
+
+    def mark_built(self):
+        """标记索引已完成初始构建"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO index_state (key, value) VALUES ('built', '1')"
+            )
+
+    def _insert(
+        self,
+        conn: sqlite3.Connection,
+        agent_id: str,
+        task_id: str,
+        file_type: str,
+        chunks: Iterable[str],
+    ):
+        for chunk in chunks:
+            terms = analyze(chunk)
+            if not terms:
+                continue
+            chunk_id = conn.execute(
+                "INSERT INTO chunks (agent_id, task_id, file_type, text) "
+                "VALUES (?, ?, ?, ?)",
+                (agent_id, task_id, file_type, chunk),
+            ).lastrowid
+            conn.execute(
+                "INSERT INTO chunks_fts (rowid, terms) VALUES (?, ?)",
+                (chunk_id, " ".join(terms)),
+            )
+
+    def _delete(
+        self,
+        conn: sqlite3.Connection,
+        agent_id: str,
+        task_id: str,
+        file_type: Optional[str] = None,
+    ):
+        condition = "agent_id = ? AND task_id = ?"
+        params: Tuple[str, ...] = (agent_id, task_id)
+        if file_type is not None:
+            condition += " AND file_type = ?"
+            params += (file_type,)
+        conn.execute(
+            f"DELETE FROM chunks_fts WHERE rowid IN "
+            f"(SELECT id FROM chunks WHERE {condition})",
+            params,
+        )
+        conn.execute(f"DELETE FROM chunks WHERE {condition}", params)
+
+    def _write(self, apply):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                apply(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def add_text(self, agent_id: str, task_id: str, file_type: str, text: str):
+        """为追加到文件末尾的内容建立索引"""
+        if file_type not in self.file_types:
+            return
+        chunks = chunk_text(text, file_type)
+        if chunks:
+            self._write(
+                lambda conn: self._insert(conn, agent_id, task_id, file_type, chunks)
+            )
+
+    def remove_text(self, agent_id: str, task_id: str, file_type: str, text: str):
+        """删除文件中某段被替换或删除的内容对应的索引条目"""
+        if file_type not in self.file_types:
+            return
+        chunks = chunk_text(text, file_type)
+        if not chunks:
+            return
+
+        def apply(conn: sqlite3.Connection):
+            for chunk in chunks:
+                row = conn.execute(
+                    "SELECT id FROM chunks WHERE agent_id = ? AND task_id = ? "
+                    "AND file_type = ? AND text = ? LIMIT 1",
+                    (agent_id, task_id, file_type, chunk),
+                ).fetchone()
+                if row is not None:
+                    conn.execute("DELETE FROM chunks_fts WHERE rowid = ?", (row[0],))
+                    conn.execute("DELETE FROM chunks WHERE id = ?", (row[0],))
+
+        self._write(apply)
+
+    def replace_file(self, agent_id: str, task_id: str, file_type: str, content: str):
+        """文件被整体改写后重新建立索引"""
+        if file_type not in self.file_types:
+            return
+        chunks = chunk_text(content, file_type)
+
+        def apply(conn: sqlite3.Connection):
+            self._delete(conn, agent_id, task_id, file_type)
+            self._insert(conn, agent_id, task_id, file_type, chunks)
+
+        self._write(apply)
+
+    def replace_task(self, agent_id: str, task_id: str, files: Dict[str, str]):
+        """重新建立任务全部文件的索引（files 为文件类型 -> 内容）"""
+        chunks = {
+            file_type: chunk_text(content, file_type)
+            for file_type, content in files.items()
+            if file_type in self.file_types and content
+        }
+
+        def apply(conn: sqlite3.Connection):
+            self._delete(conn, agent_id, task_id)
+            for file_type, file_chunks in chunks.items():
+                self._insert(conn, agent_id, task_id, file_type, file_chunks)
+
+        self._write(apply)
+
+    def delete_task(self, agent_id: str, task_id: str):
+        """删除任务的全部索引条目"""
+        self._write(lambda conn: self._delete(conn, agent_id, task_id))
+
+    def search(
+        self,
+        query: str,
+        k: int = 10,
+        agent_id: Optional[str] = None,
+        exclude_task: Optional[Tuple[str, str]] = None,
+        file_types: Optional[Sequence[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        按 BM25 检索条目
+
+        Args:
+            agent_id: 只检索该 Agent 的任务（默认所有 Agent）
+            exclude_task: 排除的任务 (agent_id, task_id)，如当前任务
+            file_types: 只检索这些文件类型
+
+        Returns:
+            按相关性从高到低排列的结果：agent_id、task_id、file_type、score（越大越相关）、
+            coverage（查询词在条目中出现的比例）和 snippet
+        """
+        terms = list(dict.fromkeys(analyze(query)))
+        if not terms or k <= 0:
+            return []
+        match = " OR ".join(f'"{term}"' for term in terms)
+        conditions = ["chunks_fts MATCH ?"]
+        params: List[Any] = [match]
+        if agent_id is not None:
+            conditions.append("c.agent_id = ?")
+            params.append(agent_id)
+        if exclude_task is not None:
+            conditions.append("NOT (c.agent_id = ? AND c.task_id = ?)")
+            params.extend(exclude_task)
+        if file_types:
+            conditions.append(f"c.file_type IN ({', '.join('?' * len(file_types))})")
+            params.extend(file_types)
+        params.append(k)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT c.agent_id, c.task_id, c.file_type, c.text, "
+                "bm25(chunks_fts) AS score "
+                "FROM chunks_fts JOIN chunks c ON c.id = chunks_fts.rowid "
+                f"WHERE {' AND '.join(conditions)} ORDER BY score LIMIT ?",
+                params,
+            ).fetchall()
+
+        results = []
+        for row in rows:
+            found = set(analyze(row["text"]))
+            results.append(
+                {
+                    "agent_id": row["agent_id"],
+                    "task_id": row["task_id"],
+                    "file_type": row["file_type"],
+                    "score": round(-row["score"], 4),
+                    "coverage": round(
+                        sum(term in found for term in terms) / len(terms), 3
+                    ),
+                    "snippet": make_snippet(row["text"], terms),
+                }
+            )
+        return results
+
+    def optimize(self):
+        """把所有段合并为一个（大批量写入或重建之后调用）"""
+        self._write(
+            lambda conn: conn.execute(
+                "INSERT INTO chunks_fts (chunks_fts) VALUES ('optimize')"
+            )
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """索引的条目数、任务数和数据库大小"""
+        with self._lock:
+            chunks, tasks = self._conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT agent_id || '/' || task_id) "
+                "FROM chunks"
+            ).fetchone()
+            page_count = self._conn.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+        return {"chunks": chunks, "tasks": tasks, "bytes": page_count * page_size}
@@ -0,0 +1,251 @@
+"""
+Markdown 条目偏移索引
+summary.md、todo.md 按 "## 标题" 分为条目，旁路索引 .<类型>.sections.json 记录每个条目和
+删除标记的起始字节偏移，upsert_section/delete_section 据此只读写受影响的字节范围：
+
+- 条目从标题前的连续换行开始，到下一个条目或删除标记为止（与 compaction.split_sections 一致）
+- 删除标记：被删除或被替换的条目原地覆盖为等长的空 HTML 注释，读取内容时去掉，
+  删除标记累计超过阈值时整体重写文件将其清除
+- 追加写入后只扫描新增的尾部字节；文件被整体重写（inode 变化）、变短或被原地修改时整体重建
+"""
+
+import os
+import re
+from pathlib import Path
+from typing import (
+    Any,
+    BinaryIO,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from . import context_format
+from .atomic_io import atomic_write_bytes
+from .metadata_codec import decode_metadata, get_codec
+
+# 支持按条目修改的文件类型
+SECTION_FILE_TYPES = ("summary", "todo")
+# 删除标记累计超过该字节数且超过文件一半时，整体重写文件清除删除标记
+TOMBSTONE_GC_BYTES = 64 * 1024
+
+_SECTION_START = re.compile(rb"\n+(?=## )")
+_HEADING = re.compile(rb"## ([^\n]*)")
+_TOMBSTONE_PREFIX = b"\n\n<!--"
+_TOMBSTONE_SUFFIX = b"-->"
+_TOMBSTONE = re.compile(rb"\n\n<!-- *-->")
+_TOMBSTONE_TEXT = re.compile(r"\n\n<!-- *-->")
+# 文本末尾可能是删除标记开头的部分
+_TOMBSTONE_PARTIAL = re.compile(r"\n(?:\n(?:<(?:!(?:-(?:- *-{0,2})?)?)?)?)?\Z")
+_TOMBSTONE_MIN = len(_TOMBSTONE_PREFIX) + len(_TOMBSTONE_SUFFIX) + 1
+# 条目内容中的一、二级标题（写入时降为三级，避免被识别为新的条目）
+_CONTENT_HEADING = re.compile(r"(?m)^#{1,2}(?= )")
+
+# (条目名称，删除标记为 None；起始偏移；结束偏移)
+Section = Tuple[Optional[str], int, int]
+
+
+def tombstone(length: int) -> bytes:
+    """覆盖 length 个字节的删除标记（过短时用换行填充）"""
+    if length < _TOMBSTONE_MIN:
+        return b"\n" * length
+    return _TOMBSTONE_PREFIX + b" " * (length - _TOMBSTONE_MIN + 1) + _TOMBSTONE_SUFFIX
+
+
+def write_tombstone(f: BinaryIO, start: int, length: int) -> bytes:
+    """
+    把文件中 [start, start + length) 覆盖为删除标记
+
+    先写标题之后的部分，最后覆盖标题所在的开头，中途失败时条目仍可被识别
+    """
+    marker = tombstone(length)
+    head = len(_TOMBSTONE_PREFIX)
+    f.seek(start + head)
+    f.write(marker[head:])
+    f.seek(start)
+    f.write(marker[:head])
+    return marker
+
+
+def strip_tombstones(content: str) -> str:
+    """去掉内容中的删除标记"""
+    return _TOMBSTONE_TEXT.sub("", content)
+
+
+def strip_tombstone_chunks(chunks: Iterable[str]) -> Iterator[str]:
+    """逐块去掉删除标记，跨越分块边界的标记留到下一块一起处理"""
+    carry = ""
+    for chunk in chunks:
+        text = strip_tombstones(carry + chunk)
+        partial = _TOMBSTONE_PARTIAL.search(text)
+        cut = partial.start() if partial else len(text)
+        carry = text[cut:]
+        if cut:
+            yield text[:cut]
+    if carry:
+        yield carry
+
+
+def section_body(content: str) -> str:
+    """条目内容中的一、二级标题降为三级"""
+    return _CONTENT_HEADING.sub("###", content)
+
+
+def section_entry(file_type: str, section: str, content: str) -> str:
+    """条目文本：summary 与 add_summary_entry 的格式一致（带更新时间）"""
+    if file_type == "summary":
+        return context_format.summary_entry(section, section_body(content))
+    return f"\n\n## {section}\n{section_body(content).rstrip()}\n"
+
+
+def is_section_name(file_type: str, section: str) -> bool:
+    """文件类型是否支持按条目修改，条目名称是否为非空的单行文本"""
+    return file_type in SECTION_FILE_TYPES and bool(section) and "\n" not in section
+
+
+def heading_name(section: str) -> Optional[str]:
+    """条目的标题名称（不是以 "## " 开头的片段返回 None）"""
+    stripped = section.lstrip("\n")
+    if not stripped.startswith("## "):
+        return None
+    return stripped[3:].split("\n", 1)[0].strip()
+
+
+def replace_section(
+    content: str, section: str, entry: Optional[str]
+) -> Tuple[str, bool]:
+    """
+    在完整内容中替换或删除条目（不使用偏移索引的后端使用）
+
+    同名条目全部移除，entry 不为 None 时写在最后一个同名条目的位置（不存在时追加到末尾）
+
+    Returns:
+        (新内容, 是否存在同名条目)
+    """
+    bounds = [0] + [match.start() for match in re.finditer(r"\n+(?=## )", content)]
+    bounds = sorted(set(bounds)) + [len(content)]
+    pieces = [content[start:end] for start, end in zip(bounds, bounds[1:])]
+    positions = [i for i, piece in enumerate(pieces) if heading_name(piece) == section]
+    if not positions:
+        return (content + entry if entry is not None else content), False
+    last = positions[-1]
+    kept = []
+    for i, piece in enumerate(pieces):
+        if i == last and entry is not None:
+            kept.append(entry)
+        elif i not in positions:
+            kept.append(piece)
+    return strip_tombstones("".join(kept)), True
+
+
+def scan_sections(data: bytes, base_offset: int = 0) -> List[List[Any]]:
+    """扫描数据中的条目标题和删除标记，返回按偏移排序的 [名称, 起始偏移] 列表"""
+    entries = []
+    for match in _SECTION_START.finditer(data):
+        heading = _HEADING.match(data, match.end())
+        name = heading.group(1).decode("utf-8", errors="replace").strip()
+        entries.append([name, base_offset + match.start()])
+    for match in _TOMBSTONE.finditer(data):
+        entries.append([None, base_offset + match.start()])
+    entries.sort(key=lambda entry: entry[1])
+    return entries
+
+
+class SectionIndex:
+    """单个 Markdown 文件的条目偏移索引（调用方需持有任务锁）"""
+
+    def __init__(self, index_path: Path, file_path: Path, fsync: bool = False):
+        self.index_path = Path(index_path)
+        self.file_path = Path(file_path)
+        self.fsync = fsync
+
+    def reset(self):
+        """删除索引（文件被整体重写时调用，下次使用时重建）"""
+        self.index_path.unlink(missing_ok=True)
+
+    def _load(self) -> Optional[Dict[str, Any]]:
+        try:
+            return decode_metadata(self.index_path.read_bytes())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, entries: List[List[Any]], garbage: Optional[int] = None):
+        """
+        保存条目列表，并记录文件当前的大小、inode 和修改时间
+
+        Args:
+            garbage: 删除标记占用的字节数，为 None 时按条目列表计算
+        """
+        stat = os.stat(self.file_path)
+        if garbage is None:
+            ends = [entry[1] for entry in entries[1:]] + [stat.st_size]
+            garbage = sum(
+                end - start
+                for (name, start), end in zip(entries, ends)
+                if name is None
+            )
+        state = {
+            "size": stat.st_size,
+            "inode": stat.st_ino,
+            "mtime_ns": stat.st_mtime_ns,
+            "garbage": garbage,
+            "entries": entries,
+        }
+        # 条目较多时索引较大，优先使用 orjson 编码
+        atomic_write_bytes(self.index_path, get_codec().encode(state), fsync=self.fsync)
+        return state
+
+    def rebuild(self) -> Dict[str, Any]:
+        """扫描整个文件重建索引"""
+        return self.save(scan_sections(self.file_path.read_bytes()))
+
+    def refresh(self) -> Optional[Dict[str, Any]]:
+        """
+        使索引与文件保持一致：正常追加后只扫描新增的尾部字节
+
+        Returns:
+            索引状态（size、inode、mtime_ns、garbage、entries），文件不存在时返回 None
+        """
+        try:
+            stat = os.stat(self.file_path)
+        except FileNotFoundError:
+            self.reset()
+            return None
+        state = self._load()
+        if (
+            state is None
+            or state["inode"] != stat.st_ino
+            or state["size"] > stat.st_size
+            or (state["size"] == stat.st_size and state["mtime_ns"] != stat.st_mtime_ns)
+        ):
+            return self.rebuild()
+        if state["size"] == stat.st_size:
+            return state
+
+        # 从已索引部分的最后一个字节开始扫描，覆盖新条目标题前的换行
+        start = max(state["size"] - 1, 0)
+        with open(self.file_path, "rb") as f:
+            f.seek(start)
+            tail = f.read(stat.st_size - start)
+        entries = state["entries"] + [
+            entry for entry in scan_sections(tail, start) if entry[1] >= start
+        ]
+        return self.save(entries)
+
+    def sections(self) -> Tuple[List[Section], int]:
+        """
+        当前的条目列表 (名称, 起始偏移, 结束偏移) 和文件字节数
+
+        第一个条目之前的文件头部不在列表中；文件不存在时返回空列表
+        """
+        state = self.refresh()
+        if state is None:
+            return [], 0
+        entries = state["entries"]
+        ends = [entry[1] for entry in entries[1:]] + [state["size"]]
+        return [
+            (name, start, end) for (name, start), end in zip(entries, ends)
+        ], state["size"]
@@ -0,0 +1,1210 @@
+"""
+SQLite 上下文存储
+消息、待办事项、资源链接、总结和笔记按行存储在 SQLite（WAL）中，
+Markdown 文件只在读取内容或导出时按 context_format 渲染，与文件存储的格式一致
+"""
+
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from . import context_format
+from .artifact_cache import DEFAULT_MAX_BYTES, ArtifactCache
+from .context_format import PREVIEW_LENGTH
+from .context_store import BATCH_METHODS, ContextMutation, ContextStore
+from .file_context_manager import ContextFile, TaskContext
+from .history_index import split_entries
+from .resource_registry import merge_description, normalize_url, resource_key
+from .task_transfer import ImportedFile, ImportedTask
+from .todo_index import TodoIndex, TodoItem
+from .token_count import count_tokens
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    agent_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    metadata TEXT NOT NULL DEFAULT '{}',
+    PRIMARY KEY (agent_id, task_id)
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_agent_updated
+    ON tasks (agent_id, updated_at DESC, task_id DESC);
+CREATE INDEX IF NOT EXISTS idx_tasks_agent_status_updated
+    ON tasks (agent_id, status, updated_at DESC, task_id DESC);
+CREATE TABLE IF NOT EXISTS files (
+    agent_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    file_type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1,
+    metadata TEXT NOT NULL DEFAULT '{}',
+    head TEXT NOT NULL,
+    base TEXT,
+    base_seq INTEGER NOT NULL DEFAULT 0,
+    size INTEGER NOT NULL DEFAULT 0,
+    length INTEGER NOT NULL DEFAULT 0,
+    tokens INTEGER,
+    preview TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (agent_id, task_id, file_type)
+);
+CREATE TABLE IF NOT EXISTS todos (
+    agent_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    item_id TEXT,
+    PRIMARY KEY (agent_id, task_id, position)
+);
+CREATE TABLE IF NOT EXISTS resources (
+    agent_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    url_key TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    url TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT '',
+    hits INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (agent_id, task_id, url_key)
+);
+CREATE TABLE IF NOT EXISTS entries (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    agent_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    file_type TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    label TEXT,
+    url TEXT,
+    description TEXT,
+    content TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_file
+    ON entries (agent_id, task_id, file_type, seq);
+CREATE INDEX IF NOT EXISTS idx_entries_kind
+    ON entries (agent_id, task_id, kind, seq);
+"""
+
+
+class SQLiteContextStore(ContextStore):
+    """
+    基于 SQLite 的上下文存储
+
+    文件内容由三部分渲染：
+    - head: 创建文件时的固定头部（todo.md 之后还会渲染待办事项行和进度记录起始部分）
+    - base: update_file_content 整体替换后的内容，存在时替代 head 及此前的条目
+    - entries: 追加的消息、资源、总结、笔记、进度记录和原始文本
+    """
+
+    def __init__(
+        self,
+        db_path: str = "./agent_contexts.sqlite",
+        artifact_cache_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        # 数据库同目录 shared/ 下的产物缓存，按需打开
+        self.artifact_cache_bytes = artifact_cache_bytes
+        self._artifact_cache: Optional[ArtifactCache] = None
+        # isolation_level=None：由 _transaction 显式控制事务边界
+        self._conn = sqlite3.connect(
+            str(self.db_path),
+            timeout=30,
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self._conn.row_factory = sqlite3.Row
+        # WAL 允许多个 worker 进程并发读写同一数据库
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        tables = {
+            row["name"]
+            for row in self._conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'"
+            )
+        }
+        self._conn.executescript(_SCHEMA)
+        self._migrate_schema(tables)
+
+    def _migrate_schema(self, tables: Sequence[str]):
+        """为旧版本创建的数据库补充新增的列和表"""
+        columns = {
+            row["name"] for row in self._conn.execute("PRAGMA table_info(todos)")
+        }
+        if "item_id" not in columns:
+            self._conn.execute("ALTER TABLE todos ADD COLUMN item_id TEXT")
+        columns = {
+            row["name"] for row in self._conn.execute("PRAGMA table_info(files)")
+        }
+        if "tokens" not in columns:
+            # 旧数据的 token 数为 NULL，首次读取时按内容计算
+            self._conn.execute("ALTER TABLE files ADD COLUMN tokens INTEGER")
+        if "entries" in tables and "resources" not in tables:
+            # 由已有的资源条目生成资源登记表
+            with self._transaction() as conn:
+                for row in conn.execute(
+                    "SELECT * FROM entries WHERE kind = 'resource' ORDER BY seq"
+                ).fetchall():
+                    try:
+                        normalize_url(row["url"])
+                    except ValueError:
+                        continue
+                    self._register_resource(
+                        conn,
+                        row["agent_id"],
+                        row["task_id"],
+                        row["seq"],
+                        row["label"],
+                        row["url"],
+                        row["description"],
+                    )
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """写事务（BEGIN IMMEDIATE，跨进程串行化读改写）"""
+        with self._lock:
+            if self._conn.in_transaction:
+                # 嵌套调用复用外层事务
+                yield self._conn
+                return
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def close(self):
+        """关闭数据库连接和产物缓存"""
+        with self._lock:
+            self._conn.close()
+            if self._artifact_cache is not None:
+                self._artifact_cache.close()
+                self._artifact_cache = None
+
+    def get_artifact_cache(self) -> ArtifactCache:
+        """获取数据库同目录 shared/ 下跨 Agent 共享的产物缓存"""
+        with self._lock:
+            if self._artifact_cache is None:
+                self._artifact_cache = ArtifactCache(
+                    self.db_path.parent / "shared",
+                    max_bytes=self.artifact_cache_bytes,
+                )
+            return self._artifact_cache
+
+    def _get_task_row(
+        self, conn: sqlite3.Connection, agent_id: str, task_id: str
+    ) -> Optional[sqlite3.Row]:
+        """读取任务行"""
+        return conn.execute(
+            "SELECT * FROM tasks WHERE agent_id = ? AND task_id = ?",
+            (agent_id, task_id),
+        ).fetchone()
+
+    def _get_file_row(
+        self, conn: sqlite3.Connection, agent_id: str, task_id: str, file_type: str
+    ) -> Optional[sqlite3.Row]:
+        """读取文件行"""
+        return conn.execute(
+            "SELECT * FROM files WHERE agent_id = ? AND task_id = ? AND file_type = ?",
+            (agent_id, task_id, file_type),
+        ).fetchone()
+
+    def _file_head(self, task_row: sqlite3.Row, file_type: str) -> Optional[str]:
+        """渲染文件固定头部，不支持的文件类型返回 None"""
+        created_at = datetime.fromisoformat(task_row["created_at"])
+        if file_type == "todo":
+            return context_format.todo_header(
+                task_row["task_id"],
+                task_row["title"],
+                task_row["description"],
+                task_row["status"],
+                created_at,
+            )
+        if file_type == "history":
+            return context_format.history_header(
+                task_row["task_id"], task_row["title"], created_at
+            )
+        if file_type == "resource":
+            return context_format.resource_header(
+                task_row["task_id"], task_row["title"]
+            )
+        if file_type == "summary":
+            return context_format.summary_header(
+                task_row["task_id"], task_row["title"], task_row["description"]
+            )
+        if file_type == "scratchpad":
+            return context_format.scratchpad_header(
+                task_row["task_id"], task_row["title"]
+            )
+        return None
+
+    def _ensure_file(
+        self,
+        conn: sqlite3.Connection,
+        task_row: sqlite3.Row,
+        file_type: str,
+        now: Optional[str] = None,
+    ) -> Optional[sqlite3.Row]:
+        """获取文件行，history/summary/scratchpad 等在首次写入时创建"""
+        agent_id, task_id = task_row["agent_id"], task_row["task_id"]
+        file_row = self._get_file_row(conn, agent_id, task_id, file_type)
+        if file_row is not None:
+            return file_row
+
+        head = self._file_head(task_row, file_type)
+        if head is None:
+            return None
+        conn.execute(
+            """
+            INSERT INTO files (
+                agent_id, task_id, file_type, name, created_at, updated_at, head
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                agent_id,
+                task_id,
+                file_type,
+                context_format.FILE_NAMES[file_type],
+                task_row["created_at"],
+                now or task_row["updated_at"],
+                head,
+            ),
+        )
+        self._refresh_file_stats(conn, agent_id, task_id, file_type)
+        return self._get_file_row(conn, agent_id, task_id, file_type)
+
+    def _render_entry(self, row: sqlite3.Row) -> str:
+        """渲染单个条目"""
+        kind = row["kind"]
+        timestamp = datetime.fromisoformat(row["created_at"])
+        if kind == "chat":
+            return context_format.chat_entry(row["label"], row["content"], timestamp)
+        if kind == "resource":
+            return context_format.resource_entry(
+                row["label"], row["url"], row["description"], timestamp
+            )
+        if kind == "summary":
+            return context_format.summary_entry(
+                row["label"], row["content"], timestamp
+            )
+        if kind == "scratchpad":
+            return context_format.scratchpad_entry(row["content"], timestamp)
+        if kind == "progress":
+            return context_format.todo_progress_block(
+                json.loads(row["content"]), timestamp
+            )
+        return row["content"]
+
+    def _render_file(
+        self, conn: sqlite3.Connection, agent_id: str, task_id: str, file_type: str
+    ) -> Optional[str]:
+        """渲染文件的完整 Markdown 内容"""
+        file_row = self._get_file_row(conn, agent_id, task_id, file_type)
+        if file_row is None:
+            return None
+
+        if file_row["base"] is not None:
+            parts = [file_row["base"]]
+        else:
+            parts = [file_row["head"]]
+            if file_type == "todo":
+                for todo in conn.execute(
+                    """
+                    SELECT text, completed, item_id FROM todos
+                    WHERE agent_id = ? AND task_id = ? ORDER BY position
+                    """,
+                    (agent_id, task_id),
+                ):
+                    parts.append(
+                        context_format.todo_item(
+                            todo["text"], bool(todo["completed"]), todo["item_id"]
+                        )
+                    )
+                parts.append(
+                    context_format.todo_footer(
+                        datetime.fromisoformat(file_row["created_at"])
+                    )
+                )
+
+        for row in conn.execute(
+            """
+            SELECT * FROM entries
+            WHERE agent_id = ? AND task_id = ? AND file_type = ? AND seq > ?
+            ORDER BY seq
+            """,
+            (agent_id, task_id, file_type, file_row["base_seq"]),
+        ):
+            parts.append(self._render_entry(row))
+        return "".join(parts)
+
+    def render_file(self, agent_id: str, task_id: str, file_type: str) -> Optional[str]:
+        """按需渲染文件内容"""
+        with self._lock:
+            return self._render_file(self._conn, agent_id, task_id, file_type)
+
+    def _refresh_file_stats(
+        self, conn: sqlite3.Connection, agent_id: str, task_id: str, file_type: str
+    ):
+        """重新渲染文件并更新大小、字符数、token 数和预览（用于非追加的修改）"""
+        content = self._render_file(conn, agent_id, task_id, file_type) or ""
+        conn.execute(
+            """
+            UPDATE files SET size = ?, length = ?, tokens = ?, preview = ?
+            WHERE agent_id = ? AND task_id = ? AND file_type = ?
+            """,
+            (
+                len(content.encode("utf-8")),
+                len(content),
+                count_tokens(content),
+                content[:PREVIEW_LENGTH],
+                agent_id,
+                task_id,
+                file_type,
+            ),
+        )
+
+    def _touch(
+        self,
+        conn: sqlite3.Connection,
+        agent_id: str,
+        task_id: str,
+        file_type: str,
+        now: str,
+        appended: Optional[str] = None,
+    ):
+        """递增文件版本并更新时间；appended 不为 None 时增量更新统计信息"""
+        if appended is None:
+            conn.execute(
+                """
+                UPDATE files SET version = version + 1, updated_at = ?
+                WHERE agent_id = ? AND task_id = ? AND file_type = ?
+                """,
+                (now, agent_id, task_id, file_type),
+            )
+            self._refresh_file_stats(conn, agent_id, task_id, file_type)
+        else:
+            conn.execute(
+                f"""
+                UPDATE files SET
+                    version = version + 1,
+                    updated_at = ?,
+                    size = size + ?,
+                    length = length + ?,
+                    tokens = tokens + ?,
+                    preview = CASE WHEN length(preview) < {PREVIEW_LENGTH}
+                        THEN substr(preview || ?, 1, {PREVIEW_LENGTH})
+                        ELSE preview END
+                WHERE agent_id = ? AND task_id = ? AND file_type = ?
+                """,
+                (
+                    now,
+                    len(appended.encode("utf-8")),
+                    len(appended),
+                    count_tokens(appended),
+                    appended,
+                    agent_id,
+                    task_id,
+                    file_type,
+                ),
+            )
+        conn.execute(
+            "UPDATE tasks SET updated_at = ? WHERE agent_id = ? AND task_id = ?",
+            (now, agent_id, task_id),
+        )
+
+    def create_task_context(
+        self,
+        agent_id: str,
+        task_id: str,
+        title: str,
+        description: str,
+        todo_items: Optional[List[Union[str, TodoItem]]] = None,
+    ) -> TaskContext:
+        """创建新的任务上下文（只创建 todo.md 和 resource_links.txt）"""
+        now = datetime.utcnow().isoformat()
+        if not (todo_items and isinstance(todo_items, list)):
+            todo_items = context_format.DEFAULT_TODO_ITEMS
+
+        with self._transaction() as conn:
+            # 与文件存储一致：重复创建时覆盖原有任务
+            for table in ("entries", "resources", "todos", "files", "tasks"):
+                conn.execute(
+                    f"DELETE FROM {table} WHERE agent_id = ? AND task_id = ?",
+                    (agent_id, task_id),
+                )
+            conn.execute(
+                """
+                INSERT INTO tasks (
+                    agent_id, task_id, title, description, status,
+                    created_at, updated_at
+                ) VALUES (?, ?, ?, ?, 'pending', ?, ?)
+                """,
+                (agent_id, task_id, title, description, now, now),
+            )
+            conn.executemany(
+                """
+                INSERT INTO todos (agent_id, task_id, position, text, item_id)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                [
+                    (agent_id, task_id, position, item.text, item.item_id)
+                    for position, item in enumerate(map(TodoItem.of, todo_items))
+                ],
+            )
+            task_row = self._get_task_row(conn, agent_id, task_id)
+            self._ensure_file(conn, task_row, "todo")
+            self._ensure_file(conn, task_row, "resource")
+
+        return self.load_task_context(agent_id, task_id)
+
+    def import_task_batch(self, agent_id: str, tasks: List[ImportedTask]) -> int:
+        """
+        批量导入任务：整批在一个事务中写入，每个任务使用一个保存点，失败的任务单独回滚
+
+        文件内容整体保存为 base；history 中的消息、resource 中的资源和 todo 中的
+        待办事项同时拆分为结构化的行（折叠在 base 之前），查询接口与直接写入的任务一致
+        """
+        imported = 0
+        with self._transaction() as conn:
+            for task in tasks:
+                conn.execute("SAVEPOINT import_task")
+                try:
+                    self._import_task(conn, agent_id, task)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO import_task")
+                    print(f"导入任务 {task.task_id} 失败: {e}")
+                else:
+                    imported += 1
+                conn.execute("RELEASE import_task")
+        return imported
+
+    def _import_task(
+        self, conn: sqlite3.Connection, agent_id: str, task: ImportedTask
+    ):
+        """写入一个导入的任务，覆盖同 ID 的任务"""
+        task_id = task.task_id
+        for table in ("entries", "resources", "todos", "files", "tasks"):
+            conn.execute(
+                f"DELETE FROM {table} WHERE agent_id = ? AND task_id = ?",
+                (agent_id, task_id),
+            )
+        conn.execute(
+            """
+            INSERT INTO tasks (
+                agent_id, task_id, title, description, status,
+                created_at, updated_at, metadata
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                agent_id,
+                task_id,
+                task.title,
+                task.description,
+                task.status,
+                task.created_at.isoformat(),
+                task.updated_at.isoformat(),
+                json.dumps(task.metadata, ensure_ascii=False),
+            ),
+        )
+        for file_type, imported_file in task.files.items():
+            updated_at = (imported_file.updated_at or task.updated_at).isoformat()
+            self._import_entries(conn, agent_id, task_id, imported_file, updated_at)
+            base_seq = conn.execute(
+                """
+                SELECT COALESCE(MAX(seq), 0) FROM entries
+                WHERE agent_id = ? AND task_id = ? AND file_type = ?
+                """,
+                (agent_id, task_id, file_type),
+            ).fetchone()[0]
+            content = imported_file.content
+            conn.execute(
+                """
+                INSERT INTO files (
+                    agent_id, task_id, file_type, name, created_at, updated_at,
+                    version, metadata, head, base, base_seq, size, length, tokens,
+                    preview
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, '', ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    agent_id,
+                    task_id,
+                    file_type,
+                    context_format.FILE_NAMES[file_type],
+                    (imported_file.created_at or task.created_at).isoformat(),
+                    updated_at,
+                    imported_file.version,
+                    json.dumps(imported_file.metadata, ensure_ascii=False),
+                    content,
+                    base_seq,
+                    len(content.encode("utf-8")),
+                    len(content),
+                    count_tokens(content),
+                    content[:PREVIEW_LENGTH],
+                ),
+            )
+            if file_type == "todo":
+                self._sync_todos_from_content(conn, agent_id, task_id, content)
+
+    def _import_entries(
+        self,
+        conn: sqlite3.Connection,
+        agent_id: str,
+        task_id: str,
+        imported_file: ImportedFile,
+        created_at: str,
+    ):
+        """将导入文件中的消息和资源拆分为结构化的行"""
+        if imported_file.file_type == "history":
+            conn.executemany(
+                """
+                INSERT INTO entries (
+                    agent_id, task_id, file_type, kind, label, content, created_at
+                ) VALUES (?, ?, 'history', 'chat', ?, ?, ?)
+                """,
+                [
+                    (
+                        agent_id,
+                        task_id,
+                        role,
+                        content,
+                        datetime.fromisoformat(timestamp).isoformat(),
+                    )
+                    for timestamp, role, content in split_entries(
+                        imported_file.content.encode("utf-8")
+                    )
+                ],
+            )
+        elif imported_file.file_type == "resource":
+            for resource in context_format.parse_resources(imported_file.content):
+                try:
+                    normalize_url(resource.get("url", ""))
+                except ValueError:
+                    continue
+                if not self._register_resource(
+                    conn,
+                    agent_id,
+                    task_id,
+                    None,
+                    resource["title"],
+                    resource["url"],
+                    resource.get("description"),
+                ):
+                    continue
+                cursor = conn.execute(
+                    """
+                    INSERT INTO entries (
+                        agent_id, task_id, file_type, kind, label, url, description,
+                        content, created_at
+                    ) VALUES (?, ?, 'resource', 'resource', ?, ?, ?, '', ?)
+                    """,
+                    (
+                        agent_id,
+                        task_id,
+                        resource["title"],
+                        resource["url"],
+                        resource.get("description", ""),
+                        created_at,
+                    ),
+                )
+                self._register_resource(
+                    conn,
+                    agent_id,
+                    task_id,
+                    cursor.lastrowid,
+                    resource["title"],
+                    resource["url"],
+                    resource.get("description"),
+                )
+
+    def load_task_context(self, agent_id: str, task_id: str) -> Optional[TaskContext]:
+        """加载任务上下文，文件内容在首次访问时渲染"""
+        with self._lock:
+            task_row = self._get_task_row(self._conn, agent_id, task_id)
+            if task_row is None:
+                return None
+            file_rows = self._conn.execute(
+                "SELECT * FROM files WHERE agent_id = ? AND task_id = ?",
+                (agent_id, task_id),
+            ).fetchall()
+
+        task_context = TaskContext(
+            task_id=task_row["task_id"],
+            title=task_row["title"],
+            description=task_row["description"],
+            status=task_row["status"],
+            created_at=datetime.fromisoformat(task_row["created_at"]),
+            updated_at=datetime.fromisoformat(task_row["updated_at"]),
+            metadata=json.loads(task_row["metadata"]),
+        )
+        for row in file_rows:
+            task_context.files[row["file_type"]] = ContextFile(
+                name=row["name"],
+                content=None,
+                file_type=row["file_type"],
+                created_at=datetime.fromisoformat(row["created_at"]),
+                updated_at=datetime.fromisoformat(row["updated_at"]),
+                version=row["version"],
+                metadata=json.loads(row["metadata"]),
+                size=row["size"],
+                length=row["length"],
+                tokens=row["tokens"],
+                preview=row["preview"],
+                loader=partial(
+                    self._render_or_empty, agent_id, task_id, row["file_type"]
+                ),
+            )
+        return task_context
+
+    def _render_or_empty(self, agent_id: str, task_id: str, file_type: str) -> str:
+        """ContextFile 懒加载使用的渲染函数"""
+        return self.render_file(agent_id, task_id, file_type) or ""
+
+    def get_file_content(
+        self, agent_id: str, task_id: str, file_type: str
+    ) -> Optional[str]:
+        """直接渲染指定文件，无需构建任务上下文"""
+        return self.render_file(agent_id, task_id, file_type)
+
+    def update_file_content(
+        self,
+        agent_id: str,
+        task_id: str,
+        file_type: str,
+        content: str,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> bool:
+        """整体替换文件内容，此前的条目折叠进新内容，但仍保留为结构化数据"""
+        now = datetime.utcnow().isoformat()
+        with self._transaction() as conn:
+            task_row = self._get_task_row(conn, agent_id, task_id)
+            if task_row is None:
+                return False
+            file_row = self._ensure_file(conn, task_row, file_type, now)
+            if file_row is None:
+                return False
+
+            last_seq = conn.execute(
+                """
+                SELECT COALESCE(MAX(seq), 0) FROM entries
+                WHERE agent_id = ? AND task_id = ? AND file_type = ?
+                """,
+                (agent_id, task_id, file_type),
+            ).fetchone()[0]
+            conn.execute(
+                """
+                UPDATE files SET base = ?, base_seq = ?, metadata = ?
+                WHERE agent_id = ? AND task_id = ? AND file_type = ?
+                """,
+                (
+                    content,
+                    last_seq,
+                    json.dumps(metadata or {}, ensure_ascii=False),
+                    agent_id,
+                    task_id,
+                    file_type,
+                ),
+            )
+            if file_type == "todo":
+                self._sync_todos_from_content(conn, agent_id, task_id, content)
+            self._touch(conn, agent_id, task_id, file_type, now)
+        return True
+
+    def replace_file_prefix(
+        self,
+        agent_id: str,
+        task_id: str,
+        file_type: str,
+        old_prefix: str,
+        new_prefix: str,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> bool:
+        """在写事务内比较并替换文件开头的内容，保留其后追加的内容"""
+        with self._transaction():
+            return super().replace_file_prefix(
+                agent_id, task_id, file_type, old_prefix, new_prefix, metadata
+            )
+
+    def upsert_section(
+        self, agent_id: str, task_id: str, file_type: str, section: str, content: str
+    ) -> bool:
+        """在写事务内替换或追加条目"""
+        with self._transaction():
+            return super().upsert_section(
+                agent_id, task_id, file_type, section, content
+            )
+
+    def delete_section(
+        self, agent_id: str, task_id: str, file_type: str, section: str
+    ) -> bool:
+        """在写事务内删除条目"""
+        with self._transaction():
+            return super().delete_section(agent_id, task_id, file_type, section)
+
+    def _sync_todos_from_content(
+        self, conn: sqlite3.Connection, agent_id: str, task_id: str, content: str
+    ):
+        """根据整体替换后的 todo.md 重建待办事项行"""
+        conn.execute(
+            "DELETE FROM todos WHERE agent_id = ? AND task_id = ?", (agent_id, task_id)
+        )
+        rows = []
+        for line in content.split("\n"):
+            parsed = context_format.parse_todo_line(line)
+            if parsed:
+                completed, text, item_id = parsed
+                rows.append(
+                    (agent_id, task_id, len(rows), text, int(completed), item_id)
+                )
+        conn.executemany(
+            """
+            INSERT INTO todos (agent_id, task_id, position, text, completed, item_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            rows,
+        )
+
+    def update_task_status(self, agent_id: str, task_id: str, status: str) -> bool:
+        """更新任务状态"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                """
+                UPDATE tasks SET status = ?, updated_at = ?
+                WHERE agent_id = ? AND task_id = ?
+                """,
+                (status, datetime.utcnow().isoformat(), agent_id, task_id),
+            )
+        return cursor.rowcount > 0
+
+    def _add_entry(
+        self,
+        agent_id: str,
+        task_id: str,
+        file_type: str,
+        kind: str,
+        content: str,
+        label: Optional[str] = None,
+        url: Optional[str] = None,
+        description: Optional[str] = None,
+    ) -> bool:
+        """追加一个条目，文件统计信息按渲染后的条目增量更新"""
+        now = datetime.utcnow().isoformat()
+        with self._transaction() as conn:
+            task_row = self._get_task_row(conn, agent_id, task_id)
+            if task_row is None:
+                return False
+            if self._ensure_file(conn, task_row, file_type, now) is None:
+                return False
+
+            cursor = conn.execute(
+                """
+                INSERT INTO entries (
+                    agent_id, task_id, file_type, kind, label, url, description,
+                    content, created_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    agent_id,
+                    task_id,
+                    file_type,
+                    kind,
+                    label,
+                    url,
+                    description,
+                    content,
+                    now,
+                ),
+            )
+            row = conn.execute(
+                "SELECT * FROM entries WHERE seq = ?", (cursor.lastrowid,)
+            ).fetchone()
+            self._touch(
+                conn, agent_id, task_id, file_type, now, self._render_entry(row)
+            )
+        return True
+
+    def append_file_content(
+        self, agent_id: str, task_id: str, file_type: str, append_text: str
+    ) -> bool:
+        """
+        追加原始文本
+
+        向 todo.md 追加待办事项行时并入整体内容并重建待办事项行，
+        使追加的事项与文件存储一样可以被查询和标记完成
+        """
+        if file_type == "todo" and any(
+            map(context_format.parse_todo_line, append_text.split("\n"))
+        ):
+            with self._transaction() as conn:
+                file_row = self._get_file_row(conn, agent_id, task_id, file_type)
+                if file_row is not None:
+                    content = self._render_file(conn, agent_id, task_id, file_type)
+                    return self.update_file_content(
+                        agent_id,
+                        task_id,
+                        file_type,
+                        content + append_text,
+                        metadata=json.loads(file_row["metadata"]),
+                    )
+        return self._add_entry(agent_id, task_id, file_type, "raw", append_text)
+
+    def add_chat_message(
+        self, agent_id: str, task_id: str, role: str, content: str
+    ) -> bool:
+        """添加聊天消息"""
+        return self._add_entry(agent_id, task_id, "history", "chat", content, role)
+
+    def _register_resource(
+        self,
+        conn: sqlite3.Connection,
+        agent_id: str,
+        task_id: str,
+        seq: Optional[int],
+        title: str,
+        url: str,
+        description: Optional[str],
+    ) -> bool:
+        """
+        登记资源链接，已登记的 URL 累计命中次数并合并描述
+
+        seq 为 None 时只检查是否已登记。Returns: True 表示新资源
+        """
+        key = resource_key(url)
+        row = conn.execute(
+            """
+            SELECT description FROM resources
+            WHERE agent_id = ? AND task_id = ? AND url_key = ?
+            """,
+            (agent_id, task_id, key),
+        ).fetchone()
+        if row is not None:
+            conn.execute(
+                """
+                UPDATE resources SET hits = hits + 1, description = ?
+                WHERE agent_id = ? AND task_id = ? AND url_key = ?
+                """,
+                (
+                    merge_description(row["description"], description),
+                    agent_id,
+                    task_id,
+                    key,
+                ),
+            )
+            return False
+        if seq is not None:
+            conn.execute(
+                """
+                INSERT INTO resources (
+                    agent_id, task_id, url_key, seq, title, url, description
+                ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    agent_id,
+                    task_id,
+                    key,
+                    seq,
+                    title,
+                    url,
+                    (description or "").strip(),
+                ),
+            )
+        return True
+
+    def add_resource_link(
+        self, agent_id: str, task_id: str, title: str, url: str, description: str = ""
+    ) -> bool:
+        """添加资源链接，已登记的 URL 只累计命中次数并合并描述，不重复写入条目"""
+        try:
+            normalize_url(url)
+        except ValueError as e:
+            print(f"添加资源链接失败: {e}")
+            return False
+        with self._transaction() as conn:
+            if not self._register_resource(
+                conn, agent_id, task_id, None, title, url, description
+            ):
+                return True
+            if not self._add_entry(
+                agent_id, task_id, "resource", "resource", "", title, url, description
+            ):
+                return False
+            seq = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            self._register_resource(
+                conn, agent_id, task_id, seq, title, url, description
+            )
+        return True
+
+    def add_summary_entry(
+        self, agent_id: str, task_id: str, section: str, content: str
+    ) -> bool:
+        """添加总结条目"""
+        return self._add_entry(
+            agent_id, task_id, "summary", "summary", content, section
+        )
+
+    def add_scratchpad_entry(self, agent_id: str, task_id: str, content: str) -> bool:
+        """添加临时笔记"""
+        return self._add_entry(agent_id, task_id, "scratchpad", "scratchpad", content)
+
+    def _complete_todos(
+        self,
+        conn: sqlite3.Connection,
+        agent_id: str,
+        task_id: str,
+        positions: Sequence[int],
+        texts: Sequence[str],
+    ):
+        """标记待办事项行为完成，存在整体替换内容时同步修改其中对应的行"""
+        conn.executemany(
+            """
+            UPDATE todos SET completed = 1
+            WHERE agent_id = ? AND task_id = ? AND position = ?
+            """,
+            [(agent_id, task_id, position) for position in positions],
+        )
+        file_row = self._get_file_row(conn, agent_id, task_id, "todo")
+        if file_row is not None and file_row["base"] is not None:
+            base = file_row["base"]
+            for text in texts:
+                base = context_format.mark_todo_line(base, text)
+            conn.execute(
+                """
+                UPDATE files SET base = ?
+                WHERE agent_id = ? AND task_id = ? AND file_type = 'todo'
+                """,
+                (base, agent_id, task_id),
+            )
+
+    def update_todo_progress(
+        self, agent_id: str, task_id: str, progress_updates: List[str]
+    ) -> bool:
+        """更新待办事项进度"""
+        now = datetime.utcnow().isoformat()
+        with self._transaction() as conn:
+            if self._get_file_row(conn, agent_id, task_id, "todo") is None:
+                return False
+
+            # 每条更新最多匹配一个未完成的待办事项（规则与文件存储一致）
+            index = TodoIndex()
+            texts = {}
+            for row in conn.execute(
+                """
+                SELECT position, text, item_id FROM todos
+                WHERE agent_id = ? AND task_id = ? AND completed = 0
+                ORDER BY position
+                """,
+                (agent_id, task_id),
+            ):
+                index.add(row["position"], row["text"], row["item_id"])
+                texts[row["position"]] = row["text"]
+            matched = [
+                (position, texts[position])
+                for position in index.resolve_all(progress_updates)
+            ]
+            self._complete_todos(
+                conn,
+                agent_id,
+                task_id,
+                [position for position, _ in matched],
+                [text for _, text in matched],
+            )
+            conn.execute(
+                """
+                INSERT INTO entries (
+                    agent_id, task_id, file_type, kind, content, created_at
+                ) VALUES (?, ?, 'todo', 'progress', ?, ?)
+                """,
+                (
+                    agent_id,
+                    task_id,
+                    json.dumps(progress_updates, ensure_ascii=False),
+                    now,
+                ),
+            )
+            self._touch(conn, agent_id, task_id, "todo", now)
+        return True
+
+    def mark_todo_completed(self, agent_id: str, task_id: str, item_text: str) -> bool:
+        """标记待办事项为完成"""
+        now = datetime.utcnow().isoformat()
+        with self._transaction() as conn:
+            if self._get_file_row(conn, agent_id, task_id, "todo") is None:
+                return False
+
+            matched = conn.execute(
+                """
+                SELECT position, text FROM todos
+                WHERE agent_id = ? AND task_id = ? AND completed = 0
+                    AND instr(text, ?) > 0
+                """,
+                (agent_id, task_id, item_text),
+            ).fetchall()
+            self._complete_todos(
+                conn,
+                agent_id,
+                task_id,
+                [row["position"] for row in matched],
+                [item_text],
+            )
+            self._touch(conn, agent_id, task_id, "todo", now)
+        return True
+
+    def apply_mutations(
+        self, agent_id: str, task_id: str, mutations: Sequence[ContextMutation]
+    ) -> bool:
+        """批量提交修改：所有修改在同一个写事务中执行，任一失败时整体回滚"""
+        try:
+            with self._transaction():
+                for mutation in mutations:
+                    if mutation.method not in BATCH_METHODS:
+                        raise ValueError(f"不支持的操作 {mutation.method}")
+                    method = getattr(self, mutation.method)
+                    if not method(agent_id, task_id, *mutation.args):
+                        raise ValueError(f"{mutation.method} 执行失败")
+        except Exception as e:
+            print(f"批量写入失败: {e}")
+            return False
+        return True
+
+    def get_chat_messages(
+        self,
+        agent_id: str,
+        task_id: str,
+        limit: Optional[int] = None,
+        since: Optional[datetime] = None,
+    ) -> List[Dict[str, str]]:
+        """获取聊天消息（直接按行查询，无需解析 history.md）"""
+        sql = """
+            SELECT label, content FROM entries
+            WHERE agent_id = ? AND task_id = ? AND kind = 'chat'
+        """
+        params: List[Any] = [agent_id, task_id]
+        if since is not None:
+            sql += " AND created_at >= ?"
+            params.append(since.isoformat())
+        sql += " ORDER BY seq DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [
+            {"role": row["label"], "content": row["content"].strip()}
+            for row in reversed(rows)
+        ]
+
+    def get_todo_items(
+        self, agent_id: str, task_id: str, include_completed: bool = False
+    ) -> List[str]:
+        """获取待办事项文本"""
+        sql = "SELECT text FROM todos WHERE agent_id = ? AND task_id = ?"
+        if not include_completed:
+            sql += " AND completed = 0"
+        with self._lock:
+            rows = self._conn.execute(
+                sql + " ORDER BY position", (agent_id, task_id)
+            ).fetchall()
+        return [row["text"] for row in rows]
+
+    def get_resources(self, agent_id: str, task_id: str) -> List[Dict[str, Any]]:
+        """获取资源链接列表（按 URL 去重，附带命中次数）"""
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT title, url, description, hits FROM resources
+                WHERE agent_id = ? AND task_id = ?
+                ORDER BY seq
+                """,
+                (agent_id, task_id),
+            ).fetchall()
+        return [
+            {
+                "title": row["title"],
+                "url": row["url"],
+                "description": row["description"],
+                "hits": row["hits"],
+            }
+            for row in rows
+        ]
+
+    def list_agent_tasks_page(
+        self,
+        agent_id: str,
+        status: Union[str, Sequence[str], None] = None,
+        page_size: Optional[int] = 50,
+        cursor: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """分页列出Agent的任务（游标格式与 FileContextManager 一致）"""
+        where = "WHERE agent_id = ?"
+        params: List[Any] = [agent_id]
+        if status is not None:
+            statuses = [status] if isinstance(status, str) else list(status)
+            where += f" AND status IN ({', '.join('?' for _ in statuses)})"
+            params += statuses
+        if cursor:
+            updated_at, _, task_id = cursor.partition("|")
+            where += " AND (updated_at < ? OR (updated_at = ? AND task_id < ?))"
+            params += [updated_at, updated_at, task_id]
+        sql = f"""
+            SELECT task_id, title, status, created_at, updated_at FROM tasks
+            {where} ORDER BY updated_at DESC, task_id DESC
+        """
+        if page_size is not None:
+            sql += " LIMIT ?"
+            params.append(page_size)
+        with self._lock:
+            rows = [dict(row) for row in self._conn.execute(sql, params)]
+
+        next_cursor = None
+        if page_size is not None and len(rows) == page_size:
+            last = rows[-1]
+            next_cursor = f"{last['updated_at']}|{last['task_id']}"
+        return {"tasks": rows, "next_cursor": next_cursor}
+
+    def export_markdown(
+        self, agent_id: str, task_id: str, output_dir: Union[str, Path]
+    ) -> Dict[str, Path]:
+        """
+        将任务的各个文件渲染为 Markdown 写入目录
+
+        Args:
+            agent_id: Agent ID
+            task_id: 任务ID
+            output_dir: 输出目录，文件写入 output_dir/agent_{id}/task_{id}/
+
+        Returns:
+            {文件类型: 文件路径}
+        """
+        task_dir = Path(output_dir) / f"agent_{agent_id}" / f"task_{task_id}"
+        task_dir.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            file_rows: List[Tuple[str, str]] = [
+                (row["file_type"], row["name"])
+                for row in self._conn.execute(
+                    """
+                    SELECT file_type, name FROM files
+                    WHERE agent_id = ? AND task_id = ?
+                    """,
+                    (agent_id, task_id),
+                )
+            ]
+            exported = {}
+            for file_type, name in file_rows:
+                content = self._render_file(self._conn, agent_id, task_id, file_type)
+                path = task_dir / name
+                path.write_text(content or "", encoding="utf-8")
+                exported[file_type] = path
+        return exported
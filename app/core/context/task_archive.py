@@ -0,0 +1,162 @@
+"""
+任务归档包
+将长期未访问的任务目录打包为单个压缩包（优先 zstd，未安装 zstandard 时使用 gzip），
+需要时再解压还原；metadata.json 总是包内第一个成员，重建索引时无需解压整个包
+"""
+
+import gzip
+import os
+import shutil
+import tarfile
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .atomic_io import fsync_dir
+
+try:
+    import zstandard
+except ImportError:  # 未安装 zstandard 时退化为 gzip
+    zstandard = None
+
+ZSTD_SUFFIX = ".tar.zst"
+GZIP_SUFFIX = ".tar.gz"
+BUNDLE_SUFFIXES = (ZSTD_SUFFIX, GZIP_SUFFIX)
+
+# 归档包内任务元数据文件名，与 FileContextManager 保持一致
+METADATA_NAME = "metadata.json"
+
+
+def bundle_suffix() -> str:
+    """当前环境新建归档包使用的扩展名"""
+    return ZSTD_SUFFIX if zstandard is not None else GZIP_SUFFIX
+
+
+def _bundle_members(task_path: Path) -> List[Path]:
+    """归档成员列表：metadata.json 在最前，其余按路径排序"""
+    members = sorted(
+        path
+        for path in task_path.rglob("*")
+        if path.is_file() and path.name != METADATA_NAME
+    )
+    metadata_path = task_path / METADATA_NAME
+    if metadata_path.exists():
+        members.insert(0, metadata_path)
+    return members
+
+
+def _disk_usage(paths: List[Path]) -> int:
+    """文件实际占用的磁盘字节数（按块计算）"""
+    total = 0
+    for path in paths:
+        stat = path.stat()
+        blocks = getattr(stat, "st_blocks", None)
+        total += blocks * 512 if blocks is not None else stat.st_size
+    return total
+
+
+def disk_usage(path: Path) -> int:
+    """任务目录或归档包实际占用的磁盘字节数（不存在时为 0，遍历期间被删除的文件忽略）"""
+    paths = [path] if path.is_file() else path.rglob("*")
+    total = 0
+    for member in paths:
+        try:
+            if member.is_file():
+                total += _disk_usage([member])
+        except FileNotFoundError:
+            continue
+    return total
+
+
+def pack_task(task_path: Path, bundle_path: Path, level: int = 10) -> Dict[str, int]:
+    """
+    将任务目录打包为压缩包（先写临时文件，落盘后原子替换）
+
+    Returns:
+        {"files": 文件数, "original_bytes": 原占用字节数, "archived_bytes": 压缩包字节数}
+    """
+    members = _bundle_members(task_path)
+    bundle_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = bundle_path.with_name(f".{bundle_path.name}.{os.getpid()}.tmp")
+
+    try:
+        with open(tmp_path, "wb") as raw:
+            if bundle_path.name.endswith(ZSTD_SUFFIX):
+                compressor = zstandard.ZstdCompressor(level=level)
+                with compressor.stream_writer(raw, closefd=False) as writer:
+                    with tarfile.open(fileobj=writer, mode="w|") as tar:
+                        for path in members:
+                            tar.add(path, arcname=str(path.relative_to(task_path)))
+            else:
+                with gzip.GzipFile(
+                    fileobj=raw, mode="wb", compresslevel=min(level, 9)
+                ) as writer:
+                    with tarfile.open(fileobj=writer, mode="w|") as tar:
+                        for path in members:
+                            tar.add(path, arcname=str(path.relative_to(task_path)))
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, bundle_path)
+        fsync_dir(bundle_path.parent)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    return {
+        "files": len(members),
+        "original_bytes": _disk_usage(members),
+        "archived_bytes": bundle_path.stat().st_size,
+    }
+
+
+def _open_bundle(bundle_path: Path, raw) -> Tuple[tarfile.TarFile, Optional[object]]:
+    """以流式方式打开归档包，返回 (tar, 解压流)"""
+    if bundle_path.name.endswith(ZSTD_SUFFIX):
+        if zstandard is None:
+            raise RuntimeError(f"解压 {bundle_path.name} 需要安装 zstandard")
+        reader = zstandard.ZstdDecompressor().stream_reader(raw)
+        return tarfile.open(fileobj=reader, mode="r|"), reader
+    return tarfile.open(fileobj=raw, mode="r|gz"), None
+
+
+def unpack_task(bundle_path: Path, task_path: Path):
+    """
+    将归档包解压还原为任务目录
+
+    先解压到同级临时目录再重命名，避免中途失败留下只有 metadata.json 的不完整任务
+    """
+    tmp_path = task_path.with_name(f".{task_path.name}.rehydrate.{os.getpid()}")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir(parents=True)
+    try:
+        with open(bundle_path, "rb") as raw:
+            tar, reader = _open_bundle(bundle_path, raw)
+            with tar:
+                if hasattr(tarfile, "data_filter"):
+                    tar.extractall(tmp_path, filter="data")
+                else:
+                    tar.extractall(tmp_path)
+            if reader is not None:
+                reader.close()
+        # _get_task_path 可能已经创建了空的任务目录
+        if task_path.exists():
+            task_path.rmdir()
+        os.rename(tmp_path, task_path)
+        fsync_dir(task_path.parent)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+
+def read_bundle_metadata(bundle_path: Path) -> Optional[bytes]:
+    """只读取归档包中的 metadata.json（第一个成员）"""
+    with open(bundle_path, "rb") as raw:
+        tar, reader = _open_bundle(bundle_path, raw)
+        with tar:
+            member = tar.next()
+            data = None
+            if member is not None and member.name == METADATA_NAME:
+                extracted = tar.extractfile(member)
+                data = extracted.read() if extracted is not None else None
+        if reader is not None:
+            reader.close()
+    return data
@@ -0,0 +1,146 @@
+"""
+任务上下文缓存
+进程内共享的 TaskContext LRU 缓存，通过文件 inode/mtime/size 校验缓存是否过期；
+启用目录监听（cache_watcher）时，由监听线程在文件变化后重新校验，查找时可跳过校验
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+# 文件签名：((文件名, inode, mtime_ns, size), ...)
+FileSignature = Tuple[Tuple[str, int, int, int], ...]
+
+
+class TaskContextCache:
+    """TaskContext 的有界 LRU 缓存（线程安全）"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[FileSignature, Any]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def lookup(
+        self,
+        key: Hashable,
+        signature_fn: Callable[[Any], FileSignature],
+        verify: bool = True,
+    ) -> Optional[Any]:
+        """
+        查找缓存项，signature_fn 根据缓存值计算当前磁盘签名，不一致则视为过期
+
+        verify=False 时跳过签名校验（调用方确认监听线程会及时使过期项失效）
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        cached_signature, value = entry
+        # 在锁外执行 stat，避免阻塞其他线程
+        current_signature = signature_fn(value) if verify else cached_signature
+
+        with self._lock:
+            if current_signature != cached_signature:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, signature: FileSignature, value: Any):
+        """写入缓存项（写回），超出容量时淘汰最久未使用的项"""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (signature, value)
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def revalidate(
+        self, key: Hashable, signature_fn: Callable[[Any], FileSignature]
+    ) -> Optional[Tuple[FileSignature, FileSignature]]:
+        """
+        重新校验缓存项，签名不一致时使其失效
+
+        Returns:
+            失效时返回 (缓存的签名, 当前签名)，缓存项有效或不存在时返回 None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        cached_signature, value = entry
+        current_signature = signature_fn(value)
+        if current_signature == cached_signature:
+            return None
+        with self._lock:
+            if self._entries.get(key) is not entry:
+                # 期间已被替换（如本进程写回），新值由写入方负责
+                return None
+            del self._entries[key]
+            self.invalidations += 1
+        return cached_signature, current_signature
+
+    def contains(self, key: Hashable) -> bool:
+        """缓存中是否有该项"""
+        with self._lock:
+            return key in self._entries
+
+    def invalidate(self, key: Hashable):
+        """使指定缓存项失效"""
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def resize(self, max_entries: int):
+        """调整缓存容量"""
+        with self._lock:
+            self.max_entries = max_entries
+            self._evict()
+
+    def _evict(self):
+        """淘汰超出容量的缓存项（调用方需持有锁）"""
+        while len(self._entries) > max(self.max_entries, 0):
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+# 进程级共享缓存，所有 FileContextManager 实例默认共用
+_shared_cache = TaskContextCache()
+
+
+def get_shared_task_cache() -> TaskContextCache:
+    """获取进程级共享的任务上下文缓存"""
+    return _shared_cache
@@ -0,0 +1,216 @@
+"""
+Agent 任务索引
+每个 Agent 一个 SQLite 索引库，记录任务的标题、状态和时间，
+list_agent_tasks 借助索引完成状态过滤、按 updated_at 排序和游标分页，无需扫描任务目录
+"""
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    archived INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_updated ON tasks (updated_at DESC, task_id DESC);
+CREATE INDEX IF NOT EXISTS idx_tasks_status_updated
+    ON tasks (status, updated_at DESC, task_id DESC);
+CREATE TABLE IF NOT EXISTS index_state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class TaskIndex:
+    """单个 Agent 的任务索引"""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(self.db_path), timeout=30, check_same_thread=False
+        )
+        self._conn.row_factory = sqlite3.Row
+        # WAL 允许多个 worker 进程并发读写同一索引
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        # 兼容旧版本索引库：补充 archived 列
+        columns = {
+            row["name"] for row in self._conn.execute("PRAGMA table_info(tasks)")
+        }
+        if "archived" not in columns:
+            self._conn.execute(
+                "ALTER TABLE tasks ADD COLUMN archived INTEGER NOT NULL DEFAULT 0"
+            )
+        self._conn.commit()
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+    def is_built(self) -> bool:
+        """索引是否已完成初始构建"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM index_state WHERE key = 'built'"
+            ).fetchone()
+        return row is not None
+
+    def mark_built(self):
+        """标记索引已完成初始构建"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO index_state (key, value) VALUES ('built', '1')"
+            )
+            self._conn.commit()
+
+    def upsert(
+        self,
+        task_id: str,
+        title: str,
+        status: str,
+        created_at: str,
+        updated_at: str,
+    ):
+        """新增或更新任务索引项"""
+        self.upsert_many([(task_id, title, status, created_at, updated_at)])
+
+    def upsert_many(
+        self, rows: Iterable[Tuple[str, str, str, str, str]], archived: bool = False
+    ):
+        """批量新增或更新任务索引项"""
+        with self._lock:
+            self._conn.executemany(
+                """
+                INSERT INTO tasks (
+                    task_id, title, status, created_at, updated_at, archived
+                )
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (task_id) DO UPDATE SET
+                    title = excluded.title,
+                    status = excluded.status,
+                    created_at = excluded.created_at,
+                    updated_at = excluded.updated_at,
+                    archived = excluded.archived
+                """,
+                [(*row, int(archived)) for row in rows],
+            )
+            self._conn.commit()
+
+    def set_archived(self, task_id: str, archived: bool):
+        """标记任务是否已归档"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET archived = ? WHERE task_id = ?",
+                (int(archived), task_id),
+            )
+            self._conn.commit()
+
+    def query_idle(
+        self,
+        before: str,
+        status: Union[str, Sequence[str], None] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """查询 updated_at 早于 before 且尚未归档的任务（最旧的在前）"""
+        where, params = self._status_filter(status)
+        where += " AND " if where else "WHERE "
+        where += "archived = 0 AND updated_at < ?"
+        params.append(before)
+        sql = f"SELECT * FROM tasks {where} ORDER BY updated_at ASC, task_id ASC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def query_by_id(
+        self, after: Optional[str] = None, limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """按 task_id 顺序分页查询所有任务（包括已归档的），用于增量遍历"""
+        sql = "SELECT * FROM tasks"
+        params: List[Any] = []
+        if after is not None:
+            sql += " WHERE task_id > ?"
+            params.append(after)
+        sql += " ORDER BY task_id ASC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def remove(self, task_id: str):
+        """删除任务索引项"""
+        with self._lock:
+            self._conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+            self._conn.commit()
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """获取单个任务索引项"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM tasks WHERE task_id = ?", (task_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def count(self, status: Union[str, Sequence[str], None] = None) -> int:
+        """统计任务数量"""
+        where, params = self._status_filter(status)
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT COUNT(*) FROM tasks {where}", params
+            ).fetchone()
+        return row[0]
+
+    def query(
+        self,
+        status: Union[str, Sequence[str], None] = None,
+        limit: Optional[int] = None,
+        after: Optional[Tuple[str, str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        按 updated_at 倒序查询任务
+
+        Args:
+            status: 状态过滤，可以是单个状态或状态列表
+            limit: 返回数量上限
+            after: 游标 (updated_at, task_id)，只返回排在其后的任务
+
+        Returns:
+            任务索引项列表
+        """
+        where, params = self._status_filter(status)
+        if after is not None:
+            # 键集分页：(updated_at, task_id) 严格小于游标
+            where += " AND " if where else "WHERE "
+            where += "(updated_at < ? OR (updated_at = ? AND task_id < ?))"
+            params += [after[0], after[0], after[1]]
+        sql = f"SELECT * FROM tasks {where} ORDER BY updated_at DESC, task_id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def _status_filter(
+        status: Union[str, Sequence[str], None]
+    ) -> Tuple[str, List[Any]]:
+        """构造状态过滤条件"""
+        if status is None:
+            return "", []
+        statuses = [status] if isinstance(status, str) else list(status)
+        placeholders = ", ".join("?" for _ in statuses)
+        return f"WHERE status IN ({placeholders})", statuses
@@ -0,0 +1,205 @@
+"""
+任务级跨进程锁
+基于 fcntl.flock 的读写锁，保证多 worker 进程对同一任务目录的读改写不丢失更新
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows 等平台没有 fcntl，退化为进程内互斥锁
+    fcntl = None
+
+
+@dataclass
+class LockStats:
+    """单个任务锁的等待统计"""
+
+    acquisitions: int = 0
+    exclusive_acquisitions: int = 0
+    contended: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+
+@dataclass
+class _HeldLock:
+    """当前线程持有的锁"""
+
+    fd: int
+    exclusive: bool
+    depth: int = 1
+
+
+class TaskLockManager:
+    """按 (agent_id, task_id) 划分的读写锁，同一线程内可重入"""
+
+    def __init__(
+        self,
+        lock_dir: Path,
+        timeout: Optional[float] = None,
+        max_tracked_tasks: int = 4096,
+    ):
+        self.lock_dir = Path(lock_dir)
+        self.lock_dir.mkdir(parents=True, exist_ok=True)
+        self.timeout = timeout
+        self.max_tracked_tasks = max_tracked_tasks
+        self._local = threading.local()
+        self._stats: "OrderedDict[str, LockStats]" = OrderedDict()
+        self._stats_lock = threading.Lock()
+        # 没有 fcntl 时使用的进程内锁
+        self._fallback_locks: Dict[str, threading.Lock] = {}
+
+    def _lock_path(self, key: str) -> Path:
+        """锁文件路径，放在任务目录之外，任务目录被移动或归档时锁依然有效"""
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        shard = self.lock_dir / digest[:2]
+        shard.mkdir(exist_ok=True)
+        return shard / f"{digest}.lock"
+
+    def _held(self) -> Dict[str, _HeldLock]:
+        held = getattr(self._local, "held", None)
+        if held is None:
+            held = self._local.held = {}
+        return held
+
+    @contextmanager
+    def acquire(self, key: str, exclusive: bool = True) -> Iterator[None]:
+        """获取任务锁：exclusive=True 为写锁，否则为读锁"""
+        held = self._held()
+        current = held.get(key)
+        if current is not None:
+            if exclusive and not current.exclusive:
+                raise RuntimeError(f"不支持将读锁升级为写锁: {key}")
+            current.depth += 1
+            try:
+                yield
+            finally:
+                current.depth -= 1
+            return
+
+        fd, wait, contended = self._lock(key, exclusive)
+        self._record(key, exclusive, wait, contended)
+        held[key] = _HeldLock(fd=fd, exclusive=exclusive)
+        try:
+            yield
+        finally:
+            del held[key]
+            self._unlock(key, fd)
+
+    def holds_exclusive(self, key: str) -> bool:
+        """当前线程是否持有任务的写锁"""
+        current = self._held().get(key)
+        return current is not None and current.exclusive
+
+    def _lock(self, key: str, exclusive: bool):
+        """阻塞获取锁，返回 (fd, 等待时间, 是否发生竞争)"""
+        start = time.perf_counter()
+        deadline = None if self.timeout is None else start + self.timeout
+
+        if fcntl is None:
+            lock = self._fallback_locks.setdefault(key, threading.Lock())
+            contended = not lock.acquire(blocking=False)
+            if contended and not lock.acquire(timeout=self.timeout or -1):
+                raise TimeoutError(f"获取任务锁超时: {key}")
+            return -1, time.perf_counter() - start, contended
+
+        fd = os.open(str(self._lock_path(key)), os.O_RDWR | os.O_CREAT, 0o644)
+        operation = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        contended = False
+        try:
+            try:
+                fcntl.flock(fd, operation | fcntl.LOCK_NB)
+            except BlockingIOError:
+                contended = True
+                if deadline is None:
+                    fcntl.flock(fd, operation)
+                else:
+                    self._lock_until(fd, operation, deadline, key)
+        except BaseException:
+            os.close(fd)
+            raise
+        return fd, time.perf_counter() - start, contended
+
+    def _lock_until(self, fd: int, operation: int, deadline: float, key: str):
+        """带超时地轮询获取锁"""
+        delay = 0.001
+        while True:
+            try:
+                fcntl.flock(fd, operation | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if time.perf_counter() >= deadline:
+                    raise TimeoutError(f"获取任务锁超时: {key}")
+                time.sleep(delay)
+                delay = min(delay * 2, 0.05)
+
+    def _unlock(self, key: str, fd: int):
+        """释放锁"""
+        if fcntl is None:
+            self._fallback_locks[key].release()
+            return
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def _record(self, key: str, exclusive: bool, wait: float, contended: bool):
+        """记录锁等待指标"""
+        with self._stats_lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = LockStats()
+                while len(self._stats) > self.max_tracked_tasks:
+                    self._stats.popitem(last=False)
+            else:
+                self._stats.move_to_end(key)
+            stats.acquisitions += 1
+            if exclusive:
+                stats.exclusive_acquisitions += 1
+            if contended:
+                stats.contended += 1
+            stats.total_wait += wait
+            stats.max_wait = max(stats.max_wait, wait)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取锁等待的汇总指标"""
+        with self._stats_lock:
+            all_stats = list(self._stats.values())
+        acquisitions = sum(s.acquisitions for s in all_stats)
+        total_wait = sum(s.total_wait for s in all_stats)
+        return {
+            "tracked_tasks": len(all_stats),
+            "acquisitions": acquisitions,
+            "contended": sum(s.contended for s in all_stats),
+            "total_wait": total_wait,
+            "avg_wait": total_wait / acquisitions if acquisitions else 0.0,
+            "max_wait": max((s.max_wait for s in all_stats), default=0.0),
+        }
+
+    def contention_report(self, top: int = 10) -> List[Dict[str, Any]]:
+        """按总等待时间排序的竞争最激烈的任务"""
+        with self._stats_lock:
+            items = list(self._stats.items())
+        items.sort(key=lambda item: item[1].total_wait, reverse=True)
+        return [
+            {
+                "task": key,
+                "acquisitions": stats.acquisitions,
+                "exclusive_acquisitions": stats.exclusive_acquisitions,
+                "contended": stats.contended,
+                "contention_rate": stats.contended / stats.acquisitions,
+                "total_wait": stats.total_wait,
+                "max_wait": stats.max_wait,
+            }
+            for key, stats in items[:top]
+            if stats.acquisitions
+        ]
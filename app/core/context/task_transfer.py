@@ -0,0 +1,310 @@
+"""
+任务上下文的流式导出与批量导入
+导出格式为 NDJSON（每行一个 JSON 记录），可以边生成边通过 HTTP 发送，无需在内存中
+拼出完整的导出内容：
+
+    {"type": "header", "format": "agent-context", "version": 1, ...}
+    {"type": "task", "agent_id": ..., "task_id": ..., "title": ..., ...}
+    {"type": "file", "task_id": ..., "file_type": ..., "version": ..., ...}
+    {"type": "chunk", "task_id": ..., "file_type": ..., "content": ...}
+    {"type": "end", "task_id": ..., "files": 文件数}
+
+文件内容按块写入多条 chunk 记录；读取时一个任务在 end 记录出现后才算完整，
+被截断的任务不会导入
+"""
+
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Union,
+)
+
+from . import context_format
+
+if TYPE_CHECKING:
+    from .context_store import ContextStore
+
+EXPORT_FORMAT = "agent-context"
+EXPORT_VERSION = 1
+# 每条 chunk 记录的最大字符数
+CHUNK_CHARS = 256 * 1024
+# 未指定任务时，按页列出 Agent 的任务
+_TASK_PAGE_SIZE = 500
+
+
+@dataclass
+class ImportedFile:
+    """导入流中的一个上下文文件"""
+
+    file_type: str
+    content: str = ""
+    version: int = 1
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class ImportedTask:
+    """导入流中的一个完整任务"""
+
+    agent_id: Optional[str]
+    task_id: str
+    title: str
+    description: str
+    status: str
+    created_at: datetime
+    updated_at: datetime
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    files: Dict[str, ImportedFile] = field(default_factory=dict)
+
+
+def encode_record(record: Dict[str, Any]) -> bytes:
+    """编码一条 NDJSON 记录"""
+    return json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def _parse_time(value: Optional[str], default: datetime) -> datetime:
+    return datetime.fromisoformat(value) if value else default
+
+
+def is_safe_id(value: Any) -> bool:
+    """任务和 Agent 的 ID 会用作目录名，不允许为空或包含路径分隔符"""
+    return (
+        isinstance(value, str)
+        and value not in ("", ".", "..")
+        and "/" not in value
+        and "\\" not in value
+        and "\0" not in value
+    )
+
+
+def iter_export_records(
+    store: "ContextStore",
+    agent_id: str,
+    task_ids: Optional[Iterable[str]] = None,
+    chunk_chars: int = CHUNK_CHARS,
+) -> Iterator[Dict[str, Any]]:
+    """逐条生成导出记录，文件内容通过 store.iter_file_chunks 分块读取"""
+    yield {
+        "type": "header",
+        "format": EXPORT_FORMAT,
+        "version": EXPORT_VERSION,
+        "exported_at": datetime.utcnow().isoformat(),
+    }
+    if task_ids is None:
+        task_ids = _iter_task_ids(store, agent_id)
+    for task_id in task_ids:
+        task_context = store.load_task_context(agent_id, task_id)
+        if task_context is None:
+            continue
+        yield {
+            "type": "task",
+            "agent_id": agent_id,
+            "task_id": task_context.task_id,
+            "title": task_context.title,
+            "description": task_context.description,
+            "status": task_context.status,
+            "created_at": task_context.created_at.isoformat(),
+            "updated_at": task_context.updated_at.isoformat(),
+            "metadata": task_context.metadata,
+        }
+        for file_type, context_file in task_context.files.items():
+            yield {
+                "type": "file",
+                "task_id": task_id,
+                "file_type": file_type,
+                "version": context_file.version,
+                "created_at": context_file.created_at.isoformat(),
+                "updated_at": context_file.updated_at.isoformat(),
+                "metadata": context_file.metadata,
+            }
+            for chunk in store.iter_file_chunks(
+                agent_id, task_id, file_type, chunk_chars
+            ):
+                yield {
+                    "type": "chunk",
+                    "task_id": task_id,
+                    "file_type": file_type,
+                    "content": chunk,
+                }
+        yield {"type": "end", "task_id": task_id, "files": len(task_context.files)}
+
+
+def _iter_task_ids(store: "ContextStore", agent_id: str) -> Iterator[str]:
+    cursor = None
+    while True:
+        page = store.list_agent_tasks_page(
+            agent_id, page_size=_TASK_PAGE_SIZE, cursor=cursor
+        )
+        for task in page["tasks"]:
+            yield task["task_id"]
+        cursor = page["next_cursor"]
+        if not cursor:
+            return
+
+
+def export_ndjson(
+    store: "ContextStore",
+    agent_id: str,
+    task_ids: Optional[Iterable[str]] = None,
+    chunk_chars: int = CHUNK_CHARS,
+) -> Iterator[bytes]:
+    """生成 NDJSON 导出流（每次产出一行），可直接作为 HTTP 流式响应体"""
+    for record in iter_export_records(store, agent_id, task_ids, chunk_chars):
+        yield encode_record(record)
+
+
+def _iter_lines(source: Iterable[Union[bytes, str]]) -> Iterator[Union[bytes, str]]:
+    """
+    将输入整理为逐行记录：文件对象、按行切分的列表可直接使用，
+    HTTP 请求体等任意切分的字节块会在这里重新按换行符切分
+    """
+    pending = b""
+    for piece in source:
+        if isinstance(piece, str):
+            piece = piece.encode("utf-8")
+        if not pending and piece.endswith(b"\n") and piece.count(b"\n") == 1:
+            yield piece
+            continue
+        pending += piece
+        *lines, pending = pending.split(b"\n")
+        yield from lines
+    if pending:
+        yield pending
+
+
+def read_tasks(
+    source: Iterable[Union[bytes, str]], errors: Optional[List[str]] = None
+) -> Iterator[ImportedTask]:
+    """
+    解析 NDJSON 导入流，逐个产出完整的任务
+
+    无法解析的行、未知的文件类型和不完整的任务被跳过，原因追加到 errors
+    """
+    errors = errors if errors is not None else []
+    task: Optional[ImportedTask] = None
+    chunks: Dict[str, List[str]] = {}
+
+    for line_number, line in enumerate(_iter_lines(source), 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            record_type = record["type"]
+        except (ValueError, KeyError, TypeError) as e:
+            errors.append(f"第 {line_number} 行无法解析: {e}")
+            continue
+
+        if record_type == "header":
+            if record.get("format") != EXPORT_FORMAT:
+                errors.append(f"第 {line_number} 行: 不支持的导出格式")
+            continue
+        if record_type == "task":
+            if task is not None:
+                errors.append(f"任务 {task.task_id} 不完整，已跳过")
+            task, chunks = None, {}
+            try:
+                now = datetime.utcnow()
+                created_at = _parse_time(record.get("created_at"), now)
+                if not is_safe_id(record["task_id"]):
+                    raise ValueError(f"非法的任务ID: {record['task_id']!r}")
+                if record.get("agent_id") is not None and not is_safe_id(
+                    record["agent_id"]
+                ):
+                    raise ValueError(f"非法的Agent ID: {record['agent_id']!r}")
+                task = ImportedTask(
+                    agent_id=record.get("agent_id"),
+                    task_id=record["task_id"],
+                    title=record.get("title", "Imported Task"),
+                    description=record.get("description", ""),
+                    status=record.get("status", "pending"),
+                    created_at=created_at,
+                    updated_at=_parse_time(record.get("updated_at"), created_at),
+                    metadata=record.get("metadata") or {},
+                )
+            except (ValueError, KeyError, TypeError) as e:
+                errors.append(f"第 {line_number} 行任务记录无效: {e}")
+            continue
+        if task is None or record.get("task_id") != task.task_id:
+            # 属于被跳过的任务，或者缺少任务记录
+            continue
+
+        file_type = record.get("file_type")
+        if record_type == "file":
+            if file_type not in context_format.FILE_NAMES:
+                errors.append(f"任务 {task.task_id}: 未知的文件类型 {file_type!r}")
+                continue
+            try:
+                task.files[file_type] = ImportedFile(
+                    file_type=file_type,
+                    version=int(record.get("version", 1)),
+                    created_at=_parse_time(record.get("created_at"), task.created_at),
+                    updated_at=_parse_time(record.get("updated_at"), task.updated_at),
+                    metadata=record.get("metadata") or {},
+                )
+            except (ValueError, TypeError) as e:
+                errors.append(f"第 {line_number} 行文件记录无效: {e}")
+                continue
+            chunks[file_type] = []
+        elif record_type == "chunk":
+            if file_type in chunks:
+                chunks[file_type].append(record.get("content", ""))
+        elif record_type == "end":
+            for file_type, parts in chunks.items():
+                task.files[file_type].content = "".join(parts)
+            yield task
+            task, chunks = None, {}
+
+    if task is not None:
+        errors.append(f"任务 {task.task_id} 不完整，已跳过")
+
+
+def task_from_dict(context_data: Dict[str, Any]) -> ImportedTask:
+    """由 AgentContext.export_task_context 导出的字典构建导入任务"""
+    records: List[Dict[str, Any]] = [{**context_data, "type": "task"}]
+    for file_type, file_data in (context_data.get("files") or {}).items():
+        file_type = file_data.get("file_type", file_type)
+        records.append(
+            {
+                **file_data,
+                "type": "file",
+                "task_id": context_data["task_id"],
+                "file_type": file_type,
+            }
+        )
+        records.append(
+            {
+                "type": "chunk",
+                "task_id": context_data["task_id"],
+                "file_type": file_type,
+                "content": file_data.get("content") or "",
+            }
+        )
+    records.append({"type": "end", "task_id": context_data["task_id"]})
+    errors: List[str] = []
+    tasks = list(read_tasks((encode_record(record) for record in records), errors))
+    if not tasks:
+        raise ValueError("; ".join(errors) or "没有可导入的任务")
+    return tasks[0]
+
+
+def batched(tasks: Iterable[ImportedTask], size: int) -> Iterator[List[ImportedTask]]:
+    """将任务流按 size 分批"""
+    batch: List[ImportedTask] = []
+    for task in tasks:
+        batch.append(task)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
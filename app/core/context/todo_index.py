@@ -0,0 +1,199 @@
+"""
+待办事项索引
+待办事项可以带稳定 ID（由规划步骤名生成），进度更新按 ID 或规范化文本 O(1) 精确匹配，
+匹配不到时通过预先构建的分词倒排索引做模糊匹配，每条更新最多标记一个待办事项。
+resolve_updates 是所有存储共用的匹配规则
+"""
+
+import re
+from dataclasses import dataclass
+from typing import (
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+
+# 模糊匹配时，更新中至少有该比例的词出现在待办事项中
+FUZZY_MIN_OVERLAP = 0.6
+
+_NON_WORD = re.compile(r"[^\w]+")
+_TOKEN = re.compile(r"[a-z0-9]+|[\u4e00-\u9fff]+")
+
+
+@dataclass
+class TodoItem:
+    """带稳定 ID 的待办事项"""
+
+    text: str
+    item_id: Optional[str] = None
+
+    @classmethod
+    def of(cls, item: Union[str, "TodoItem"]) -> "TodoItem":
+        """将字符串或 TodoItem 统一为 TodoItem"""
+        return item if isinstance(item, TodoItem) else cls(str(item))
+
+
+def todo_item_id(name: str) -> str:
+    """由步骤名生成待办事项 ID：小写，连续的非字母数字字符折叠为 -"""
+    return _NON_WORD.sub("-", name.strip().lower()).strip("-")
+
+
+def tokenize(text: str) -> Set[str]:
+    """分词：英文和数字按词（忽略不超过 2 个字符的词），中文按相邻两字"""
+    tokens = set()
+    for word in _TOKEN.findall(text.lower()):
+        if "\u4e00" <= word[0] <= "\u9fff":
+            if len(word) == 1:
+                tokens.add(word)
+            tokens.update(word[i : i + 2] for i in range(len(word) - 1))
+        elif len(word) > 2:
+            tokens.add(word)
+    return tokens
+
+
+def resolve_updates(
+    updates: Sequence[str],
+    find_exact: Callable[[str, Set[Hashable]], Optional[Hashable]],
+    build_index: Callable[[Set[Hashable]], "TodoIndex"],
+) -> List[Hashable]:
+    """
+    为一组进度更新选出要标记为完成的待办事项（所有存储共用的匹配规则）
+
+    每条更新最多匹配一个事项，每个事项最多被匹配一次：先为所有更新按 ID、
+    规范化文本精确匹配（find_exact 返回不在已选集合中、位置最靠前的一项），
+    其余更新再在 build_index 构建的 TodoIndex（不含已选事项）中模糊匹配。
+    精确匹配不需要加载全部事项，只有需要模糊匹配时才构建索引
+    """
+    matched: List[Hashable] = []
+    chosen: Set[Hashable] = set()
+    remaining = []
+    for update in updates:
+        key = find_exact(todo_item_id(update), chosen)
+        if key is None:
+            remaining.append(update)
+        else:
+            matched.append(key)
+            chosen.add(key)
+    if remaining:
+        index = build_index(chosen)
+        for update in remaining:
+            key = index.resolve(update)
+            if key is not None:
+                matched.append(key)
+                index.remove(key)
+    return matched
+
+
+class TodoIndex:
+    """
+    未完成待办事项的索引（键为行号或位置）
+
+    ID 和文本映射在加入时建立；分词倒排索引在第一次需要模糊匹配时才构建，
+    全部更新都能精确匹配时不做分词
+    """
+
+    def __init__(self):
+        # ID、规范化文本 -> 按加入顺序排列的事项
+        self._by_id: Dict[str, List[Hashable]] = {}
+        self._by_text: Dict[str, List[Hashable]] = {}
+        self._texts: Dict[Hashable, str] = {}
+        self._postings: Optional[Dict[str, Set[Hashable]]] = None
+        self._item_tokens: Dict[Hashable, Set[str]] = {}
+        self._item_names: Dict[Hashable, Tuple[Optional[str], str]] = {}
+        self._order: Dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def add(self, key: Hashable, text: str, item_id: Optional[str] = None):
+        """加入一个未完成的待办事项"""
+        self._order[key] = len(self._order)
+        text_key = todo_item_id(text)
+        self._item_names[key] = (item_id, text_key)
+        if item_id:
+            self._by_id.setdefault(item_id, []).append(key)
+        self._by_text.setdefault(text_key, []).append(key)
+        self._texts[key] = text
+        if self._postings is not None:
+            self._index_tokens(key)
+
+    def _index_tokens(self, key: Hashable):
+        tokens = tokenize(self._texts[key])
+        self._item_tokens[key] = tokens
+        for token in tokens:
+            self._postings.setdefault(token, set()).add(key)
+
+    def remove(self, key: Hashable):
+        """移除已完成的待办事项"""
+        if self._order.pop(key, None) is None:
+            return
+        item_id, text_key = self._item_names.pop(key)
+        for mapping, name in ((self._by_id, item_id), (self._by_text, text_key)):
+            keys = mapping.get(name)
+            if keys is not None:
+                keys.remove(key)
+                if not keys:
+                    del mapping[name]
+        del self._texts[key]
+        for token in self._item_tokens.pop(key, ()):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.discard(key)
+
+    def find_exact(self, normalized: str) -> Optional[Hashable]:
+        """按 ID、规范化文本精确查找，多个时取最先加入的一项"""
+        keys = self._by_id.get(normalized) or self._by_text.get(normalized)
+        return keys[0] if keys else None
+
+    def resolve(self, update: str) -> Optional[Hashable]:
+        """
+        查找进度更新对应的待办事项
+
+        依次尝试：ID 精确匹配、规范化文本精确匹配、倒排索引模糊匹配
+        （重合词比例最高者，比例相同时取重合度更高、位置更靠前的一项）
+        """
+        key = self.find_exact(todo_item_id(update))
+        if key is not None:
+            return key
+
+        tokens = tokenize(update)
+        if not tokens:
+            return None
+        if self._postings is None:
+            self._postings = {}
+            for key in self._texts:
+                self._index_tokens(key)
+        scores: Dict[Hashable, int] = {}
+        for token in tokens:
+            for key in self._postings.get(token, ()):
+                scores[key] = scores.get(key, 0) + 1
+        if not scores:
+            return None
+        best = max(
+            scores,
+            key=lambda key: (
+                scores[key],
+                scores[key] / max(len(self._item_tokens[key]), 1),
+                -self._order[key],
+            ),
+        )
+        if scores[best] / len(tokens) < FUZZY_MIN_OVERLAP:
+            return None
+        return best
+
+    def resolve_all(self, updates: Sequence[str]) -> List[Hashable]:
+        """为一组进度更新选出待办事项（规则见 resolve_updates），选中的事项从索引中移除"""
+
+        def find_exact(normalized: str, chosen: Set[Hashable]) -> Optional[Hashable]:
+            key = self.find_exact(normalized)
+            if key is not None:
+                self.remove(key)
+            return key
+
+        return resolve_updates(updates, find_exact, lambda chosen: self)
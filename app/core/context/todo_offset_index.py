@@ -0,0 +1,265 @@
+"""
+待办事项偏移索引
+todo.md 的 SQLite 旁路索引 .todo.items.sqlite，记录每个未完成待办事项的复选框
+"- [ ]" 在文件中的字节偏移、文本和 ID。进度更新按 ID 或规范化文本直接查索引
+（查不到时才加载全部未完成事项做模糊匹配），把对应字节原地改为 "- [x]"
+（长度不变），再追加进度记录，不读取也不重写整个文件：
+
+- 追加写入后只扫描新增的尾部字节
+- 文件被整体重写（inode 变化）、变短或被原地修改时整体重建
+"""
+
+import os
+import re
+import sqlite3
+from contextlib import closing, contextmanager
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .context_format import parse_todo_line
+from .todo_index import TodoIndex, resolve_updates, todo_item_id
+
+# 未完成的待办事项行（允许缩进）
+_OPEN_ITEM = re.compile(rb"(?m)^([ \t]*)- \[ \][^\n]*")
+_OPEN_CHECKBOX = b"- [ ]"
+# 复选框中被改写的字节相对复选框起始位置的偏移
+_CHECK_OFFSET = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    offset INTEGER PRIMARY KEY,
+    text TEXT NOT NULL,
+    item_id TEXT,
+    text_key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_items_id ON items (item_id);
+CREATE INDEX IF NOT EXISTS idx_items_text ON items (text_key);
+CREATE TABLE IF NOT EXISTS file_state (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    size INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+"""
+
+# (文件大小, inode, 修改时间)
+FileState = Tuple[int, int, int]
+
+
+def scan_open_items(
+    data: bytes, base_offset: int = 0
+) -> List[Tuple[int, str, Optional[str]]]:
+    """扫描数据中的未完成待办事项，返回 (复选框偏移, 文本, ID) 列表"""
+    items = []
+    for match in _OPEN_ITEM.finditer(data):
+        parsed = parse_todo_line(match.group(0).decode("utf-8", errors="replace"))
+        if parsed is None:
+            continue
+        offset = base_offset + match.start() + len(match.group(1))
+        items.append((offset, parsed[1], parsed[2]))
+    return items
+
+
+class TodoOffsetIndex:
+    """todo.md 中未完成待办事项的偏移索引（调用方需持有任务锁）"""
+
+    def __init__(self, index_path: Path, file_path: Path, fsync: bool = False):
+        self.index_path = Path(index_path)
+        self.file_path = Path(file_path)
+        self.fsync = fsync
+
+    def reset(self):
+        """删除索引（文件被整体重写时调用，下次使用时重建）"""
+        self.index_path.unlink(missing_ok=True)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        with closing(sqlite3.connect(str(self.index_path), timeout=30)) as conn:
+            conn.execute(f"PRAGMA synchronous={'FULL' if self.fsync else 'OFF'}")
+            conn.executescript(_SCHEMA)
+            with conn:
+                yield conn
+
+    def _insert(
+        self, conn: sqlite3.Connection, items: List[Tuple[int, str, Optional[str]]]
+    ):
+        conn.executemany(
+            "INSERT OR REPLACE INTO items (offset, text, item_id, text_key) "
+            "VALUES (?, ?, ?, ?)",
+            [
+                (offset, text, item_id, todo_item_id(text))
+                for offset, text, item_id in items
+            ],
+        )
+
+    def _save_state(self, conn: sqlite3.Connection) -> FileState:
+        stat = os.stat(self.file_path)
+        state = (stat.st_size, stat.st_ino, stat.st_mtime_ns)
+        conn.execute(
+            "INSERT OR REPLACE INTO file_state (id, size, inode, mtime_ns) "
+            "VALUES (0, ?, ?, ?)",
+            state,
+        )
+        return state
+
+    def _rebuild(self, conn: sqlite3.Connection) -> FileState:
+        conn.execute("DELETE FROM items")
+        self._insert(conn, scan_open_items(self.file_path.read_bytes()))
+        return self._save_state(conn)
+
+    def _refresh(self, conn: sqlite3.Connection) -> FileState:
+        """使索引与文件保持一致：正常追加后只扫描新增的尾部字节"""
+        stat = os.stat(self.file_path)
+        state = conn.execute(
+            "SELECT size, inode, mtime_ns FROM file_state WHERE id = 0"
+        ).fetchone()
+        if (
+            state is None
+            or state[1] != stat.st_ino
+            or state[0] > stat.st_size
+            or (state[0] == stat.st_size and state[2] != stat.st_mtime_ns)
+        ):
+            return self._rebuild(conn)
+        if state[0] == stat.st_size:
+            return state
+
+        # 从已索引部分的最后一个字节（通常是换行）开始扫描，只接受从新行开始的事项
+        start = max(state[0] - 1, 0)
+        with open(self.file_path, "rb") as f:
+            f.seek(start)
+            tail = f.read(stat.st_size - start)
+        self._insert(
+            conn,
+            [
+                item
+                for item in scan_open_items(tail, start)
+                if item[0] > start or start == 0
+            ],
+        )
+        return self._save_state(conn)
+
+    def _resolve(
+        self, conn: sqlite3.Connection, updates: List[str], exclude: Set[int]
+    ) -> List[int]:
+        """按 resolve_updates 的规则匹配：精确匹配直接查索引，模糊匹配时才加载全部事项"""
+
+        def excluded(chosen: Set[int]) -> str:
+            return ",".join(map(str, chosen | exclude)) or "-1"
+
+        def find_exact(normalized: str, chosen: Set[int]) -> Optional[int]:
+            for column in ("item_id", "text_key"):
+                row = conn.execute(
+                    f"SELECT offset FROM items WHERE {column} = ? "
+                    f"AND offset NOT IN ({excluded(chosen)}) "
+                    "ORDER BY offset LIMIT 1",
+                    (normalized,),
+                ).fetchone()
+                if row is not None:
+                    return row[0]
+            return None
+
+        def build_index(chosen: Set[int]) -> TodoIndex:
+            index = TodoIndex()
+            for offset, text, item_id in conn.execute(
+                "SELECT offset, text, item_id FROM items "
+                f"WHERE offset NOT IN ({excluded(chosen)}) ORDER BY offset"
+            ):
+                index.add(offset, text, item_id)
+            return index
+
+        return resolve_updates(updates, find_exact, build_index)
+
+    def _verified(self, offsets: List[int]) -> bool:
+        """偏移处是否仍是未完成的复选框"""
+        with open(self.file_path, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                if f.read(len(_OPEN_CHECKBOX)) != _OPEN_CHECKBOX:
+                    return False
+        return True
+
+    def _match(
+        self, select: Callable[[sqlite3.Connection], List[int]]
+    ) -> Tuple[FileState, List[int]]:
+        """选出事项并校验其偏移（不一致时重建一次索引）"""
+        with self._connect() as conn:
+            for _ in range(2):
+                state = self._refresh(conn)
+                offsets = select(conn)
+                if self._verified(offsets):
+                    return state, offsets
+                self._rebuild(conn)
+        raise ValueError(f"待办事项索引与文件 {self.file_path.name} 不一致")
+
+    def match(
+        self, updates: List[str], exclude: Iterable[int] = ()
+    ) -> Tuple[FileState, List[int]]:
+        """
+        查找进度更新对应的未完成事项（匹配规则见 todo_index.resolve_updates）
+
+        Args:
+            exclude: 已被选中、尚未写入的事项偏移（批量提交中先前的修改）
+
+        Returns:
+            (文件状态, 匹配到的复选框偏移)；文件不存在时抛出 FileNotFoundError
+        """
+        exclude = set(exclude)
+        return self._match(lambda conn: self._resolve(conn, updates, exclude))
+
+    def match_containing(
+        self, item_text: str, exclude: Iterable[int] = ()
+    ) -> Tuple[FileState, List[int]]:
+        """查找文本包含 item_text 的所有未完成事项（exclude 同 match）"""
+        exclude = set(exclude)
+        return self._match(
+            lambda conn: [
+                row[0]
+                for row in conn.execute(
+                    "SELECT offset FROM items WHERE instr(text, ?) > 0 "
+                    "ORDER BY offset",
+                    (item_text,),
+                )
+                if row[0] not in exclude
+            ]
+        )
+
+    def mark(self, state: FileState, offsets: List[int], append: bytes = b"") -> int:
+        """
+        把 match 选出的事项原地改为 "- [x]"，再将 append 追加到文件末尾
+
+        Returns:
+            写入后的文件字节数
+        """
+        with open(self.file_path, "r+b") as f:
+            for offset in offsets:
+                f.seek(offset + _CHECK_OFFSET)
+                f.write(b"x")
+            if append:
+                f.seek(state[0])
+                f.write(append)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        with self._connect() as conn:
+            conn.executemany(
+                "DELETE FROM items WHERE offset = ?", [(offset,) for offset in offsets]
+            )
+            self._insert(conn, scan_open_items(append, state[0]))
+            return self._save_state(conn)[0]
+
+    def read_marked(self, state: FileState, offsets: List[int]) -> bytes:
+        """match 时的文件内容在 offsets 处标记为完成后的字节（不写入文件）"""
+        with open(self.file_path, "rb") as f:
+            data = bytearray(f.read(state[0]))
+        for offset in offsets:
+            data[offset + _CHECK_OFFSET] = ord("x")
+        return bytes(data)
+
+    def undo_mark(self, offsets: List[int], size: int):
+        """撤销 mark：复选框改回 "- [ ]"，截断追加的内容，并删除索引（下次使用时重建）"""
+        with open(self.file_path, "r+b") as f:
+            for offset in offsets:
+                f.seek(offset + _CHECK_OFFSET)
+                f.write(b" ")
+            f.truncate(size)
+        self.reset()
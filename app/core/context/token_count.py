@@ -0,0 +1,59 @@
+"""
+Token 计数
+非中日韩文本使用 tiktoken（未安装或编码不可用时按字节数估算），中日韩字符按字符数近似，
+避免对大段中文逐字做 BPE 编码。计数可以按写入增量累加（分段计数之和与整体计数近似相等）
+"""
+
+import re
+from typing import Optional
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - requirements.txt 已固定版本，未安装时退回估算
+    tiktoken = None
+
+# tiktoken 编码名称
+TOKEN_ENCODING = "cl100k_base"
+# 每个中日韩字符近似计为的 token 数
+CJK_TOKENS_PER_CHAR = 1.0
+# 没有 tiktoken 时，其他文本每个 token 近似对应的字节数
+BYTES_PER_TOKEN = 4
+
+# 中日韩标点、假名、汉字、谚文和全角字符
+_CJK = re.compile(
+    r"[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf"
+    r"\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]+"
+)
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    """延迟加载 tiktoken 编码（首次使用时可能需要下载词表，失败时退回估算）"""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        if tiktoken is not None:
+            try:
+                _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+            except Exception as e:
+                print(f"加载 tiktoken 编码失败，改用估算: {e}")
+    return _encoding
+
+
+def count_tokens(text: Optional[str]) -> int:
+    """估算文本的 token 数"""
+    if not text:
+        return 0
+    cjk_chars = 0
+    for match in _CJK.finditer(text):
+        cjk_chars += match.end() - match.start()
+    rest = _CJK.sub(" ", text) if cjk_chars else text
+
+    encoding = _get_encoding()
+    if encoding is not None:
+        rest_tokens = len(encoding.encode_ordinary(rest))
+    else:
+        rest_tokens = -(-len(rest.encode("utf-8")) // BYTES_PER_TOKEN)
+    return rest_tokens + round(cjk_chars * CJK_TOKENS_PER_CHAR)
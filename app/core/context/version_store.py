@@ -0,0 +1,335 @@
+"""
+上下文文件版本存储
+按内容寻址的分块存储（sha256 去重 + zlib 压缩），为每个上下文文件保留历史版本
+
+- 代（generation）：文件两次整体重写之间的内容。追加只会让当前代变长，
+  代结束（文件被重写）时才将其内容分块写入 chunks/，并生成代清单 gens/<类型>/<代>.json
+- 版本索引：<类型>.idx 为定长记录 (代, 字节数, 时间戳)，第 v 个版本位于 (v-1)*记录长度，
+  读取任意版本只需一次索引定位和一次清单读取
+- 磁盘预算：超出预算时按时间从旧到新淘汰版本，再标记-清除不再被引用的代和数据块
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import struct
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from .atomic_io import atomic_write_bytes
+
+# 版本索引记录：代（0 表示已淘汰）、内容字节数、时间戳
+_RECORD = struct.Struct("<IQd")
+
+# 按行切分数据块：不小于 MIN_CHUNK，不大于 MAX_CHUNK，
+# 中间按行内容哈希决定边界，插入/修改后块边界可以重新对齐
+MIN_CHUNK = 1024
+MAX_CHUNK = 16 * 1024
+_BOUNDARY_MASK = 0x7
+
+
+def split_chunks(data: bytes) -> Iterator[bytes]:
+    """将内容按行切分为数据块（内容定义的分块边界）"""
+    start = 0
+    pos = 0
+    length = len(data)
+    while pos < length:
+        end = data.find(b"\n", pos)
+        end = length if end == -1 else end + 1
+        size = end - start
+        line_hash = zlib.crc32(data[pos:end])
+        if size >= MAX_CHUNK or (
+            size >= MIN_CHUNK and line_hash & _BOUNDARY_MASK == 0
+        ):
+            yield data[start:end]
+            start = end
+        pos = end
+    if start < length:
+        yield data[start:]
+
+
+class VersionStore:
+    """单个任务目录下的版本存储（调用方需持有任务写锁）"""
+
+    def __init__(self, root: Path, fsync: bool = False):
+        self.root = Path(root)
+        self.fsync = fsync
+        self._state: Optional[Dict[str, Any]] = None
+
+    # ---- 路径与状态 ----
+
+    def _state_path(self) -> Path:
+        return self.root / "state.json"
+
+    def _index_path(self, file_type: str) -> Path:
+        return self.root / f"{file_type}.idx"
+
+    def _gen_path(self, file_type: str, generation: int) -> Path:
+        return self.root / "gens" / file_type / f"{generation}.json"
+
+    def _chunk_path(self, digest: str) -> Path:
+        return self.root / "chunks" / digest[:2] / digest
+
+    def _load_state(self) -> Dict[str, Any]:
+        """读取状态：各文件当前代、下一个代编号、占用字节数和逻辑字节数"""
+        if self._state is None:
+            try:
+                self._state = json.loads(self._state_path().read_bytes())
+            except FileNotFoundError:
+                self._state = {"live": {}, "next_gen": 1, "usage": 0, "logical": 0}
+        return self._state
+
+    def _save_state(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        atomic_write_bytes(
+            self._state_path(),
+            json.dumps(self._state).encode("utf-8"),
+            fsync=self.fsync,
+        )
+
+    def reset(self):
+        """清空版本历史（任务被重新创建时调用）"""
+        shutil.rmtree(self.root, ignore_errors=True)
+        self._state = None
+
+    # ---- 写入 ----
+
+    def _write_chunk(self, chunk: bytes) -> Tuple[str, int]:
+        """写入数据块（已存在则跳过），返回摘要和新增的磁盘字节数"""
+        digest = hashlib.sha256(chunk).hexdigest()
+        path = self._chunk_path(digest)
+        if path.exists():
+            return digest, 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = zlib.compress(chunk, 1)
+        atomic_write_bytes(path, data, fsync=self.fsync)
+        return digest, len(data)
+
+    def start_generation(self, file_type: str, live_path: Path) -> int:
+        """
+        文件即将被整体重写：封存当前代的内容并开始新的一代
+
+        Args:
+            file_type: 文件类型
+            live_path: 当前文件路径，当前代的内容从这里读取
+
+        Returns:
+            新一代的编号
+        """
+        state = self._load_state()
+        live = state["live"].get(file_type)
+        if live is not None:
+            try:
+                content = live_path.read_bytes()
+            except FileNotFoundError:
+                content = b""
+            chunks = []
+            offset = 0
+            for chunk in split_chunks(content):
+                digest, written = self._write_chunk(chunk)
+                state["usage"] += written
+                chunks.append([digest, offset, len(chunk)])
+                offset += len(chunk)
+            manifest = json.dumps(
+                {
+                    "size": len(content),
+                    "digest": hashlib.sha256(content).hexdigest(),
+                    "chunks": chunks,
+                }
+            ).encode("utf-8")
+            gen_path = self._gen_path(file_type, live)
+            gen_path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write_bytes(gen_path, manifest, fsync=self.fsync)
+            state["usage"] += len(manifest)
+            state["logical"] += len(content)
+
+        generation = state["next_gen"]
+        state["next_gen"] += 1
+        state["live"][file_type] = generation
+        self._save_state()
+        return generation
+
+    def record(self, file_type: str, version: int, size: int):
+        """记录版本：该版本内容为当前代的前 size 个字节"""
+        if version < 1:
+            return
+        state = self._load_state()
+        generation = state["live"].get(file_type)
+        if generation is None:
+            # 启用版本历史之前创建的文件：从当前内容开始新的一代
+            generation = state["next_gen"]
+            state["next_gen"] += 1
+            state["live"][file_type] = generation
+            self._save_state()
+        self.root.mkdir(parents=True, exist_ok=True)
+        index_path = self._index_path(file_type)
+        fd = os.open(str(index_path), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.pwrite(
+                fd,
+                _RECORD.pack(generation, size, time.time()),
+                (version - 1) * _RECORD.size,
+            )
+            if self.fsync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    # ---- 读取 ----
+
+    def _read_record(
+        self, file_type: str, version: int
+    ) -> Optional[Tuple[int, int, float]]:
+        """O(1) 读取版本索引记录"""
+        if version < 1:
+            return None
+        try:
+            with open(self._index_path(file_type), "rb") as f:
+                f.seek((version - 1) * _RECORD.size)
+                data = f.read(_RECORD.size)
+        except FileNotFoundError:
+            return None
+        if len(data) < _RECORD.size:
+            return None
+        record = _RECORD.unpack(data)
+        return record if record[0] else None
+
+    def _iter_records(self, file_type: str) -> Iterator[Tuple[int, int, int, float]]:
+        """遍历版本索引，返回 (版本, 代, 字节数, 时间戳)"""
+        try:
+            data = self._index_path(file_type).read_bytes()
+        except FileNotFoundError:
+            return
+        for i in range(len(data) // _RECORD.size):
+            generation, size, timestamp = _RECORD.unpack_from(data, i * _RECORD.size)
+            if generation:
+                yield i + 1, generation, size, timestamp
+
+    def get_version(
+        self, file_type: str, version: int, live_path: Path
+    ) -> Optional[bytes]:
+        """读取指定版本的内容，版本不存在或已被淘汰时返回 None"""
+        record = self._read_record(file_type, version)
+        if record is None:
+            return None
+        generation, size, _ = record
+
+        if generation == self._load_state()["live"].get(file_type):
+            # 当前代只会被追加，历史版本是当前文件的前缀
+            try:
+                with open(live_path, "rb") as f:
+                    return f.read(size)
+            except FileNotFoundError:
+                return None
+
+        try:
+            manifest = json.loads(self._gen_path(file_type, generation).read_bytes())
+        except FileNotFoundError:
+            return None
+        parts = []
+        for digest, offset, _ in manifest["chunks"]:
+            if offset >= size:
+                break
+            parts.append(zlib.decompress(self._chunk_path(digest).read_bytes()))
+        return b"".join(parts)[:size]
+
+    def list_versions(self, file_type: str) -> List[Dict[str, Any]]:
+        """列出文件仍保留的历史版本"""
+        return [
+            {"version": version, "size": size, "timestamp": timestamp}
+            for version, _, size, timestamp in self._iter_records(file_type)
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        """占用字节数与去重前的逻辑字节数"""
+        state = self._load_state()
+        return {
+            "usage_bytes": state["usage"],
+            "logical_bytes": state["logical"],
+            "generations": state["next_gen"] - 1,
+        }
+
+    # ---- 淘汰与回收 ----
+
+    def _file_types(self) -> List[str]:
+        if not self.root.exists():
+            return []
+        return [path.stem for path in self.root.glob("*.idx")]
+
+    def _drop(self, file_type: str, versions: List[int]):
+        """将版本索引记录标记为已淘汰"""
+        if not versions:
+            return
+        fd = os.open(str(self._index_path(file_type)), os.O_RDWR)
+        try:
+            for version in versions:
+                os.pwrite(fd, _RECORD.pack(0, 0, 0.0), (version - 1) * _RECORD.size)
+        finally:
+            os.close(fd)
+
+    def prune(self, keep_versions: int):
+        """每个文件只保留最近的 keep_versions 个版本"""
+        for file_type in self._file_types():
+            versions = [record[0] for record in self._iter_records(file_type)]
+            self._drop(file_type, versions[: max(len(versions) - keep_versions, 0)])
+        self._sweep()
+
+    def enforce_budget(self, budget_bytes: Optional[int]):
+        """占用超出预算时从最旧的版本开始淘汰（每个文件的最新版本始终保留）"""
+        if budget_bytes is None:
+            return
+        while self._load_state()["usage"] > budget_bytes:
+            candidates = []
+            for file_type in self._file_types():
+                records = list(self._iter_records(file_type))
+                candidates += [
+                    (timestamp, file_type, version)
+                    for version, _, _, timestamp in records[:-1]
+                ]
+            if not candidates:
+                break
+            candidates.sort()
+            # 每轮淘汰约 10% 的版本，减少标记-清除的次数
+            batch = candidates[: max(len(candidates) // 10, 1)]
+            by_type: Dict[str, List[int]] = {}
+            for _, file_type, version in batch:
+                by_type.setdefault(file_type, []).append(version)
+            for file_type, versions in by_type.items():
+                self._drop(file_type, versions)
+            self._sweep()
+
+    def _sweep(self):
+        """删除不再被任何版本引用的代清单和数据块，并重新统计占用"""
+        state = self._load_state()
+        referenced_chunks: Set[str] = set()
+        usage = 0
+        logical = 0
+        for file_type in self._file_types():
+            referenced = {record[1] for record in self._iter_records(file_type)}
+            gen_dir = self.root / "gens" / file_type
+            if not gen_dir.exists():
+                continue
+            for gen_path in gen_dir.glob("*.json"):
+                if int(gen_path.stem) not in referenced:
+                    gen_path.unlink()
+                    continue
+                data = gen_path.read_bytes()
+                manifest = json.loads(data)
+                referenced_chunks.update(chunk[0] for chunk in manifest["chunks"])
+                usage += len(data)
+                logical += manifest["size"]
+
+        chunk_root = self.root / "chunks"
+        if chunk_root.exists():
+            for chunk_path in chunk_root.glob("*/*"):
+                if chunk_path.name in referenced_chunks:
+                    usage += chunk_path.stat().st_size
+                else:
+                    chunk_path.unlink()
+
+        state["usage"] = usage
+        state["logical"] = logical
+        self._save_state()
@@ -61,6 +61,9 @@ SOLVE_PROMPT = """解决以下创作任务。我们已经制定了逐步计划
 
 {plan}
 
+证据和任务上下文：
+{context}
+
 根据提供的证据解决任务，直接回复答案。
 
 任务：{task}
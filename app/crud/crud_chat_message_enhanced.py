@@ -4,13 +4,19 @@
 """
 
 import json
+import weakref
 from datetime import datetime
 from typing import Any, Dict, List, Optional
 
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorCollection
 
-from app.core.context import AgentContext, ContextTools, FileContextManager
+from app.core.context import (
+    AgentContext,
+    AsyncFileContextManager,
+    ContextTools,
+    FileContextManager,
+)
 from app.models.chat_message_enhanced import (
     ChatMessageEnhanced,
     ContextFileReference,
@@ -20,6 +26,9 @@ from app.models.chat_message_enhanced import (
 )
 from app.schemas.chat_message import ChatMessage
 
+# 已创建的实例，应用关闭时统一释放上下文管理器持有的线程池和监听线程
+_live_cruds: "weakref.WeakSet[CRUDChatMessageEnhanced]" = weakref.WeakSet()
+
 
 class CRUDChatMessageEnhanced:
     """增强的聊天消息CRUD操作类"""
@@ -30,7 +39,19 @@ class CRUDChatMessageEnhanced:
         context_manager: Optional[FileContextManager] = None,
     ):
         self.collection = collection
-        self.context_manager = context_manager or FileContextManager()
+        # 多个 worker 进程共用上下文目录，监听其他进程的写入以及时丢弃缓存
+        self._owns_context_manager = context_manager is None
+        self.context_manager = context_manager or FileContextManager(watch_changes=True)
+        # 文件 I/O 在线程池中执行，避免阻塞事件循环
+        self.async_context_manager = AsyncFileContextManager(self.context_manager)
+        _live_cruds.add(self)
+
+    async def close(self):
+        """关闭线程池；上下文管理器由本实例创建时一并关闭（停止目录监听）"""
+        await self.async_context_manager.close()
+        if self._owns_context_manager:
+            self.context_manager.close()
+        _live_cruds.discard(self)
 
     async def get_by_chat(
         self, thread_id: str, skip: int = 0, limit: int = 100
@@ -87,7 +108,9 @@ class CRUDChatMessageEnhanced:
             await self._update_context_file(agent_id, task_id, file_type, content)
 
         # 添加到历史记录
-        self.context_manager.add_chat_message(agent_id, task_id, role, content)
+        await self.async_context_manager.add_chat_message(
+            agent_id, task_id, role, content
+        )
 
         # 保存到数据库
         result = await self.collection.insert_one(message_data)
@@ -116,7 +139,7 @@ class CRUDChatMessageEnhanced:
 
     async def get_context_summary(self, agent_id: str, task_id: str) -> Dict[str, Any]:
         """获取上下文摘要"""
-        return self.context_manager.get_context_summary(agent_id, task_id)
+        return await self.async_context_manager.get_context_summary(agent_id, task_id)
 
     async def create_context_snapshot(
         self,
@@ -129,7 +152,9 @@ class CRUDChatMessageEnhanced:
     ) -> ContextSnapshot:
         """创建上下文快照"""
         # 获取当前上下文数据
-        context_data = self.context_manager.get_context_summary(agent_id, task_id)
+        context_data = await self.async_context_manager.get_context_summary(
+            agent_id, task_id
+        )
 
         # 创建快照对象
         snapshot_data = {
@@ -201,7 +226,7 @@ class CRUDChatMessageEnhanced:
 
             # 更新文件系统上下文
             if current_step:
-                self.context_manager.update_todo_progress(
+                await self.async_context_manager.update_todo_progress(
                     agent_id, task_id, [f"当前步骤: {current_step}"]
                 )
 
@@ -323,7 +348,9 @@ class CRUDChatMessageEnhanced:
 
         if agent_id and task_id:
             # 添加到历史记录
-            self.context_manager.add_chat_message(agent_id, task_id, role, content)
+            await self.async_context_manager.add_chat_message(
+                agent_id, task_id, role, content
+            )
 
             # 如果指定了文件类型，更新对应文件
             if file_type:
@@ -334,27 +361,33 @@ class CRUDChatMessageEnhanced:
     ):
         """更新特定类型的上下文文件"""
         if file_type == "todo":
-            self.context_manager.update_todo_progress(agent_id, task_id, [content])
+            await self.async_context_manager.update_todo_progress(
+                agent_id, task_id, [content]
+            )
         elif file_type == "summary":
-            self.context_manager.add_summary_entry(
+            await self.async_context_manager.add_summary_entry(
                 agent_id, task_id, "自动摘要", content
             )
         elif file_type == "scratchpad":
-            self.context_manager.add_scratchpad_entry(agent_id, task_id, content)
+            await self.async_context_manager.add_scratchpad_entry(
+                agent_id, task_id, content
+            )
         elif file_type == "resource":
             # 假设content包含URL和描述
             lines = content.split("\n")
             title = lines[0] if lines else "资源"
             url = lines[1] if len(lines) > 1 else ""
             description = "\n".join(lines[2:]) if len(lines) > 2 else ""
-            self.context_manager.add_resource_link(
+            await self.async_context_manager.add_resource_link(
                 agent_id, task_id, title, url, description
             )
 
     async def export_context_data(self, agent_id: str, task_id: str) -> Dict[str, Any]:
         """导出上下文数据"""
         # 获取文件系统上下文
-        context_data = self.context_manager.get_context_summary(agent_id, task_id)
+        context_data = await self.async_context_manager.get_context_summary(
+            agent_id, task_id
+        )
 
         # 获取数据库中的相关数据
         messages = await self.get_context_messages("", agent_id, task_id)
@@ -416,3 +449,12 @@ class CRUDChatMessageEnhanced:
         except Exception as e:
             print(f"导入上下文数据失败: {e}")
             return False
+
+
+async def close_context_managers():
+    """应用关闭时调用：关闭所有实例的上下文管理器"""
+    for crud in list(_live_cruds):
+        try:
+            await crud.close()
+        except Exception as e:
+            print(f"关闭上下文管理器失败: {e}")
@@ -0,0 +1,1297 @@
+#!/usr/bin/env python3
+"""
+上下文管理性能基准测试
+对比不同实现/配置下 FileContextManager 的写入与读取开销
+"""
+
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.context import (
+    AgentContext,
+    CompactionPolicy,
+    CompactionWorker,
+    ContextAssembler,
+    ContextStore,
+    FileContextManager,
+    ContextTools,
+    SQLiteContextStore,
+    TaskContextCache,
+    TodoItem,
+    context_format,
+    namespaced_agent_id,
+    read_tasks,
+    todo_item_id,
+)
+from app.core.context.token_count import count_tokens
+
+
+def _print_table(title: str, rows):
+    """打印结果表格"""
+    print(f"\n=== {title} ===")
+    for row in rows:
+        print("  " + " | ".join(f"{cell:>14}" for cell in row))
+
+
+def bench_metadata_durability(num_appends: int = 1000):
+    """对比逐次 fsync、组提交和非安全写入在突发追加下的耗时"""
+    rows = [("mode", "total_s", "ops/s", "meta_commits")]
+
+    for mode in ("fsync", "group", "atomic", "unsafe"):
+        base_dir = tempfile.mkdtemp(prefix=f"bench_{mode}_")
+        try:
+            manager = FileContextManager(base_dir, cache_size=16, durability=mode)
+            manager.create_task_context("bench", "task", "基准测试", "突发追加")
+
+            start = time.perf_counter()
+            for i in range(num_appends):
+                manager.add_scratchpad_entry("bench", "task", f"第 {i} 条笔记")
+            manager.flush()
+            elapsed = time.perf_counter() - start
+
+            commits = (
+                manager._group_writer.stats()["commits"]
+                if manager._group_writer is not None
+                else num_appends
+            )
+            rows.append(
+                (
+                    mode,
+                    f"{elapsed:.3f}",
+                    f"{num_appends / elapsed:.0f}",
+                    str(commits),
+                )
+            )
+        finally:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+    _print_table(f"元数据持久化模式（{num_appends} 次追加）", rows)
+
+
+def _parallel_append_worker(args):
+    """子进程：向指定任务追加笔记，返回锁等待指标"""
+    base_dir, task_id, worker_id, num_appends = args
+    manager = FileContextManager(base_dir, cache_size=16)
+    for i in range(num_appends):
+        manager.add_scratchpad_entry("bench", task_id, f"worker-{worker_id} #{i}")
+    return manager.get_lock_stats()
+
+
+def bench_parallel_appends(num_workers: int = 4, num_appends: int = 250):
+    """多进程并发追加：不同任务互不阻塞，同一任务不丢失更新"""
+    rows = [("scenario", "total_s", "entries", "expected", "contended")]
+
+    for scenario in ("different_tasks", "same_task"):
+        base_dir = tempfile.mkdtemp(prefix=f"bench_{scenario}_")
+        try:
+            manager = FileContextManager(base_dir, cache_size=16)
+            task_ids = [
+                f"task_{i}" if scenario == "different_tasks" else "shared"
+                for i in range(num_workers)
+            ]
+            for task_id in set(task_ids):
+                manager.create_task_context("bench", task_id, "并发测试", "并发追加")
+
+            start = time.perf_counter()
+            with multiprocessing.Pool(num_workers) as pool:
+                results = pool.map(
+                    _parallel_append_worker,
+                    [
+                        (base_dir, task_id, i, num_appends)
+                        for i, task_id in enumerate(task_ids)
+                    ],
+                )
+            elapsed = time.perf_counter() - start
+
+            # 统计实际写入的条目数和元数据版本，验证没有丢失更新
+            entries = 0
+            for task_id in set(task_ids):
+                task_context = manager.load_task_context("bench", task_id)
+                scratchpad = task_context.files["scratchpad"]
+                entries += scratchpad.content.count("临时笔记\nworker-")
+                assert scratchpad.version == 1 + num_appends * task_ids.count(
+                    task_id
+                ), "元数据版本丢失更新"
+            rows.append(
+                (
+                    scenario,
+                    f"{elapsed:.3f}",
+                    str(entries),
+                    str(num_workers * num_appends),
+                    str(sum(r["contended"] for r in results)),
+                )
+            )
+        finally:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+    _print_table(f"多进程并发追加（{num_workers} 进程 x {num_appends} 次）", rows)
+
+
+def bench_list_agent_tasks(num_tasks: int = 5000, page_size: int = 50):
+    """对比全量扫描任务目录与基于索引的分页查询"""
+    base_dir = tempfile.mkdtemp(prefix="bench_list_")
+    try:
+        manager = FileContextManager(base_dir, cache_size=16)
+        for i in range(num_tasks):
+            manager.create_task_context("bench", f"{i:06d}", f"任务 {i}", "列表测试")
+            if i % 3 == 0:
+                manager.update_task_status("bench", f"{i:06d}", "completed")
+
+        start = time.perf_counter()
+        scanned = sorted(
+            manager._scan_agent_tasks("bench"),
+            key=lambda x: x["updated_at"],
+            reverse=True,
+        )
+        scan_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        page = manager.list_agent_tasks_page(
+            "bench", status="completed", page_size=page_size
+        )
+        first_page_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        pages = 0
+        cursor = None
+        while True:
+            page = manager.list_agent_tasks_page(
+                "bench", page_size=page_size, cursor=cursor
+            )
+            pages += 1
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        paging_elapsed = time.perf_counter() - start
+
+        rows = [
+            ("query", "total_ms", "rows"),
+            ("full_scan", f"{scan_elapsed * 1000:.1f}", str(len(scanned))),
+            (
+                "index_page",
+                f"{first_page_elapsed * 1000:.2f}",
+                str(page_size),
+            ),
+            (
+                "index_all_pages",
+                f"{paging_elapsed * 1000:.1f}",
+                f"{pages} pages",
+            ),
+        ]
+        _print_table(f"任务列表（{num_tasks} 个任务）", rows)
+        manager.close()
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+
+def bench_lazy_load(history_mb: int = 50):
+    """加载带有超大 history.md 的任务：只读元数据，不读取文件内容"""
+    base_dir = tempfile.mkdtemp(prefix="bench_lazy_")
+    try:
+        manager = FileContextManager(base_dir, cache_size=16)
+        manager.create_task_context("bench", "task", "懒加载测试", "大文件")
+        manager.append_file_content(
+            "bench", "task", "history", "历史消息\n" * (history_mb * 1024 * 1024 // 13)
+        )
+
+        # 使用无缓存的管理器模拟冷加载
+        cold_manager = FileContextManager(base_dir, cache_size=0)
+        tracemalloc.start()
+        start = time.perf_counter()
+        cold_manager.load_task_context("bench", "task")
+        load_elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        summary = cold_manager.get_context_summary("bench", "task")
+        summary_elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        rows = [
+            ("operation", "elapsed_us", "peak_kb"),
+            ("load_task", f"{load_elapsed * 1e6:.0f}", ""),
+            ("context_summary", f"{summary_elapsed * 1e6:.0f}", f"{peak / 1024:.0f}"),
+            (
+                "history_length",
+                str(summary["files"]["history"]["content_length"]),
+                "",
+            ),
+        ]
+        _print_table(f"懒加载（history.md 约 {history_mb} MB）", rows)
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+
+def _planning_workload(context: AgentContext, task_index: int, num_steps: int):
+    """模拟规划 Agent 执行一个任务：逐步写入搜索结果、摘要和进度，并读取上下文"""
+    context.create_new_task(f"文章 {task_index}", "撰写一篇技术文章")
+    context.add_chat_message("user", f"请写一篇关于主题 {task_index} 的文章")
+    for step in range(num_steps):
+        context.add_resource_link(
+            f"搜索结果 {step}", f"https://example.com/{task_index}/{step}", "摘要"
+        )
+        context.add_scratchpad_entry(f"步骤 {step} 的推理过程\n" * 5)
+        context.add_summary_entry("内容摘要", f"步骤 {step} 的结果\n" * 10)
+        context.update_todo_progress([f"步骤 {step} 收集必要信息"])
+        context.append_to_task_file("todo", f"\n---\n步骤完成: step_{step}\n")
+        # 每一步规划前读取最近的对话、待办事项和资源
+        context.get_recent_chat_history(5)
+        context.get_task_todo_items()
+        context.get_task_resources()
+    context.add_chat_message("assistant", "文章已完成")
+    context.get_task_file_content("summary")
+
+
+def bench_context_stores(num_tasks: int = 50, num_steps: int = 10):
+    """对比文件存储与 SQLite 存储在规划 Agent 典型负载下的耗时"""
+    rows = [("store", "total_s", "per_task_ms", "history_reads_ms")]
+
+    for name in ("file", "sqlite"):
+        base_dir = tempfile.mkdtemp(prefix=f"bench_store_{name}_")
+        try:
+            store = (
+                FileContextManager(base_dir, cache_size=16)
+                if name == "file"
+                else SQLiteContextStore(os.path.join(base_dir, "contexts.sqlite"))
+            )
+            context = AgentContext("bench", store)
+
+            start = time.perf_counter()
+            for i in range(num_tasks):
+                _planning_workload(context, i, num_steps)
+            elapsed = time.perf_counter() - start
+
+            # 单独统计读取最近对话的耗时（文件存储需要解析整个 history.md）
+            for _ in range(20):
+                context.add_chat_message("user", "追加消息\n" * 20)
+            start = time.perf_counter()
+            for _ in range(100):
+                context.get_recent_chat_history(10)
+            read_elapsed = time.perf_counter() - start
+
+            rows.append(
+                (
+                    name,
+                    f"{elapsed:.3f}",
+                    f"{elapsed / num_tasks * 1000:.1f}",
+                    f"{read_elapsed / 100 * 1000:.3f}",
+                )
+            )
+            store.close()
+        finally:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+    _print_table(f"存储后端（{num_tasks} 个任务 x {num_steps} 步）", rows)
+
+
+def bench_version_history(num_updates: int = 200):
+    """版本历史：对比开启/关闭时的重写耗时，以及分块去重后的磁盘占用"""
+    rows = [("history", "total_s", "stored_kb", "logical_kb", "read_v1_us")]
+
+    for enabled in (False, True):
+        base_dir = tempfile.mkdtemp(prefix="bench_versions_")
+        try:
+            manager = FileContextManager(
+                base_dir, cache_size=16, version_history=enabled
+            )
+            manager.create_task_context("bench", "task", "版本测试", "反复重写 todo.md")
+
+            start = time.perf_counter()
+            for i in range(num_updates):
+                manager.append_to_task_file(
+                    "bench", "task", "todo", f"\n---\n步骤完成: step_{i}\n" * 20
+                )
+                manager.update_todo_progress("bench", "task", [f"步骤 {i}"])
+            elapsed = time.perf_counter() - start
+
+            stats = manager.get_version_stats("bench", "task")
+            start = time.perf_counter()
+            manager.get_file_version("bench", "task", "todo", 1)
+            read_elapsed = time.perf_counter() - start
+            rows.append(
+                (
+                    "on" if enabled else "off",
+                    f"{elapsed:.3f}",
+                    f"{stats.get('usage_bytes', 0) / 1024:.0f}",
+                    f"{stats.get('logical_bytes', 0) / 1024:.0f}",
+                    f"{read_elapsed * 1e6:.0f}" if enabled else "",
+                )
+            )
+        finally:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+    _print_table(f"版本历史（{num_updates} 次追加 + 重写）", rows)
+
+
+def bench_archive(num_tasks: int = 200, num_messages: int = 50):
+    """冷任务归档：统计节省的磁盘空间，以及透明还原的加载延迟"""
+    base_dir = tempfile.mkdtemp(prefix="bench_archive_")
+    try:
+        manager = FileContextManager(base_dir, cache_size=0)
+        for i in range(num_tasks):
+            task_id = f"{i:05d}"
+            manager.create_task_context("bench", task_id, f"任务 {i}", "归档测试")
+            for j in range(num_messages):
+                manager.add_chat_message("bench", task_id, "user", f"消息 {j}\n" * 10)
+            manager.update_task_status("bench", task_id, "completed")
+
+        start = time.perf_counter()
+        report = manager.archive_idle_tasks(idle_days=0, agent_id="bench")
+        archive_elapsed = time.perf_counter() - start
+
+        for i in range(0, num_tasks, 10):
+            manager.load_task_context("bench", f"{i:05d}")
+        stats = manager.get_archive_stats()
+
+        rows = [
+            ("metric", "value"),
+            ("archived_tasks", str(report["archived"])),
+            ("files_removed", str(report["files"])),
+            ("original_kb", f"{report['original_bytes'] / 1024:.0f}"),
+            ("archived_kb", f"{report['archived_bytes'] / 1024:.0f}"),
+            ("archive_s", f"{archive_elapsed:.3f}"),
+            ("rehydrate_avg_ms", f"{stats['rehydration_avg_ms']:.2f}"),
+            ("rehydrate_max_ms", f"{stats['rehydration_max_ms']:.2f}"),
+        ]
+        _print_table(f"冷任务归档（{num_tasks} 个任务）", rows)
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+
+def _max_dir_entries(root: str) -> int:
+    """目录树中单个目录的最大条目数"""
+    return max((len(dirs) + len(files) for _, dirs, files in os.walk(root)), default=0)
+
+
+def bench_layout(num_tasks: int = 2000, num_agents: int = 200):
+    """分桶布局：单目录最大条目数、按 ID 加载任务的耗时，以及旧版平铺布局的在线迁移"""
+    base_dir = tempfile.mkdtemp(prefix="bench_layout_")
+    try:
+        manager = FileContextManager(base_dir, cache_size=0, version_history=False)
+        for i in range(num_tasks):
+            agent_id = namespaced_agent_id("default", f"user{i % num_agents}")
+            manager.create_task_context(agent_id, f"{i:06d}", f"任务 {i}", "布局测试")
+        agents_root = os.path.join(base_dir, "agents")
+        sharded_max = _max_dir_entries(agents_root)
+
+        start = time.perf_counter()
+        for i in range(0, num_tasks, 10):
+            agent_id = namespaced_agent_id("default", f"user{i % num_agents}")
+            manager.load_task_context(agent_id, f"{i:06d}")
+        load_ms = (time.perf_counter() - start) / (num_tasks // 10) * 1000
+
+        # 将所有任务还原为旧版平铺布局（单个 agent_default 目录），再在线迁移
+        legacy_dir = os.path.join(base_dir, "agent_default")
+        os.mkdir(legacy_dir)
+        for dirpath, dirs, _ in os.walk(agents_root):
+            for name in [d for d in dirs if d.startswith("task_")]:
+                os.rename(os.path.join(dirpath, name), os.path.join(legacy_dir, name))
+                dirs.remove(name)
+        shutil.rmtree(agents_root)
+        legacy_max = _max_dir_entries(legacy_dir)
+
+        manager = FileContextManager(base_dir, cache_size=0, version_history=False)
+        start = time.perf_counter()
+        report = manager.migrate_layout()
+        migrate_elapsed = time.perf_counter() - start
+
+        rows = [
+            ("metric", "value"),
+            ("legacy_max_dir_entries", str(legacy_max)),
+            ("sharded_max_dir_entries", str(sharded_max)),
+            ("load_by_id_ms", f"{load_ms:.2f}"),
+            ("migrated_tasks", str(report["migrated"])),
+            ("migrate_s", f"{migrate_elapsed:.3f}"),
+        ]
+        _print_table(f"分桶目录布局（{num_tasks} 个任务）", rows)
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+
+def _search_step(context: AgentContext, step: int, num_links: int):
+    """模拟 execute_step 中一次搜索步骤的全部写入"""
+    for i in range(num_links):
+        context.add_resource_link(
+            f"结果 {step}-{i}", f"https://example.com/{step}/{i}", "搜索摘要"
+        )
+    context.add_scratchpad_entry(f"搜索[主题 {step}]结果: " + "内容 " * 50)
+    context.update_todo_progress([f"步骤 {step}"])
+    context.append_to_task_file("todo", f"\n---\n步骤完成: 步骤 {step} (Search)\n")
+
+
+def bench_batch(num_steps: int = 50, num_links: int = 5):
+    """对比逐条写入与 batch() 批量提交在搜索步骤中的耗时"""
+    rows = [("mode", "total_s", "per_step_ms")]
+    for batched in (False, True):
+        base_dir = tempfile.mkdtemp(prefix="bench_batch_")
+        try:
+            context = AgentContext("bench", FileContextManager(base_dir, cache_size=0))
+            context.create_new_task(
+                "批量写入", "搜索步骤", todo_items=[f"步骤 {i}" for i in range(num_steps)]
+            )
+            start = time.perf_counter()
+            for step in range(num_steps):
+                if batched:
+                    with context.batch():
+                        _search_step(context, step, num_links)
+                else:
+                    _search_step(context, step, num_links)
+            elapsed = time.perf_counter() - start
+            rows.append(
+                (
+                    "batch" if batched else "sequential",
+                    f"{elapsed:.3f}",
+                    f"{elapsed / num_steps * 1000:.2f}",
+                )
+            )
+        finally:
+            shutil.rmtree(base_dir, ignore_errors=True)
+    _print_table(f"搜索步骤批量提交（{num_steps} 步，每步 {num_links} 条链接）", rows)
+
+
+def bench_chat_history(sizes=(1000, 10000, 100000), limit: int = 10):
+    """读取最近 N 条聊天消息：全量解析 history.md 与偏移索引的对比"""
+    rows = [("messages", "history_kb", "full_parse_ms", "indexed_ms")]
+    for num_messages in sizes:
+        base_dir = tempfile.mkdtemp(prefix="bench_history_")
+        try:
+            manager = FileContextManager(base_dir, cache_size=0)
+            manager.create_task_context("bench", "history", "长对话", "历史索引测试")
+            manager.add_chat_message("bench", "history", "user", "开始")
+            # 直接写入大量消息，索引在首次读取时补齐
+            history_path = manager._get_task_path("bench", "history") / "history.md"
+            with open(history_path, "a", encoding="utf-8") as f:
+                for i in range(num_messages):
+                    role = "user" if i % 2 == 0 else "assistant"
+                    f.write(context_format.chat_entry(role, f"第 {i} 条消息 " * 10))
+            manager.get_chat_messages("bench", "history", limit)
+
+            start = time.perf_counter()
+            content = manager.get_file_content("bench", "history", "history")
+            context_format.parse_chat_messages(content)[-limit:]
+            full_ms = (time.perf_counter() - start) * 1000
+
+            runs = 100
+            start = time.perf_counter()
+            for _ in range(runs):
+                manager.get_chat_messages("bench", "history", limit)
+            indexed_ms = (time.perf_counter() - start) / runs * 1000
+
+            rows.append(
+                (
+                    str(num_messages),
+                    f"{history_path.stat().st_size / 1024:.0f}",
+                    f"{full_ms:.2f}",
+                    f"{indexed_ms:.3f}",
+                )
+            )
+        finally:
+            shutil.rmtree(base_dir, ignore_errors=True)
+    _print_table(f"读取最近 {limit} 条聊天消息", rows)
+
+
+def _legacy_todo_progress(content: str, progress_updates):
+    """改为索引匹配之前的实现：逐行逐条更新做子串和词重合判断"""
+    new_lines = []
+    for line in content.split("\n"):
+        if line.strip().startswith("- [ ]"):
+            item_lower = line.strip()[5:].strip().lower()
+            for update in progress_updates:
+                update_lower = update.lower()
+                if (
+                    update_lower in item_lower
+                    or item_lower in update_lower
+                    or any(
+                        word in item_lower
+                        for word in update_lower.split()
+                        if len(word) > 3
+                    )
+                ):
+                    line = line.replace("- [ ]", "- [x]")
+                    break
+        new_lines.append(line)
+    return "\n".join(new_lines) + context_format.todo_progress_block(progress_updates)
+
+
+def bench_todo_progress(sizes=(50, 200, 800)):
+    """逐步完成规划步骤：旧的逐行匹配与 TodoIndex 匹配的耗时和误标记数"""
+    rows = [("items", "legacy_ms", "indexed_ms", "legacy_extra", "indexed_extra")]
+    for num_items in sizes:
+        steps = [
+            (f"Search step {i}", f"Search web for chapter {i} references")
+            for i in range(num_items)
+        ]
+        header = context_format.todo_header("bench", "规划", "规划", "pending", 0)
+        results = []
+        for indexed in (False, True):
+            content = header + "".join(
+                context_format.todo_item(
+                    f"{name} (TavilySearch): {description}",
+                    item_id=todo_item_id(name) if indexed else None,
+                )
+                for name, description in steps
+            )
+            extra = 0
+            start = time.perf_counter()
+            for done, (name, description) in enumerate(steps, 1):
+                if indexed:
+                    content = context_format.apply_todo_progress(content, [name])
+                else:
+                    content = _legacy_todo_progress(content, [description])
+                # 完成第 done 步后应当恰好有 done 项被标记
+                completed = content.count("- [x]")
+                extra = max(extra, completed - done)
+            results.append(((time.perf_counter() - start) * 1000, extra))
+        (legacy_ms, legacy_extra), (indexed_ms, indexed_extra) = results
+        rows.append(
+            (
+                str(num_items),
+                f"{legacy_ms:.1f}",
+                f"{indexed_ms:.1f}",
+                str(legacy_extra),
+                str(indexed_extra),
+            )
+        )
+    _print_table("逐步更新待办事项进度（累计耗时，extra 为多标记的项数）", rows)
+
+
+def bench_todo_in_place(sizes=(200, 2000, 10000), rounds: int = 50):
+    """FileContextManager.update_todo_progress：偏移索引原地标记与读取全文后整体重写的对比"""
+    rows = [("items", "todo_KB", "rewrite_ms", "in_place_ms")]
+    for num_items in sizes:
+        timings = {}
+        for in_place in (False, True):
+            base_dir = tempfile.mkdtemp(prefix="bench_todo_")
+            try:
+                manager = FileContextManager(
+                    base_dir, cache_size=0, search_index=False, version_history=False
+                )
+                items = [
+                    TodoItem(f"Search step {i} (TavilySearch): 第 {i} 章资料", f"s{i}")
+                    for i in range(num_items)
+                ]
+                manager.create_task_context("bench", "todo", "待办", "原地", items)
+                start = time.perf_counter()
+                for i in range(rounds):
+                    update = [f"s{(i * 7919) % num_items}"]
+                    if in_place:
+                        manager.update_todo_progress("bench", "todo", update)
+                    else:
+                        content = manager.get_file_content("bench", "todo", "todo")
+                        manager.update_file_content(
+                            "bench",
+                            "todo",
+                            "todo",
+                            context_format.apply_todo_progress(content, update),
+                        )
+                timings[in_place] = (time.perf_counter() - start) / rounds
+                size = manager.get_context_size("bench", "todo")
+                manager.close()
+            finally:
+                shutil.rmtree(base_dir, ignore_errors=True)
+        rows.append(
+            (
+                str(num_items),
+                f"{size['files']['todo']['size'] / 1024:.0f}",
+                f"{timings[False] * 1000:.2f}",
+                f"{timings[True] * 1000:.2f}",
+            )
+        )
+    _print_table(f"按 ID 完成待办事项（每次 1 项，共 {rounds} 次）", rows)
+
+
+def bench_resources(
+    num_steps: int = 100, results_per_step: int = 10, pool: int = 600
+):
+    """重复搜索结果写入 resource_links.txt：逐条追加与按 URL 去重登记的对比"""
+    rows = [("mode", "resource_kb", "url_entries", "resources", "add_ms", "get_ms")]
+    for dedup in (False, True):
+        base_dir = tempfile.mkdtemp(prefix="bench_resources_")
+        try:
+            manager = FileContextManager(base_dir, cache_size=0)
+            manager.create_task_context("bench", "res", "资源去重", "重复搜索")
+            start = time.perf_counter()
+            for step in range(num_steps):
+                for i in range(results_per_step):
+                    # 相邻步骤的搜索结果大量重合
+                    n = (step * 3 + i) % pool
+                    args = (f"结果 {n}", f"https://example.com/doc/{n}", "摘要 " * 20)
+                    if dedup:
+                        manager.add_resource_link("bench", "res", *args)
+                    else:
+                        entry = context_format.resource_entry(*args)
+                        manager.append_file_content("bench", "res", "resource", entry)
+            elapsed = time.perf_counter() - start
+            add_ms = elapsed * 1000 / (num_steps * results_per_step)
+
+            start = time.perf_counter()
+            if dedup:
+                resources = manager.get_resources("bench", "res")
+            else:
+                content = manager.get_file_content("bench", "res", "resource")
+                resources = context_format.parse_resources(content)
+            get_ms = (time.perf_counter() - start) * 1000
+
+            task_path = manager._get_task_path("bench", "res")
+            content = (task_path / "resource_links.txt").read_text(encoding="utf-8")
+            rows.append(
+                (
+                    "registry" if dedup else "append",
+                    f"{len(content.encode('utf-8')) / 1024:.1f}",
+                    str(content.count("- URL:")),
+                    str(len(resources)),
+                    f"{add_ms:.3f}",
+                    f"{get_ms:.2f}",
+                )
+            )
+        finally:
+            shutil.rmtree(base_dir, ignore_errors=True)
+    _print_table(
+        f"搜索结果登记（{num_steps} 步，每步 {results_per_step} 条，共 {pool} 个 URL）",
+        rows,
+    )
+
+
+def bench_context_size(history_mb: int = 20):
+    """计算任务大小：读取全部内容重新计量与读取元数据中增量维护的统计"""
+    base_dir = tempfile.mkdtemp(prefix="bench_size_")
+    try:
+        manager = FileContextManager(base_dir, cache_size=0)
+        manager.create_task_context("bench", "size", "大小统计", "大文件")
+        chunk = "用户: 请继续完善文章的第二章 (chapter two)\n" * 1000
+        for _ in range(history_mb * 1024 * 1024 // len(chunk.encode("utf-8"))):
+            manager.append_file_content("bench", "size", "history", chunk)
+
+        start = time.perf_counter()
+        task_context = manager.load_task_context("bench", "size")
+        context_data = {
+            "files": {
+                name: {"content": file.content}
+                for name, file in task_context.files.items()
+            }
+        }
+        full_tokens = ContextTools.calculate_context_size(context_data, "tokens")
+        full_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        stats = manager.get_context_size("bench", "size")
+        metadata_ms = (time.perf_counter() - start) * 1000
+
+        rows = [
+            ("method", "elapsed_ms", "tokens"),
+            ("recount_content", f"{full_ms:.1f}", str(full_tokens)),
+            ("metadata", f"{metadata_ms:.3f}", str(stats["tokens"])),
+        ]
+        _print_table(f"任务 token 统计（history.md 约 {history_mb} MB）", rows)
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+
+class _SlowLLM:
+    """模拟耗时的 LLM 摘要调用"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def invoke(self, prompt: str) -> str:
+        time.sleep(self.delay)
+        return "较早的对话讨论了文章结构和资料来源。"
+
+
+def bench_compaction(num_messages: int = 300, llm_delay: float = 0.2):
+    """聊天写入延迟：不压缩、写入路径上同步压缩与后台压缩的对比"""
+    policy = CompactionPolicy(task_tokens=4000, file_tokens=3000, check_interval=0)
+    message = "请根据资料继续完善文章的这一部分，注意保持风格一致。" * 4
+    rows = [("mode", "p50_ms", "max_ms", "total_s", "history_tokens")]
+    for mode in ("none", "sync", "background"):
+        base_dir = tempfile.mkdtemp(prefix="bench_compaction_")
+        worker = CompactionWorker(policy, max_concurrency=1)
+        try:
+            context = AgentContext("bench", FileContextManager(base_dir, cache_size=0))
+            context.create_new_task("压缩", "长对话")
+            llm = _SlowLLM(llm_delay)
+            if mode == "background":
+                context.enable_compaction(worker, llm)
+            latencies = []
+            start = time.perf_counter()
+            for i in range(num_messages):
+                write_start = time.perf_counter()
+                context.add_chat_message("user" if i % 2 == 0 else "assistant", message)
+                if mode == "sync":
+                    worker.compact_task(
+                        context.context_manager, "bench", context.current_task_id, llm
+                    )
+                latencies.append(time.perf_counter() - write_start)
+            total = time.perf_counter() - start
+            worker.wait()
+            latencies.sort()
+            rows.append(
+                (
+                    mode,
+                    f"{latencies[len(latencies) // 2] * 1000:.2f}",
+                    f"{latencies[-1] * 1000:.1f}",
+                    f"{total:.2f}",
+                    str(context.get_context_size()["files"]["history"]["tokens"]),
+                )
+            )
+        finally:
+            worker.shutdown()
+            shutil.rmtree(base_dir, ignore_errors=True)
+    _print_table(f"后台压缩（{num_messages} 条消息，LLM 摘要耗时 {llm_delay}s）", rows)
+
+
+def bench_context_assembly(num_entries: int = 400, budget: int = 4000):
+    """提示词上下文：整文件嵌入与按 token 预算组装（首次与缓存命中后）的对比"""
+    base_dir = tempfile.mkdtemp(prefix="bench_assembly_")
+    try:
+        manager = FileContextManager(base_dir)
+        manager.create_task_context("bench", "assembly", "组装", "提示词上下文")
+        for i in range(num_entries):
+            manager.add_summary_entry(
+                "bench", "assembly", f"步骤{i}", "检索到的资料要点和结论。" * 20
+            )
+            manager.add_scratchpad_entry(
+                "bench", "assembly", f"推理记录 {i}: 对比不同来源的观点。" * 10
+            )
+            manager.add_chat_message("bench", "assembly", "user", f"第 {i} 轮修改意见")
+
+        start = time.perf_counter()
+        full = "\n".join(
+            manager.get_file_content("bench", "assembly", file_type) or ""
+            for file_type in ("todo", "summary", "scratchpad", "history")
+        )
+        full_ms = (time.perf_counter() - start) * 1000
+
+        assembler = ContextAssembler(manager)
+        rows = [("method", "elapsed_ms", "prompt_tokens")]
+        rows.append(("whole_files", f"{full_ms:.1f}", str(count_tokens(full))))
+        for label in ("assemble_cold", "assemble_cached"):
+            start = time.perf_counter()
+            text = assembler.assemble("bench", "assembly", budget, query="资料 结论")
+            elapsed = (time.perf_counter() - start) * 1000
+            rows.append((label, f"{elapsed:.1f}", str(count_tokens(text))))
+        _print_table(f"提示词上下文（{num_entries} 组条目，预算 {budget} token）", rows)
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+
+def _make_transfer_store(name: str, base_dir: str):
+    if name == "file":
+        return FileContextManager(base_dir, cache_size=16)
+    return SQLiteContextStore(os.path.join(base_dir, "contexts.sqlite"))
+
+
+def bench_transfer(num_tasks: int = 1000):
+    """任务迁移：逐个创建再写入文件的导入与 NDJSON 流式批量导入的吞吐对比"""
+    rows = [("store", "method", "tasks_per_s", "export_MB")]
+    for store_name in ("file", "sqlite"):
+        source_dir = tempfile.mkdtemp(prefix="bench_transfer_src_")
+        try:
+            source = _make_transfer_store(store_name, source_dir)
+            for i in range(num_tasks):
+                task_id = f"task-{i:05d}"
+                source.create_task_context("bench", task_id, f"任务 {i}", "迁移")
+                source.add_chat_message("bench", task_id, "user", "请整理资料。" * 20)
+                source.add_summary_entry("bench", task_id, "结论", "要点。" * 40)
+            exported = b"".join(source.export_tasks("bench"))
+            tasks = list(read_tasks([exported]))
+
+            for method in ("per_file", "bulk_ndjson"):
+                target_dir = tempfile.mkdtemp(prefix="bench_transfer_dst_")
+                try:
+                    target = _make_transfer_store(store_name, target_dir)
+                    start = time.perf_counter()
+                    if method == "per_file":
+                        ContextStore.import_task_batch(target, "bench", tasks)
+                    else:
+                        target.import_tasks([exported])
+                    elapsed = time.perf_counter() - start
+                    target.close()
+                finally:
+                    shutil.rmtree(target_dir, ignore_errors=True)
+                rows.append(
+                    (
+                        store_name,
+                        method,
+                        f"{num_tasks / elapsed:.0f}",
+                        f"{len(exported) / 1024 / 1024:.1f}",
+                    )
+                )
+            source.close()
+        finally:
+            shutil.rmtree(source_dir, ignore_errors=True)
+    _print_table(f"任务导入吞吐（{num_tasks} 个任务）", rows)
+
+
+def bench_artifact_cache(
+    num_tasks: int = 40,
+    steps_per_task: int = 5,
+    num_queries: int = 60,
+    remote_delay: float = 0.02,
+):
+    """共享产物缓存：各任务重复请求搜索结果时，不缓存、不限容量与限容量缓存的对比"""
+    import random
+
+    rng = random.Random(0)
+    # 请求按长尾分布抽取，热门请求被多个任务重复使用
+    plan = [
+        [
+            f"查询 {min(int(rng.paretovariate(1.2)), num_queries)}"
+            for _ in range(steps_per_task)
+        ]
+        for _ in range(num_tasks)
+    ]
+    payload = "搜索结果摘要。" * 500
+    modes = (("none", 0), ("cache", 64 * 1024 * 1024), ("bounded", 64 * 1024))
+    rows = [("mode", "remote_calls", "hit_rate", "total_s", "cache_KB", "evictions")]
+    for mode, max_bytes in modes:
+        base_dir = tempfile.mkdtemp(prefix="bench_artifacts_")
+        remote_calls = 0
+
+        def remote(query: str) -> str:
+            nonlocal remote_calls
+            remote_calls += 1
+            time.sleep(remote_delay)
+            return f"{query}\n{payload}"
+
+        try:
+            store = FileContextManager(
+                base_dir, cache_size=0, artifact_cache_bytes=max_bytes
+            )
+            context = AgentContext("bench", store)
+            start = time.perf_counter()
+            for i, queries in enumerate(plan):
+                context.create_new_task(f"任务 {i}", "检索")
+                for query in queries:
+                    if mode == "none":
+                        remote(query)
+                    else:
+                        context.cached_artifact(
+                            "search", query, lambda query=query: remote(query)
+                        )
+                context.release_artifacts()
+            total = time.perf_counter() - start
+            stats = store.get_artifact_cache().stats()
+            rows.append(
+                (
+                    mode,
+                    str(remote_calls),
+                    f"{1 - remote_calls / (num_tasks * steps_per_task):.2f}",
+                    f"{total:.2f}",
+                    f"{stats['bytes'] / 1024:.0f}",
+                    str(stats["evictions"]),
+                )
+            )
+            store.close()
+        finally:
+            shutil.rmtree(base_dir, ignore_errors=True)
+    _print_table(
+        f"共享产物缓存（{num_tasks} 个任务 x {steps_per_task} 次请求，"
+        f"远程调用耗时 {remote_delay}s）",
+        rows,
+    )
+
+
+def _invalidation_writer(args):
+    """子进程：轮流向多个任务追加消息，模拟其他 worker 和离线脚本的写入"""
+    base_dir, task_ids, num_writes, interval = args
+    manager = FileContextManager(base_dir, cache_size=0)
+    for i in range(num_writes):
+        task_id = task_ids[i % len(task_ids)]
+        manager.add_chat_message("bench", task_id, "user", f"外部写入 #{i}")
+        time.sleep(interval)
+    manager.close()
+
+
+def bench_cache_invalidation(
+    num_tasks: int = 40,
+    num_writers: int = 4,
+    num_writes: int = 60,
+    interval: float = 0.02,
+):
+    """
+    跨进程缓存失效压力测试：多个写入进程修改任务的同时，读取进程反复加载全部任务；
+    对比逐次校验文件签名与监听目录变化的读取吞吐、失效延迟，并在写入结束后
+    检查读取进程的缓存与磁盘一致
+    """
+    rows = [
+        ("mode", "reads_per_s", "hit_rate", "lag_p50_ms", "lag_p95_ms", "stale_after")
+    ]
+    for mode in ("stat", "watch"):
+        base_dir = tempfile.mkdtemp(prefix="bench_invalidation_")
+        try:
+            manager = FileContextManager(
+                base_dir,
+                cache=TaskContextCache(num_tasks * 2),
+                watch_changes=mode == "watch",
+            )
+            task_ids = [f"task-{i:03d}" for i in range(num_tasks)]
+            for task_id in task_ids:
+                manager.create_task_context("bench", task_id, "失效测试", "并发写入")
+                manager.load_task_context("bench", task_id)
+            time.sleep(0.5)
+
+            writers = [
+                multiprocessing.Process(
+                    target=_invalidation_writer,
+                    args=((base_dir, task_ids[i::num_writers], num_writes, interval),),
+                )
+                for i in range(num_writers)
+            ]
+            for writer in writers:
+                writer.start()
+            reads = 0
+            start = time.perf_counter()
+            while any(writer.is_alive() for writer in writers):
+                for task_id in task_ids:
+                    manager.load_task_context("bench", task_id)
+                    reads += 1
+            elapsed = time.perf_counter() - start
+            for writer in writers:
+                writer.join()
+
+            # 等待超过失效延迟后，缓存中的版本应与磁盘一致
+            time.sleep(1.0)
+            fresh = FileContextManager(base_dir, cache_size=0)
+            stale = sum(
+                manager.load_task_context("bench", task_id).files["history"].version
+                != fresh.load_task_context("bench", task_id).files["history"].version
+                for task_id in task_ids
+            )
+            cache_stats = manager.get_cache_stats()
+            watch_stats = manager.get_invalidation_stats()
+            rows.append(
+                (
+                    watch_stats.get("backend", mode),
+                    f"{reads / elapsed:.0f}",
+                    f"{cache_stats['hit_rate']:.2f}",
+                    str(watch_stats.get("lag_p50_ms", "-")),
+                    str(watch_stats.get("lag_p95_ms", "-")),
+                    str(stale),
+                )
+            )
+            fresh.close()
+            manager.close()
+        finally:
+            shutil.rmtree(base_dir, ignore_errors=True)
+    _print_table(
+        f"跨进程缓存失效（{num_writers} 个写入进程 x {num_writes} 次，"
+        f"{num_tasks} 个任务）",
+        rows,
+    )
+
+
+def _sample_metadata(num_files: int):
+    """构造与 _save_task_metadata 结构相同、含 num_files 个文件项的元数据"""
+    now = datetime.now().isoformat()
+    return {
+        "task_id": "bench",
+        "title": "元数据编码测试",
+        "description": "比较不同编码器的编解码耗时",
+        "status": "in_progress",
+        "created_at": now,
+        "updated_at": now,
+        "files": {
+            f"file_{i}": {
+                "name": f"file_{i}.md",
+                "file_type": "scratchpad",
+                "created_at": now,
+                "updated_at": now,
+                "version": i,
+                "size": 4096 + i,
+                "length": 1365 + i,
+                "tokens": 1200 + i,
+                "preview": "这是文件开头的预览内容，用于列表展示。" * 6,
+                "metadata": {"compaction": {"method": "extractive", "sections": i}},
+            }
+            for i in range(num_files)
+        },
+        "stats": {"size": 4096 * num_files, "length": 1365 * num_files},
+        "metadata": {"source": "benchmark"},
+    }
+
+
+def bench_metadata_codec(file_counts=(10, 100, 500), rounds: int = 200):
+    """元数据编解码：每个任务的编码、解析（含时间字段）耗时和磁盘大小"""
+    from app.core.context.metadata_codec import (
+        available_codecs,
+        decode_metadata,
+        get_codec,
+    )
+
+    def parse_times(metadata):
+        # 与 load_task_context 一样解析每个文件项的时间
+        for file_info in metadata["files"].values():
+            datetime.fromisoformat(file_info["created_at"])
+            datetime.fromisoformat(file_info["updated_at"])
+
+    rows = [("codec", "files", "encode_us", "decode_us", "size_KB")]
+    for num_files in file_counts:
+        metadata = _sample_metadata(num_files)
+        codecs = [("json(stdlib)", get_codec("json").encode, json.loads)]
+        codecs += [
+            (name, get_codec(name).encode, decode_metadata)
+            for name in available_codecs()
+            if name != "json"
+        ]
+        for name, encode, decode in codecs:
+            start = time.perf_counter()
+            for _ in range(rounds):
+                data = encode(metadata)
+            encode_time = (time.perf_counter() - start) / rounds
+            start = time.perf_counter()
+            for _ in range(rounds):
+                parse_times(decode(data))
+            decode_time = (time.perf_counter() - start) / rounds
+            rows.append(
+                (
+                    name,
+                    str(num_files),
+                    f"{encode_time * 1e6:.0f}",
+                    f"{decode_time * 1e6:.0f}",
+                    f"{len(data) / 1024:.1f}",
+                )
+            )
+    _print_table(f"元数据编解码（每个任务，{rounds} 次平均）", rows)
+
+
+_SEARCH_TOPICS = [
+    "量子计算",
+    "药物发现",
+    "大语言模型",
+    "供应链金融",
+    "碳中和政策",
+    "自动驾驶",
+    "基因编辑",
+    "半导体制造",
+    "rust async runtime",
+    "postgres vacuum tuning",
+]
+
+
+def _search_task_text(i: int) -> str:
+    topic = _SEARCH_TOPICS[i % len(_SEARCH_TOPICS)]
+    other = _SEARCH_TOPICS[(i * 7 + 3) % len(_SEARCH_TOPICS)]
+    return f"{topic}的研究进展（编号 {i}），与{other}的关系仍需验证。" * 5
+
+
+def bench_search_index(num_tasks: int = 2000, num_queries: int = 50):
+    """全文检索：BM25 索引的写入开销、查询延迟与逐个读取文件查找的对比"""
+    base_dir = tempfile.mkdtemp(prefix="bench_search_")
+    rows = [("method", "p50_ms", "p95_ms")]
+    write_times = {}
+    try:
+        for indexed in (False, True):
+            shutil.rmtree(base_dir, ignore_errors=True)
+            manager = FileContextManager(
+                base_dir, cache_size=0, search_index=indexed
+            )
+            start = time.perf_counter()
+            for i in range(num_tasks):
+                agent_id = f"agent-{i % 20}"
+                task_id = f"task-{i:05d}"
+                manager.create_task_context(agent_id, task_id, f"任务 {i}", "检索")
+                manager.add_summary_entry(
+                    agent_id, task_id, "结论", _search_task_text(i)
+                )
+            write_times[indexed] = (time.perf_counter() - start) / num_tasks
+            if not indexed:
+                manager.close()
+        queries = [
+            _SEARCH_TOPICS[i % len(_SEARCH_TOPICS)] for i in range(num_queries)
+        ]
+
+        def percentiles(samples):
+            samples = sorted(samples)
+            return (
+                f"{samples[len(samples) // 2] * 1000:.2f}",
+                f"{samples[int(len(samples) * 0.95)] * 1000:.2f}",
+            )
+
+        samples = []
+        for query in queries:
+            start = time.perf_counter()
+            hits = manager.search_contexts(query, k=10)
+            samples.append(time.perf_counter() - start)
+            assert hits, query
+        rows.append(("bm25_index", *percentiles(samples)))
+
+        samples = []
+        for query in queries[:5]:
+            start = time.perf_counter()
+            matched = []
+            for path in Path(base_dir).rglob("summary.md"):
+                if query in path.read_text(encoding="utf-8"):
+                    matched.append(path)
+            samples.append(time.perf_counter() - start)
+        rows.append(("scan_files", *percentiles(samples)))
+        stats = manager._get_search_index().stats()
+        manager.close()
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+    _print_table(
+        f"全文检索（{num_tasks} 个任务，{stats['chunks']} 个条目，"
+        f"索引 {stats['bytes'] / 1024 / 1024:.1f} MB，"
+        f"建任务并写总结 {write_times[False] * 1000:.2f} -> "
+        f"{write_times[True] * 1000:.2f} ms/个）",
+        rows,
+    )
+
+
+def bench_retention(num_tasks: int = 1000, num_agents: int = 10, batch_size: int = 50):
+    """保留策略：增量巡检每一步的耗时与一次性遍历整个目录树统计占用的对比"""
+    from app.core.context import RetentionEngine, RetentionPolicy
+    from app.core.context.task_archive import disk_usage
+
+    base_dir = tempfile.mkdtemp(prefix="bench_retention_")
+    try:
+        manager = FileContextManager(base_dir, cache_size=0, search_index=False)
+        for i in range(num_tasks):
+            agent_id = f"agent-{i % num_agents}"
+            task_id = f"task-{i:05d}"
+            manager.create_task_context(agent_id, task_id, f"任务 {i}", "保留")
+            for version in range(3):
+                manager.update_file_content(
+                    agent_id, task_id, "summary", f"第 {version} 版。" * 200
+                )
+            manager.update_task_status(agent_id, task_id, "completed")
+
+        start = time.perf_counter()
+        full_bytes = disk_usage(Path(base_dir))
+        full_walk = time.perf_counter() - start
+
+        engine = RetentionEngine(
+            manager,
+            RetentionPolicy(
+                keep_versions=1,
+                version_idle_days=0,
+                global_quota_bytes=full_bytes // 4,
+                min_idle_hours=0,
+                batch_size=batch_size,
+            ),
+        )
+        step_times = []
+        while True:
+            start = time.perf_counter()
+            engine.step()
+            step_times.append(time.perf_counter() - start)
+            if not engine.stats()["pending_agents"]:
+                break
+        stats = engine.stats()
+        engine.close()
+        manager.close()
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+    step_times.sort()
+    rows = [
+        ("metric", "value"),
+        ("full_walk_ms", f"{full_walk * 1000:.1f}"),
+        ("steps", str(len(step_times))),
+        ("step_p50_ms", f"{step_times[len(step_times) // 2] * 1000:.1f}"),
+        ("step_max_ms", f"{step_times[-1] * 1000:.1f}"),
+        ("before_MB", f"{full_bytes / 1024 / 1024:.1f}"),
+        ("tracked_MB", f"{stats['tracked_bytes'] / 1024 / 1024:.1f}"),
+    ]
+    rows += [
+        (f"{action}_MB", f"{item['bytes'] / 1024 / 1024:.1f} ({item['count']})")
+        for action, item in sorted(stats["reclaimed"].items())
+    ]
+    _print_table(
+        f"保留策略（{num_tasks} 个任务，每步 {batch_size} 个，全局配额为原占用的 1/4）",
+        rows,
+    )
+
+
+def bench_section_patch(num_sections=(100, 1000, 5000), rounds: int = 50):
+    """按条目修改：upsert_section 只写受影响的字节，与读取全文替换后整体重写的对比"""
+    from app.core.context import ContextStore
+
+    rows = [("sections", "summary_KB", "versions", "full_rewrite_ms", "upsert_ms")]
+    for count in num_sections:
+        for version_history in (False, True):
+            base_dir = tempfile.mkdtemp(prefix="bench_section_")
+            try:
+                manager = FileContextManager(
+                    base_dir,
+                    cache_size=0,
+                    search_index=False,
+                    version_history=version_history,
+                )
+                manager.create_task_context("agent", "task", "条目", "修改")
+                manager.update_file_content(
+                    "agent",
+                    "task",
+                    "summary",
+                    "# 总结\n"
+                    + "".join(
+                        f"\n\n## 条目 {i}\n" + f"第 {i} 条的内容。" * 20 + "\n"
+                        for i in range(count)
+                    ),
+                )
+                size = manager.get_context_size("agent", "task")
+                summary_kb = size["files"]["summary"]["size"] / 1024
+                timings = {}
+                # ContextStore 的默认实现：读取全文，替换条目后整体重写
+                for method, upsert in (
+                    ("full_rewrite", ContextStore.upsert_section),
+                    ("upsert", FileContextManager.upsert_section),
+                ):
+                    start = time.perf_counter()
+                    for i in range(rounds):
+                        section = f"条目 {(i * 7919) % count}"
+                        upsert(manager, "agent", "task", "summary", section, f"新内容 {i}")
+                    timings[method] = (time.perf_counter() - start) / rounds
+                manager.close()
+            finally:
+                shutil.rmtree(base_dir, ignore_errors=True)
+            rows.append(
+                (
+                    str(count),
+                    f"{summary_kb:.0f}",
+                    "on" if version_history else "off",
+                    f"{timings['full_rewrite'] * 1000:.2f}",
+                    f"{timings['upsert'] * 1000:.2f}",
+                )
+            )
+    _print_table("按条目修改 summary.md（每次替换一个中间条目）", rows)
+
+
+def main():
+    bench_metadata_durability()
+    bench_parallel_appends()
+    bench_list_agent_tasks()
+    bench_lazy_load()
+    bench_context_stores()
+    bench_version_history()
+    bench_archive()
+    bench_layout()
+    bench_batch()
+    bench_chat_history()
+    bench_todo_progress()
+    bench_todo_in_place()
+    bench_resources()
+    bench_context_size()
+    bench_compaction()
+    bench_context_assembly()
+    bench_transfer()
+    bench_artifact_cache()
+    bench_cache_invalidation()
+    bench_metadata_codec()
+    bench_search_index()
+    bench_retention()
+    bench_section_patch()
+
+
+if __name__ == "__main__":
+    main()
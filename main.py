@@ -3,6 +3,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.api.v1.api import api_router
 from app.core.config import settings
 from app.db.mongodb import connect_to_mongo, close_mongo_connection
+from app.crud.crud_chat_message_enhanced import close_context_managers
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -29,6 +30,7 @@ async def startup_event():
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    await close_context_managers()
     await close_mongo_connection()
 
 if __name__ == "__main__":
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+共享产物缓存的测试：内容去重与引用计数、按访问时间淘汰、任务引用和损坏内容的处理
+"""
+
+import itertools
+import os
+import sys
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.context import AgentContext, FileContextManager
+from app.core.context import artifact_cache as artifact_cache_module
+from app.core.context.artifact_cache import ArtifactCache, artifact_key
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """每次读取时间递增 1 秒，访问顺序确定"""
+    clock = itertools.count(1_000_000)
+    monkeypatch.setattr(
+        artifact_cache_module, "time", SimpleNamespace(time=lambda: next(clock))
+    )
+    cache = ArtifactCache(tmp_path / "shared", max_bytes=250)
+    yield cache
+    cache.close()
+
+
+def _objects(cache: ArtifactCache):
+    return sorted(path.name for path in cache.objects_path.glob("*/*"))
+
+
+def test_identical_content_is_stored_once(cache):
+    """相同内容只存一份，最后一个请求删除后才删除内容文件"""
+    assert cache.put("search", "问题 一", "结果")
+    assert cache.put("search", "问题  一 ", "结果")  # 规范化后是同一请求
+    assert cache.put("outline", "问题 一", "结果")
+    assert len(_objects(cache)) == 1
+    assert cache.stats()["entries"] == 2
+
+    assert cache.invalidate("search", "问题 一")
+    assert cache.get("search", "问题 一") is None
+    assert cache.get("outline", "问题 一") == "结果"
+    assert len(_objects(cache)) == 1
+    assert cache.invalidate("outline", "问题 一")
+    assert _objects(cache) == []
+
+
+def test_replacing_content_releases_previous_object(cache):
+    """同一请求发布新产物后，旧内容不再被引用时删除"""
+    cache.put("summary", "https://Example.com/a/", "旧摘要")
+    cache.put("summary", "https://example.com/a", "新摘要")
+    assert artifact_key("summary", "https://Example.com/a/") == artifact_key(
+        "summary", "https://example.com/a"
+    )
+    assert cache.get("summary", "https://example.com/a") == "新摘要"
+    assert len(_objects(cache)) == 1
+
+
+def test_evicts_least_recently_used(cache):
+    """超过容量上限时淘汰最久未访问的产物"""
+    for name in ("a", "b"):
+        assert cache.put("search", name, name * 100)
+    assert cache.get("search", "a") == "a" * 100
+    assert cache.put("search", "c", "c" * 100)
+
+    assert cache.get("search", "b") is None
+    assert cache.get("search", "a") == "a" * 100
+    assert cache.get("search", "c") == "c" * 100
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["bytes"] == 200
+    # 超过上限的单个产物不写入
+    assert not cache.put("search", "huge", "x" * 251)
+
+
+def test_referenced_artifacts_survive_eviction(cache):
+    """任务引用的产物在释放前不会被淘汰"""
+    cache.put("search", "a", "a" * 100, holder="agent/task")
+    cache.put("search", "b", "b" * 100)
+    cache.put("search", "c", "c" * 100)
+    assert cache.get("search", "b") is None
+    assert cache.stats()["referenced"] == 1
+
+    assert cache.release("agent/task") == 1
+    assert cache.evict(max_bytes=100) == 1
+    assert cache.get("search", "a") is None
+    assert cache.get("search", "c") == "c" * 100
+
+
+def test_corrupted_object_is_a_miss(cache):
+    """内容文件被改动或删除时按未命中处理，并删除索引项"""
+    cache.put("search", "a", "原始内容")
+    (path,) = cache.objects_path.glob("*/*")
+    path.write_bytes("被改动".encode("utf-8"))
+    assert cache.get("search", "a") is None
+    assert cache.stats()["entries"] == 0
+    assert cache.get_or_compute("search", "a", lambda: "重新计算") == "重新计算"
+
+
+def test_get_or_compute_runs_once(tmp_path):
+    """并发的相同请求只计算一次；计算失败（None）不写入缓存"""
+    cache = ArtifactCache(tmp_path / "shared")
+    calls = []
+    started = threading.Event()
+
+    def compute():
+        calls.append(1)
+        started.wait(timeout=5)
+        return "结果"
+
+    threads = [
+        threading.Thread(
+            target=lambda: cache.get_or_compute("search", "同一请求", compute)
+        )
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    started.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 3
+
+    assert cache.get_or_compute("search", "失败", lambda: None) is None
+    assert cache.stats()["entries"] == 1
+    cache.close()
+
+
+def test_agent_contexts_share_artifacts(tmp_path):
+    """不同 Agent 的任务复用同一产物，任务结束时释放引用"""
+    manager = FileContextManager(str(tmp_path), cache_size=0)
+    first, second = AgentContext("first", manager), AgentContext("second", manager)
+    first.create_new_task("共享", "第一个任务")
+    second.create_new_task("共享", "第二个任务")
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return "搜索结果"
+
+    assert first.cached_artifact("search", "共享请求", compute) == "搜索结果"
+    assert second.cached_artifact("search", "共享请求", compute) == "搜索结果"
+    assert len(calls) == 1
+    cache = manager.get_artifact_cache()
+    assert cache.stats()["referenced"] == 1
+    assert first.release_artifacts() == 1 and second.release_artifacts() == 1
+    assert cache.stats()["referenced"] == 0
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+异步上下文的测试：批量提交按协程隔离
+"""
+
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.context import (
+    AsyncAgentContext,
+    AsyncFileContextManager,
+    FileContextManager,
+)
+
+
+class _BatchFailed(Exception):
+    pass
+
+
+async def _concurrent_batch(base_path: str, fail: bool):
+    manager = AsyncFileContextManager(FileContextManager(base_path, cache_size=0))
+    context = AsyncAgentContext("agent", manager)
+    task_id = await context.create_new_task("并发批量", "协程隔离")
+    started, written = asyncio.Event(), asyncio.Event()
+
+    async def batch_writer():
+        async with context.batch() as batch:
+            await context.add_scratchpad_entry("批量笔记")
+            started.set()
+            # 等待另一个协程写入，期间批量提交保持打开
+            await asyncio.wait_for(written.wait(), timeout=10)
+            await context.add_chat_message("assistant", "批量消息")
+            if fail:
+                raise _BatchFailed()
+        return batch
+
+    async def direct_writer():
+        await started.wait()
+        assert await context.add_scratchpad_entry("直接笔记")
+        # 不会被并入另一个协程的批量提交，返回时已经写入
+        content = await context.get_task_file_content("scratchpad")
+        assert "直接笔记" in content and "批量笔记" not in content
+        written.set()
+
+    results = await asyncio.gather(
+        batch_writer(), direct_writer(), return_exceptions=True
+    )
+    return manager, task_id, results[0]
+
+
+def test_batch_is_isolated_between_coroutines(tmp_path):
+    """一个协程的批量提交失败时，只丢弃它自己的写操作"""
+    manager, task_id, result = asyncio.run(_concurrent_batch(str(tmp_path), True))
+    assert isinstance(result, _BatchFailed)
+    scratchpad = manager.context_manager.get_file_content(
+        "agent", task_id, "scratchpad"
+    )
+    assert "直接笔记" in scratchpad and "批量笔记" not in scratchpad
+    messages = manager.context_manager.get_chat_messages("agent", task_id)
+    assert all(message["content"] != "批量消息" for message in messages)
+
+
+def test_batch_commits_alongside_concurrent_writes(tmp_path):
+    """批量提交成功时，两个协程的写操作都保留"""
+    manager, task_id, batch = asyncio.run(_concurrent_batch(str(tmp_path), False))
+    assert batch.committed
+    scratchpad = manager.context_manager.get_file_content(
+        "agent", task_id, "scratchpad"
+    )
+    assert scratchpad.index("直接笔记") < scratchpad.index("批量笔记")
+    messages = manager.context_manager.get_chat_messages("agent", task_id)
+    assert messages[-1]["content"] == "批量消息"
+
+
+def test_nested_batch_joins_outer(tmp_path):
+    """同一协程中嵌套的批量提交并入外层"""
+
+    async def run():
+        manager = AsyncFileContextManager(
+            FileContextManager(str(tmp_path), cache_size=0)
+        )
+        context = AsyncAgentContext("agent", manager)
+        await context.create_new_task("嵌套批量", "并入外层")
+        async with context.batch() as outer:
+            async with context.batch() as inner:
+                await context.add_scratchpad_entry("内层")
+            assert inner is outer and len(outer.mutations) == 1
+            await context.add_scratchpad_entry("外层")
+        assert outer.committed
+        return await context.get_task_file_content("scratchpad")
+
+    content = asyncio.run(run())
+    assert content.index("内层") < content.index("外层")
+
+
+def test_delete_task_forwards_conditions(tmp_path):
+    """异步删除与同步接口一致，按状态和更新时间过滤"""
+
+    async def run():
+        manager = AsyncFileContextManager(
+            FileContextManager(str(tmp_path), cache_size=0)
+        )
+        context = AsyncAgentContext("agent", manager)
+        task_id = await context.create_new_task("删除", "按条件删除")
+        await context.add_scratchpad_entry("笔记")
+        skipped = [
+            await manager.delete_task("agent", task_id, statuses=["completed"]),
+            await manager.delete_task(
+                "agent", task_id, idle_before=datetime.utcnow() - timedelta(days=1)
+            ),
+        ]
+        await context.update_task_status("completed")
+        freed = await manager.delete_task(
+            "agent", task_id, idle_before=datetime.utcnow(), statuses=["completed"]
+        )
+        return skipped, freed, await manager.load_task_context("agent", task_id)
+
+    skipped, freed, task_context = asyncio.run(run())
+    assert skipped == [None, None]
+    assert freed > 0 and task_context is None
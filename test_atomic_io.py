@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+持久化模式的测试：原子写入和组提交（延迟 fsync）
+"""
+
+import os
+import sys
+
+import pytest
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.context import FileContextManager
+from app.core.context.atomic_io import (
+    DURABILITY_MODES,
+    DeferredFsyncWriter,
+    atomic_write_bytes,
+)
+
+
+def test_atomic_write_replaces_without_leftovers(tmp_path):
+    """原子写入覆盖目标文件，不留下临时文件"""
+    file_path = tmp_path / "metadata.json"
+    for data in (b"first", b"second"):
+        atomic_write_bytes(file_path, data)
+        assert file_path.read_bytes() == data
+    assert [path.name for path in tmp_path.iterdir()] == ["metadata.json"]
+
+
+def test_deferred_fsync_merges_registrations(tmp_path):
+    """窗口期内的多次登记合并为一次 fsync"""
+    writer = DeferredFsyncWriter(window=60)
+    paths = [tmp_path / f"file_{i}" for i in range(3)]
+    for path in paths:
+        path.write_bytes(b"data")
+    for _ in range(4):
+        for path in paths:
+            writer.sync_later(path)
+    # 不存在的文件（如已删除）不影响其他文件的同步
+    writer.sync_later(tmp_path / "missing")
+    writer.flush()
+    assert writer.stats() == {"submitted": 13, "commits": 1, "files_synced": 4}
+
+
+@pytest.mark.parametrize("durability", DURABILITY_MODES)
+def test_writes_visible_to_other_managers_immediately(tmp_path, durability):
+    """所有模式下写入（包括组提交）在返回时已对其他进程可见"""
+    manager = FileContextManager(str(tmp_path), cache_size=0, durability=durability)
+    manager.create_task_context("agent", "task", "持久化", durability)
+    for i in range(5):
+        assert manager.add_scratchpad_entry("agent", "task", f"笔记 {i}")
+        assert manager.update_task_status("agent", "task", f"状态 {i}")
+
+        other = FileContextManager(str(tmp_path), cache_size=0)
+        assert f"笔记 {i}" in other.get_file_content("agent", "task", "scratchpad")
+        assert other.load_task_context("agent", "task").status == f"状态 {i}"
+
+    manager.flush()
+    if durability == "group":
+        stats = manager._group_writer.stats()
+        assert stats["commits"] <= stats["submitted"]
+    manager.close()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+冷任务归档的测试：归档后透明还原，按空闲时间和状态批量归档
+"""
+
+import os
+import sys
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.context import AgentContext, FileContextManager
+
+FILE_TYPES = ("todo", "resource", "history", "scratchpad", "summary")
+
+
+def _new_manager(base_path) -> FileContextManager:
+    """不使用进程级共享缓存，每次都从磁盘读取"""
+    return FileContextManager(str(base_path), cache_size=0)
+
+
+def _snapshot(manager: FileContextManager, agent_id: str, task_id: str):
+    """任务所有文件的内容和资源列表"""
+    return (
+        {
+            file_type: manager.get_file_content(agent_id, task_id, file_type)
+            for file_type in FILE_TYPES
+        },
+        manager.get_resources(agent_id, task_id),
+    )
+
+
+def test_archive_rehydrate_round_trip(tmp_path):
+    """归档后读取任务自动还原，内容、资源和聊天记录保持不变"""
+    manager = _new_manager(tmp_path)
+    context = AgentContext("agent", manager)
+    task_id = context.create_new_task("归档", "归档还原", todo_items=["收集资料"])
+    for i in range(20):
+        context.add_chat_message("user" if i % 2 == 0 else "assistant", f"消息 {i}")
+    context.add_resource_link("资源", "https://example.com/a", "第一行\n第二行")
+    context.add_summary_entry("选题", "归档还原")
+    context.update_todo_progress(["收集资料"])
+    before = _snapshot(manager, "agent", task_id)
+    messages = manager.get_chat_messages("agent", task_id)
+
+    result = manager.archive_task("agent", task_id)
+    assert result is not None and result["archived_bytes"] > 0
+    task_dir = manager._task_dir("agent", task_id)
+    assert not task_dir.exists()
+
+    reloaded = _new_manager(tmp_path)
+    assert _snapshot(reloaded, "agent", task_id) == before
+    assert reloaded.get_chat_messages("agent", task_id) == messages
+    assert task_dir.exists()
+    assert reloaded._find_archive("agent", task_id) is None
+    # 还原后可以继续写入
+    assert reloaded.add_scratchpad_entry("agent", task_id, "还原后写入")
+
+
+def test_archive_idle_tasks_filters_by_status(tmp_path):
+    """只归档满足空闲时间和状态条件的任务，归档的任务仍出现在任务列表中"""
+    manager = _new_manager(tmp_path)
+    for task_id in ("done", "active"):
+        manager.create_task_context("agent", task_id, f"任务 {task_id}", "批量归档")
+        manager.add_scratchpad_entry("agent", task_id, "笔记 " * 200)
+    manager.update_task_status("agent", "done", "completed")
+
+    assert manager.archive_idle_tasks(idle_days=1)["archived"] == 0
+    report = manager.archive_idle_tasks(idle_days=0, status="completed")
+    assert report["archived"] == 1 and report["files"] > 0
+    assert report["bytes_saved"] == report["original_bytes"] - report["archived_bytes"]
+    assert not manager._task_dir("agent", "done").exists()
+    assert manager._task_dir("agent", "active").exists()
+
+    tasks = {task["task_id"]: task for task in manager.list_agent_tasks("agent")}
+    assert set(tasks) == {"done", "active"}
+    # 归档过的任务再次读取时还原
+    assert "笔记" in manager.get_file_content("agent", "done", "scratchpad")
+    assert manager.get_archive_stats()["rehydrations"] == 1
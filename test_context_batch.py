@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+批量提交的测试：一次性提交、代码块异常时丢弃、无法应用或写入失败时整体回滚
+"""
+
+import os
+import sys
+
+import pytest
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.context import AgentContext, FileContextManager
+
+FILE_TYPES = ("todo", "resource", "history", "scratchpad", "summary")
+
+
+def _new_manager(base_path) -> FileContextManager:
+    """不使用进程级共享缓存，每次都从磁盘读取"""
+    return FileContextManager(str(base_path), cache_size=0)
+
+
+def _snapshot(manager: FileContextManager, agent_id: str, task_id: str):
+    """任务所有文件的内容和资源列表"""
+    return (
+        {
+            file_type: manager.get_file_content(agent_id, task_id, file_type)
+            for file_type in FILE_TYPES
+        },
+        manager.get_resources(agent_id, task_id),
+    )
+
+
+def _write_steps(context: AgentContext):
+    context.add_chat_message("user", "问题")
+    context.add_chat_message("assistant", "回答")
+    context.add_scratchpad_entry("笔记")
+    context.add_resource_link("资源", "https://example.com/a", "描述")
+    context.add_summary_entry("选题", "批量提交")
+    context.update_todo_progress(["收集资料"])
+    context.update_task_status("completed")
+
+
+def test_batch_matches_sequential_writes(tmp_path):
+    """批量提交的结果与逐次写入一致，每个文件只写入一次"""
+    results = []
+    for name in ("sequential", "batch"):
+        manager = _new_manager(tmp_path / name)
+        context = AgentContext("agent", manager)
+        task_id = context.create_new_task(
+            "批量", "对比", task_id="task", todo_items=["收集资料"]
+        )
+        versions = {
+            file_type: file_obj.version
+            for file_type, file_obj in manager.load_task_context(
+                "agent", task_id
+            ).files.items()
+        }
+        if name == "batch":
+            with context.batch() as batch:
+                _write_steps(context)
+                # 代码块内读不到尚未提交的修改
+                assert manager.get_chat_messages("agent", task_id) == []
+            assert batch.committed and len(batch.mutations) == 7
+            # 首次写入时创建的文件版本为 1
+            task_context = manager.load_task_context("agent", task_id)
+            for file_type in ("history", "todo", "resource", "summary"):
+                version = task_context.files[file_type].version
+                assert version == versions.get(file_type, 1) + 1
+        else:
+            _write_steps(context)
+        assert context.current_task_context.status == "completed"
+        results.append(
+            (
+                manager.get_chat_messages("agent", task_id),
+                manager.get_resources("agent", task_id),
+                manager.load_task_context("agent", task_id).status,
+                context.get_task_todo_items(),
+            )
+        )
+    assert [[m["content"] for m in result[0]] for result in results] == [
+        ["问题", "回答"],
+        ["问题", "回答"],
+    ]
+    assert results[0][1:] == results[1][1:]
+
+
+def test_batch_discards_mutations_when_block_raises(tmp_path):
+    """代码块抛出异常时不提交任何修改"""
+    manager = _new_manager(tmp_path)
+    context = AgentContext("agent", manager)
+    task_id = context.create_new_task("批量", "代码块异常")
+    before = _snapshot(manager, "agent", task_id)
+
+    with pytest.raises(RuntimeError):
+        with context.batch() as batch:
+            _write_steps(context)
+            raise RuntimeError("中断")
+    assert batch.committed is None
+    assert _snapshot(manager, "agent", task_id) == before
+    # 批量提交结束后恢复逐次写入
+    assert context.add_scratchpad_entry("之后的笔记")
+    assert "之后的笔记" in manager.get_file_content("agent", task_id, "scratchpad")
+
+
+def test_batch_rolls_back_when_mutation_cannot_be_applied(tmp_path):
+    """批量提交中有修改无法应用时，不写入任何内容"""
+    manager = _new_manager(tmp_path)
+    context = AgentContext("agent", manager)
+    task_id = context.create_new_task("批量回滚", "无法应用的修改")
+    before = _snapshot(manager, "agent", task_id)
+
+    with context.batch() as batch:
+        context.add_chat_message("user", "不会写入")
+        context.add_scratchpad_entry("不会写入")
+        context.add_resource_link("资源", "https://example.com/a", "不会登记")
+        context.add_resource_link("无效资源", "", "空 URL")
+
+    assert batch.committed is False
+    assert _snapshot(_new_manager(tmp_path), "agent", task_id) == before
+
+
+def test_batch_rolls_back_when_write_fails_partway(tmp_path, monkeypatch):
+    """写入中途失败时恢复已写入的文件，元数据和资源登记表保持不变"""
+    manager = _new_manager(tmp_path)
+    context = AgentContext("agent", manager)
+    task_id = context.create_new_task("批量回滚", "写入中途失败")
+    context.add_scratchpad_entry("已有笔记")
+    before = _snapshot(manager, "agent", task_id)
+    task_context = manager.load_task_context("agent", task_id)
+    versions = {
+        file_type: file_obj.version
+        for file_type, file_obj in task_context.files.items()
+    }
+
+    append_file = FileContextManager._append_file
+
+    def failing_append(self, file_obj, file_path, text):
+        if file_obj.file_type == "scratchpad":
+            raise OSError("磁盘已满")
+        return append_file(self, file_obj, file_path, text)
+
+    monkeypatch.setattr(FileContextManager, "_append_file", failing_append)
+    with context.batch() as batch:
+        # history 和 resource 先于 scratchpad 写入
+        context.add_chat_message("user", "写入后被撤销")
+        context.add_resource_link("资源", "https://example.com/a", "写入后被撤销")
+        context.add_scratchpad_entry("写入失败")
+    monkeypatch.undo()
+
+    assert batch.committed is False
+    reloaded = _new_manager(tmp_path)
+    assert _snapshot(reloaded, "agent", task_id) == before
+    task_context = reloaded.load_task_context("agent", task_id)
+    for file_type, file_obj in task_context.files.items():
+        assert file_obj.version == versions[file_type]
+        assert file_obj.size == file_obj.path.stat().st_size
+
+    # 撤销后仍可正常写入，资源链接按新链接写入文件
+    assert context.add_resource_link("资源", "https://example.com/a", "重新写入")
+    assert "https://example.com/a" in reloaded.get_file_content(
+        "agent", task_id, "resource"
+    )
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+目录布局的测试：按用户/会话隔离的 Agent ID、分桶目录和旧版布局迁移
+"""
+
+import os
+import sys
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.context import FileContextManager, context_layout
+from app.core.context.context_layout import namespaced_agent_id
+
+FILE_TYPES = ("todo", "resource", "history", "scratchpad", "summary")
+
+
+def _new_manager(base_path) -> FileContextManager:
+    """不使用进程级共享缓存，每次都从磁盘读取"""
+    return FileContextManager(str(base_path), cache_size=0)
+
+
+def _snapshot(manager: FileContextManager, agent_id: str, task_id: str):
+    """任务所有文件的内容和资源列表"""
+    return (
+        {
+            file_type: manager.get_file_content(agent_id, task_id, file_type)
+            for file_type in FILE_TYPES
+        },
+        manager.get_resources(agent_id, task_id),
+    )
+
+
+def test_namespaced_agent_id():
+    """用户/会话 ID 中的特殊字符被替换，不同的原始 ID 不会冲突"""
+    assert namespaced_agent_id("default") == "default"
+    assert namespaced_agent_id("default", "alice", "42") == "default--u-alice--t-42"
+    unsafe = namespaced_agent_id("default", "a/b")
+    assert "/" not in unsafe and unsafe.startswith("default--u-a_b-")
+    assert unsafe != namespaced_agent_id("default", "a_b")
+    assert unsafe != namespaced_agent_id("default", "a:b")
+
+
+def test_tasks_are_sharded_per_agent(tmp_path):
+    """任务按哈希前缀分桶存放，不同用户的 Agent 互不可见"""
+    manager = _new_manager(tmp_path)
+    alice = namespaced_agent_id("default", "alice")
+    bob = namespaced_agent_id("default", "bob")
+    manager.create_task_context(alice, "task", "分桶", "alice 的任务")
+    manager.create_task_context(bob, "other", "分桶", "bob 的任务")
+
+    agent_dir = context_layout.agent_path(tmp_path, alice)
+    assert context_layout.task_path(agent_dir, "task").is_dir()
+    assert [task_id for task_id, _ in context_layout.iter_task_dirs(agent_dir)] == [
+        "task"
+    ]
+    assert [task["task_id"] for task in manager.list_agent_tasks(alice)] == ["task"]
+    assert manager.load_task_context(bob, "task") is None
+    assert sorted(context_layout.iter_agent_ids(tmp_path)) == sorted([alice, bob])
+
+
+def test_migrate_layout(tmp_path):
+    """旧版平铺布局的任务迁移到分桶布局，迁移前后都能读取"""
+    manager = _new_manager(tmp_path)
+    snapshots = {}
+    for task_id in ("t1", "t2", "t3"):
+        manager.create_task_context("agent", task_id, f"任务 {task_id}", "迁移")
+        manager.add_chat_message("agent", task_id, "user", f"{task_id} 的消息")
+        manager.add_resource_link(
+            "agent", task_id, "资源", f"https://example.com/{task_id}", "描述"
+        )
+        snapshots[task_id] = _snapshot(manager, "agent", task_id)
+    manager.close()
+
+    # 构造旧版布局：base/agent_<id>/task_<id>
+    legacy_dir = context_layout.legacy_agent_path(tmp_path, "agent")
+    legacy_dir.mkdir()
+    agent_dir = context_layout.agent_path(tmp_path, "agent")
+    for task_id, task_dir in list(context_layout.iter_task_dirs(agent_dir)):
+        os.rename(task_dir, legacy_dir / f"task_{task_id}")
+
+    manager = _new_manager(tmp_path)
+    assert _snapshot(manager, "agent", "t1") == snapshots["t1"]
+
+    report = manager.migrate_layout(limit=2)
+    assert report["migrated"] == 2 and report["agents"] == 0
+    report = manager.migrate_layout()
+    assert report == {"migrated": 1, "bundles": 0, "conflicts": 0, "agents": 1}
+    assert not legacy_dir.exists()
+
+    reloaded = _new_manager(tmp_path)
+    for task_id, snapshot in snapshots.items():
+        assert context_layout.task_path(agent_dir, task_id).is_dir()
+        assert _snapshot(reloaded, "agent", task_id) == snapshot
+    assert sorted(
+        task["task_id"] for task in reloaded.list_agent_tasks("agent")
+    ) == ["t1", "t2", "t3"]
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+按条目修改 summary.md / todo.md 的测试：原位替换、删除标记和与默认实现的一致性
+"""
+
+import os
+import re
+import sys
+
+import pytest
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.context import FileContextManager, SQLiteContextStore
+from app.core.context.atomic_io import DURABILITY_MODES
+
+
+def _new_manager(base_path, **kwargs) -> FileContextManager:
+    """不使用进程级共享缓存，每次都从磁盘读取"""
+    return FileContextManager(str(base_path), cache_size=0, **kwargs)
+
+
+def _sections(content: str):
+    return [line[3:] for line in content.split("\n") if line.startswith("## ")]
+
+
+@pytest.mark.parametrize("durability", DURABILITY_MODES)
+def test_upsert_and_delete_section(tmp_path, durability):
+    """按条目替换和删除：同名条目只保留一个，读取的内容中没有删除标记"""
+    manager = _new_manager(tmp_path, durability=durability)
+    manager.create_task_context("agent", "task", "条目", "按条目修改")
+    assert manager.upsert_section("agent", "task", "summary", "选题", "初稿")
+    for i in range(3):
+        manager.add_summary_entry("agent", "task", f"章节 {i}", "正文 " * 20)
+
+    # 非末尾条目长度变化：原位置写删除标记，新内容追加到末尾
+    assert manager.upsert_section("agent", "task", "summary", "选题", "修改后的选题")
+    summary = manager.get_file_content("agent", "task", "summary")
+    assert _sections(summary).count("选题") == 1
+    assert "修改后的选题" in summary and "初稿" not in summary
+    assert not re.search(r"\n\n<!-- *-->", summary)
+
+    # 同名的重复条目全部替换为一个
+    manager.add_summary_entry("agent", "task", "重复", "第一次")
+    manager.add_summary_entry("agent", "task", "重复", "第二次")
+    manager.add_summary_entry("agent", "task", "末尾", "最后")
+    assert manager.upsert_section("agent", "task", "summary", "重复", "合并")
+    summary = manager.get_file_content("agent", "task", "summary")
+    assert _sections(summary).count("重复") == 1
+    assert "合并" in summary and "第一次" not in summary and "第二次" not in summary
+
+    assert manager.delete_section("agent", "task", "summary", "章节 1")
+    assert not manager.delete_section("agent", "task", "summary", "章节 1")
+    assert not manager.delete_section("agent", "task", "summary", "不存在")
+    assert not manager.upsert_section("agent", "task", "history", "条目", "内容")
+
+    # 元数据与磁盘一致，分块读取与完整读取一致
+    manager.flush()
+    reloaded = _new_manager(tmp_path, durability=durability)
+    summary = reloaded.get_file_content("agent", "task", "summary")
+    assert _sections(summary).count("章节 1") == 0
+    assert "".join(reloaded.iter_file_chunks("agent", "task", "summary", 16)) == summary
+    summary_file = reloaded.load_task_context("agent", "task").files["summary"]
+    assert summary_file.size == summary_file.path.stat().st_size
+    assert summary_file.length == len(summary)
+
+    # 整体重写后仍可按条目修改
+    reloaded.update_file_content("agent", "task", "summary", "# 总结\n\n## 唯一\n旧\n")
+    assert reloaded.upsert_section("agent", "task", "summary", "唯一", "新")
+    assert _sections(reloaded.get_file_content("agent", "task", "summary")) == ["唯一"]
+
+
+def _apply_section_edits(store):
+    store.create_task_context("agent", "task", "条目", "一致性", ["收集资料"])
+    store.upsert_section("agent", "task", "todo", "写作", "- [ ] 写初稿\n- [ ] 修改")
+    store.upsert_section("agent", "task", "summary", "选题", "初稿")
+    store.add_summary_entry("agent", "task", "章节", "正文 " * 10)
+    store.upsert_section("agent", "task", "summary", "选题", "# 标题\n修改后的选题")
+    store.update_todo_progress("agent", "task", ["写初稿"])
+    store.upsert_section("agent", "task", "todo", "写作", "- [ ] 重写")
+    store.delete_section("agent", "task", "summary", "章节")
+    return [
+        store.get_file_content("agent", "task", file_type)
+        for file_type in ("summary", "todo")
+    ]
+
+
+def _section_bodies(content: str):
+    """条目名 -> 去掉时间戳和首尾空白的正文"""
+    content = re.sub(r"\d{4}-\d\d-\d\d \d\d:\d\d:\d\d(\.\d+)?", "", content)
+    return {
+        block.split("\n", 1)[0]: block.split("\n", 1)[1].strip()
+        for block in content.split("\n## ")[1:]
+    }
+
+
+def test_section_edits_match_default_implementation(tmp_path):
+    """
+    文件存储按条目原位修改的结果与 SQLite 存储（整体改写）包含相同的条目
+
+    长度变化的非末尾条目在文件存储中移到末尾，只比较条目内容不比较顺序
+    """
+    files = _apply_section_edits(_new_manager(tmp_path / "files"))
+    rows = _apply_section_edits(SQLiteContextStore(str(tmp_path / "context.sqlite")))
+    assert list(map(_section_bodies, files)) == list(map(_section_bodies, rows))
+    summary, todo = files
+    assert _sections(summary).count("选题") == 1 and "章节" not in _sections(summary)
+    assert "### 标题" in summary
+    assert "- [ ] 重写" in todo and "- [x] 写初稿" not in todo
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+任务统计的测试：字符数和 token 数取自元数据，旧版元数据缺失时只补算一次
+"""
+
+import json
+import os
+import sys
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.context import FileContextManager
+from app.core.context.file_context_manager import ContextFile
+
+
+def test_stats_track_appends_without_reading_files(tmp_path, monkeypatch):
+    """追加只增量更新统计，不读取文件内容"""
+    manager = FileContextManager(str(tmp_path), cache_size=0)
+    manager.create_task_context("agent", "task", "统计", "增量维护")
+    manager.add_scratchpad_entry("agent", "task", "第一条")
+
+    reads = []
+    load_content = ContextFile._load_content
+    monkeypatch.setattr(
+        ContextFile,
+        "_load_content",
+        lambda self: reads.append(self.file_type) or load_content(self),
+    )
+    for i in range(5):
+        assert manager.add_scratchpad_entry("agent", "task", f"笔记 {i}")
+    assert reads == []
+
+
+def test_legacy_metadata_backfills_length_and_tokens(tmp_path, monkeypatch):
+    """旧版元数据没有字符数和 token 数：首次保存时补算并写回，之后不再读取文件"""
+    manager = FileContextManager(str(tmp_path), cache_size=0)
+    manager.create_task_context("agent", "task", "统计", "旧版元数据")
+    manager.add_scratchpad_entry("agent", "task", "第一条")
+    metadata_path = manager._get_metadata_path(manager._get_task_path("agent", "task"))
+    metadata = json.loads(metadata_path.read_text(encoding="utf-8"))
+    for file_info in metadata["files"].values():
+        file_info.pop("length", None)
+        file_info.pop("tokens", None)
+    metadata.pop("stats", None)
+    metadata_path.write_text(json.dumps(metadata), encoding="utf-8")
+
+    reads = []
+    load_content = ContextFile._load_content
+    monkeypatch.setattr(
+        ContextFile,
+        "_load_content",
+        lambda self: reads.append(self.file_type) or load_content(self),
+    )
+    manager = FileContextManager(str(tmp_path), cache_size=0)
+    for i in range(5):
+        assert manager.add_scratchpad_entry("agent", "task", f"笔记 {i}")
+    # 每个文件最多读取一次
+    assert sorted(reads) == sorted(set(reads))
+
+    metadata = json.loads(metadata_path.read_text(encoding="utf-8"))
+    task_context = manager.load_task_context("agent", "task")
+    for name, file_info in metadata["files"].items():
+        content = manager.get_file_content("agent", "task", name)
+        assert file_info["length"] == len(content)
+        assert file_info["tokens"] is not None
+        assert task_context.files[name].get_length() == len(content)
+    assert metadata["stats"]["length"] == sum(
+        file_info["length"] for file_info in metadata["files"].values()
+    )
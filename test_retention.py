@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+保留策略的测试：按状态过期删除、超出配额时从最旧的已结束任务开始淘汰
+"""
+
+import os
+import sys
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.context import FileContextManager, RetentionEngine, RetentionPolicy
+
+
+def _new_manager(base_path) -> FileContextManager:
+    """不使用进程级共享缓存，每次都从磁盘读取"""
+    return FileContextManager(str(base_path), cache_size=0)
+
+
+def _create_tasks(manager: FileContextManager, statuses):
+    """按顺序创建任务，越靠前的任务最近更新时间越早"""
+    for i, status in enumerate(statuses):
+        manager.create_task_context("agent", f"t{i}", f"任务 {i}", "保留策略")
+        manager.add_scratchpad_entry("agent", f"t{i}", "笔记 " * 200)
+        manager.update_task_status("agent", f"t{i}", status)
+
+
+def _remaining(manager: FileContextManager):
+    return sorted(task["task_id"] for task in manager.list_agent_tasks("agent"))
+
+
+def test_agent_quota_evicts_oldest_finished_tasks(tmp_path):
+    """超出 Agent 配额时按更新时间从旧到新删除已结束的任务，进行中的任务保留"""
+    manager = _new_manager(tmp_path)
+    _create_tasks(manager, ["in_progress", "completed", "failed", "completed"])
+    sizes = [manager.get_task_disk_usage("agent", f"t{i}") for i in range(4)]
+    # 只需删除一个已结束任务即可回到配额以内
+    policy = RetentionPolicy(
+        status_ttl_days={},
+        archive_idle_days=None,
+        keep_versions=None,
+        agent_quota_bytes=sum(sizes) - 1,
+        min_idle_hours=0,
+    )
+    engine = RetentionEngine(manager, policy)
+    report = engine.run_cycle()
+
+    assert _remaining(manager) == ["t0", "t2", "t3"]
+    (record,) = engine.reclaimed()
+    assert record["action"] == "agent_quota" and record["task_id"] == "t1"
+    assert record["bytes"] == report["reclaimed_bytes"] == sizes[1]
+    assert engine.usage() == [
+        {"agent_id": "agent", "tasks": 3, "bytes": sum(sizes) - sizes[1]}
+    ]
+
+    # 配额小于进行中任务的占用时，已结束的任务全部删除，进行中的任务仍保留
+    engine.policy.agent_quota_bytes = 0
+    engine.run_cycle()
+    assert _remaining(manager) == ["t0"]
+    assert engine.stats()["reclaimed"]["agent_quota"]["count"] == 3
+    engine.close()
+
+
+def test_expired_tasks_are_deleted_by_status(tmp_path):
+    """超过所在状态保留期的任务被删除，未配置保留期的状态不受影响"""
+    manager = _new_manager(tmp_path)
+    _create_tasks(manager, ["completed", "failed", "in_progress"])
+    policy = RetentionPolicy(
+        status_ttl_days={"failed": 0},
+        archive_idle_days=None,
+        keep_versions=None,
+        batch_size=1,
+    )
+    engine = RetentionEngine(manager, policy)
+    report = engine.run_cycle()
+
+    assert report["tasks"] == 3
+    assert _remaining(manager) == ["t0", "t2"]
+    assert [(r["action"], r["task_id"]) for r in engine.reclaimed()] == [
+        ("expired", "t1")
+    ]
+    engine.close()
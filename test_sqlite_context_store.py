@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+SQLite 上下文存储的测试：与文件存储的读写结果一致，重新打开后数据保留
+"""
+
+import os
+import re
+import sys
+
+import pytest
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.context import (
+    AgentContext,
+    FileContextManager,
+    SQLiteContextStore,
+    TodoItem,
+)
+
+FILE_TYPES = ("todo", "resource", "history", "scratchpad", "summary")
+
+
+def _normalize(content):
+    """去掉内容中的时间戳"""
+    if content is None:
+        return None
+    return re.sub(r"\d{4}-\d\d-\d\dT?\s?\d\d:\d\d:\d\d(\.\d+)?", "TS", content)
+
+
+def _populate(store) -> AgentContext:
+    context = AgentContext("agent", store)
+    context.create_new_task(
+        "一致性",
+        "两种存储",
+        task_id="task",
+        todo_items=[TodoItem("搜索资料", "search"), "写大纲", "写文章"],
+    )
+    for i in range(6):
+        context.add_chat_message("user" if i % 2 == 0 else "assistant", f"消息 {i}")
+    context.add_resource_link("资源", "https://example.com/a", "第一次")
+    context.add_resource_link("资源", "https://EXAMPLE.com/a/", "第二次")
+    context.add_resource_link("其他", "https://example.com/b", "")
+    context.add_summary_entry("选题", "一致性测试")
+    context.add_scratchpad_entry("笔记")
+    context.update_todo_progress(["search"])
+    context.mark_todo_completed("写大纲")
+    context.append_to_task_file("todo", "\n- [ ] 追加事项\n")
+    context.update_task_status("in_progress")
+    return context
+
+
+def _observe(store):
+    """两种存储都应一致的读取结果"""
+    task_context = store.load_task_context("agent", "task")
+    return {
+        "status": task_context.status,
+        "files": {
+            file_type: _normalize(store.get_file_content("agent", "task", file_type))
+            for file_type in FILE_TYPES
+        },
+        "messages": [
+            (message["role"], message["content"])
+            for message in store.get_chat_messages("agent", "task")
+        ],
+        "recent": [
+            message["content"]
+            for message in store.get_chat_messages("agent", "task", limit=2)
+        ],
+        "todo": store.get_todo_items("agent", "task"),
+        "resources": store.get_resources("agent", "task"),
+    }
+
+
+def test_sqlite_store_matches_file_store(tmp_path):
+    """同一组写操作在两种存储中产生相同的内容"""
+    files = FileContextManager(str(tmp_path / "files"), cache_size=0)
+    rows = SQLiteContextStore(str(tmp_path / "context.sqlite"))
+    for store in (files, rows):
+        _populate(store)
+    expected = _observe(files)
+    assert expected["todo"] == ["写文章", "追加事项"]
+    assert expected["recent"] == ["消息 4", "消息 5"]
+    assert _observe(rows) == expected
+
+    # 整体替换后内容与待办事项同步更新
+    for store in (files, rows):
+        assert store.update_file_content("agent", "task", "todo", "- [ ] 新事项\n")
+    assert rows.get_todo_items("agent", "task") == ["新事项"]
+    assert _observe(rows) == _observe(files)
+
+
+def test_sqlite_store_persists_across_connections(tmp_path):
+    """关闭后重新打开数据库，内容和版本保持不变"""
+    db_path = str(tmp_path / "context.sqlite")
+    store = SQLiteContextStore(db_path)
+    _populate(store)
+    before = _observe(store)
+    versions = {
+        file_type: file_obj.version
+        for file_type, file_obj in store.load_task_context(
+            "agent", "task"
+        ).files.items()
+    }
+    store.close()
+
+    store = SQLiteContextStore(db_path)
+    assert _observe(store) == before
+    task_context = store.load_task_context("agent", "task")
+    assert {
+        file_type: file_obj.version for file_type, file_obj in task_context.files.items()
+    } == versions
+    assert task_context.get_stats()["length"] == sum(
+        len(store.get_file_content("agent", "task", file_type) or "")
+        for file_type in task_context.files
+    )
+    store.close()
+
+
+@pytest.mark.parametrize("page_size", [1, 2, None])
+def test_task_pagination_matches(tmp_path, page_size):
+    """两种存储的分页和状态过滤结果一致"""
+    stores = [
+        FileContextManager(str(tmp_path / "files"), cache_size=0),
+        SQLiteContextStore(str(tmp_path / "context.sqlite")),
+    ]
+    pages = []
+    for store in stores:
+        for i in range(5):
+            store.create_task_context("agent", f"t{i}", f"任务 {i}", "分页")
+            if i % 2 == 0:
+                store.update_task_status("agent", f"t{i}", "completed")
+        task_ids, cursor = [], None
+        while True:
+            page = store.list_agent_tasks_page(
+                "agent", status="completed", page_size=page_size, cursor=cursor
+            )
+            task_ids += [task["task_id"] for task in page["tasks"]]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        pages.append(task_ids)
+    assert sorted(pages[0]) == ["t0", "t2", "t4"]
+    assert pages[0] == pages[1]
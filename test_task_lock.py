@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+任务锁的测试：跨进程读写锁、可重入和超时，多进程并发追加
+"""
+
+import multiprocessing
+import os
+import re
+import sys
+import threading
+
+import pytest
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.context import FileContextManager
+from app.core.context.atomic_io import DURABILITY_MODES
+from app.core.context.task_lock import TaskLockManager
+
+
+def _new_manager(base_path, **kwargs) -> FileContextManager:
+    """不使用进程级共享缓存，每次都从磁盘读取"""
+    return FileContextManager(str(base_path), cache_size=0, **kwargs)
+
+
+def _append_worker(base_path: str, durability: str, tag: str, count: int):
+    manager = _new_manager(base_path, durability=durability)
+    for i in range(count):
+        assert manager.append_file_content(
+            "agent", "task", "scratchpad", f"{tag}-{i:04d}\n"
+        )
+    manager.close()
+
+
+@pytest.mark.parametrize("durability", DURABILITY_MODES)
+def test_concurrent_appends_across_processes(tmp_path, durability):
+    """多个进程并发追加同一任务：内容不丢失，元数据与文件一致"""
+    manager = _new_manager(tmp_path, durability=durability)
+    manager.create_task_context("agent", "task", "并发追加", "多进程写入")
+    # scratchpad 首次写入时创建
+    assert manager.append_file_content("agent", "task", "scratchpad", "开始\n")
+    version = manager.load_task_context("agent", "task").files["scratchpad"].version
+    manager.close()
+
+    workers, count = 3, 40
+    processes = [
+        multiprocessing.Process(
+            target=_append_worker, args=(str(tmp_path), durability, f"p{k}", count)
+        )
+        for k in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=120)
+        assert process.exitcode == 0
+
+    manager = _new_manager(tmp_path, durability=durability)
+    scratchpad = manager.load_task_context("agent", "task").files["scratchpad"]
+    data = scratchpad.path.read_bytes()
+    for k in range(workers):
+        lines = re.findall(rf"^p{k}-(\d{{4}})$", data.decode("utf-8"), re.M)
+        # 每个进程的追加全部保留，且保持各自的顺序
+        assert lines == [f"{i:04d}" for i in range(count)]
+    assert scratchpad.size == len(data)
+    assert scratchpad.version == version + workers * count
+    manager.close()
+
+
+def test_lock_is_reentrant_and_exclusive(tmp_path):
+    """同一线程内可重入；写锁与其他持有者互斥，读锁可以共享"""
+    locks = TaskLockManager(tmp_path, timeout=0.05)
+    other = TaskLockManager(tmp_path, timeout=0.05)
+
+    with locks.acquire("agent/task"):
+        with locks.acquire("agent/task"):
+            assert locks.holds_exclusive("agent/task")
+        with pytest.raises(TimeoutError):
+            with other.acquire("agent/task", exclusive=False):
+                pass
+        # 不同任务互不影响
+        with other.acquire("agent/other"):
+            pass
+    assert not locks.holds_exclusive("agent/task")
+
+    with locks.acquire("agent/task", exclusive=False):
+        with other.acquire("agent/task", exclusive=False):
+            pass
+        with pytest.raises(RuntimeError):
+            with locks.acquire("agent/task"):
+                pass
+        with pytest.raises(TimeoutError):
+            with other.acquire("agent/task"):
+                pass
+
+    # 超时的获取不计入统计；等待后获取成功的记为一次竞争
+    assert other.stats()["contended"] == 0
+    waiter = TaskLockManager(tmp_path, timeout=10)
+
+    def wait_for_lock():
+        with waiter.acquire("agent/task"):
+            pass
+
+    with locks.acquire("agent/task"):
+        thread = threading.Thread(target=wait_for_lock)
+        thread.start()
+        thread.join(timeout=0.1)
+        assert thread.is_alive()
+    thread.join()
+    report = waiter.contention_report(top=1)[0]
+    assert report["task"] == "agent/task" and report["contended"] == 1
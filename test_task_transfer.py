@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+任务流式导出与批量导入的测试：NDJSON 往返、跨存储导入和损坏输入的处理
+"""
+
+import json
+import os
+import sys
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.context import AgentContext, FileContextManager, SQLiteContextStore
+
+FILE_TYPES = ("todo", "resource", "history", "scratchpad", "summary")
+
+
+def _populate(store, task_ids=("t1", "t2")):
+    context = AgentContext("source", store)
+    for task_id in task_ids:
+        context.create_new_task(
+            f"任务 {task_id}", "导出", task_id=task_id, todo_items=["收集资料"]
+        )
+        for i in range(4):
+            context.add_chat_message("user", f"{task_id} 消息 {i}\n第二行")
+        context.add_resource_link("资源", f"https://example.com/{task_id}", "描述")
+        context.add_summary_entry("选题", "导出导入")
+        context.update_todo_progress(["收集资料"])
+        context.update_task_status("completed")
+    # 超过一个 chunk 的文件
+    context.add_scratchpad_entry("长笔记 " * 60000)
+
+
+def _snapshot(store, agent_id: str, task_id: str):
+    task_context = store.load_task_context(agent_id, task_id)
+    return (
+        task_context.title,
+        task_context.status,
+        {
+            file_type: store.get_file_content(agent_id, task_id, file_type)
+            for file_type in FILE_TYPES
+        },
+        store.get_chat_messages(agent_id, task_id),
+        store.get_resources(agent_id, task_id),
+        store.get_todo_items(agent_id, task_id, include_completed=True),
+    )
+
+
+def _split_bytes(lines, size: int):
+    """将导出流切成与行边界无关的固定大小分块"""
+    data = b"".join(lines)
+    return [data[start : start + size] for start in range(0, len(data), size)]
+
+
+def test_ndjson_round_trip(tmp_path):
+    """导出后导入到另一个 Agent 和另一种存储，内容保持不变"""
+    source = FileContextManager(str(tmp_path / "source"), cache_size=0)
+    _populate(source)
+    lines = list(source.export_tasks("source"))
+    records = [json.loads(line) for line in lines]
+    assert records[0]["type"] == "header"
+    assert sum(record["type"] == "end" for record in records) == 2
+    assert sum(record["type"] == "chunk" for record in records) > 2 * len(FILE_TYPES)
+
+    targets = [
+        FileContextManager(str(tmp_path / "target"), cache_size=0),
+        SQLiteContextStore(str(tmp_path / "target.sqlite")),
+    ]
+    for target in targets:
+        report = target.import_tasks(_split_bytes(lines, 4096), agent_id="target")
+        assert report == {"imported": 2, "failed": 0, "errors": []}
+        for task_id in ("t1", "t2"):
+            assert _snapshot(target, "target", task_id) == _snapshot(
+                source, "source", task_id
+            )
+
+    # 再次导入覆盖同 ID 的任务，不产生重复
+    report = targets[0].import_tasks(lines, agent_id="target")
+    assert report["imported"] == 2
+    assert len(targets[0].list_agent_tasks("target")) == 2
+    assert _snapshot(targets[0], "target", "t1") == _snapshot(source, "source", "t1")
+
+
+def test_import_skips_damaged_records(tmp_path):
+    """无法解析的行、非法 ID 和被截断的任务被跳过并记录原因"""
+    source = FileContextManager(str(tmp_path / "source"), cache_size=0)
+    _populate(source, task_ids=("t1",))
+    lines = list(source.export_tasks("source"))
+    unsafe = json.dumps({"type": "task", "task_id": "../escape"}).encode() + b"\n"
+    stream = [b"not json\n", unsafe] + lines + lines[:-1]
+
+    target = FileContextManager(str(tmp_path / "target"), cache_size=0)
+    report = target.import_tasks(stream)
+    assert report["imported"] == 1 and report["failed"] == 0
+    assert len(report["errors"]) == 3
+    assert any("不完整" in error for error in report["errors"])
+    # 未指定 agent_id 时导入到记录中的 Agent
+    assert [task["task_id"] for task in target.list_agent_tasks("source")] == ["t1"]
+    assert not (tmp_path / "escape").exists()
+
+
+def test_agent_context_stream_round_trip(tmp_path):
+    """AgentContext 默认导出当前任务，导入到当前 Agent"""
+    source = AgentContext("source", FileContextManager(str(tmp_path / "a")))
+    task_id = source.create_new_task("当前任务", "流式导出")
+    source.add_chat_message("user", "你好")
+
+    target = AgentContext("target", FileContextManager(str(tmp_path / "b")))
+    report = target.import_task_stream(source.export_task_stream())
+    assert report["imported"] == 1
+    assert target.load_task(task_id)
+    assert [m["content"] for m in target.get_recent_chat_history()] == ["你好"]
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+待办事项进度匹配的测试：逐次更新与批量更新都通过偏移索引原地标记，
+三种实现（Markdown 内容、偏移索引、SQLite 存储）使用同一套匹配规则
+"""
+
+import os
+import re
+import sys
+
+import pytest
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.context import (
+    AgentContext,
+    FileContextManager,
+    SQLiteContextStore,
+    TodoItem,
+    context_format,
+)
+from app.core.context.atomic_io import DURABILITY_MODES
+
+TODO_ITEMS = [
+    TodoItem("Search web (TavilySearch): 搜索资料", "search-web"),
+    TodoItem("Write outline: 写大纲", "write-outline"),
+    TodoItem("Write outline again: 重写大纲", "write-outline"),
+    "整理参考文献资料",
+    "Review the article draft",
+    "  缩进 item",
+]
+# 精确匹配（ID、文本）、重复 ID、模糊匹配、无匹配和空更新
+ROUNDS = [
+    ["search web"],
+    ["write outline", "write outline"],
+    ["参考文献资料整理", "nothing matches here at all"],
+    ["review article draft"],
+    [],
+]
+
+
+def _normalize(content: str) -> str:
+    """去掉进度记录中的时间戳"""
+    return re.sub(r"\d{4}-\d\d-\d\d \d\d:\d\d:\d\d(\.\d+)?", "TS", content)
+
+
+def _completed(content: str):
+    return context_format.parse_todo_items(content, include_completed=True)[
+        : len(TODO_ITEMS)
+    ], [
+        parsed[1]
+        for parsed in map(context_format.parse_todo_line, content.split("\n"))
+        if parsed and parsed[0]
+    ]
+
+
+@pytest.mark.parametrize("durability", DURABILITY_MODES)
+def test_progress_updates_match_rewrite_semantics(tmp_path, durability):
+    """原地标记的结果与在完整内容上应用 apply_todo_progress 一致"""
+    manager = FileContextManager(str(tmp_path), cache_size=0, durability=durability)
+    manager.create_task_context("agent", "task", "进度", "原地标记", TODO_ITEMS)
+    todo_path = manager._get_task_path("agent", "task") / "todo.md"
+    inode = todo_path.stat().st_ino
+
+    expected = manager.get_file_content("agent", "task", "todo")
+    for updates in ROUNDS:
+        expected = context_format.apply_todo_progress(expected, updates)
+        assert manager.update_todo_progress("agent", "task", updates)
+        content = manager.get_file_content("agent", "task", "todo")
+        assert _normalize(content) == _normalize(expected)
+
+    # 没有整体重写文件，元数据与磁盘一致
+    assert todo_path.stat().st_ino == inode
+    todo_file = manager.load_task_context("agent", "task").files["todo"]
+    assert todo_file.size == todo_path.stat().st_size
+    assert todo_file.length == len(content)
+
+
+def test_batched_progress_updates_flip_in_place(tmp_path):
+    """批量提交中的进度更新同样原地标记，进度记录作为追加写入"""
+    manager = FileContextManager(str(tmp_path), cache_size=0)
+    context = AgentContext("agent", manager)
+    task_id = context.create_new_task("批量进度", "原地标记", todo_items=TODO_ITEMS)
+    todo_path = manager._get_task_path("agent", task_id) / "todo.md"
+    inode = todo_path.stat().st_ino
+
+    expected = manager.get_file_content("agent", task_id, "todo")
+    with context.batch() as batch:
+        for updates in ROUNDS:
+            expected = context_format.apply_todo_progress(expected, updates)
+            context.update_todo_progress(updates)
+        expected = context_format.mark_todo_line(expected, "缩进")
+        context.mark_todo_completed("缩进")
+        context.add_chat_message("assistant", "同一批次的其他写入")
+
+    assert batch.committed
+    assert todo_path.stat().st_ino == inode
+    content = manager.get_file_content("agent", task_id, "todo")
+    assert _normalize(content) == _normalize(expected)
+    todo_file = manager.load_task_context("agent", task_id).files["todo"]
+    assert todo_file.size == todo_path.stat().st_size
+    assert todo_file.length == len(content)
+
+
+def test_batched_progress_after_pending_items_sees_them(tmp_path):
+    """同一批次中先追加的事项也能被之后的进度更新匹配"""
+    manager = FileContextManager(str(tmp_path), cache_size=0)
+    context = AgentContext("agent", manager)
+    task_id = context.create_new_task("批量进度", "待写入的事项", todo_items=["旧事项"])
+
+    with context.batch() as batch:
+        context.update_todo_progress(["旧事项"])
+        context.append_to_task_file("todo", "\n- [ ] 新增事项\n")
+        context.update_todo_progress(["新增事项"])
+        context.upsert_section("todo", "附加", "- [ ] 附加事项")
+        context.mark_todo_completed("附加")
+
+    assert batch.committed
+    _, completed = _completed(manager.get_file_content("agent", task_id, "todo"))
+    assert completed == ["旧事项", "新增事项", "附加事项"]
+    # 整体重写后偏移索引重建，之后的原地标记仍然正确
+    context.append_to_task_file("todo", "- [ ] 最后一项\n")
+    assert context.update_todo_progress(["最后一项"])
+    _, completed = _completed(manager.get_file_content("agent", task_id, "todo"))
+    assert completed[-1] == "最后一项"
+
+
+def test_failed_batch_restores_marked_checkboxes(tmp_path, monkeypatch):
+    """批量写入中途失败时，已原地标记的复选框和追加的进度记录被撤销"""
+    manager = FileContextManager(str(tmp_path), cache_size=0)
+    context = AgentContext("agent", manager)
+    task_id = context.create_new_task("批量进度", "回滚", todo_items=TODO_ITEMS)
+    before = manager.get_file_content("agent", task_id, "todo")
+
+    append_file = FileContextManager._append_file
+
+    def failing_append(self, file_obj, file_path, text):
+        if file_obj.file_type == "history":
+            raise OSError("磁盘已满")
+        return append_file(self, file_obj, file_path, text)
+
+    monkeypatch.setattr(FileContextManager, "_append_file", failing_append)
+    with context.batch() as batch:
+        context.update_todo_progress(["search web", "review article draft"])
+        context.add_chat_message("assistant", "写入失败")
+    monkeypatch.undo()
+
+    assert batch.committed is False
+    assert manager.get_file_content("agent", task_id, "todo") == before
+    assert context.update_todo_progress(["search web"])
+    _, completed = _completed(manager.get_file_content("agent", task_id, "todo"))
+    assert completed == ["Search web (TavilySearch): 搜索资料"]
+
+
+def test_stores_share_matching_rules(tmp_path):
+    """文件存储（逐次、批量）与 SQLite 存储对同一组更新标记相同的事项"""
+    results = []
+    stores = [
+        FileContextManager(str(tmp_path / "files"), cache_size=0),
+        FileContextManager(str(tmp_path / "batch"), cache_size=0),
+        SQLiteContextStore(str(tmp_path / "context.sqlite")),
+    ]
+    for i, store in enumerate(stores):
+        context = AgentContext("agent", store)
+        task_id = context.create_new_task("规则", "一致", todo_items=TODO_ITEMS)
+        if i == 1:
+            with context.batch():
+                for updates in ROUNDS:
+                    context.update_todo_progress(updates)
+        else:
+            for updates in ROUNDS:
+                assert context.update_todo_progress(updates)
+        results.append(_completed(store.get_file_content("agent", task_id, "todo")))
+    assert results[0] == results[1] == results[2]
+    assert results[0][1] == [
+        "Search web (TavilySearch): 搜索资料",
+        "Write outline: 写大纲",
+        "Write outline again: 重写大纲",
+        "整理参考文献资料",
+        "Review the article draft",
+    ]